@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+對話消息段文件基準測試
+對比整份JSON文檔加載與段文件內存映射讀取在長歷史（默認100萬條消息）下取最近消息的延遲
+
+用法:
+    python powerautomation_v2/benchmarks/message_segments_benchmark.py [--messages 1000000] [--rounds 50]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# 添加共享模組路徑
+sys.path.append(str(Path(__file__).parent.parent / "shared"))
+
+from message_segments import MessageSegmentLog
+
+ROLES = ["user", "trae"]
+WORDS = ["React", "組件", "性能", "優化", "部署", "錯誤", "測試", "數據庫", "接口", "同步", "api", "cache"]
+APPEND_CHUNK = 10_000
+
+
+def generate_messages(count: int, start_time: float, seed: int = 42) -> List[Dict]:
+    """生成與TRAE對話消息結構一致的合成消息，每條間隔1秒"""
+    rng = random.Random(seed)
+    return [
+        {
+            "role": ROLES[i % 2],
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(5, 30))),
+            "timestamp": start_time + i
+        }
+        for i in range(count)
+    ]
+
+
+def measure(fn: Callable[[], object], rounds: int) -> Dict[str, float]:
+    """測量延遲(毫秒)"""
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    }
+
+
+def run_benchmark(count: int, rounds: int, json_rounds: int):
+    start_time = time.time() - count
+    messages = generate_messages(count, start_time)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+
+        # 基線：整份對話保存為一個JSON文檔
+        json_file = tmp_path / "conversation.json"
+        begin = time.perf_counter()
+        json_file.write_text(json.dumps({"messages": messages}, ensure_ascii=False), encoding="utf-8")
+        json_write = time.perf_counter() - begin
+
+        log = MessageSegmentLog(tmp_path / "messages")
+        begin = time.perf_counter()
+        for i in range(0, count, APPEND_CHUNK):
+            log.append(messages[i:i + APPEND_CHUNK])
+        segment_write = time.perf_counter() - begin
+
+        def load_json_tail():
+            with open(json_file, encoding="utf-8") as f:
+                return json.load(f)["messages"][-20:]
+
+        last_hour = start_time + count - 3600
+        results = [
+            ("json load, last 20", measure(load_json_tail, json_rounds)),
+            ("segment tail(20)", measure(lambda: log.tail(20), rounds)),
+            ("segment tail(1000)", measure(lambda: log.tail(1000), rounds)),
+            ("segment last hour", measure(lambda: log.time_range(last_hour), rounds)),
+        ]
+        assert log.tail(20) == load_json_tail()
+
+        begin = time.perf_counter()
+        compacted = log.compact(keep_last=count // 10)
+        compact_time = time.perf_counter() - begin
+
+        print(f"\n=== {count:,} messages (json write {json_write:.2f}s "
+              f"{json_file.stat().st_size / 1e6:.0f}MB, segment append {segment_write:.2f}s "
+              f"{log.segment_path.stat().st_size / 1e6:.0f}MB after compaction) ===")
+        print(f"{'mode':<22}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, result in results:
+            print(f"{name:<22}{result['mean_ms']:>10.3f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}")
+        print(f"compaction keep_last={count // 10:,}: {compacted['before']:,} -> {compacted['after']:,} "
+              f"in {compact_time:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message segment benchmark")
+    parser.add_argument("--messages", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--rounds", type=int, default=50, help="段文件讀取的測量次數")
+    parser.add_argument("--json-rounds", type=int, default=3, help="整份JSON加載的測量次數")
+    args = parser.parse_args()
+
+    for count in args.messages:
+        run_benchmark(count, args.rounds, args.json_rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PowerAutomation EC2端對話存儲 - SQLite後端
+功能：以WAL模式的SQLite存儲同步的對話，按對話ID、時間戳和介入標記建立索引，
+並增量維護統計計數，使統計、最新對話和介入查詢的耗時不隨歷史增長；
+寫入時按對話ID和內容哈希去重，同步批次按冪等鍵只處理一次
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_RANK = {"high": 3, "medium": 2, "low": 1}
+
+# 計算內容哈希時忽略的易變字段（每個同步週期都會重新生成）
+VOLATILE_FIELDS = ("sync_time",)
+VOLATILE_ANALYSIS_FIELDS = ("analysis_time",)
+
+# SQLite單條語句的綁定參數上限較保守的取值
+QUERY_CHUNK_SIZE = 500
+
+SCHEMA_TABLES = """
+CREATE TABLE IF NOT EXISTS sync_batches (
+    batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    save_time TEXT NOT NULL,
+    source TEXT,
+    conversation_count INTEGER NOT NULL DEFAULT 0,
+    metadata TEXT,
+    source_file TEXT UNIQUE,
+    idempotency_key TEXT,
+    result TEXT
+);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    row_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT,
+    batch_id INTEGER NOT NULL REFERENCES sync_batches(batch_id),
+    timestamp TEXT,
+    intervention_needed INTEGER NOT NULL DEFAULT 0,
+    priority_rank INTEGER NOT NULL DEFAULT 1,
+    confidence_score REAL NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    content_hash TEXT
+);
+
+CREATE TABLE IF NOT EXISTS intervention_analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT,
+    timestamp TEXT,
+    analysis TEXT NOT NULL,
+    save_time TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+SCHEMA_INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS uq_conversations_conversation_id ON conversations(conversation_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_conversations_anonymous_hash
+    ON conversations(content_hash) WHERE conversation_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations(timestamp, row_id);
+CREATE INDEX IF NOT EXISTS idx_conversations_intervention
+    ON conversations(intervention_needed, priority_rank, confidence_score);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_sync_batches_idempotency_key ON sync_batches(idempotency_key);
+CREATE INDEX IF NOT EXISTS idx_intervention_analyses_conversation_id
+    ON intervention_analyses(conversation_id);
+"""
+
+def content_hash(conversation: Dict) -> str:
+    """計算對話內容哈希（忽略同步時間等易變字段）"""
+    payload = {k: v for k, v in conversation.items() if k not in VOLATILE_FIELDS}
+    analysis = payload.get("intervention_analysis")
+    if isinstance(analysis, dict):
+        payload["intervention_analysis"] = {
+            k: v for k, v in analysis.items() if k not in VOLATILE_ANALYSIS_FIELDS
+        }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _conversation_key(conversation: Dict) -> Optional[str]:
+    conversation_id = conversation.get("id")
+    return None if conversation_id is None else str(conversation_id)
+
+class SQLiteConversationStorage:
+    """對話數據存儲管理（SQLite後端，接口與ConversationStorage一致）"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._connect()
+        conn.executescript(SCHEMA_TABLES)
+        self._migrate(conn)
+        conn.executescript(SCHEMA_INDEXES)
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每個線程使用獨立連接（Flask多線程處理請求）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """升級未去重的舊表結構：每個對話ID只保留最新一行並重算計數"""
+        batch_columns = {row["name"] for row in conn.execute("PRAGMA table_info(sync_batches)")}
+        if "idempotency_key" not in batch_columns:
+            conn.execute("ALTER TABLE sync_batches ADD COLUMN idempotency_key TEXT")
+            conn.execute("ALTER TABLE sync_batches ADD COLUMN result TEXT")
+
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(conversations)")}
+        if "content_hash" in columns:
+            return
+
+        conn.execute("DROP INDEX IF EXISTS idx_conversations_conversation_id")
+        conn.execute("ALTER TABLE conversations ADD COLUMN content_hash TEXT")
+        removed = conn.execute(
+            "DELETE FROM conversations WHERE conversation_id IS NOT NULL AND row_id NOT IN "
+            "(SELECT MAX(row_id) FROM conversations WHERE conversation_id IS NOT NULL GROUP BY conversation_id)"
+        ).rowcount
+        conn.executemany(
+            "INSERT INTO counters(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            [
+                ("total_conversations", conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]),
+                ("intervention_needed_count", conn.execute(
+                    "SELECT COUNT(*) FROM conversations WHERE intervention_needed = 1").fetchone()[0])
+            ]
+        )
+        logger.info(f"對話表已升級為去重結構，移除 {removed} 條重複記錄")
+
+    @staticmethod
+    def _conversation_row(conv: Dict, batch_id: int, digest: str) -> tuple:
+        analysis = conv.get("intervention_analysis") or {}
+        return (
+            batch_id,
+            conv.get("timestamp"),
+            1 if analysis.get("intervention_needed", False) else 0,
+            PRIORITY_RANK.get(analysis.get("priority", "low"), 1),
+            analysis.get("confidence_score") or 0,
+            json.dumps(conv, ensure_ascii=False),
+            digest,
+            _conversation_key(conv)
+        )
+
+    def _existing_state(self, conn: sqlite3.Connection, conversations: List[Dict]) -> Dict:
+        """批量查詢已存儲對話的內容哈希和介入標記"""
+        existing = {}
+        keys = list({key for key in map(_conversation_key, conversations) if key is not None})
+        for start in range(0, len(keys), QUERY_CHUNK_SIZE):
+            chunk = keys[start:start + QUERY_CHUNK_SIZE]
+            rows = conn.execute(
+                "SELECT conversation_id, content_hash, intervention_needed FROM conversations "
+                f"WHERE conversation_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for row in rows:
+                existing[row["conversation_id"]] = (row["content_hash"], row["intervention_needed"])
+
+        hashes = list({content_hash(conv) for conv in conversations if _conversation_key(conv) is None})
+        for start in range(0, len(hashes), QUERY_CHUNK_SIZE):
+            chunk = hashes[start:start + QUERY_CHUNK_SIZE]
+            rows = conn.execute(
+                "SELECT content_hash FROM conversations WHERE conversation_id IS NULL "
+                f"AND content_hash IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for row in rows:
+                existing[("hash", row["content_hash"])] = (row["content_hash"], None)
+        return existing
+
+    @staticmethod
+    def _bump_counters(conn: sqlite3.Connection, **deltas):
+        conn.executemany(
+            "INSERT INTO counters(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [(name, delta) for name, delta in deltas.items() if delta]
+        )
+
+    def _insert_batch(self, conn: sqlite3.Connection, conversations: List[Dict], metadata: Dict,
+                      save_time: str, source_file: Optional[str] = None,
+                      idempotency_key: Optional[str] = None) -> Dict:
+        """
+        在當前事務中寫入一個同步批次
+
+        新對話插入，內容變化的對話更新，內容未變的對話跳過
+        """
+        cursor = conn.execute(
+            "INSERT INTO sync_batches(save_time, source, conversation_count, metadata, source_file, idempotency_key) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (save_time, (metadata or {}).get("source_system", "unknown"), len(conversations),
+             json.dumps(metadata or {}, ensure_ascii=False), source_file, idempotency_key)
+        )
+        batch_id = cursor.lastrowid
+
+        existing = self._existing_state(conn, conversations)
+        inserts, updates, changed_ids, changed_hashes = [], [], [], []
+        skipped = 0
+        intervention_delta = 0
+
+        for conv in conversations:
+            digest = content_hash(conv)
+            key = _conversation_key(conv)
+            state_key = key if key is not None else ("hash", digest)
+            row = self._conversation_row(conv, batch_id, digest)
+
+            previous = existing.get(state_key)
+            if previous is None:
+                inserts.append(row)
+                intervention_delta += row[2]
+            elif previous[0] == digest:
+                skipped += 1
+                continue
+            else:
+                updates.append(row)
+                intervention_delta += row[2] - previous[1]
+
+            existing[state_key] = (digest, row[2])
+            if key is None:
+                changed_hashes.append(digest)
+            else:
+                changed_ids.append(conv.get("id"))
+
+        conn.executemany(
+            "INSERT INTO conversations(batch_id, timestamp, intervention_needed, priority_rank, "
+            "confidence_score, data, content_hash, conversation_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            inserts
+        )
+        conn.executemany(
+            "UPDATE conversations SET batch_id = ?, timestamp = ?, intervention_needed = ?, priority_rank = ?, "
+            "confidence_score = ?, data = ?, content_hash = ? WHERE conversation_id = ?",
+            updates
+        )
+
+        self._bump_counters(
+            conn,
+            total_batches=1,
+            total_conversations=len(inserts),
+            intervention_needed_count=intervention_delta
+        )
+        conn.execute(
+            "INSERT INTO meta(key, value) VALUES ('latest_sync_time', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+            (save_time,)
+        )
+
+        result = {
+            "batch": f"batch_{batch_id}",
+            "inserted": len(inserts),
+            "updated": len(updates),
+            "skipped": skipped,
+            "changed_ids": changed_ids,
+            "changed_hashes": changed_hashes
+        }
+        conn.execute("UPDATE sync_batches SET result = ? WHERE batch_id = ?",
+                     (json.dumps(result, ensure_ascii=False, default=str), batch_id))
+        return result
+
+    def save_conversations(self, conversations: List[Dict], metadata: Dict,
+                           idempotency_key: Optional[str] = None) -> Dict:
+        """
+        保存對話數據（整個批次在一個事務中寫入）
+
+        Args:
+            conversations: 對話列表
+            metadata: 同步元數據
+            idempotency_key: 批次冪等鍵，重複提交時直接返回首次處理的結果
+
+        Returns:
+            包含batch、inserted、updated、skipped、changed_ids、changed_hashes和replayed的結果字典；
+            新增或變化的匿名對話（沒有ID）以內容哈希記在changed_hashes中
+        """
+        conn = self._connect()
+        with conn:
+            # 立即獲取寫鎖，保證同一冪等鍵的並發請求只有一個真正寫入
+            conn.execute("BEGIN IMMEDIATE")
+            if idempotency_key:
+                row = conn.execute("SELECT result FROM sync_batches WHERE idempotency_key = ?",
+                                   (idempotency_key,)).fetchone()
+                if row is not None:
+                    logger.info(f"重複的同步批次 {idempotency_key}，返回已處理結果")
+                    return {**json.loads(row["result"]), "replayed": True}
+
+            result = self._insert_batch(conn, conversations, metadata, datetime.now().isoformat(),
+                                        idempotency_key=idempotency_key)
+
+        logger.info(f"保存批次 {result['batch']}: 新增 {result['inserted']}，"
+                    f"更新 {result['updated']}，跳過 {result['skipped']}")
+        return {**result, "replayed": False}
+
+    def save_intervention_analysis(self, analyses: List[Dict]) -> str:
+        """保存介入分析結果"""
+        save_time = datetime.now().isoformat()
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO intervention_analyses(conversation_id, timestamp, analysis, save_time) "
+                "VALUES (?, ?, ?, ?)",
+                [(item.get("conversation_id"), item.get("timestamp"),
+                  json.dumps(item, ensure_ascii=False), save_time) for item in analyses]
+            )
+
+        logger.info(f"保存 {len(analyses)} 條介入分析")
+        return f"intervention_analysis_{save_time}"
+
+    def get_latest_conversations(self, limit: int = 50) -> List[Dict]:
+        """獲取最新的對話記錄（走時間戳索引）"""
+        rows = self._connect().execute(
+            "SELECT data FROM conversations ORDER BY timestamp DESC, row_id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def get_interventions_needed(self, limit: int = 100) -> List[Dict]:
+        """獲取需要介入的對話，按優先級和信心度排序（走介入索引）"""
+        rows = self._connect().execute(
+            "SELECT data FROM conversations WHERE intervention_needed = 1 "
+            "ORDER BY priority_rank DESC, confidence_score DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def get_statistics(self, recent_batches: int = 20) -> Dict:
+        """獲取統計信息（讀取增量維護的計數器）"""
+        conn = self._connect()
+        counters = {row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM counters")}
+        latest = conn.execute("SELECT value FROM meta WHERE key = 'latest_sync_time'").fetchone()
+        batches = conn.execute(
+            "SELECT batch_id, source_file, conversation_count, save_time FROM sync_batches "
+            "ORDER BY batch_id DESC LIMIT ?",
+            (recent_batches,)
+        ).fetchall()
+
+        return {
+            "total_files": counters.get("total_batches", 0),
+            "total_conversations": counters.get("total_conversations", 0),
+            "intervention_needed_count": counters.get("intervention_needed_count", 0),
+            "latest_sync_time": latest["value"] if latest else None,
+            "file_list": [
+                {
+                    "filename": row["source_file"] or f"batch_{row['batch_id']}",
+                    "conversation_count": row["conversation_count"],
+                    "save_time": row["save_time"]
+                }
+                for row in batches
+            ],
+            "storage_backend": "sqlite"
+        }
+
+    def is_empty(self) -> bool:
+        """是否還沒有任何同步批次（包括導入的JSON文件）"""
+        return self._connect().execute("SELECT 1 FROM sync_batches LIMIT 1").fetchone() is None
+
+    def import_json_files(self, data_dir: str) -> Dict:
+        """
+        一次性導入舊版conversations_<ts>.json文件
+
+        已導入的文件按文件名記錄在sync_batches.source_file中，重複調用會跳過
+        """
+        result = {"imported_files": 0, "imported_conversations": 0, "skipped_files": 0, "errors": []}
+        if not os.path.isdir(data_dir):
+            return result
+
+        conn = self._connect()
+        imported = {row["source_file"] for row in
+                    conn.execute("SELECT source_file FROM sync_batches WHERE source_file IS NOT NULL")}
+
+        filenames = sorted(f for f in os.listdir(data_dir)
+                           if f.startswith("conversations_") and f.endswith(".json"))
+        for filename in filenames:
+            if filename in imported:
+                result["skipped_files"] += 1
+                continue
+
+            try:
+                with open(os.path.join(data_dir, filename), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                conversations = data.get("conversations", [])
+                with conn:
+                    self._insert_batch(conn, conversations, data.get("metadata", {}),
+                                       data.get("save_time") or datetime.now().isoformat(),
+                                       source_file=filename)
+                result["imported_files"] += 1
+                result["imported_conversations"] += len(conversations)
+            except Exception as e:
+                logger.error(f"導入文件 {filename} 失敗: {e}")
+                result["errors"].append(f"{filename}: {e}")
+
+        if result["imported_files"]:
+            logger.info(f"從JSON文件導入 {result['imported_conversations']} 條對話 "
+                        f"({result['imported_files']} 個文件)")
+        return result
+
+    def close(self):
+        """關閉當前線程的連接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+def main():
+    """命令行：導入舊版JSON文件"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="導入舊版對話JSON文件到SQLite存儲")
+    parser.add_argument("data_dir", help="conversations_<ts>.json 所在目錄")
+    parser.add_argument("db_path", help="SQLite數據庫路徑")
+    args = parser.parse_args()
+
+    storage = SQLiteConversationStorage(args.db_path)
+    print(json.dumps(storage.import_json_files(args.data_dir), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
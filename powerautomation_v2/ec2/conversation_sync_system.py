@@ -3,12 +3,16 @@
 """
 PowerAutomation 對話同步系統
 功能：不管是否智能介入，都要同步所有TRAE對話內容到EC2
+按來源持久化水位線（最後同步的時間戳和ID），每個週期只分頁提取水位線之後的新對話
 """
 
+import gzip
 import json
+import os
 import sqlite3
 import requests
 import time
+import uuid
 from datetime import datetime
 from typing import Dict, List, Optional
 import logging
@@ -19,6 +23,8 @@ class ConversationSyncSystem:
         self.config = self.load_config(config_path)
         self.setup_logging()
         self.last_sync_time = None
+        self.watermark_path = self.config.get("watermark_path", "sync_watermarks.json")
+        self.watermarks = self.load_watermarks()
         
     def load_config(self, config_path: str) -> Dict:
         """載入配置"""
@@ -30,9 +36,44 @@ class ConversationSyncSystem:
                 "ec2_endpoint": "http://18.212.97.173:8000",
                 "trae_db_path": "/Users/alexchuang/trae/conversations.db",
                 "sync_interval": 30,
-                "max_retries": 3
+                "max_retries": 3,
+                "page_size": 100,
+                "max_pages_per_cycle": 20,
+                "compress_payload": True,
+                "watermark_path": "sync_watermarks.json"
             }
     
+    def load_watermarks(self) -> Dict[str, Dict]:
+        """載入各來源的同步水位線"""
+        try:
+            with open(self.watermark_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"水位線文件讀取失敗，從頭同步: {e}")
+            return {}
+    
+    def save_watermarks(self):
+        """持久化水位線（寫臨時文件後原子替換）"""
+        tmp_path = f"{self.watermark_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.watermarks, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.watermark_path)
+    
+    def advance_watermark(self, source: str, conversations: List[Dict]):
+        """在批次同步成功後把來源的水位線推進到批次中最後一條對話"""
+        rows = [conv for conv in conversations if conv.get("source") == source]
+        if not rows:
+            return
+        last = max(rows, key=lambda conv: (conv["timestamp"], conv["id"]))
+        self.watermarks[source] = {
+            "timestamp": last["timestamp"],
+            "id": last["id"],
+            "updated_at": datetime.now().isoformat()
+        }
+        self.save_watermarks()
+    
     def setup_logging(self):
         """設置日誌"""
         logging.basicConfig(
@@ -45,16 +86,23 @@ class ConversationSyncSystem:
         )
         self.logger = logging.getLogger(__name__)
     
-    def extract_trae_conversations(self) -> List[Dict]:
-        """從TRAE數據庫提取對話"""
+    def extract_trae_conversations(self, page_size: Optional[int] = None) -> List[Dict]:
+        """
+        從TRAE數據庫提取水位線之後的一頁對話
+        
+        按 (timestamp, id) 升序返回，積壓的對話在後續頁中按順序取完；
+        水位線只在同步成功後由 advance_watermark 推進
+        """
         conversations = []
+        page_size = page_size or self.config.get("page_size", 100)
+        watermark = self.watermarks.get("trae")
         
         try:
             # 連接TRAE SQLite數據庫
             conn = sqlite3.connect(self.config["trae_db_path"])
             cursor = conn.cursor()
             
-            # 查詢最新對話
+            # 查詢水位線之後的對話
             query = """
             SELECT 
                 id,
@@ -65,11 +113,15 @@ class ConversationSyncSystem:
                 session_id,
                 metadata
             FROM conversations 
-            ORDER BY timestamp DESC 
-            LIMIT 100
             """
+            params = []
+            if watermark:
+                query += "WHERE timestamp > ? OR (timestamp = ? AND id > ?) "
+                params = [watermark["timestamp"], watermark["timestamp"], watermark["id"]]
+            query += "ORDER BY timestamp ASC, id ASC LIMIT ?"
+            params.append(page_size)
             
-            cursor.execute(query)
+            cursor.execute(query, params)
             rows = cursor.fetchall()
             
             for row in rows:
@@ -146,39 +198,59 @@ class ConversationSyncSystem:
             self.logger.info("沒有對話需要同步")
             return True
             
-        try:
-            # 準備同步數據
-            sync_data = {
-                "conversations": conversations,
-                "sync_metadata": {
-                    "total_count": len(conversations),
-                    "sync_time": datetime.now().isoformat(),
-                    "source_system": "powerautomation_mac",
-                    "sync_type": "full_sync"
-                }
+        # 每個批次一個冪等鍵，重試時沿用，服務端不會重複寫入
+        idempotency_key = uuid.uuid4().hex
+        sync_data = {
+            "conversations": conversations,
+            "sync_metadata": {
+                "total_count": len(conversations),
+                "sync_time": datetime.now().isoformat(),
+                "source_system": "powerautomation_mac",
+                "sync_type": "incremental",
+                "idempotency_key": idempotency_key
             }
-            
-            # 發送到EC2
-            response = requests.post(
-                f"{self.config['ec2_endpoint']}/api/sync/conversations",
-                json=sync_data,
-                timeout=30,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                self.logger.info(f"成功同步 {len(conversations)} 條對話到EC2")
-                return True
-            else:
-                self.logger.error(f"EC2同步失敗: {response.status_code} - {response.text}")
-                return False
+        }
+        max_retries = self.config.get("max_retries", 3)
+        
+        headers = {"Content-Type": "application/json", "Idempotency-Key": idempotency_key}
+        body = json.dumps(sync_data, ensure_ascii=False).encode("utf-8")
+        if self.config.get("compress_payload", True):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        
+        for attempt in range(max_retries + 1):
+            try:
+                # 發送到EC2
+                response = requests.post(
+                    f"{self.config['ec2_endpoint']}/api/sync/conversations",
+                    data=body,
+                    timeout=30,
+                    headers=headers
+                )
                 
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"EC2連接失敗: {e}")
-            return False
-        except Exception as e:
-            self.logger.error(f"同步過程出錯: {e}")
-            return False
+                if response.status_code == 200:
+                    result = response.json()
+                    self.logger.info(
+                        f"成功同步 {len(conversations)} 條對話到EC2: 新增 {result.get('inserted', 0)}，"
+                        f"更新 {result.get('updated', 0)}，跳過 {result.get('skipped', 0)}"
+                    )
+                    return True
+                if response.status_code < 500:
+                    self.logger.error(f"EC2同步失敗: {response.status_code} - {response.text}")
+                    return False
+                self.logger.warning(f"EC2同步失敗: {response.status_code} - {response.text}")
+                
+            except requests.exceptions.RequestException as e:
+                self.logger.warning(f"EC2連接失敗: {e}")
+            except Exception as e:
+                self.logger.error(f"同步過程出錯: {e}")
+                return False
+            
+            if attempt < max_retries:
+                time.sleep(min(30, 2 ** attempt))
+        
+        self.logger.error(f"EC2同步在 {max_retries + 1} 次嘗試後仍失敗")
+        return False
     
     def analyze_conversation_for_intervention(self, conversation: Dict) -> Dict:
         """分析對話是否需要智能介入"""
@@ -256,41 +328,62 @@ class ConversationSyncSystem:
             }
     
     def run_sync_cycle(self, include_current: bool = True) -> Dict:
-        """執行一次完整的同步週期"""
+        """
+        執行一次同步週期
+        
+        逐頁提取水位線之後的對話並同步，每頁成功後推進水位線；
+        某一頁失敗時停止，下個週期從同一水位線重試
+        """
         sync_result = {
             "start_time": datetime.now().isoformat(),
             "conversations_synced": 0,
             "interventions_analyzed": 0,
+            "pages_synced": 0,
             "success": False,
             "errors": []
         }
+        page_size = self.config.get("page_size", 100)
+        max_pages = self.config.get("max_pages_per_cycle", 20)
         
         try:
-            # 1. 提取TRAE歷史對話
-            historical_conversations = self.extract_trae_conversations()
-            
-            # 2. 提取當前對話
-            current_conversations = []
-            if include_current:
-                current_conv = self.extract_current_conversation()
-                current_conversations.append(current_conv)
-            
-            # 3. 合併所有對話
-            all_conversations = historical_conversations + current_conversations
-            
-            # 4. 分析每個對話的介入需求
-            for conv in all_conversations:
-                intervention_analysis = self.analyze_conversation_for_intervention(conv)
-                conv["intervention_analysis"] = intervention_analysis
-                sync_result["interventions_analyzed"] += 1
+            for page in range(max_pages):
+                # 1. 提取水位線之後的一頁TRAE對話
+                historical_conversations = self.extract_trae_conversations(page_size)
+                
+                # 2. 提取當前對話（只附在第一頁）
+                current_conversations = []
+                if include_current and page == 0:
+                    current_conv = self.extract_current_conversation()
+                    current_conversations.append(current_conv)
+                
+                # 3. 合併所有對話
+                all_conversations = historical_conversations + current_conversations
+                if not all_conversations:
+                    break
+                
+                # 4. 分析每個對話的介入需求
+                for conv in all_conversations:
+                    intervention_analysis = self.analyze_conversation_for_intervention(conv)
+                    conv["intervention_analysis"] = intervention_analysis
+                    sync_result["interventions_analyzed"] += 1
+                
+                # 5. 同步到EC2，成功後推進水位線
+                if not self.sync_to_ec2(all_conversations):
+                    sync_result["errors"].append("EC2同步失敗")
+                    break
+                
+                self.advance_watermark("trae", historical_conversations)
+                sync_result["conversations_synced"] += len(all_conversations)
+                sync_result["pages_synced"] += 1
+                
+                if len(historical_conversations) < page_size:
+                    break
             
-            # 5. 同步到EC2
-            if self.sync_to_ec2(all_conversations):
-                sync_result["conversations_synced"] = len(all_conversations)
+            if not sync_result["errors"]:
                 sync_result["success"] = True
-                self.logger.info(f"同步週期完成: {len(all_conversations)} 條對話")
-            else:
-                sync_result["errors"].append("EC2同步失敗")
+                self.last_sync_time = datetime.now().isoformat()
+                self.logger.info(f"同步週期完成: {sync_result['conversations_synced']} 條對話，"
+                                 f"{sync_result['pages_synced']} 頁")
             
         except Exception as e:
             error_msg = f"同步週期出錯: {e}"
@@ -298,6 +391,7 @@ class ConversationSyncSystem:
             sync_result["errors"].append(error_msg)
         
         sync_result["end_time"] = datetime.now().isoformat()
+        sync_result["watermarks"] = self.watermarks
         return sync_result
     
     def start_continuous_sync(self, interval: int = None):
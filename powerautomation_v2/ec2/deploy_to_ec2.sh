@@ -28,6 +28,9 @@ scp -i "$SSH_KEY" conversation_sync_system.py "$EC2_HOST:$REMOTE_DIR/"
 
 # 上傳EC2 API服務器
 scp -i "$SSH_KEY" ec2_api_server.py "$EC2_HOST:$REMOTE_DIR/"
+scp -i "$SSH_KEY" conversation_store.py "$EC2_HOST:$REMOTE_DIR/"
+scp -i "$SSH_KEY" remote_agent.py "$EC2_HOST:$REMOTE_DIR/"
+scp -i "$SSH_KEY" ../shared/intelligent_repository_selector.py "$EC2_HOST:$REMOTE_DIR/"
 
 # 上傳之前的核心文件
 scp -i "$SSH_KEY" powerautomation_ec2_system.py "$EC2_HOST:$REMOTE_DIR/" 2>/dev/null || echo "⚠️  powerautomation_ec2_system.py 不存在，跳過"
@@ -40,6 +43,10 @@ cat > $REMOTE_DIR/config.json << 'EOF'
     \"trae_db_path\": \"/Users/alexchuang/trae/conversations.db\",
     \"sync_interval\": 30,
     \"max_retries\": 3,
+    \"page_size\": 100,
+    \"max_pages_per_cycle\": 20,
+    \"compress_payload\": true,
+    \"watermark_path\": \"sync_watermarks.json\",
     \"manus_url\": \"https://manus.im/app/ogbxIEerutqP7e4NgIB7oQ\",
     \"api_settings\": {
         \"host\": \"0.0.0.0\",
@@ -6,11 +6,15 @@ PowerAutomation EC2端對話接收API
 """
 
 from flask import Flask, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 import json
 import os
+import zlib
 from datetime import datetime
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from conversation_store import SQLiteConversationStorage, content_hash
 
 app = Flask(__name__)
 
@@ -28,6 +32,15 @@ logger = logging.getLogger(__name__)
 # 數據存儲目錄
 DATA_DIR = "/home/ec2-user/powerautomation/data"
 LOGS_DIR = "/home/ec2-user/powerautomation/logs"
+DB_PATH = os.path.join(DATA_DIR, "conversations.db")
+
+# 存儲後端: sqlite(默認) 或 json(舊版按批次寫JSON文件)
+STORAGE_BACKEND = os.environ.get("POWERAUTOMATION_STORAGE_BACKEND", "sqlite")
+
+# 請求體上限(字節): 傳輸的原始請求體，以及gzip請求體解壓後的大小
+MAX_CONTENT_LENGTH = int(os.environ.get("POWERAUTOMATION_MAX_CONTENT_LENGTH", 16 * 1024 * 1024))
+MAX_DECOMPRESSED_LENGTH = int(os.environ.get("POWERAUTOMATION_MAX_DECOMPRESSED_LENGTH", 64 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 # 確保目錄存在
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -40,8 +53,9 @@ class ConversationStorage:
         self.data_dir = DATA_DIR
         self.logs_dir = LOGS_DIR
     
-    def save_conversations(self, conversations: List[Dict], metadata: Dict) -> str:
-        """保存對話數據"""
+    def save_conversations(self, conversations: List[Dict], metadata: Dict,
+                           idempotency_key: Optional[str] = None) -> Dict:
+        """保存對話數據（JSON後端不做去重，每個批次寫入一個文件）"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"conversations_{timestamp}.json"
         filepath = os.path.join(self.data_dir, filename)
@@ -60,7 +74,15 @@ class ConversationStorage:
             json.dump(save_data, f, indent=2, ensure_ascii=False)
         
         logger.info(f"保存 {len(conversations)} 條對話到 {filename}")
-        return filename
+        return {
+            "batch": filename,
+            "inserted": len(conversations),
+            "updated": 0,
+            "skipped": 0,
+            "changed_ids": [conv.get("id") for conv in conversations if conv.get("id") is not None],
+            "changed_hashes": [content_hash(conv) for conv in conversations if conv.get("id") is None],
+            "replayed": False
+        }
     
     def save_intervention_analysis(self, analyses: List[Dict]) -> str:
         """保存介入分析結果"""
@@ -104,6 +126,14 @@ class ConversationStorage:
         
         return conversations[:limit]
     
+    def get_interventions_needed(self, limit: int = 100) -> List[Dict]:
+        """獲取需要介入的對話（僅掃描最新的100條）"""
+        conversations = self.get_latest_conversations(100)
+        return [
+            conv for conv in conversations
+            if conv.get("intervention_analysis", {}).get("intervention_needed", False)
+        ][:limit]
+    
     def get_statistics(self) -> Dict:
         """獲取統計信息"""
         stats = {
@@ -157,13 +187,41 @@ class ConversationStorage:
         return stats
 
 # 初始化存儲管理器
-storage = ConversationStorage()
+if STORAGE_BACKEND == "json":
+    storage = ConversationStorage()
+else:
+    storage = SQLiteConversationStorage(DB_PATH)
+    # 只在空庫首次啟動時導入舊版JSON文件；之後補導入請運行
+    # python3 conversation_store.py <data_dir> <db_path>
+    if storage.is_empty():
+        storage.import_json_files(DATA_DIR)
+
+def gunzip_limited(body: bytes, max_length: int) -> bytes:
+    """解壓gzip請求體，解壓後超過max_length字節時拒絕（防止壓縮炸彈耗盡內存）"""
+    chunks = []
+    total = 0
+    # 與gzip.decompress一致，支持多個串接的gzip成員
+    while body:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunk = decompressor.decompress(body, max_length - total + 1)
+        total += len(chunk)
+        if total > max_length:
+            raise RequestEntityTooLarge(f"解壓後的請求體超過 {max_length} 字節")
+        if not decompressor.eof:
+            raise ValueError("gzip請求體不完整")
+        chunks.append(chunk)
+        body = decompressor.unused_data
+    return b"".join(chunks)
 
 @app.route('/api/sync/conversations', methods=['POST'])
 def sync_conversations():
     """接收對話同步請求"""
     try:
-        data = request.get_json()
+        # 同步客戶端默認以gzip壓縮請求體
+        if request.headers.get("Content-Encoding", "").lower() == "gzip":
+            data = json.loads(gunzip_limited(request.get_data(), MAX_DECOMPRESSED_LENGTH))
+        else:
+            data = request.get_json()
         
         if not data:
             return jsonify({"error": "沒有數據"}), 400
@@ -174,12 +232,35 @@ def sync_conversations():
         if not conversations:
             return jsonify({"error": "沒有對話數據"}), 400
         
-        # 保存對話數據
-        filename = storage.save_conversations(conversations, sync_metadata)
+        # 批次冪等鍵：優先取請求頭，其次取同步元數據
+        idempotency_key = request.headers.get("Idempotency-Key") or sync_metadata.get("idempotency_key")
+        
+        # 保存對話數據（按對話ID和內容哈希去重，只寫入新增或變化的記錄）
+        result = storage.save_conversations(conversations, sync_metadata, idempotency_key=idempotency_key)
+        filename = result["batch"]
+        counts = {key: result[key] for key in ("inserted", "updated", "skipped")}
+        
+        if result["replayed"]:
+            return jsonify({
+                "success": True,
+                "message": "同步批次已處理過",
+                "conversation_count": len(conversations),
+                **counts,
+                "replayed": True,
+                "batch": filename,
+                "timestamp": datetime.now().isoformat()
+            })
         
-        # 提取介入分析
+        # 提取介入分析（只針對新增或變化的對話）
+        changed_ids = set(result["changed_ids"])
+        changed_hashes = set(result.get("changed_hashes", []))
         intervention_analyses = []
         for conv in conversations:
+            if conv.get("id") is None:
+                if content_hash(conv) not in changed_hashes:
+                    continue
+            elif conv.get("id") not in changed_ids:
+                continue
             analysis = conv.get("intervention_analysis")
             if analysis:
                 intervention_analyses.append({
@@ -200,8 +281,10 @@ def sync_conversations():
             "timestamp": datetime.now().isoformat(),
             "action": "conversation_sync",
             "conversation_count": len(conversations),
+            **counts,
             "intervention_count": len(intervention_analyses),
             "source": sync_metadata.get("source_system", "unknown"),
+            "idempotency_key": idempotency_key,
             "files_created": [filename, analysis_filename] if analysis_filename else [filename]
         }
         
@@ -210,17 +293,24 @@ def sync_conversations():
         with open(log_file, 'a', encoding='utf-8') as f:
             f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
         
-        logger.info(f"成功接收並保存 {len(conversations)} 條對話")
+        logger.info(f"成功接收 {len(conversations)} 條對話: 新增 {counts['inserted']}，"
+                    f"更新 {counts['updated']}，跳過 {counts['skipped']}")
         
         return jsonify({
             "success": True,
             "message": f"成功同步 {len(conversations)} 條對話",
             "conversation_count": len(conversations),
+            **counts,
+            "replayed": False,
+            "batch": filename,
             "intervention_count": len(intervention_analyses),
             "files_created": [filename, analysis_filename] if analysis_filename else [filename],
             "timestamp": datetime.now().isoformat()
         })
         
+    except RequestEntityTooLarge as e:
+        logger.warning(f"拒絕過大的同步請求: {e.description}")
+        return jsonify({"error": "請求體過大"}), 413
     except Exception as e:
         logger.error(f"同步對話失敗: {e}")
         return jsonify({"error": f"同步失敗: {str(e)}"}), 500
@@ -267,16 +357,18 @@ def health_check():
         "service": "PowerAutomation EC2 API",
         "timestamp": datetime.now().isoformat(),
         "data_dir": DATA_DIR,
-        "logs_dir": LOGS_DIR
+        "logs_dir": LOGS_DIR,
+        "storage_backend": STORAGE_BACKEND
     })
 
 @app.route('/api/interventions/needed', methods=['GET'])
 def get_interventions_needed():
     """獲取需要介入的對話"""
     try:
-        conversations = storage.get_latest_conversations(100)
+        limit = request.args.get('limit', 100, type=int)
+        conversations = storage.get_interventions_needed(limit)
         
-        # 篩選需要介入的對話
+        # 整理需要介入的對話
         interventions_needed = []
         for conv in conversations:
             analysis = conv.get("intervention_analysis", {})
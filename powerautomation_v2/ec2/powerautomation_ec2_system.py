@@ -7,14 +7,28 @@ PowerAutomation EC2端核心系統
 import os
 import sys
 import json
+import shlex
 import sqlite3
 import subprocess
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 import argparse
 
+from remote_agent import RemoteAgentChannel, RemoteAgentError, ssh_worker_command
+
+# 部署時與本文件放在同一目錄；在源碼樹中位於 shared/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+try:
+    from intelligent_repository_selector import IntelligentRepositorySelector
+except ImportError:
+    IntelligentRepositorySelector = None
+
+# 同步策略優先級排序（數值越小越先處理）
+SYNC_PRIORITY_RANK = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
 class PowerAutomationEC2:
     def __init__(self):
         self.setup_logging()
@@ -29,6 +43,10 @@ class PowerAutomationEC2:
         self.logs_dir.mkdir(exist_ok=True)
         
         self.load_config()
+        self.remote_agent = None
+        self.repository_selector = IntelligentRepositorySelector() if IntelligentRepositorySelector else None
+        # 各倉庫最近一次提取/同步的耗時和結果
+        self.repository_timings = {}
         
     def setup_logging(self):
         logging.basicConfig(
@@ -51,6 +69,17 @@ class PowerAutomationEC2:
                 "password": "123456"
             },
             "trae_db_path": "/Users/alexchuang/Library/Application Support/Trae/User/workspaceStorage/f002a9b85f221075092022809f5a075f/state.vscdb",
+            "trae_scripts_dir": "/home/alexchuang/aiengine/trae/git/scripts",
+            "remote_agent": {
+                "enabled": True,
+                "max_workers": 4,
+                "timeout": 30
+            },
+            "fanout": {
+                "enabled": True,
+                "max_concurrency": 3,
+                "repo_timeout": 60
+            },
             "manus_url": "https://manus.im/app/ogbxIEerutqP7e4NgIB7oQ",
             "monitoring": {
                 "interval": 30,
@@ -71,8 +100,32 @@ class PowerAutomationEC2:
         with open(self.config_file, 'w', encoding='utf-8') as f:
             json.dump(self.config, f, indent=2, ensure_ascii=False)
             
+    def get_remote_agent(self):
+        """獲取常駐的遠程代理通道（首次調用時經SSH啟動Mac端worker）"""
+        if self.remote_agent is None:
+            agent_config = self.config.get("remote_agent", {})
+            self.remote_agent = RemoteAgentChannel(
+                ssh_worker_command(self.config["mac_ssh"], agent_config.get("max_workers", 4)),
+                default_timeout=agent_config.get("timeout", 30)
+            )
+        return self.remote_agent
+    
+    @staticmethod
+    def _command_result(result):
+        return {
+            "success": result["returncode"] == 0 and not result["timed_out"],
+            "stdout": result["stdout"],
+            "stderr": result["stderr"]
+        }
+    
     def ssh_execute(self, command):
         """通過SSH執行Mac端命令"""
+        if self.config.get("remote_agent", {}).get("enabled", True):
+            try:
+                return self._command_result(self.get_remote_agent().execute(["/bin/sh", "-c", command]))
+            except RemoteAgentError as e:
+                return {"success": False, "error": str(e)}
+        
         ssh_config = self.config["mac_ssh"]
         ssh_cmd = f"sshpass -p '{ssh_config['password']}' ssh -p {ssh_config['port']} -o StrictHostKeyChecking=no {ssh_config['user']}@{ssh_config['host']} '{command}'"
         
@@ -87,18 +140,156 @@ class PowerAutomationEC2:
             return {"success": False, "error": "SSH命令超時"}
         except Exception as e:
             return {"success": False, "error": str(e)}
+    
+    def run_trae_script(self, script_name, args, timeout=None):
+        """運行Mac端的TRAE腳本（經遠程代理時在常駐解釋器中fork執行）"""
+        scripts_dir = self.config.get("trae_scripts_dir", "/home/alexchuang/aiengine/trae/git/scripts")
+        script_path = f"{scripts_dir}/{script_name}"
+        
+        if self.config.get("remote_agent", {}).get("enabled", True):
+            try:
+                return self._command_result(self.get_remote_agent().run_script(script_path, args, timeout=timeout))
+            except RemoteAgentError as e:
+                return {"success": False, "error": str(e)}
+        
+        return self.ssh_execute(" ".join(["python3", script_path] + [shlex.quote(arg) for arg in args]))
             
+    def get_repository_order(self):
+        """
+        按同步策略排列倉庫：優先級高的、自動同步的倉庫先處理
+        
+        倉庫列表取自配置的 repositories，未配置時使用智能倉庫選擇器中的倉庫
+        """
+        repositories = self.config.get("repositories")
+        if not repositories:
+            if self.repository_selector is None:
+                return []
+            repositories = list(self.repository_selector.repositories.keys())
+        
+        if self.repository_selector is None:
+            return list(repositories)
+        
+        def sort_key(repo):
+            strategy = self.repository_selector.get_sync_strategy(repo)
+            repo_config = self.repository_selector.repositories.get(repo, {})
+            return (
+                SYNC_PRIORITY_RANK.get(strategy.get("priority"), len(SYNC_PRIORITY_RANK)),
+                not strategy.get("auto_sync", False),
+                repo_config.get("priority", len(self.repository_selector.repositories) + 1)
+            )
+        
+        return sorted(repositories, key=sort_key)
+    
+    def run_per_repository(self, script_name, repositories, extra_args=None, parse_json=False):
+        """
+        對每個倉庫併發運行一次TRAE腳本
+        
+        併發數有上限，按傳入順序提交；單個倉庫失敗或超時只影響它自己的結果
+        
+        Returns:
+            {倉庫名: 結果}，結果包含 success、duration，成功且parse_json時包含 data
+        """
+        fanout = self.config.get("fanout", {})
+        timeout = fanout.get("repo_timeout", 60)
+        max_workers = max(1, min(fanout.get("max_concurrency", 3), len(repositories)))
+        
+        def run(repo):
+            start = time.monotonic()
+            try:
+                result = self.run_trae_script(script_name, ["--repo", repo] + (extra_args or []), timeout=timeout)
+                if result["success"] and parse_json:
+                    result["data"] = json.loads(result["stdout"])
+            except json.JSONDecodeError:
+                result = {"success": False, "error": "數據格式錯誤"}
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            if not result["success"] and not result.get("error"):
+                result["error"] = (result.get("stderr") or "").strip()[-500:] or "腳本執行失敗或超時"
+            result["duration"] = round(time.monotonic() - start, 3)
+            return result
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trae-repo") as executor:
+            futures = {executor.submit(run, repo): repo for repo in repositories}
+            for future in as_completed(futures):
+                repo = futures[future]
+                result = future.result()
+                results[repo] = result
+                self.repository_timings[repo] = {
+                    "script": script_name,
+                    "success": result["success"],
+                    "duration": result["duration"],
+                    "finished_at": datetime.now().isoformat()
+                }
+                if not result["success"]:
+                    self.logger.warning(f"倉庫 {repo} 執行 {script_name} 失敗: {result['error']}")
+        
+        # 按提交順序返回
+        return {repo: results[repo] for repo in repositories}
+    
+    @staticmethod
+    def _summarize_repositories(results):
+        return {
+            repo: {key: value for key, value in result.items() if key not in ("data", "stdout")}
+            for repo, result in results.items()
+        }
+    
+    def _fanout_enabled(self):
+        return self.config.get("fanout", {}).get("enabled", True) and bool(self.get_repository_order())
+    
+    def extract_trae_history_parallel(self):
+        """按倉庫併發提取TRAE對話歷史，合併成功倉庫的結果"""
+        repositories = self.get_repository_order()
+        self.logger.info(f"開始併發提取TRAE歷史: {len(repositories)} 個倉庫")
+        
+        results = self.run_per_repository("extract_history.py", repositories, parse_json=True)
+        
+        history_data = []
+        for repo, result in results.items():
+            if not result["success"]:
+                continue
+            data = result["data"]
+            for conv in data if isinstance(data, list) else [data]:
+                if isinstance(conv, dict):
+                    conv.setdefault("repository", repo)
+                history_data.append(conv)
+        # 合併後按時間排序，最後一條仍是最新對話
+        history_data.sort(key=lambda conv: conv.get("timestamp", "") if isinstance(conv, dict) else "")
+        
+        failed = [repo for repo, result in results.items() if not result["success"]]
+        summary = self._summarize_repositories(results)
+        if len(failed) == len(results):
+            self.logger.error("所有倉庫的TRAE歷史提取均失敗")
+            return {"success": False, "error": "所有倉庫提取失敗", "repositories": summary}
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        history_file = self.data_dir / f"trae_history_{timestamp}.json"
+        with open(history_file, 'w', encoding='utf-8') as f:
+            json.dump(history_data, f, indent=2, ensure_ascii=False)
+        
+        self.logger.info(f"TRAE歷史已保存: {history_file} (失敗倉庫: {failed or '無'})")
+        return {
+            "success": True,
+            "partial": bool(failed),
+            "file": str(history_file),
+            "data": history_data,
+            "repositories": summary
+        }
+    
     def extract_trae_history(self, repository_name=None):
-        """提取TRAE對話歷史"""
+        """提取TRAE對話歷史（未指定倉庫時按倉庫併發提取）"""
+        if not repository_name and self._fanout_enabled():
+            return self.extract_trae_history_parallel()
+        
         self.logger.info(f"開始提取TRAE歷史: {repository_name or 'all'}")
         
-        # 構建提取命令
+        # 構建提取參數
         if repository_name:
-            command = f"python3 /home/alexchuang/aiengine/trae/git/scripts/extract_history.py --repo {repository_name}"
+            args = ["--repo", repository_name]
         else:
-            command = f"python3 /home/alexchuang/aiengine/trae/git/scripts/extract_history.py --all"
+            args = ["--all"]
             
-        result = self.ssh_execute(command)
+        result = self.run_trae_script("extract_history.py", args)
         
         if result["success"]:
             # 保存歷史到本地
@@ -123,8 +314,7 @@ class PowerAutomationEC2:
         """發送消息到TRAE"""
         self.logger.info(f"發送消息到TRAE: {repository_name}")
         
-        command = f"python3 /home/alexchuang/aiengine/trae/git/scripts/send_message.py --repo {repository_name} --message '{message}'"
-        result = self.ssh_execute(command)
+        result = self.run_trae_script("send_message.py", ["--repo", repository_name, "--message", message])
         
         if result["success"]:
             self.logger.info("消息發送成功")
@@ -141,11 +331,27 @@ class PowerAutomationEC2:
         return result
         
     def sync_repositories(self):
-        """同步Git倉庫"""
+        """同步Git倉庫（按倉庫併發同步，單個倉庫失敗不影響其他倉庫）"""
+        if self._fanout_enabled():
+            repositories = self.get_repository_order()
+            self.logger.info(f"開始併發同步Git倉庫: {len(repositories)} 個")
+            
+            results = self.run_per_repository("sync_repositories.py", repositories)
+            failed = [repo for repo, result in results.items() if not result["success"]]
+            if failed:
+                self.logger.error(f"倉庫同步失敗: {', '.join(failed)}")
+            else:
+                self.logger.info("倉庫同步成功")
+            return {
+                "success": not failed,
+                "partial": bool(failed) and len(failed) < len(results),
+                "failed": failed,
+                "repositories": self._summarize_repositories(results)
+            }
+        
         self.logger.info("開始同步Git倉庫")
         
-        command = "python3 /home/alexchuang/aiengine/trae/git/scripts/sync_repositories.py --all"
-        result = self.ssh_execute(command)
+        result = self.run_trae_script("sync_repositories.py", ["--all"])
         
         if result["success"]:
             self.logger.info("倉庫同步成功")
@@ -258,12 +464,17 @@ class PowerAutomationEC2:
             self.logger.info("監控已停止")
         except Exception as e:
             self.logger.error(f"監控錯誤: {e}")
+        finally:
+            if self.remote_agent is not None:
+                self.remote_agent.close()
             
     def get_status(self):
         """獲取系統狀態"""
         return {
             "timestamp": datetime.now().isoformat(),
             "config": self.config,
+            "remote_agent": self.remote_agent.get_stats() if self.remote_agent else None,
+            "repository_timings": self.repository_timings,
             "directories": {
                 "base": str(self.base_dir),
                 "data": str(self.data_dir),
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+PowerAutomation 遠程代理通道
+在Mac端常駐一個Python worker，經由一條複用的SSH連接以JSON Lines RPC通信；
+請求可以流水線發送並併發執行，省去每次操作的SSH握手和解釋器啟動開銷
+"""
+
+import json
+import os
+import shlex
+import itertools
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 在遠程主機上常駐運行的worker
+# 協議：每行一個請求 {"id", "method", "params"}，每行一個響應 {"id", "result"} 或 {"id", "error"}
+REMOTE_WORKER = r'''
+import io, itertools, json, os, queue, runpy, selectors, signal, socket, subprocess, sys, tempfile, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+out_lock = threading.Lock()
+stdout = sys.stdout
+
+def reply(message):
+    line = json.dumps(message, ensure_ascii=False)
+    with out_lock:
+        stdout.write(line + "\n")
+        stdout.flush()
+
+def exit_code(status):
+    if hasattr(os, "waitstatus_to_exitcode"):
+        return os.waitstatus_to_exitcode(status)
+    return -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+def run_child(request):
+    """fork出的子進程：輸出重定向到文件，在已啟動的解釋器中運行腳本，不返回"""
+    code = 1
+    try:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+        os.dup2(os.open(request["stdout"], os.O_WRONLY), 1)
+        os.dup2(os.open(request["stderr"], os.O_WRONLY), 2)
+        # 不把fork服務的控制連接等描述符留給腳本
+        os.closerange(3, os.sysconf("SC_OPEN_MAX") if hasattr(os, "sysconf") else 1024)
+        sys.stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False), encoding="utf-8")
+        sys.stderr = io.TextIOWrapper(io.FileIO(2, "w", closefd=False), encoding="utf-8")
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+        path = request["path"]
+        sys.argv = [path] + request.get("args", [])
+        sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+        runpy.run_path(path, run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+def serve_forks(sock):
+    """
+    fork服務進程（單線程）：按請求fork子進程運行腳本，回報 {"id", "pid"} 和 {"id", "returncode"}
+
+    worker有線程池，在多線程進程中fork不安全（macOS上尤其如此），所以由啟動時fork出的單線程進程負責fork
+    """
+    # 釋放RPC管道，worker退出後客戶端才能讀到EOF
+    null = os.open(os.devnull, os.O_RDWR)
+    os.dup2(null, 0)
+    os.dup2(null, 1)
+    os.close(null)
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_w, False)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.set_wakeup_fd(wake_w)
+
+    def send(message):
+        sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+    children = {}
+    buffer = b""
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
+    sel.register(wake_r, selectors.EVENT_READ)
+    while True:
+        for key, _ in sel.select():
+            if key.fileobj is not sock:
+                os.read(wake_r, 4096)
+                continue
+            data = sock.recv(65536)
+            if not data:
+                # worker已退出
+                for pid in children:
+                    os.kill(pid, signal.SIGKILL)
+                return
+            *lines, buffer = (buffer + data).split(b"\n")
+            for line in filter(None, lines):
+                request = json.loads(line)
+                try:
+                    pid = os.fork()
+                except OSError as e:
+                    send({"id": request["id"], "error": "fork失敗: %s" % e})
+                    continue
+                if pid == 0:
+                    run_child(request)
+                children[pid] = request["id"]
+                send({"id": request["id"], "pid": pid})
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            send({"id": children.pop(pid), "returncode": exit_code(status)})
+
+class ForkServer:
+    """worker端的fork服務客戶端"""
+
+    def __init__(self):
+        sock, server_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                sock.close()
+                serve_forks(server_sock)
+            finally:
+                os._exit(0)
+        server_sock.close()
+        self.sock = sock
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.waiting = {}
+        self.alive = True
+        threading.Thread(target=self.read_loop, daemon=True).start()
+
+    def read_loop(self):
+        for line in self.sock.makefile("r", encoding="utf-8"):
+            message = json.loads(line)
+            with self.lock:
+                replies = self.waiting.get(message["id"])
+            if replies is not None:
+                replies.put(message)
+        with self.lock:
+            self.alive = False
+            for replies in self.waiting.values():
+                replies.put({"error": "fork服務已退出"})
+
+    def run(self, params):
+        timeout = params.get("timeout", 30)
+        replies = queue.Queue()
+        paths = []
+        with self.lock:
+            request_id = next(self.ids)
+            self.waiting[request_id] = replies
+        try:
+            for suffix in (".out", ".err"):
+                fd, path = tempfile.mkstemp(prefix="pa-script-", suffix=suffix)
+                os.close(fd)
+                paths.append(path)
+            request = {"id": request_id, "path": params["path"], "args": params.get("args", []),
+                       "cwd": params.get("cwd"), "stdout": paths[0], "stderr": paths[1]}
+            with self.lock:
+                self.sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            started = replies.get()
+            if "error" in started:
+                raise RuntimeError(started["error"])
+
+            timed_out = False
+            try:
+                exited = replies.get(timeout=timeout)
+            except queue.Empty:
+                timed_out = True
+                try:
+                    os.kill(started["pid"], signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                exited = replies.get()
+            if "error" in exited:
+                raise RuntimeError(exited["error"])
+
+            output = []
+            for path in paths:
+                with open(path, "rb") as f:
+                    output.append(f.read().decode("utf-8", "replace"))
+            return {"returncode": exited["returncode"], "stdout": output[0], "stderr": output[1],
+                    "timed_out": timed_out}
+        finally:
+            with self.lock:
+                self.waiting.pop(request_id, None)
+            for path in paths:
+                os.unlink(path)
+
+def run_script(params):
+    """在fork出的子進程中運行Python腳本，複用已啟動的解釋器；不支持fork時以新解釋器運行"""
+    if fork_server is not None and fork_server.alive:
+        return fork_server.run(params)
+    return run_exec({"argv": [sys.executable, params["path"]] + params.get("args", []),
+                     "timeout": params.get("timeout", 30), "cwd": params.get("cwd")})
+
+def run_exec(params):
+    """運行外部命令（參數列表，不經過shell）"""
+    try:
+        result = subprocess.run(params["argv"], capture_output=True, text=True,
+                                timeout=params.get("timeout", 30), cwd=params.get("cwd"))
+        return {"returncode": result.returncode, "stdout": result.stdout,
+                "stderr": result.stderr, "timed_out": False}
+    except subprocess.TimeoutExpired as e:
+        # 超時時已讀取的輸出可能是bytes
+        text = lambda value: value.decode("utf-8", "replace") if isinstance(value, bytes) else (value or "")
+        return {"returncode": -9, "stdout": text(e.stdout), "stderr": text(e.stderr), "timed_out": True}
+
+METHODS = {
+    "ping": lambda params: {"pid": os.getpid(), "time": time.time()},
+    "exec": run_exec,
+    "run_script": run_script,
+}
+
+def handle(request):
+    try:
+        method = METHODS.get(request.get("method"))
+        if method is None:
+            raise ValueError("unknown method: %s" % request.get("method"))
+        reply({"id": request["id"], "result": method(request.get("params") or {})})
+    except Exception as e:
+        reply({"id": request.get("id"), "error": "%s: %s" % (type(e).__name__, e)})
+
+# fork服務必須在線程池啟動前創建
+fork_server = ForkServer() if hasattr(os, "fork") else None
+pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+for line in sys.stdin:
+    if line.strip():
+        pool.submit(handle, json.loads(line))
+pool.shutdown(wait=True)
+'''
+
+class RemoteAgentError(Exception):
+    """遠程代理調用失敗"""
+    pass
+
+def local_worker_command(max_workers: int = 4) -> List[str]:
+    """在本機子進程中運行worker（用於測試）"""
+    return [sys.executable, "-u", "-c", REMOTE_WORKER, str(max_workers)]
+
+def ssh_worker_command(ssh_config: Dict[str, Any], max_workers: int = 4,
+                       control_path: Optional[str] = None, python: str = "python3") -> List[str]:
+    """經由複用的SSH連接在遠程主機上運行worker"""
+    control_path = control_path or os.path.join(
+        "/tmp", f"pa-ssh-{ssh_config['user']}@{ssh_config['host']}-{ssh_config['port']}"
+    )
+    command = []
+    if ssh_config.get("password"):
+        command += ["sshpass", "-p", ssh_config["password"]]
+    command += [
+        "ssh",
+        "-p", str(ssh_config["port"]),
+        "-o", "StrictHostKeyChecking=no",
+        "-o", "ControlMaster=auto",
+        "-o", f"ControlPath={control_path}",
+        "-o", "ControlPersist=600",
+        "-o", "ServerAliveInterval=30",
+        f"{ssh_config['user']}@{ssh_config['host']}",
+        " ".join(shlex.quote(arg) for arg in [python, "-u", "-c", REMOTE_WORKER, str(max_workers)])
+    ]
+    return command
+
+class RemoteAgentChannel:
+    """
+    JSON Lines RPC客戶端
+
+    一個讀線程按請求ID分發響應，多個調用方可以同時發送請求；
+    worker退出後的下一次調用會自動重新啟動
+    """
+
+    def __init__(self, command: List[str], default_timeout: float = 30):
+        self.command = command
+        self.default_timeout = default_timeout
+        self.process: Optional[subprocess.Popen] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "restarts": 0
+        }
+
+    def _ensure_started(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+        if self.process is not None:
+            self.stats["restarts"] += 1
+        # 每個worker進程有自己的待響應表，舊進程退出時只讓它自己的請求失敗
+        self._pending = {}
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1
+        )
+        threading.Thread(target=self._read_loop, args=(self.process, self._pending), daemon=True).start()
+        logger.info(f"遠程代理已啟動 (pid {self.process.pid})")
+
+    def _read_loop(self, process: subprocess.Popen, pending: Dict[int, Future]):
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.warning(f"忽略無法解析的代理輸出: {line[:200]}")
+                continue
+            with self._lock:
+                future = pending.pop(message.get("id"), None)
+            if future is None:
+                continue
+            if "error" in message:
+                future.set_exception(RemoteAgentError(message["error"]))
+            else:
+                future.set_result(message.get("result"))
+
+        # worker退出，未完成的請求全部失敗
+        with self._lock:
+            orphaned = list(pending.values())
+            pending.clear()
+        for future in orphaned:
+            future.set_exception(RemoteAgentError("遠程代理連接已斷開"))
+
+    def submit(self, method: str, params: Optional[Dict] = None) -> Future:
+        """發送請求並立即返回Future（可流水線發送多個請求）"""
+        future: Future = Future()
+        with self._lock:
+            self._ensure_started()
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self.stats["requests"] += 1
+            try:
+                self.process.stdin.write(json.dumps(
+                    {"id": request_id, "method": method, "params": params or {}},
+                    ensure_ascii=False
+                ) + "\n")
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                self._pending.pop(request_id, None)
+                future.set_exception(RemoteAgentError(f"發送請求失敗: {e}"))
+        return future
+
+    def call(self, method: str, params: Optional[Dict] = None, timeout: Optional[float] = None) -> Any:
+        """同步調用"""
+        if timeout is None:
+            timeout = self.default_timeout
+        future = self.submit(method, params)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # 不再等待的請求移出待響應表，遲到的響應會被讀線程忽略
+            with self._lock:
+                for request_id, pending in list(self._pending.items()):
+                    if pending is future:
+                        del self._pending[request_id]
+                        break
+            self.stats["errors"] += 1
+            raise RemoteAgentError(f"遠程調用 {method} 超時")
+        except RemoteAgentError:
+            self.stats["errors"] += 1
+            raise
+
+    def run_script(self, path: str, args: Optional[List[str]] = None, timeout: Optional[float] = None) -> Dict:
+        """在遠程worker中運行Python腳本"""
+        if timeout is None:
+            timeout = self.default_timeout
+        # 本地等待略長於遠程超時，讓worker先終止子進程並返回輸出
+        return self.call("run_script", {"path": path, "args": args or [], "timeout": timeout},
+                         timeout=timeout + 5)
+
+    def execute(self, argv: List[str], timeout: Optional[float] = None) -> Dict:
+        """在遠程worker中運行外部命令"""
+        if timeout is None:
+            timeout = self.default_timeout
+        return self.call("exec", {"argv": argv, "timeout": timeout}, timeout=timeout + 5)
+
+    def close(self):
+        """關閉worker"""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.process = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "running": self.process is not None and self.process.poll() is None,
+            "pending": len(self._pending)
+        }
@@ -8,6 +8,7 @@ import asyncio
 import json
 import time
 import os
+import sys
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
@@ -16,6 +17,11 @@ from pathlib import Path
 from playwright.async_api import async_playwright, Page, Browser, BrowserContext
 import re
 
+# 添加共享模組路徑
+sys.path.append(str(Path(__file__).parent.parent / "shared"))
+
+from manus_message_identity import IncrementalMessageParser, message_fingerprint, new_messages
+
 @dataclass
 class ConversationMessage:
     """對話消息數據結構"""
@@ -59,6 +65,7 @@ class ManusPlaywrightOperator:
         self.conversations = []
         self.tasks = []
         self.monitoring_active = False
+        self.message_parser = IncrementalMessageParser(self._message_from_snapshot, logger=self.logger)
         
         # 選擇器配置
         self.selectors = {
@@ -418,70 +425,57 @@ class ManusPlaywrightOperator:
             pass
     
     async def _find_all_messages(self) -> List[ConversationMessage]:
-        """查找所有消息"""
-        messages = []
-        
-        # 查找消息項目
-        message_elements = await self._find_elements(self.selectors['message_item'])
-        
-        self.logger.info(f"找到 {len(message_elements)} 個消息元素")
-        
-        for i, element in enumerate(message_elements):
-            try:
-                message = await self._parse_message_element(element, i)
-                if message:
-                    messages.append(message)
-            except Exception as e:
-                self.logger.error(f"解析消息 {i} 失敗: {e}")
-        
+        """查找所有消息（一次頁面調用取得所有消息節點，只解析之前沒見過的節點）"""
+        messages = await self.message_parser.collect(self.page, self.selectors['message_item'], {
+            'content': self.selectors['message_content'],
+            'sender': self.selectors['message_sender'],
+            'time': self.selectors['message_timestamp'],
+            'attachments': True
+        })
+        
+        self.logger.info(f"找到 {len(messages)} 個消息元素")
         return messages
     
-    async def _parse_message_element(self, element, index: int) -> Optional[ConversationMessage]:
-        """解析消息元素"""
-        try:
-            # 提取內容
-            content = await self._extract_text_from_element(element, self.selectors['message_content'])
-            if not content:
-                content = await element.inner_text()
-            
-            # 提取發送者
-            sender = await self._extract_text_from_element(element, self.selectors['message_sender'])
-            if not sender:
-                # 嘗試從CSS類名判斷
-                class_name = await element.get_attribute('class') or ""
-                if 'user' in class_name.lower():
-                    sender = 'user'
-                elif 'assistant' in class_name.lower() or 'ai' in class_name.lower():
-                    sender = 'assistant'
-                else:
-                    sender = 'unknown'
-            
-            # 提取時間戳
-            timestamp = await self._extract_timestamp_from_element(element)
-            
-            # 檢查附件
-            attachments = await self._extract_attachments_from_element(element)
-            
-            # 生成消息ID
-            message_id = f"msg_{index}_{int(timestamp.timestamp())}"
-            
-            return ConversationMessage(
-                id=message_id,
-                content=content.strip() if content else "",
-                sender=sender,
-                timestamp=timestamp,
-                message_type=self._determine_message_type(content, sender),
-                conversation_id="main",
-                attachments=attachments,
-                metadata={
-                    'index': index,
-                    'element_html': await element.inner_html()
-                }
-            )
-            
-        except Exception as e:
-            self.logger.error(f"解析消息元素失敗: {e}")
-            return None
+    def _message_from_snapshot(self, snapshot: Dict[str, Any]) -> Optional[ConversationMessage]:
+        """
+        把頁面端提取的消息字段轉換為ConversationMessage
+        
+        消息ID由發送者、內容和時間屬性的哈希生成，同一條消息在重新渲染或列表位置變化後ID不變
+        """
+        content = (snapshot.get('content') or snapshot.get('text') or "").strip()
+        
+        sender = snapshot.get('sender')
+        if not sender:
+            # 嘗試從CSS類名判斷
+            class_name = (snapshot.get('className') or "").lower()
+            if 'user' in class_name:
+                sender = 'user'
+            elif 'assistant' in class_name or 'ai' in class_name:
+                sender = 'assistant'
+            else:
+                sender = 'unknown'
+        
+        # 提取時間戳，沒有時使用當前時間
+        timestamp = None
+        for time_str in (snapshot.get('timeAttr'), snapshot.get('timeText')):
+            if time_str:
+                timestamp = self._parse_timestamp(time_str)
+                if timestamp:
+                    break
+        
+        return ConversationMessage(
+            id=f"msg_{message_fingerprint(sender, content, snapshot.get('timeAttr'))}",
+            content=content,
+            sender=sender,
+            timestamp=timestamp or datetime.now(),
+            message_type=self._determine_message_type(content, sender),
+            conversation_id="main",
+            attachments=snapshot.get('attachments') or [],
+            metadata={
+                'key': snapshot['key'],
+                'element_html': snapshot.get('html', "")
+            }
+        )
     
     async def _extract_text_from_element(self, element, selectors: List[str]) -> Optional[str]:
         """從元素中提取文本"""
@@ -496,33 +490,6 @@ class ManusPlaywrightOperator:
                 continue
         return None
     
-    async def _extract_timestamp_from_element(self, element) -> datetime:
-        """從元素中提取時間戳"""
-        # 嘗試從時間戳選擇器提取
-        for selector in self.selectors['message_timestamp']:
-            try:
-                time_element = await element.query_selector(selector)
-                if time_element:
-                    # 嘗試從屬性獲取
-                    for attr in ['datetime', 'data-time', 'title', 'data-timestamp']:
-                        time_str = await time_element.get_attribute(attr)
-                        if time_str:
-                            parsed_time = self._parse_timestamp(time_str)
-                            if parsed_time:
-                                return parsed_time
-                    
-                    # 嘗試從文本獲取
-                    text = await time_element.inner_text()
-                    if text:
-                        parsed_time = self._parse_timestamp(text)
-                        if parsed_time:
-                            return parsed_time
-            except:
-                continue
-        
-        # 如果沒找到，返回當前時間
-        return datetime.now()
-    
     def _parse_timestamp(self, time_str: str) -> Optional[datetime]:
         """解析時間戳字符串"""
         try:
@@ -548,37 +515,6 @@ class ManusPlaywrightOperator:
         except:
             return None
     
-    async def _extract_attachments_from_element(self, element) -> List[str]:
-        """從元素中提取附件"""
-        attachments = []
-        
-        try:
-            # 查找圖片
-            images = await element.query_selector_all('img')
-            for img in images:
-                src = await img.get_attribute('src')
-                if src:
-                    attachments.append(f"image:{src}")
-            
-            # 查找鏈接
-            links = await element.query_selector_all('a[href]')
-            for link in links:
-                href = await link.get_attribute('href')
-                if href and href.startswith('http'):
-                    attachments.append(f"link:{href}")
-            
-            # 查找文件
-            files = await element.query_selector_all('[data-file], .file, .attachment')
-            for file_elem in files:
-                file_url = await file_elem.get_attribute('data-file') or await file_elem.get_attribute('href')
-                if file_url:
-                    attachments.append(f"file:{file_url}")
-        
-        except Exception as e:
-            self.logger.debug(f"提取附件失敗: {e}")
-        
-        return attachments
-    
     def _determine_message_type(self, content: str, sender: str) -> str:
         """判斷消息類型"""
         if not content:
@@ -929,19 +865,17 @@ class ManusPlaywrightOperator:
         """智能自動回覆"""
         self.logger.info("🤖 開始智能自動回覆監控...")
         
-        last_message_count = 0
+        seen_message_ids = set()
         
         while self.monitoring_active:
             try:
                 # 獲取最新消息
                 messages = await self.extract_conversation_history()
-                current_message_count = len(messages)
                 
-                if current_message_count > last_message_count:
-                    # 檢查新消息
-                    new_messages = messages[last_message_count:]
-                    
-                    for message in new_messages:
+                # 按消息ID檢查新消息
+                fresh_messages = new_messages(messages, seen_message_ids)
+                if fresh_messages:
+                    for message in fresh_messages:
                         if message.sender == 'user':  # 只處理用戶消息
                             content_lower = message.content.lower()
                             
@@ -961,8 +895,6 @@ class ManusPlaywrightOperator:
                                     await asyncio.sleep(2)  # 稍等一下再回覆
                                     await self.send_message(reply)
                                     break
-                    
-                    last_message_count = current_message_count
                 
                 await asyncio.sleep(10)  # 每10秒檢查一次
                 
@@ -994,6 +926,7 @@ class ManusPlaywrightOperator:
         return {
             'conversations_count': len(self.conversations),
             'tasks_count': len(self.tasks),
+            'message_parser': self.message_parser.get_stats(),
             'monitoring_active': self.monitoring_active,
             'manus_url': self.manus_url,
             'last_update': datetime.now().isoformat()
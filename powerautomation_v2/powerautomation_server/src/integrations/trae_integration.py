@@ -4,149 +4,170 @@ TRAE集成模塊
 """
 
 import subprocess
+import shutil
 import json
 import logging
 import os
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable
 from datetime import datetime
 
+from .trae_jobs import TraeJobManager, TraeJob, JobQueueFullError
+
 logger = logging.getLogger(__name__)
 
 class TraeIntegration:
     """TRAE集成類"""
     
-    def __init__(self):
-        self.trae_available = self._check_trae_availability()
+    # 各類命令的執行超時（秒）
+    SEND_TIMEOUT = 30
+    SYNC_TIMEOUT = 60
+    
+    def __init__(self, job_manager: Optional[TraeJobManager] = None):
+        self._trae_available: Optional[bool] = None
+        self.jobs = job_manager or TraeJobManager()
+        
+    @property
+    def trae_available(self) -> bool:
+        """TRAE是否可用（首次訪問時檢查並緩存）"""
+        if self._trae_available is None:
+            self._trae_available = self._check_trae_availability()
+        return self._trae_available
         
     def _check_trae_availability(self) -> bool:
         """檢查TRAE是否可用"""
         try:
-            result = subprocess.run(['which', 'trae'], 
-                                  capture_output=True, text=True, timeout=5)
-            return result.returncode == 0
+            return shutil.which('trae') is not None
         except Exception as e:
             logger.warning(f"檢查TRAE可用性失敗: {e}")
             return False
     
+    def submit_send_message(self, message: str, repository: Optional[str] = None,
+                            on_complete: Optional[Callable[[TraeJob], None]] = None) -> TraeJob:
+        """提交發送消息任務，立即返回任務"""
+        job = TraeJob(
+            kind='send',
+            argv=['trae', '-'],
+            params={'message': message, 'repository': repository},
+            timeout=self.SEND_TIMEOUT,
+            stdin_data=message + '\n',
+            finalize=self._finalize_send
+        )
+        return self.jobs.submit(job, on_complete)
+    
+    def submit_sync_repository(self, repository: Optional[str] = None, force: bool = False,
+                               on_complete: Optional[Callable[[TraeJob], None]] = None) -> TraeJob:
+        """
+        提交同步任務，立即返回任務
+        
+        同一倉庫已有同步在排隊或運行時合併到該任務；
+        強制同步只合併到強制同步，普通同步可以合併到任意一種
+        """
+        key = f"sync:{repository or '*'}"
+        if not force:
+            active = self.jobs.join(f"{key}:force", on_complete)
+            if active is not None:
+                return active
+        
+        cmd = ['trae', 'sync']
+        if force:
+            cmd.append('--force')
+        if repository:
+            cmd.extend(['--repository', repository])
+        
+        job = TraeJob(
+            kind='sync',
+            argv=cmd,
+            params={'repository': repository, 'force': force},
+            timeout=self.SYNC_TIMEOUT,
+            coalesce_key=f"{key}:force" if force else key,
+            finalize=self._finalize_sync
+        )
+        return self.jobs.submit(job, on_complete)
+    
+    def _unavailable_result(self, **params) -> Dict[str, Any]:
+        return {'success': False, 'error': 'TRAE命令不可用', **params}
+    
+    def _job_error_result(self, job: TraeJob, **params) -> Dict[str, Any]:
+        return {'success': False, 'error': job.error, **params}
+    
+    def _finalize_send(self, job: TraeJob) -> Dict[str, Any]:
+        message, repository = job.params['message'], job.params['repository']
+        if job.return_code is None:
+            logger.error(f"TRAE發送消息時出錯: {job.error}")
+            return self._job_error_result(job, message=message)
+        
+        success = job.status == TraeJob.SUCCEEDED
+        if success:
+            logger.info(f"TRAE消息發送成功: {message[:50]}...")
+        else:
+            logger.error(f"TRAE消息發送失敗: {job.stderr}")
+        
+        return {
+            'success': success,
+            'message': message,
+            'repository': repository,
+            'stdout': job.stdout,
+            'stderr': job.stderr,
+            'return_code': job.return_code,
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def _finalize_sync(self, job: TraeJob) -> Dict[str, Any]:
+        repository, force = job.params['repository'], job.params['force']
+        if job.return_code is None:
+            logger.error(f"TRAE同步時出錯: {job.error}")
+            return self._job_error_result(job)
+        
+        success = job.status == TraeJob.SUCCEEDED
+        sync_result = {
+            'success': success,
+            'repository': repository,
+            'force': force,
+            'stdout': job.stdout,
+            'stderr': job.stderr,
+            'return_code': job.return_code,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        if success:
+            logger.info(f"TRAE同步成功: 倉庫={repository}")
+            # 嘗試解析同步結果
+            try:
+                if job.stdout:
+                    sync_result['parsed_output'] = self._parse_sync_output(job.stdout)
+            except Exception as e:
+                logger.warning(f"解析同步輸出失敗: {e}")
+        else:
+            logger.error(f"TRAE同步失敗: {job.stderr}")
+        
+        return sync_result
+    
     def send_message(self, message: str, repository: Optional[str] = None) -> Dict[str, Any]:
-        """通過TRAE發送消息"""
+        """通過TRAE發送消息（提交到任務池並等待結果）"""
+        if not self.trae_available:
+            return self._unavailable_result(message=message)
+        
         try:
-            if not self.trae_available:
-                return {
-                    'success': False,
-                    'error': 'TRAE命令不可用',
-                    'message': message
-                }
-            
-            # 構建TRAE命令
-            cmd = ['echo', message]
-            trae_cmd = ['trae', '-']
-            
-            # 執行命令
-            echo_process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-            trae_process = subprocess.Popen(trae_cmd, 
-                                          stdin=echo_process.stdout,
-                                          stdout=subprocess.PIPE,
-                                          stderr=subprocess.PIPE,
-                                          text=True)
-            echo_process.stdout.close()
-            
-            stdout, stderr = trae_process.communicate(timeout=30)
-            
-            success = trae_process.returncode == 0
-            
-            result = {
-                'success': success,
-                'message': message,
-                'repository': repository,
-                'stdout': stdout,
-                'stderr': stderr,
-                'return_code': trae_process.returncode,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            if success:
-                logger.info(f"TRAE消息發送成功: {message[:50]}...")
-            else:
-                logger.error(f"TRAE消息發送失敗: {stderr}")
-            
-            return result
-            
-        except subprocess.TimeoutExpired:
-            logger.error("TRAE命令執行超時")
-            return {
-                'success': False,
-                'error': 'TRAE命令執行超時',
-                'message': message
-            }
-        except Exception as e:
-            logger.error(f"TRAE發送消息時出錯: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'message': message
-            }
+            job = self.submit_send_message(message, repository)
+        except JobQueueFullError as e:
+            return {'success': False, 'error': str(e), 'message': message}
+        
+        job.wait()
+        # 整理結果失敗時job.result為None
+        return job.result or self._job_error_result(job, message=message)
     
     def sync_repository(self, repository: Optional[str] = None, force: bool = False) -> Dict[str, Any]:
-        """同步TRAE倉庫數據"""
+        """同步TRAE倉庫數據（提交到任務池並等待結果）"""
+        if not self.trae_available:
+            return self._unavailable_result()
+        
         try:
-            if not self.trae_available:
-                return {
-                    'success': False,
-                    'error': 'TRAE命令不可用'
-                }
-            
-            # 構建同步命令
-            cmd = ['trae', 'sync']
-            if force:
-                cmd.append('--force')
-            if repository:
-                cmd.extend(['--repository', repository])
-            
-            # 執行命令
-            result = subprocess.run(cmd, 
-                                  capture_output=True, 
-                                  text=True, 
-                                  timeout=60)
-            
-            success = result.returncode == 0
-            
-            sync_result = {
-                'success': success,
-                'repository': repository,
-                'force': force,
-                'stdout': result.stdout,
-                'stderr': result.stderr,
-                'return_code': result.returncode,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            if success:
-                logger.info(f"TRAE同步成功: 倉庫={repository}")
-                # 嘗試解析同步結果
-                try:
-                    if result.stdout:
-                        # 這裡可以添加解析邏輯
-                        sync_result['parsed_output'] = self._parse_sync_output(result.stdout)
-                except Exception as e:
-                    logger.warning(f"解析同步輸出失敗: {e}")
-            else:
-                logger.error(f"TRAE同步失敗: {result.stderr}")
-            
-            return sync_result
-            
-        except subprocess.TimeoutExpired:
-            logger.error("TRAE同步命令執行超時")
-            return {
-                'success': False,
-                'error': 'TRAE同步命令執行超時'
-            }
-        except Exception as e:
-            logger.error(f"TRAE同步時出錯: {e}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            job = self.submit_sync_repository(repository, force)
+        except JobQueueFullError as e:
+            return {'success': False, 'error': str(e)}
+        
+        job.wait()
+        return job.result or self._job_error_result(job)
     
     def _parse_sync_output(self, output: str) -> Dict[str, Any]:
         """解析同步輸出"""
@@ -181,6 +202,7 @@ class TraeIntegration:
         try:
             status = {
                 'available': self.trae_available,
+                'jobs': self.jobs.get_stats(),
                 'timestamp': datetime.now().isoformat()
             }
             
@@ -0,0 +1,268 @@
+"""
+TRAE異步任務模塊
+TRAE命令在後台事件循環的有界異步子進程池中排隊執行，
+HTTP請求只提交任務並立即返回任務ID，結果通過狀態接口輪詢
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+class JobQueueFullError(Exception):
+    """任務隊列已滿"""
+    pass
+
+class TraeJob:
+    """單個TRAE命令任務"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    TIMEOUT = 'timeout'
+
+    def __init__(self, kind: str, argv: List[str], params: Dict[str, Any], timeout: float,
+                 stdin_data: Optional[str] = None, coalesce_key: Optional[str] = None,
+                 finalize: Optional[Callable[['TraeJob'], Dict[str, Any]]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.argv = argv
+        self.params = params
+        self.timeout = timeout
+        self.stdin_data = stdin_data
+        self.coalesce_key = coalesce_key
+        self.finalize = finalize
+
+        self.status = self.QUEUED
+        self.created_at = datetime.now().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.finished_monotonic: Optional[float] = None
+        self.return_code: Optional[int] = None
+        self.stdout = ''
+        self.stderr = ''
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.coalesced_requests = 0
+        self.callbacks: List[Callable[['TraeJob'], None]] = []
+        self.done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        """結果已整理完畢（狀態先於結果更新，因此以完成事件為準）"""
+        return self.done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """阻塞等待任務結束"""
+        return self.done.wait(timeout)
+
+    def to_dict(self, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'params': self.params,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'coalesced_requests': self.coalesced_requests
+        }
+        if self.error:
+            data['error'] = self.error
+        if include_result:
+            data['result'] = self.result
+        return data
+
+class TraeJobManager:
+    """
+    TRAE命令任務管理器
+
+    後台線程運行一個asyncio事件循環，固定數量的worker協程從隊列取任務，
+    以asyncio子進程執行，不佔用Flask的請求線程；
+    帶相同coalesce_key的任務在排隊或運行期間只執行一次
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue_size: int = 100, job_ttl: float = 3600):
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.job_ttl = job_ttl
+
+        self.jobs: Dict[str, TraeJob] = {}
+        self._active_by_key: Dict[str, TraeJob] = {}
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._started = threading.Event()
+
+        self.stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'rejected': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'timeout': 0
+        }
+
+    def _ensure_loop(self):
+        """首次提交任務時啟動後台事件循環"""
+        if self._loop is not None:
+            return
+        threading.Thread(target=self._run_loop, name='trae-jobs', daemon=True).start()
+        self._started.wait()
+
+    def _run_loop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._queue = asyncio.Queue()
+        for index in range(self.max_concurrency):
+            loop.create_task(self._worker(index))
+        self._loop = loop
+        self._started.set()
+        loop.run_forever()
+
+    def submit(self, job: TraeJob, on_complete: Optional[Callable[[TraeJob], None]] = None) -> TraeJob:
+        """
+        提交任務
+
+        Returns:
+            新任務；若已有相同coalesce_key的任務在排隊或運行，返回該任務
+
+        Raises:
+            JobQueueFullError: 排隊任務數已達上限
+        """
+        with self._lock:
+            self._ensure_loop()
+            self._prune()
+
+            existing = self._join(job.coalesce_key, on_complete) if job.coalesce_key else None
+            if existing is not None:
+                return existing
+
+            if self._queued >= self.max_queue_size:
+                self.stats['rejected'] += 1
+                raise JobQueueFullError(f"TRAE任務隊列已滿 ({self.max_queue_size})")
+
+            if on_complete:
+                job.callbacks.append(on_complete)
+            self.jobs[job.id] = job
+            if job.coalesce_key:
+                self._active_by_key[job.coalesce_key] = job
+            self._queued += 1
+            self.stats['submitted'] += 1
+
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job)
+        return job
+
+    def join(self, coalesce_key: str, on_complete: Optional[Callable[[TraeJob], None]] = None) -> Optional[TraeJob]:
+        """合併到排隊或運行中的同鍵任務，沒有時返回None"""
+        with self._lock:
+            return self._join(coalesce_key, on_complete)
+
+    def _join(self, coalesce_key: str, on_complete: Optional[Callable[[TraeJob], None]]) -> Optional[TraeJob]:
+        existing = self._active_by_key.get(coalesce_key)
+        if existing is not None:
+            existing.coalesced_requests += 1
+            if on_complete:
+                existing.callbacks.append(on_complete)
+            self.stats['coalesced'] += 1
+        return existing
+
+    def get(self, job_id: str) -> Optional[TraeJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _prune(self):
+        """清理超過保留時間的已結束任務（調用方持有鎖）"""
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished and now - job.finished_monotonic > self.job_ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            with self._lock:
+                self._queued -= 1
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"TRAE任務 {job.id} 執行出錯: {e}")
+                job.status = TraeJob.FAILED
+                job.error = str(e)
+            finally:
+                self._complete(job)
+
+    async def _run(self, job: TraeJob):
+        job.status = TraeJob.RUNNING
+        job.started_at = datetime.now().isoformat()
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *job.argv,
+                stdin=asyncio.subprocess.PIPE if job.stdin_data is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except OSError as e:
+            job.status = TraeJob.FAILED
+            job.error = str(e)
+            return
+
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(job.stdin_data.encode('utf-8') if job.stdin_data is not None else None),
+                timeout=job.timeout
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            job.status = TraeJob.TIMEOUT
+            job.error = f"TRAE命令執行超時 ({job.timeout}秒)"
+            return
+
+        job.return_code = process.returncode
+        job.stdout = stdout.decode('utf-8', 'replace')
+        job.stderr = stderr.decode('utf-8', 'replace')
+        job.status = TraeJob.SUCCEEDED if process.returncode == 0 else TraeJob.FAILED
+
+    def _complete(self, job: TraeJob):
+        if job.finalize:
+            try:
+                job.result = job.finalize(job)
+            except Exception as e:
+                logger.warning(f"整理TRAE任務 {job.id} 結果失敗: {e}")
+                job.error = job.error or f"整理任務結果失敗: {e}"
+
+        job.finished_at = datetime.now().isoformat()
+        job.finished_monotonic = time.monotonic()
+        with self._lock:
+            if job.coalesce_key and self._active_by_key.get(job.coalesce_key) is job:
+                del self._active_by_key[job.coalesce_key]
+            self.stats[job.status] += 1
+        job.done.set()
+
+        for callback in job.callbacks:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.warning(f"TRAE任務回調失敗: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = sum(1 for job in self.jobs.values() if job.status == TraeJob.RUNNING)
+            return {
+                **self.stats,
+                'queued': self._queued,
+                'running': running,
+                'tracked_jobs': len(self.jobs),
+                'max_concurrency': self.max_concurrency,
+                'max_queue_size': self.max_queue_size
+            }
@@ -52,6 +52,8 @@ def serve(path):
                     'stop': '/api/powerautomation/stop',
                     'trae_send': '/api/powerautomation/trae/send',
                     'trae_sync': '/api/powerautomation/trae/sync',
+                    'trae_job_status': '/api/powerautomation/trae/jobs/<job_id>',
+                    'trae_job_result': '/api/powerautomation/trae/jobs/<job_id>/result',
                     'manus_connect': '/api/powerautomation/manus/connect',
                     'manus_tasks': '/api/powerautomation/manus/tasks',
                     'analyze': '/api/powerautomation/analyze',
@@ -86,6 +88,8 @@ def api_info():
                 'stop': 'POST /api/powerautomation/stop',
                 'trae_send': 'POST /api/powerautomation/trae/send',
                 'trae_sync': 'POST /api/powerautomation/trae/sync',
+                'trae_job_status': 'GET /api/powerautomation/trae/jobs/<job_id>',
+                'trae_job_result': 'GET /api/powerautomation/trae/jobs/<job_id>/result',
                 'manus_connect': 'POST /api/powerautomation/manus/connect',
                 'manus_tasks': 'GET /api/powerautomation/manus/tasks',
                 'analyze': 'POST /api/powerautomation/analyze',
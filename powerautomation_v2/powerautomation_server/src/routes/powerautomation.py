@@ -16,9 +16,13 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'shared'))
 # 導入集成模塊
 try:
     from src.integrations.trae_integration import trae_integration
+    from src.integrations.trae_jobs import JobQueueFullError
 except ImportError:
     trae_integration = None
     logging.warning("TRAE集成模塊導入失敗")
+    
+    class JobQueueFullError(Exception):
+        pass
 
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
@@ -189,16 +193,17 @@ def trae_send():
         
         logger.info(f"TRAE發送消息: {message[:50]}... (倉庫: {repository})")
         
-        # 使用TRAE集成發送消息
-        result = trae_integration.send_message(message, repository)
+        if not trae_integration.trae_available:
+            return jsonify({'success': False, 'error': 'TRAE命令不可用', 'message': message}), 500
         
-        # 更新統計
-        if result.get('success'):
-            system_status['stats']['messages_processed'] += 1
+        # 提交到TRAE任務池，立即返回任務ID
+        job = trae_integration.submit_send_message(message, repository, on_complete=_count_sent_message)
         system_status['last_activity'] = datetime.now().isoformat()
         
-        return jsonify(result), 200 if result.get('success') else 500
+        return _job_accepted(job)
         
+    except JobQueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         logger.error(f"TRAE發送失敗: {e}")
         return jsonify({
@@ -222,13 +227,17 @@ def trae_sync():
         
         logger.info(f"TRAE同步數據: 倉庫={repository}, 強制={force}")
         
-        # 使用TRAE集成同步數據
-        result = trae_integration.sync_repository(repository, force)
+        if not trae_integration.trae_available:
+            return jsonify({'success': False, 'error': 'TRAE命令不可用'}), 500
         
+        # 提交到TRAE任務池；同一倉庫正在同步時合併到已有任務
+        job = trae_integration.submit_sync_repository(repository, force)
         system_status['last_activity'] = datetime.now().isoformat()
         
-        return jsonify(result), 200 if result.get('success') else 500
+        return _job_accepted(job)
         
+    except JobQueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         logger.error(f"TRAE同步失敗: {e}")
         return jsonify({
@@ -236,6 +245,53 @@ def trae_sync():
             'error': str(e)
         }), 500
 
+def _count_sent_message(job):
+    """發送任務完成後更新統計"""
+    if job.result and job.result.get('success'):
+        system_status['stats']['messages_processed'] += 1
+
+def _job_accepted(job):
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'coalesced': job.coalesced_requests > 0,
+        'status_url': f"/api/powerautomation/trae/jobs/{job.id}",
+        'result_url': f"/api/powerautomation/trae/jobs/{job.id}/result"
+    }), 202
+
+@powerautomation_bp.route('/trae/jobs/<job_id>', methods=['GET'])
+def trae_job_status(job_id):
+    """獲取TRAE任務狀態"""
+    if not trae_integration:
+        return jsonify({'success': False, 'error': 'TRAE集成模塊不可用'}), 500
+    
+    job = trae_integration.jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '任務不存在或已過期'}), 404
+    
+    return jsonify({'success': True, 'job': job.to_dict()}), 200
+
+@powerautomation_bp.route('/trae/jobs/<job_id>/result', methods=['GET'])
+def trae_job_result(job_id):
+    """獲取TRAE任務結果；可用wait參數(秒，最多30)等待任務結束"""
+    if not trae_integration:
+        return jsonify({'success': False, 'error': 'TRAE集成模塊不可用'}), 500
+    
+    job = trae_integration.jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '任務不存在或已過期'}), 404
+    
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 30)
+    if wait and not job.finished:
+        job.wait(wait)
+    
+    if not job.finished:
+        return jsonify({'success': True, 'job': job.to_dict()}), 202
+    
+    result = job.result or {'success': False, 'error': job.error}
+    return jsonify({**result, 'job': job.to_dict()}), 200 if result.get('success') else 500
+
 @powerautomation_bp.route('/trae/status', methods=['GET'])
 def trae_status():
     """獲取TRAE狀態"""
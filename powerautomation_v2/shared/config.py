@@ -23,6 +23,8 @@ class SystemConfig:
     # Manus平台設置
     manus_base_url: str = "https://manus.chat"
     manus_check_interval: int = 10  # 檢查間隔（秒）
+    manus_event_driven: bool = True  # 頁面推送新消息，關閉時回退到定時輪詢
+    manus_resync_interval: int = 300  # 推送模式下完整同步的間隔（秒）
     
     # TRAE設置
     trae_api_url: str = "http://localhost:8080/api"
@@ -66,6 +68,8 @@ class SystemConfig:
             'max_response_delay': self.max_response_delay,
             'manus_base_url': self.manus_base_url,
             'manus_check_interval': self.manus_check_interval,
+            'manus_event_driven': self.manus_event_driven,
+            'manus_resync_interval': self.manus_resync_interval,
             'trae_api_url': self.trae_api_url,
             'trae_model': self.trae_model,
             'trae_max_tokens': self.trae_max_tokens,
@@ -16,6 +16,8 @@ import argparse
 # 導入自定義模組
 from config import SystemConfig
 from manus_operator import ManusOperator, ManusMessage
+from manus_message_identity import new_messages as select_new_messages
+from manus_message_watcher import merge_pushed_messages
 from trae_database import TraeDatabase, TraeConversation
 
 class IntelligentInterventionSystem:
@@ -162,25 +164,27 @@ class IntelligentInterventionSystem:
         """監控對話"""
         self.logger.info("💬 開始對話監控...")
         
-        last_message_count = 0
+        if self.config.manus_event_driven:
+            await self._watch_conversations()
+            return
+        
+        seen_message_ids = set()
         last_check_time = datetime.now()
         
         while self.is_running:
             try:
                 # 獲取最新對話
                 messages = await self.manus_operator.get_conversation_history()
-                current_message_count = len(messages)
                 
-                # 檢查新消息
-                if current_message_count > last_message_count:
-                    new_messages = messages[last_message_count:]
+                # 按消息ID檢查新消息，列表滾動或重新渲染不會造成重複或遺漏
+                new_messages = select_new_messages(messages, seen_message_ids)
+                if new_messages:
                     self.logger.info(f"🆕 檢測到 {len(new_messages)} 條新消息")
                     
                     # 分析每條新消息
                     for message in new_messages:
                         await self._analyze_message(message, messages)
                     
-                    last_message_count = current_message_count
                     self.performance_stats['messages_monitored'] += len(new_messages)
                 
                 # 檢查響應延遲
@@ -193,6 +197,50 @@ class IntelligentInterventionSystem:
                 self.logger.error(f"對話監控錯誤: {e}")
                 await asyncio.sleep(30)
     
+    async def _watch_conversations(self):
+        """推送模式的對話監控：頁面推送新消息，序號不連續、頁面重載或定期時完整同步"""
+        messages: List[ManusMessage] = []
+        seen_message_ids = set()
+        last_check_time = datetime.now()
+        watcher = None
+        
+        while self.is_running:
+            try:
+                watcher = watcher or await self.manus_operator.start_message_watcher()
+                # 沒有推送時也按檢查間隔醒來檢查響應延遲
+                event = await watcher.next_event(timeout=self.config.manus_check_interval)
+                new_messages = []
+                
+                if event and event.kind in ('new_messages', 'updated_messages'):
+                    # 新增和更新都按節點合併；流式輸出的消息穩定後（內容完整）才分析，
+                    # 虛擬列表重新渲染的舊消息按ID過濾
+                    new_messages = merge_pushed_messages(messages, event.messages, seen_message_ids)
+                elif event and event.kind == 'resync':
+                    new_messages = select_new_messages(event.messages, seen_message_ids)
+                    messages = list(event.messages)
+                    self.logger.info(f"🔄 完整同步對話 ({event.reason})，共 {len(messages)} 條消息")
+                
+                if new_messages:
+                    self.logger.info(f"🆕 檢測到 {len(new_messages)} 條新消息")
+                    
+                    # 分析每條新消息
+                    for message in new_messages:
+                        await self._analyze_message(message, messages)
+                    
+                    self.performance_stats['messages_monitored'] += len(new_messages)
+                
+                # 檢查響應延遲
+                await self._check_response_delays(messages, last_check_time)
+                last_check_time = datetime.now()
+                
+            except Exception as e:
+                self.logger.error(f"對話監控錯誤: {e}")
+                # 出錯的監聽器可能已失效（頁面關閉或腳本丟失），停止後重新啟動並完整同步
+                if watcher:
+                    await self.manus_operator.stop_message_watcher()
+                    watcher = None
+                await asyncio.sleep(30)
+    
     async def _monitor_tasks(self):
         """監控任務"""
         self.logger.info("📋 開始任務監控...")
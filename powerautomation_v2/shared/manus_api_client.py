@@ -1,16 +1,26 @@
 """
 PowerAutomation Manus API 客戶端
 支持與Manus智能引擎系統的完整集成
+相同內容的分析結果按內容哈希緩存，併發的相同請求只發送一次；
+併發的不同請求由微批處理器合併到 /api/batch_analyze
 """
 
+import asyncio
+import copy
+import hashlib
 import requests
 import json
+import threading
 import time
 import logging
-from typing import Dict, List, Optional, Union, Any
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Union, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+import aiohttp
+
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -46,6 +56,12 @@ class ManusAPIConfig:
     retry_count: int = 3
     retry_delay: float = 1.0
     use_public: bool = False
+    cache_ttl: float = 300.0          # 分析結果緩存時間(秒)，0表示不緩存
+    cache_max_entries: int = 1024
+    batch_max_items: int = 16         # 每批最多請求數，1表示不做微批
+    batch_max_wait_ms: float = 20.0   # 第一個請求到達後最多等待多久再發送
+    batch_max_inflight: int = 4       # 同時在途的批量請求數
+    batch_item_retries: int = 2       # 批量中失敗項目的重試次數（只重試失敗的項目）
 
 @dataclass
 class AnalysisRequest:
@@ -67,12 +83,204 @@ class AnalysisResponse:
     timestamp: Optional[str] = None
     error: Optional[str] = None
 
+def analysis_cache_key(request: AnalysisRequest) -> str:
+    """按內容、模式、領域和分析類型計算緩存鍵（不含上下文）"""
+    parts = [
+        request.content,
+        request.mode.value,
+        request.domain.value if request.domain else None,
+        request.analysis_type.value if request.analysis_type else None
+    ]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _request_payload(request: AnalysisRequest) -> Dict[str, Any]:
+    """構建 /api/analyze 請求數據"""
+    data = {
+        'content': request.content,
+        'mode': request.mode.value
+    }
+    
+    # 添加可選參數
+    if request.domain:
+        data['domain'] = request.domain.value
+    if request.analysis_type:
+        data['analysis_type'] = request.analysis_type.value
+    if request.context:
+        data['context'] = request.context
+    return data
+
+def _response_from_result(result: Dict[str, Any], request: AnalysisRequest) -> AnalysisResponse:
+    return AnalysisResponse(
+        success=result.get('success', True),
+        analysis_mode=result.get('analysis_mode', request.mode.value),
+        summary=result.get('summary', ''),
+        ai_analysis=result.get('ai_analysis', {}),
+        file_metadata=result.get('file_metadata'),
+        timestamp=result.get('timestamp'),
+        error=result.get('error')
+    )
+
+def _error_response(request: AnalysisRequest, error: str) -> AnalysisResponse:
+    return AnalysisResponse(
+        success=False,
+        analysis_mode=request.mode.value,
+        summary='',
+        ai_analysis={},
+        error=error
+    )
+
+class AnalysisCache:
+    """
+    分析結果緩存（LRU + TTL，線程安全）
+    
+    只緩存成功的響應；存入和命中時都深拷貝，調用方修改返回結果（包括ai_analysis等嵌套數據）不會影響緩存
+    """
+    
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[float, AnalysisResponse]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    def get(self, key: str) -> Optional[AnalysisResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return copy.deepcopy(entry[1])
+    
+    def put(self, key: str, response: AnalysisResponse):
+        if self.ttl <= 0 or not response.success:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(response))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'size': len(self._entries), 'ttl': self.ttl, 'max_entries': self.max_entries}
+
+class AnalysisBatcher:
+    """
+    分析請求微批處理器
+    
+    收集併發的analyze調用，第一個請求到達後最多等待batch_max_wait_ms，
+    或湊滿batch_max_items後，一次通過 /api/batch_analyze 發送，並把結果分發回各自的Future；
+    在途批量已滿時新請求繼續累積，負載越高批量越大。
+    成功的項目收到響應後立即返回，失敗的項目在retry_delay後重新排隊，與新請求一起發送，
+    重試等待期間不佔用發送槽位
+    """
+    
+    def __init__(self, client: 'ManusAPIClient'):
+        self.client = client
+        self.max_items = client.config.batch_max_items
+        self.max_wait = client.config.batch_max_wait_ms / 1000.0
+        self.max_retries = client.config.batch_item_retries
+        self.retry_delay = client.config.retry_delay
+        # (請求, Future, 已重試次數)
+        self._pending: List[Tuple[AnalysisRequest, Future, int]] = []
+        self._condition = threading.Condition()
+        self._slots = threading.Semaphore(client.config.batch_max_inflight)
+        self._executor = ThreadPoolExecutor(max_workers=client.config.batch_max_inflight,
+                                            thread_name_prefix='manus-batch')
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'batches': 0, 'batched_requests': 0, 'max_batch_size': 0}
+    
+    def submit(self, request: AnalysisRequest) -> Future:
+        future: Future = Future()
+        self._enqueue([(request, future, 0)])
+        return future
+    
+    def _enqueue(self, items: List[Tuple[AnalysisRequest, Future, int]]):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop, name='manus-batcher', daemon=True)
+                self._thread.start()
+            self._pending.extend(items)
+            self._condition.notify()
+    
+    def _flush_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_items:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            
+            # 等待空閒的發送槽位，期間到達的請求會併入本批
+            self._slots.acquire()
+            with self._condition:
+                batch = self._pending[:self.max_items]
+                del self._pending[:self.max_items]
+            self._executor.submit(self._send, batch)
+    
+    def _send(self, batch: List[Tuple[AnalysisRequest, Future, int]]):
+        retry = []
+        try:
+            self.stats['batches'] += 1
+            self.stats['batched_requests'] += len(batch)
+            self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+            
+            requests_ = [request for request, _, _ in batch]
+            if len(requests_) == 1:
+                responses = [self.client._analyze_remote(requests_[0])]
+            else:
+                responses = self.client._send_batch(requests_)
+            
+            for (request, future, retries), response in zip(batch, responses):
+                if response.success or retries >= self.max_retries:
+                    future.set_result(response)
+                else:
+                    retry.append((request, future, retries + 1))
+        except BaseException as e:
+            retry = []
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+        
+        if retry:
+            self.client.stats['retried_items'] += len(retry)
+            timer = threading.Timer(self.retry_delay, self._enqueue, args=(retry,))
+            timer.daemon = True
+            timer.start()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            pending = len(self._pending)
+        return {**self.stats, 'pending': pending, 'max_items': self.max_items,
+                'max_wait_ms': self.max_wait * 1000}
+
 class ManusAPIClient:
     """Manus API客戶端"""
     
-    def __init__(self, config: Optional[ManusAPIConfig] = None):
+    def __init__(self, config: Optional[ManusAPIConfig] = None, cache: Optional[AnalysisCache] = None):
         """初始化客戶端"""
         self.config = config or ManusAPIConfig()
+        self.cache = cache or AnalysisCache(self.config.cache_ttl, self.config.cache_max_entries)
+        # 正在進行中的分析請求（緩存鍵 -> Future），相同請求共享一次遠程調用
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self.stats = {'remote_requests': 0, 'coalesced_requests': 0, 'retried_items': 0}
+        self.batcher = AnalysisBatcher(self) if self.config.batch_max_items > 1 else None
         self.session = requests.Session()
         self.session.headers.update({
             'Content-Type': 'application/json',
@@ -133,45 +341,54 @@ class ManusAPIClient:
             }
     
     def analyze(self, request: AnalysisRequest) -> AnalysisResponse:
-        """智能分析"""
+        """智能分析（命中緩存時不發送請求，併發的相同請求只發送一次）"""
+        key = analysis_cache_key(request)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats['coalesced_requests'] += 1
+        
+        if not owner:
+            return copy.deepcopy(future.result())
+        
         try:
-            # 構建請求數據
-            data = {
-                'content': request.content,
-                'mode': request.mode.value
-            }
-            
-            # 添加可選參數
-            if request.domain:
-                data['domain'] = request.domain.value
-            if request.analysis_type:
-                data['analysis_type'] = request.analysis_type.value
-            if request.context:
-                data['context'] = request.context
+            if self.batcher is not None:
+                response = self.batcher.submit(request).result()
+            else:
+                response = self._analyze_remote(request)
+            self.cache.put(key, response)
+            future.set_result(response)
+            # 等待者從future取副本，發起者也返回副本，互相修改不影響
+            return copy.deepcopy(response)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+    
+    def _analyze_remote(self, request: AnalysisRequest) -> AnalysisResponse:
+        """發送分析請求"""
+        try:
+            data = _request_payload(request)
             
             logger.info(f"發送分析請求: mode={request.mode.value}, content_length={len(request.content)}")
             
+            self.stats['remote_requests'] += 1
             response = self._make_request('POST', '/api/analyze', json=data)
-            result = response.json()
-            
-            return AnalysisResponse(
-                success=True,
-                analysis_mode=result.get('analysis_mode', request.mode.value),
-                summary=result.get('summary', ''),
-                ai_analysis=result.get('ai_analysis', {}),
-                file_metadata=result.get('file_metadata'),
-                timestamp=result.get('timestamp')
-            )
+            return _response_from_result(response.json(), request)
             
         except Exception as e:
             logger.error(f"分析請求失敗: {e}")
-            return AnalysisResponse(
-                success=False,
-                analysis_mode=request.mode.value,
-                summary='',
-                ai_analysis={},
-                error=str(e)
-            )
+            return _error_response(request, str(e))
     
     def analyze_conversation(self, messages: List[Dict[str, str]], 
                            context: Optional[Dict[str, Any]] = None) -> AnalysisResponse:
@@ -269,55 +486,154 @@ class ManusAPIClient:
             )
     
     def batch_analyze(self, requests: List[AnalysisRequest]) -> List[AnalysisResponse]:
-        """批量分析"""
+        """批量分析（失敗的項目單獨重試，不影響已成功的項目）"""
+        responses: List[Optional[AnalysisResponse]] = [None] * len(requests)
+        remaining = list(range(len(requests)))
+        
+        for attempt in range(self.config.batch_item_retries + 1):
+            if attempt > 0:
+                self.stats['retried_items'] += len(remaining)
+                time.sleep(self.config.retry_delay)
+            
+            for index, response in zip(remaining, self._send_batch([requests[i] for i in remaining])):
+                responses[index] = response
+            remaining = [i for i in remaining if not responses[i].success]
+            if not remaining:
+                break
+        
+        return responses
+    
+    def _send_batch(self, requests: List[AnalysisRequest]) -> List[AnalysisResponse]:
+        """發送一次批量請求，按位置把結果對應回請求"""
         try:
             # 構建批量請求數據
-            batch_data = {
-                'requests': [
-                    {
-                        'content': req.content,
-                        'mode': req.mode.value,
-                        'domain': req.domain.value if req.domain else None,
-                        'analysis_type': req.analysis_type.value if req.analysis_type else None,
-                        'context': req.context
-                    }
-                    for req in requests
-                ]
-            }
+            batch_data = {'requests': [_request_payload(req) for req in requests]}
             
             logger.info(f"發送批量分析請求: {len(requests)} 個項目")
             
+            self.stats['remote_requests'] += 1
             response = self._make_request('POST', '/api/batch_analyze', json=batch_data)
-            results = response.json()
+            results = response.json().get('results', [])
             
-            # 處理批量響應
-            responses = []
-            for i, result in enumerate(results.get('results', [])):
-                responses.append(AnalysisResponse(
-                    success=result.get('success', True),
-                    analysis_mode=result.get('analysis_mode', requests[i].mode.value),
-                    summary=result.get('summary', ''),
-                    ai_analysis=result.get('ai_analysis', {}),
-                    file_metadata=result.get('file_metadata'),
-                    timestamp=result.get('timestamp'),
-                    error=result.get('error')
-                ))
-            
-            return responses
+            # 處理批量響應，缺少結果的項目視為失敗
+            return [
+                _response_from_result(results[i], req) if i < len(results)
+                else _error_response(req, '批量響應中缺少該項目的結果')
+                for i, req in enumerate(requests)
+            ]
             
         except Exception as e:
             logger.error(f"批量分析失敗: {e}")
             # 返回錯誤響應列表
-            return [
-                AnalysisResponse(
-                    success=False,
-                    analysis_mode=req.mode.value,
-                    summary='',
-                    ai_analysis={},
-                    error=str(e)
-                )
-                for req in requests
-            ]
+            return [_error_response(req, str(e)) for req in requests]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """請求合併、微批和緩存統計"""
+        stats = {**self.stats, 'inflight': len(self._inflight), 'cache': self.cache.get_stats()}
+        if self.batcher is not None:
+            stats['batching'] = self.batcher.get_stats()
+        return stats
+
+class AsyncManusAPIClient:
+    """
+    Manus API異步客戶端
+    
+    與ManusAPIClient使用相同的緩存鍵和緩存結構，可以共享一個AnalysisCache；
+    重試等待使用asyncio.sleep，不阻塞事件循環
+    """
+    
+    def __init__(self, config: Optional[ManusAPIConfig] = None, cache: Optional[AnalysisCache] = None):
+        self.config = config or ManusAPIConfig()
+        self.cache = cache or AnalysisCache(self.config.cache_ttl, self.config.cache_max_entries)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.stats = {'remote_requests': 0, 'coalesced_requests': 0}
+    
+    @property
+    def base_url(self) -> str:
+        """獲取基礎URL"""
+        return self.config.public_url if self.config.use_public else self.config.local_url
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={'User-Agent': 'PowerAutomation-ManusAPI-Client/1.0'},
+                timeout=aiohttp.ClientTimeout(total=self.config.timeout)
+            )
+        return self._session
+    
+    async def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
+        """發送HTTP請求並返回JSON，包含重試機制"""
+        url = f"{self.base_url}{endpoint}"
+        
+        for attempt in range(self.config.retry_count):
+            try:
+                logger.info(f"發送請求到 {url} (嘗試 {attempt + 1}/{self.config.retry_count})")
+                
+                async with self._get_session().request(method, url, **kwargs) as response:
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+                    logger.warning(f"請求失敗，狀態碼: {response.status}")
+                    
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"請求異常: {e}")
+                if attempt == self.config.retry_count - 1:
+                    raise
+            
+            if attempt < self.config.retry_count - 1:
+                await asyncio.sleep(self.config.retry_delay)
+        
+        raise aiohttp.ClientError(f"請求失敗，已重試 {self.config.retry_count} 次")
+    
+    async def analyze(self, request: AnalysisRequest) -> AnalysisResponse:
+        """智能分析（命中緩存時不發送請求，併發的相同請求只發送一次）"""
+        key = analysis_cache_key(request)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats['coalesced_requests'] += 1
+            return copy.deepcopy(await asyncio.shield(future))
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await self._analyze_remote(request)
+            self.cache.put(key, response)
+            future.set_result(response)
+            # 等待者從future取副本，發起者也返回副本，互相修改不影響
+            return copy.deepcopy(response)
+        except BaseException as e:
+            # 發起者被取消不代表等待者也被取消，等待者收到普通異常
+            if isinstance(e, asyncio.CancelledError):
+                future.set_exception(RuntimeError("共享的分析請求已被取消"))
+            else:
+                future.set_exception(e)
+            # 沒有其他等待者時避免"exception was never retrieved"警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+    
+    async def _analyze_remote(self, request: AnalysisRequest) -> AnalysisResponse:
+        try:
+            logger.info(f"發送分析請求: mode={request.mode.value}, content_length={len(request.content)}")
+            self.stats['remote_requests'] += 1
+            result = await self._make_request('POST', '/api/analyze', json=_request_payload(request))
+            return _response_from_result(result, request)
+        except Exception as e:
+            logger.error(f"分析請求失敗: {e}")
+            return _error_response(request, str(e))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """請求合併和緩存統計"""
+        return {**self.stats, 'inflight': len(self._inflight), 'cache': self.cache.get_stats()}
+    
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
 
 class PowerAutomationManusIntegration:
     """PowerAutomation與Manus API的集成類"""
@@ -420,6 +736,32 @@ class PowerAutomationManusIntegration:
                 'error': str(e)
             }
     
+    def analyze_trae_conversations(self, conversations: List[Dict[str, Any]],
+                                   max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        併發分析多個TRAE對話（監控循環使用）
+        
+        各對話的Manus請求由客戶端的微批處理器合併發送
+        
+        Args:
+            conversations: 每項包含 messages、repository、conversation_id
+            max_workers: 併發數，默認為一個批量的大小
+        
+        Returns:
+            與輸入順序一致的分析結果
+        """
+        if not conversations:
+            return []
+        
+        max_workers = max_workers or max(1, self.client.config.batch_max_items)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(conversations))) as executor:
+            return list(executor.map(
+                lambda conv: self.analyze_trae_conversation(
+                    conv['messages'], conv['repository'], conv['conversation_id']
+                ),
+                conversations
+            ))
+    
     def _generate_intervention_suggestion(self, ai_analysis: Dict[str, Any]) -> str:
         """基於Manus分析生成介入建議"""
         content = ai_analysis.get('content', '')
@@ -0,0 +1,294 @@
+"""
+Manus消息標識與增量解析模組
+消息ID由發送者、內容和時間屬性的哈希生成，不依賴消息在列表中的位置；
+頁面端一次調用為每個消息節點計算HTML哈希，已解析過的節點只返回哈希，Python端直接復用緩存的解析結果
+"""
+
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Dict, List, Optional, Any, Callable, Iterable, Set
+import logging
+
+# 頁面端提取消息字段的函數（供快照腳本和推送監聽腳本共用）
+# fields: {content, sender, time: 選擇器列表, attachments: 是否提取附件}
+MESSAGE_FIELDS_FUNCTION = r"""
+(node, fields) => {
+  const textOf = (selectors) => {
+    for (const s of selectors) {
+      try {
+        const el = node.querySelector(s);
+        if (el && el.innerText && el.innerText.trim()) return el.innerText.trim();
+      } catch (e) {}
+    }
+    return null;
+  };
+  let timeAttr = null;
+  let timeText = null;
+  for (const s of fields.time) {
+    try {
+      const el = node.querySelector(s);
+      if (!el) continue;
+      for (const attr of ['datetime', 'data-time', 'data-timestamp']) {
+        const value = el.getAttribute(attr);
+        if (value) { timeAttr = value; break; }
+      }
+      timeText = el.getAttribute('title') || (el.innerText || '').trim() || null;
+      break;
+    } catch (e) {}
+  }
+  const attachments = [];
+  if (fields.attachments) {
+    node.querySelectorAll('img').forEach((img) => {
+      const src = img.getAttribute('src');
+      if (src) attachments.push('image:' + src);
+    });
+    node.querySelectorAll('a[href]').forEach((link) => {
+      const href = link.getAttribute('href');
+      if (href && href.startsWith('http')) attachments.push('link:' + href);
+    });
+    node.querySelectorAll('[data-file], .file, .attachment').forEach((file) => {
+      const url = file.getAttribute('data-file') || file.getAttribute('href');
+      if (url) attachments.push('file:' + url);
+    });
+  }
+  return {
+    content: textOf(fields.content),
+    text: (node.innerText || '').trim(),
+    sender: textOf(fields.sender),
+    className: typeof node.className === 'string' ? node.className : '',
+    timeAttr,
+    timeText,
+    attachments,
+    html: node.innerHTML
+  };
+}
+"""
+
+# 頁面內共享的節點key登記表：快照腳本和推送監聽腳本為同一個DOM節點給出同一個key（epoch:序號），
+# 頁面重載後epoch變化
+NODE_KEYS_SNIPPET = r"""
+  const nodeRegistry = window.__powerautomationNodes || (window.__powerautomationNodes = {
+    epoch: Date.now().toString(36) + Math.random().toString(36).slice(2, 8),
+    next: 0,
+    keys: new WeakMap()
+  });
+  const nodeKey = (node) => {
+    let key = nodeRegistry.keys.get(node);
+    if (!key) {
+      key = nodeRegistry.epoch + ':' + (++nodeRegistry.next);
+      nodeRegistry.keys.set(node, key);
+    }
+    return key;
+  };
+"""
+
+# page.eval_on_selector_all 使用的快照腳本，arg: {known: 已緩存的節點HTML哈希, fields}
+SNAPSHOT_SCRIPT = r"""
+(nodes, arg) => {
+__NODE_KEYS__
+  const extractMessageFields = __FIELDS__;
+  // cyrb53，53位非加密哈希
+  const hash = (str) => {
+    let h1 = 0xdeadbeef, h2 = 0x41c6ce57;
+    for (let i = 0; i < str.length; i++) {
+      const ch = str.charCodeAt(i);
+      h1 = Math.imul(h1 ^ ch, 2654435761);
+      h2 = Math.imul(h2 ^ ch, 1597334677);
+    }
+    h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507) ^ Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+    h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507) ^ Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+    return (4294967296 * (2097151 & h2) + (h1 >>> 0)).toString(36);
+  };
+  const known = new Set(arg.known);
+  return nodes.map((node) => {
+    const key = nodeKey(node);
+    const digest = hash(node.outerHTML);
+    return known.has(digest) ? {key, hash: digest} : {key, hash: digest, ...extractMessageFields(node, arg.fields)};
+  });
+}
+""".replace("__NODE_KEYS__", NODE_KEYS_SNIPPET.strip("\n")).replace("__FIELDS__", MESSAGE_FIELDS_FUNCTION.strip())
+
+def normalize_text(text: Optional[str]) -> str:
+    """合併空白，避免排版變化影響消息標識"""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def message_fingerprint(*parts: Optional[str]) -> str:
+    """消息內容哈希（發送者、內容、時間屬性等），作為穩定的消息標識"""
+    payload = json.dumps([normalize_text(part) for part in parts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:20]
+
+class MessageIdentity:
+    """
+    消息ID分配器（完整同步和推送兩條路徑共用）
+
+    基礎ID是內容哈希；內容相同的消息用前一條消息的ID區分：
+    - 已標識過的DOM節點（按頁面節點key）內容未變時沿用原ID
+    - 新節點的內容哈希和前一條消息都與已知消息相同時，視為同一條消息重新渲染（虛擬列表滾動）
+    - 前一條消息未知（渲染窗口的第一條）時，視為已知消息中最近的一條
+    - 否則是新消息，重複內容依次分配 base-2、base-3...；寧可多報一條也不丟消息
+    """
+
+    def __init__(self, max_nodes: int = 10000):
+        self.max_nodes = max_nodes
+        # 節點key -> (內容哈希, 消息ID)
+        self._by_node: "OrderedDict[str, tuple]" = OrderedDict()
+        # 內容哈希 -> [消息ID]，按首次出現順序
+        self._ids_by_fingerprint: Dict[str, List[str]] = {}
+        # 消息ID -> 前一條消息的ID
+        self._previous: Dict[str, Optional[str]] = {}
+
+    def node_id(self, node_key: Optional[str]) -> Optional[str]:
+        """節點當前對應的消息ID"""
+        entry = self._by_node.get(node_key) if node_key else None
+        return entry[1] if entry else None
+
+    def identify(self, fingerprint: str, node_key: str, previous_id: Optional[str]) -> str:
+        """
+        Args:
+            fingerprint: 消息的內容哈希（基礎ID）
+            node_key: 頁面節點key
+            previous_id: 文檔中前一條消息的ID，未知時為None
+        """
+        entry = self._by_node.get(node_key)
+        if entry and entry[0] == fingerprint:
+            self._by_node.move_to_end(node_key)
+            return entry[1]
+
+        candidates = self._ids_by_fingerprint.setdefault(fingerprint, [])
+        message_id = None
+        if previous_id is not None:
+            message_id = next((c for c in candidates if self._previous.get(c) == previous_id), None)
+        elif candidates:
+            message_id = candidates[-1]
+
+        if message_id is None:
+            message_id = fingerprint if not candidates else f"{fingerprint}-{len(candidates) + 1}"
+            candidates.append(message_id)
+            self._previous[message_id] = previous_id
+
+        self._by_node[node_key] = (fingerprint, message_id)
+        self._by_node.move_to_end(node_key)
+        while len(self._by_node) > self.max_nodes:
+            self._by_node.popitem(last=False)
+        return message_id
+
+def new_messages(messages: Iterable[Any], seen_ids: Set[str]) -> List[Any]:
+    """返回ID不在seen_ids中的消息，並把它們加入seen_ids"""
+    fresh = []
+    for message in messages:
+        if message.id not in seen_ids:
+            seen_ids.add(message.id)
+            fresh.append(message)
+    return fresh
+
+class IncrementalMessageParser:
+    """
+    增量消息解析器
+
+    解析結果按節點HTML哈希緩存；虛擬列表滾動或重新渲染時，未變化的節點不再重新解析，
+    內容變化（如流式輸出）的節點哈希變化後重新解析。消息ID由共用的MessageIdentity分配
+    """
+
+    def __init__(self, build: Callable[[Dict[str, Any]], Optional[Any]],
+                 max_entries: int = 10000, logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            build: 把頁面快照字段轉換為消息對象，消息的id為內容哈希生成的基礎ID
+            max_entries: 緩存的節點數上限
+        """
+        self.build = build
+        self.max_entries = max_entries
+        self.logger = logger or logging.getLogger(__name__)
+        self.identity = MessageIdentity(max_entries)
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self.stats = {'parsed': 0, 'reused': 0, 'missing': 0}
+
+    def known_keys(self) -> List[str]:
+        return list(self._cache)
+
+    def _build(self, snapshot: Dict[str, Any]) -> Optional[Any]:
+        try:
+            return self.build(snapshot)
+        except Exception as e:
+            self.logger.error(f"解析消息失敗: {e}")
+            return None
+
+    def _identified(self, parsed: Any, node_key: str, previous_id: Optional[str]) -> Any:
+        """分配消息ID，metadata中的key為當前節點的key"""
+        return replace(
+            parsed,
+            id=self.identity.identify(parsed.id, node_key, previous_id),
+            metadata={**(parsed.metadata or {}), 'key': node_key}
+        )
+
+    def parse(self, snapshots: List[Dict[str, Any]]) -> List[Any]:
+        """
+        把快照轉換為消息列表（按文檔順序）
+
+        只有key和hash的快照使用緩存結果；新節點調用build解析後緩存
+        """
+        messages = []
+        previous_id = None
+        for snapshot in snapshots:
+            digest = snapshot['hash']
+            if 'html' in snapshot:
+                parsed = self._build(snapshot)
+                if parsed is None:
+                    continue
+                self._cache[digest] = parsed
+                self.stats['parsed'] += 1
+            elif digest in self._cache:
+                parsed = self._cache[digest]
+                self._cache.move_to_end(digest)
+                self.stats['reused'] += 1
+            else:
+                # 頁面端認為已緩存但緩存中沒有，下次快照會重新提取
+                self.stats['missing'] += 1
+                continue
+            message = self._identified(parsed, snapshot['key'], previous_id)
+            previous_id = message.id
+            messages.append(message)
+
+        # 解析完成後再淘汰，保證本次發給頁面的已緩存哈希在解析期間有效
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return messages
+
+    def parse_pushed(self, item: Dict[str, Any]) -> Optional[Any]:
+        """
+        轉換推送監聽腳本推送的一條消息（按文檔順序逐條調用）
+
+        item中的prevKey是文檔中前一個消息節點的key
+        """
+        parsed = self._build(item)
+        if parsed is None:
+            return None
+        return self._identified(parsed, item['key'], self.identity.node_id(item.get('prevKey')))
+
+    async def collect(self, page, container_selectors: List[str], fields: Dict[str, Any]) -> List[Any]:
+        """
+        按順序嘗試消息容器選擇器，一次頁面調用取得所有節點的快照並解析
+
+        Args:
+            fields: 頁面端提取字段的選擇器，見 MESSAGE_FIELDS_FUNCTION
+        """
+        for selector in container_selectors:
+            try:
+                snapshots = await page.eval_on_selector_all(
+                    selector, SNAPSHOT_SCRIPT, {'known': self.known_keys(), 'fields': fields}
+                )
+            except Exception as e:
+                self.logger.debug(f"選擇器 '{selector}' 失敗: {e}")
+                continue
+            if snapshots:
+                self.logger.debug(f"使用選擇器 '{selector}' 找到 {len(snapshots)} 個消息節點")
+                return self.parse(snapshots)
+
+        self.logger.warning(f"所有選擇器都失敗: {container_selectors}")
+        return []
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'cached_nodes': len(self._cache)}
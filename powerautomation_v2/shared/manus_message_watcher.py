@@ -0,0 +1,323 @@
+"""
+Manus消息變化監聽模組
+在頁面中注入MutationObserver，新增的消息節點經 page.expose_binding 推送到Python，
+不再定時滾動整頁並重新解析所有消息；批次帶序號，丟失批次或頁面重載時回退到一次完整同步
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any, Callable, Awaitable, Set
+import logging
+
+from manus_message_identity import MESSAGE_FIELDS_FUNCTION, NODE_KEYS_SNIPPET
+
+BINDING_NAME = "__powerautomationMessages"
+
+# 頁面端腳本：__CONFIG__ 替換為選擇器等配置，消息字段的提取與完整同步的快照腳本相同
+# 節點key來自與快照腳本共用的登記表（WeakMap），不修改頁面DOM；
+# 新節點在一段時間內沒有變化後才推送（流式輸出的消息先寫完），已推送節點的文本變化作為更新推送；
+# 等待超過maxWaitMs時強制推送，仍在變化的消息帶 settled: false，穩定後再以 settled: true 推送
+WATCHER_SCRIPT = r"""
+(() => {
+  if (window.__powerautomationWatcher) return;
+  const cfg = __CONFIG__;
+__NODE_KEYS__
+  const epoch = nodeRegistry.epoch;
+  const registered = new WeakSet();
+  const pendingNew = new Set();
+  const dirty = new Set();
+  const lastChange = new WeakMap();
+  let seq = 0;
+  let selector = null;
+  let timer = null;
+  let firstPendingAt = 0;
+  let observer = null;
+
+  const pickSelector = () => {
+    for (const s of cfg.container) {
+      try { if (document.querySelector(s)) return s; } catch (e) {}
+    }
+    return null;
+  };
+  const extractMessageFields = __FIELDS__;
+  const register = (node, report) => {
+    if (registered.has(node)) return;
+    registered.add(node);
+    nodeKey(node);
+    if (report) {
+      pendingNew.add(node);
+      lastChange.set(node, Date.now());
+    }
+  };
+  const owner = (node) => {
+    let el = node.nodeType === 1 ? node : node.parentElement;
+    while (el) {
+      if (registered.has(el)) return el;
+      el = el.parentElement;
+    }
+    return null;
+  };
+  const flush = () => {
+    timer = null;
+    firstPendingAt = 0;
+    // 按文檔順序推送，並帶上前一個消息節點的key，Python端據此區分內容相同的消息
+    const all = selector ? Array.from(document.querySelectorAll(selector)) : [];
+    const position = new Map(all.map((n, i) => [n, i]));
+    const inOrder = (nodes) => nodes.filter((n) => position.has(n)).sort((a, b) => position.get(a) - position.get(b));
+    const added = inOrder(Array.from(pendingNew));
+    const updated = inOrder(Array.from(dirty).filter((n) => !pendingNew.has(n)));
+    pendingNew.clear();
+    dirty.clear();
+    if (!added.length && !updated.length) return;
+    // 超過maxWaitMs強制推送時仍在變化的節點標為未穩定，穩定後作為更新再推送一次
+    const now = Date.now();
+    const unsettled = [...added, ...updated].filter((n) => now - (lastChange.get(n) || 0) < cfg.settleMs);
+    const extract = (node) => {
+      const index = position.get(node);
+      return {
+        key: nodeKey(node),
+        prevKey: index > 0 ? nodeKey(all[index - 1]) : null,
+        settled: !unsettled.includes(node),
+        ...extractMessageFields(node, cfg)
+      };
+    };
+    seq += 1;
+    window[cfg.binding]({epoch, seq, added: added.map(extract), updated: updated.map(extract)});
+    if (unsettled.length) {
+      unsettled.forEach((n) => dirty.add(n));
+      schedule();
+    }
+  };
+  const schedule = () => {
+    const now = Date.now();
+    if (!firstPendingAt) firstPendingAt = now;
+    if (timer) clearTimeout(timer);
+    timer = setTimeout(flush, now - firstPendingAt >= cfg.maxWaitMs ? 0 : cfg.settleMs);
+  };
+  const collect = (root) => {
+    if (!(root instanceof Element)) return;
+    selector = selector || pickSelector();
+    if (!selector) return;
+    if (root.matches(selector)) register(root, true);
+    root.querySelectorAll(selector).forEach((n) => register(n, true));
+  };
+  const onMutations = (mutations) => {
+    let changed = false;
+    for (const m of mutations) {
+      const message = owner(m.target);
+      if (message) {
+        lastChange.set(message, Date.now());
+        if (!pendingNew.has(message)) dirty.add(message);
+        changed = true;
+        continue;
+      }
+      for (const node of m.addedNodes) collect(node);
+      changed = changed || pendingNew.size > 0;
+    }
+    if (changed && (pendingNew.size || dirty.size)) schedule();
+  };
+  const start = () => {
+    selector = pickSelector();
+    // 注入前已存在的消息由Python端的完整同步獲取
+    if (selector) document.querySelectorAll(selector).forEach((n) => register(n, false));
+    observer = new MutationObserver(onMutations);
+    observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+  };
+
+  window.__powerautomationWatcher = {
+    epoch,
+    // 停止後清除標記，重新啟動的監聽器可以再次注入
+    stop: () => {
+      if (observer) observer.disconnect();
+      if (timer) clearTimeout(timer);
+      delete window.__powerautomationWatcher;
+    }
+  };
+  if (document.body) start(); else document.addEventListener('DOMContentLoaded', start);
+})();
+""".replace("__NODE_KEYS__", NODE_KEYS_SNIPPET.strip("\n")).replace("__FIELDS__", MESSAGE_FIELDS_FUNCTION.strip())
+
+# 頁面 -> 當前監聽器；同一頁面只能註冊一次同名binding，重新啟動的監聽器沿用已註冊的binding
+_page_watchers: "weakref.WeakKeyDictionary[Any, ManusMessageWatcher]" = weakref.WeakKeyDictionary()
+
+def merge_pushed_messages(messages: List[Any], pushed: List[Any], seen_ids: Set[str]) -> List[Any]:
+    """
+    把推送的新增/更新消息合併到本地消息列表
+
+    同一節點（metadata['key']）的消息原位替換，其餘追加；
+    返回已穩定（metadata['settled']不為False）且ID未見過的消息，流式輸出中的消息等穩定後才返回
+
+    Args:
+        messages: 本地消息列表，原地修改
+        seen_ids: 已處理過的消息ID，返回的消息會加入其中
+    """
+    positions = {(m.metadata or {}).get('key'): i for i, m in enumerate(messages)}
+    fresh = []
+    for message in pushed:
+        metadata = message.metadata or {}
+        position = positions.get(metadata.get('key'))
+        if position is None:
+            positions[metadata.get('key')] = len(messages)
+            messages.append(message)
+        else:
+            messages[position] = message
+        if metadata.get('settled', True) and message.id not in seen_ids:
+            seen_ids.add(message.id)
+            fresh.append(message)
+    return fresh
+
+@dataclass
+class WatchEvent:
+    """監聽事件：new_messages（新增）、updated_messages（已推送消息的內容變化）、resync（完整同步）"""
+    kind: str
+    messages: List[Any]
+    reason: Optional[str] = None
+    received_at: float = field(default_factory=time.time)
+
+class ManusMessageWatcher:
+    """
+    推送式消息監聽器
+
+    頁面端按批次推送新增和更新的消息，批次序號不連續或頁面重載（epoch變化）時
+    調用resync做一次完整同步；長時間沒有推送時也會定期完整同步一次兜底
+    """
+
+    def __init__(self, page, selectors: Dict[str, List[str]],
+                 to_message: Callable[[Dict[str, Any]], Any],
+                 resync: Callable[[], Awaitable[List[Any]]],
+                 logger: Optional[logging.Logger] = None,
+                 settle_ms: int = 300, max_wait_ms: int = 1500,
+                 resync_interval: float = 300):
+        self.page = page
+        self.selectors = selectors
+        self.to_message = to_message
+        self._resync = resync
+        self.logger = logger or logging.getLogger(__name__)
+        self.settle_ms = settle_ms
+        self.max_wait_ms = max_wait_ms
+        self.resync_interval = resync_interval
+
+        self.epoch: Optional[str] = None
+        self.last_seq = 0
+        self.last_resync = 0.0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._resync_task: Optional[asyncio.Task] = None
+        self._running = False
+        self.stats = {
+            'batches': 0,
+            'new_messages': 0,
+            'updated_messages': 0,
+            'resyncs': 0,
+            'sequence_gaps': 0,
+            'reloads': 0
+        }
+
+    def _script(self) -> str:
+        config = {
+            'binding': BINDING_NAME,
+            'container': self.selectors['message_container'],
+            'content': self.selectors['message_content'],
+            'sender': self.selectors['message_sender'],
+            'time': self.selectors['message_time'],
+            'settleMs': self.settle_ms,
+            'maxWaitMs': self.max_wait_ms
+        }
+        return WATCHER_SCRIPT.replace('__CONFIG__', json.dumps(config, ensure_ascii=False))
+
+    async def start(self):
+        """注入監聽腳本並做一次完整同步作為基線"""
+        self._running = True
+        page = self.page
+        bound = page in _page_watchers
+        _page_watchers[page] = self
+        if not bound:
+            await page.expose_binding(BINDING_NAME, lambda source, payload: _page_watchers[page]._on_batch(source, payload))
+        script = self._script()
+        # init script保證頁面導航或重載後重新注入
+        await self.page.add_init_script(script)
+        await self.page.evaluate(script)
+        await self.resync('start')
+        self.logger.info("👁️ 已注入消息監聽腳本")
+
+    async def stop(self):
+        self._running = False
+        if self._resync_task and not self._resync_task.done():
+            self._resync_task.cancel()
+        try:
+            await self.page.evaluate("window.__powerautomationWatcher && window.__powerautomationWatcher.stop()")
+        except Exception as e:
+            self.logger.debug(f"停止頁面監聽腳本失敗: {e}")
+
+    def _on_batch(self, source, payload: Dict[str, Any]):
+        """頁面端推送的批次（在事件循環中調用）"""
+        if not self._running:
+            return
+        epoch, seq = payload.get('epoch'), payload.get('seq', 0)
+
+        if epoch != self.epoch:
+            if self.epoch is not None:
+                self.stats['reloads'] += 1
+                self._schedule_resync('reload')
+            self.epoch, self.last_seq = epoch, 0
+
+        if seq != self.last_seq + 1:
+            # 丟失了批次，這一批也可能不完整，以完整同步為準
+            self.stats['sequence_gaps'] += 1
+            self.logger.warning(f"消息批次序號不連續: 期望 {self.last_seq + 1}，收到 {seq}")
+            self.last_seq = seq
+            self._schedule_resync('sequence_gap')
+            return
+        self.last_seq = seq
+        self.stats['batches'] += 1
+
+        added = self._convert(payload.get('added', []))
+        updated = self._convert(payload.get('updated', []))
+        if added:
+            self.stats['new_messages'] += len(added)
+            self._queue.put_nowait(WatchEvent('new_messages', added))
+        if updated:
+            self.stats['updated_messages'] += len(updated)
+            self._queue.put_nowait(WatchEvent('updated_messages', updated))
+
+    def _convert(self, items: List[Dict[str, Any]]) -> List[Any]:
+        messages = []
+        for item in items:
+            try:
+                message = self.to_message(item)
+                if message is not None:
+                    messages.append(message)
+            except Exception as e:
+                self.logger.error(f"轉換推送消息失敗: {e}")
+        return messages
+
+    def _schedule_resync(self, reason: str):
+        if self._resync_task is None or self._resync_task.done():
+            self._resync_task = asyncio.ensure_future(self.resync(reason))
+
+    async def resync(self, reason: str):
+        """完整同步一次並作為resync事件發出"""
+        self.stats['resyncs'] += 1
+        self.last_resync = time.monotonic()
+        messages = await self._resync()
+        self._queue.put_nowait(WatchEvent('resync', messages, reason))
+
+    async def next_event(self, timeout: Optional[float] = None) -> Optional[WatchEvent]:
+        """
+        等待下一個事件
+
+        Returns:
+            事件；超時返回None。距離上次完整同步超過resync_interval時先做一次定期同步
+        """
+        if self._queue.empty() and time.monotonic() - self.last_resync >= self.resync_interval:
+            await self.resync('periodic')
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'epoch': self.epoch, 'last_seq': self.last_seq,
+                'queued_events': self._queue.qsize()}
@@ -15,6 +15,9 @@ import re
 import os
 from pathlib import Path
 
+from manus_message_identity import IncrementalMessageParser, message_fingerprint, new_messages
+from manus_message_watcher import ManusMessageWatcher, merge_pushed_messages
+
 @dataclass
 class ManusMessage:
     """Manus消息數據結構"""
@@ -48,6 +51,8 @@ class ManusOperator:
         self.context = None
         self.page = None
         self.is_running = False
+        self.message_watcher: Optional[ManusMessageWatcher] = None
+        self.message_parser = IncrementalMessageParser(self._message_from_snapshot, logger=logger)
         
         # 數據存儲
         self.conversations = {}
@@ -281,18 +286,10 @@ class ManusOperator:
             # 滾動加載所有消息
             await self._scroll_to_load_all_messages()
             
-            # 查找消息容器
-            message_containers = await self._find_elements(self.selectors['message_container'])
-            
-            self.logger.info(f"找到 {len(message_containers)} 個消息容器")
-            
-            for i, container in enumerate(message_containers):
-                try:
-                    message = await self._parse_message(container, i)
-                    if message:
-                        messages.append(message)
-                except Exception as e:
-                    self.logger.error(f"解析消息 {i} 失敗: {e}")
+            # 一次頁面調用取得所有消息節點，只解析之前沒見過的節點
+            messages = await self.message_parser.collect(
+                self.page, self.selectors['message_container'], self._message_fields()
+            )
             
             self.logger.info(f"✅ 成功獲取 {len(messages)} 條對話歷史")
             self.message_history = messages
@@ -350,47 +347,6 @@ class ManusOperator:
         self.logger.warning(f"所有選擇器都失敗: {selectors}")
         return []
     
-    async def _parse_message(self, container, index: int) -> Optional[ManusMessage]:
-        """解析單個消息"""
-        try:
-            # 提取內容
-            content = await self._extract_text_from_element(
-                container, self.selectors['message_content']
-            )
-            
-            # 提取發送者
-            sender = await self._extract_text_from_element(
-                container, self.selectors['message_sender']
-            ) or "unknown"
-            
-            # 提取時間
-            timestamp = await self._extract_time_from_element(
-                container, self.selectors['message_time']
-            ) or datetime.now()
-            
-            # 生成消息ID
-            message_id = f"msg_{index}_{int(timestamp.timestamp())}"
-            
-            # 判斷消息類型
-            message_type = self._determine_message_type(container, content, sender)
-            
-            return ManusMessage(
-                id=message_id,
-                content=content or "",
-                sender=sender,
-                timestamp=timestamp,
-                message_type=message_type,
-                conversation_id="main",
-                metadata={
-                    'index': index,
-                    'html': await container.inner_html() if container else ""
-                }
-            )
-            
-        except Exception as e:
-            self.logger.error(f"解析消息失敗: {e}")
-            return None
-    
     async def _extract_text_from_element(self, container, selectors: List[str]) -> Optional[str]:
         """從元素中提取文本"""
         for selector in selectors:
@@ -409,31 +365,6 @@ class ManusOperator:
         except:
             return None
     
-    async def _extract_time_from_element(self, container, selectors: List[str]) -> Optional[datetime]:
-        """從元素中提取時間"""
-        for selector in selectors:
-            try:
-                element = await container.query_selector(selector)
-                if element:
-                    # 嘗試從屬性獲取
-                    for attr in ['datetime', 'data-time', 'title']:
-                        time_str = await element.get_attribute(attr)
-                        if time_str:
-                            parsed_time = self._parse_time_string(time_str)
-                            if parsed_time:
-                                return parsed_time
-                    
-                    # 嘗試從文本獲取
-                    text = await element.inner_text()
-                    if text:
-                        parsed_time = self._parse_time_string(text)
-                        if parsed_time:
-                            return parsed_time
-            except:
-                continue
-        
-        return None
-    
     def _parse_time_string(self, time_str: str) -> Optional[datetime]:
         """解析時間字符串"""
         try:
@@ -459,17 +390,17 @@ class ManusOperator:
         except Exception:
             return None
     
-    def _determine_message_type(self, container, content: str, sender: str) -> str:
+    def _determine_message_type(self, class_name: str, content: str, sender: str) -> str:
         """判斷消息類型"""
         try:
             # 檢查CSS類名
-            class_name = container.get_attribute('class') or ""
+            class_name = (class_name or "").lower()
             
-            if 'user' in class_name.lower() or 'human' in class_name.lower():
+            if 'user' in class_name or 'human' in class_name:
                 return 'user'
-            elif 'assistant' in class_name.lower() or 'ai' in class_name.lower() or 'bot' in class_name.lower():
+            elif 'assistant' in class_name or 'ai' in class_name or 'bot' in class_name:
                 return 'assistant'
-            elif 'system' in class_name.lower():
+            elif 'system' in class_name:
                 return 'system'
             
             # 根據發送者判斷
@@ -483,6 +414,65 @@ class ManusOperator:
         except:
             return 'unknown'
     
+    def _message_fields(self) -> Dict[str, Any]:
+        """頁面端提取消息字段使用的選擇器"""
+        return {
+            'content': self.selectors['message_content'],
+            'sender': self.selectors['message_sender'],
+            'time': self.selectors['message_time']
+        }
+    
+    def _message_from_snapshot(self, snapshot: Dict[str, Any]) -> Optional[ManusMessage]:
+        """
+        把頁面端提取的消息字段（完整同步的快照或監聽腳本推送的消息）轉換為ManusMessage
+        
+        消息ID由發送者、類型、內容和時間屬性的哈希生成，同一條消息在重新渲染或列表位置變化後ID不變
+        """
+        content = snapshot.get('content') or snapshot.get('text') or ""
+        sender = snapshot.get('sender') or "unknown"
+        time_str = snapshot.get('timeAttr') or snapshot.get('timeText')
+        timestamp = (self._parse_time_string(time_str) if time_str else None) or datetime.now()
+        message_type = self._determine_message_type(snapshot.get('className'), content, sender)
+        
+        return ManusMessage(
+            id=f"msg_{message_fingerprint(sender, message_type, content, snapshot.get('timeAttr'))}",
+            content=content,
+            sender=sender,
+            timestamp=timestamp,
+            message_type=message_type,
+            conversation_id="main",
+            metadata={
+                'key': snapshot['key'],
+                'html': snapshot.get('html', ""),
+                'settled': snapshot.get('settled', True)
+            }
+        )
+    
+    async def start_message_watcher(self) -> ManusMessageWatcher:
+        """
+        啟動推送式消息監聽
+        
+        Returns:
+            監聽器，通過 next_event() 獲取新消息；首個事件是完整同步的結果
+        """
+        if self.message_watcher is None:
+            self.message_watcher = ManusMessageWatcher(
+                self.page,
+                self.selectors,
+                to_message=self.message_parser.parse_pushed,
+                resync=self.get_conversation_history,
+                logger=self.logger,
+                resync_interval=self.config.manus_resync_interval
+            )
+            await self.message_watcher.start()
+        return self.message_watcher
+    
+    async def stop_message_watcher(self):
+        """停止推送式消息監聽，下次 start_message_watcher() 重新注入並完整同步"""
+        watcher, self.message_watcher = self.message_watcher, None
+        if watcher:
+            await watcher.stop()
+    
     async def get_task_list(self) -> List[ManusTask]:
         """獲取任務列表"""
         self.logger.info("📋 開始獲取任務列表...")
@@ -656,21 +646,32 @@ class ManusOperator:
         """監控頁面變化"""
         self.logger.info("👁️ 開始監控頁面變化...")
         
-        last_message_count = 0
+        seen_message_ids = set()
         last_task_count = 0
+        watcher = None
         
         while self.is_running:
             try:
-                # 檢查新消息
-                current_messages = await self.get_conversation_history()
-                if len(current_messages) > last_message_count:
-                    new_messages = current_messages[last_message_count:]
-                    self.logger.info(f"🆕 檢測到 {len(new_messages)} 條新消息")
+                # 檢查新消息（按消息ID比較，列表滾動或重新渲染不會造成重複或遺漏）
+                if self.config.manus_event_driven:
+                    watcher = watcher or await self.start_message_watcher()
+                    # 等待頁面推送，最多等10秒後檢查任務
+                    event = await watcher.next_event(timeout=10)
+                    if event and event.kind == 'resync':
+                        fresh_messages = new_messages(event.messages, seen_message_ids)
+                    elif event:
+                        # 新增和更新都按節點合併，流式輸出的消息穩定後才作為新消息回調
+                        fresh_messages = merge_pushed_messages(self.message_history, event.messages, seen_message_ids)
+                    else:
+                        fresh_messages = []
+                else:
+                    fresh_messages = new_messages(await self.get_conversation_history(), seen_message_ids)
+                
+                if fresh_messages:
+                    self.logger.info(f"🆕 檢測到 {len(fresh_messages)} 條新消息")
                     
                     if callback:
-                        await callback('new_messages', new_messages)
-                    
-                    last_message_count = len(current_messages)
+                        await callback('new_messages', fresh_messages)
                 
                 # 檢查任務變化
                 current_tasks = await self.get_task_list()
@@ -682,15 +683,21 @@ class ManusOperator:
                     
                     last_task_count = len(current_tasks)
                 
-                await asyncio.sleep(10)  # 每10秒檢查一次
+                if not self.config.manus_event_driven:
+                    await asyncio.sleep(10)  # 每10秒檢查一次
                 
             except Exception as e:
                 self.logger.error(f"監控過程中發生錯誤: {e}")
+                # 出錯的監聽器可能已失效（頁面關閉或腳本丟失），停止後重新啟動
+                if watcher:
+                    await self.stop_message_watcher()
+                    watcher = None
                 await asyncio.sleep(30)
     
     async def _cleanup(self):
         """清理資源"""
         try:
+            await self.stop_message_watcher()
             if self.page:
                 await self.page.close()
             if self.context:
@@ -706,6 +713,8 @@ class ManusOperator:
             'is_running': self.is_running,
             'total_messages': len(self.message_history),
             'total_tasks': len(self.tasks),
+            'message_parser': self.message_parser.get_stats(),
+            'message_watcher': self.message_watcher.get_stats() if self.message_watcher else None,
             'last_update': datetime.now().isoformat()
         }
 
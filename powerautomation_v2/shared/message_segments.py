@@ -0,0 +1,351 @@
+"""
+對話消息段文件模組
+每個對話的消息追加寫入一個長度前綴的記錄文件 (.seg)，旁邊是定長的偏移索引 (.idx)；
+讀取時對兩個文件做內存映射，直接定位最後N條或某個時間範圍，不解析其餘消息
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple
+
+from storage_writer import decode_record, encode_record
+
+# 記錄頭：負載長度
+RECORD_HEADER = struct.Struct("<I")
+# 索引項：記錄偏移, 時間戳(epoch秒)
+INDEX_ENTRY = struct.Struct("<Qd")
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+def message_timestamp(message: Dict[str, Any], default: float) -> float:
+    """從消息的timestamp字段（epoch秒或ISO格式）取時間，缺失或無法解析時用default"""
+    value = message.get("timestamp") if isinstance(message, dict) else None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    return default
+
+def _to_epoch(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+def _read_prefix(f, length: int, chunk_size: int = 1 << 24):
+    """按塊讀取文件的前length字節"""
+    remaining = length
+    while remaining > 0:
+        chunk = f.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+def _replace_file(path: Path, chunks) -> None:
+    """把內容寫入臨時文件後原子替換path"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class MessageSegmentLog:
+    """
+    單個對話的消息日誌
+
+    索引中的時間戳保持非遞減（早於上一條的消息按上一條的時間索引），以便二分查找時間範圍；
+    打開時校驗索引與段文件，寫入中斷留下的不完整記錄會被截斷
+    """
+
+    def __init__(self, base_path: Path):
+        base_path = Path(base_path)
+        self.segment_path = base_path.with_name(base_path.name + SEGMENT_SUFFIX)
+        self.index_path = base_path.with_name(base_path.name + INDEX_SUFFIX)
+        self._lock = threading.RLock()
+        self._recovered = False
+
+    def exists(self) -> bool:
+        return self.segment_path.exists()
+
+    # ---- 寫入 ----
+
+    def append(self, messages: List[Dict[str, Any]]) -> int:
+        """追加消息，返回追加後的消息總數"""
+        with self._lock:
+            self._recover()
+            self.segment_path.parent.mkdir(parents=True, exist_ok=True)
+            last_ts = self._last_timestamp()
+
+            with open(self.segment_path, "ab") as seg, open(self.index_path, "ab") as idx:
+                records, entries = self._encode(messages, seg.tell(), last_ts)
+                # 先寫段文件再寫索引，中斷時最多留下未索引的尾部記錄
+                seg.write(b"".join(records))
+                seg.flush()
+                idx.write(b"".join(entries))
+
+            return os.path.getsize(self.index_path) // INDEX_ENTRY.size
+
+    def replace(self, messages: List[Dict[str, Any]]) -> int:
+        """用messages替換日誌中的全部消息（重新保存整個對話時使用），返回消息總數"""
+        with self._lock:
+            self._recover()
+            self.segment_path.parent.mkdir(parents=True, exist_ok=True)
+            records, entries = self._encode(messages, 0, float("-inf"))
+            seg_tmp = self.segment_path.with_name(self.segment_path.name + ".rewrite")
+            idx_tmp = self.index_path.with_name(self.index_path.name + ".rewrite")
+            for path, chunks in ((seg_tmp, records), (idx_tmp, entries)):
+                with open(path, "wb") as f:
+                    f.write(b"".join(chunks))
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._install(seg_tmp, idx_tmp)
+            return len(entries)
+
+    @staticmethod
+    def _encode(messages: List[Dict[str, Any]], offset: int, last_ts: float) -> Tuple[List[bytes], List[bytes]]:
+        """編碼記錄和索引項，offset為第一條記錄在段文件中的位置"""
+        now = time.time()
+        records, entries = [], []
+        for message in messages:
+            payload = encode_record(message)
+            last_ts = max(last_ts, message_timestamp(message, now))
+            records.append(RECORD_HEADER.pack(len(payload)))
+            records.append(payload)
+            entries.append(INDEX_ENTRY.pack(offset, last_ts))
+            offset += RECORD_HEADER.size + len(payload)
+        return records, entries
+
+    def _install(self, seg_tmp: Path, idx_tmp: Path):
+        """
+        用新寫好的段文件和索引替換當前文件（調用方持有鎖）
+
+        先用空索引替換舊索引使其失效，再替換段文件，中斷時由_recover按段文件重建索引；
+        全部用rename替換，已映射舊文件的讀取方繼續讀舊inode
+        """
+        _replace_file(self.index_path, [])
+        os.replace(seg_tmp, self.segment_path)
+        os.replace(idx_tmp, self.index_path)
+
+    def _last_timestamp(self) -> float:
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return float("-inf")
+        if size < INDEX_ENTRY.size:
+            return float("-inf")
+        with open(self.index_path, "rb") as idx:
+            idx.seek(size - INDEX_ENTRY.size)
+            return INDEX_ENTRY.unpack(idx.read(INDEX_ENTRY.size))[1]
+
+    def _recover(self):
+        """校驗索引和段文件的尾部，修復中斷的寫入（調用方持有鎖）"""
+        if self._recovered:
+            return
+        self._recovered = True
+        if not self.segment_path.exists():
+            if self.index_path.exists():
+                self.index_path.unlink()
+            return
+
+        seg_size = os.path.getsize(self.segment_path)
+        entries = self._read_index_entries()
+        valid_end, kept = 0, 0
+        with open(self.segment_path, "rb") as seg:
+            # 丟棄指向段文件之外或不連續的索引項
+            for offset, _ in entries:
+                if offset != valid_end or offset + RECORD_HEADER.size > seg_size:
+                    break
+                seg.seek(offset)
+                (length,) = RECORD_HEADER.unpack(seg.read(RECORD_HEADER.size))
+                end = offset + RECORD_HEADER.size + length
+                if end > seg_size:
+                    break
+                valid_end, kept = end, kept + 1
+
+            # 為已寫入段文件但沒有索引的完整記錄補索引，截斷不完整的尾部記錄
+            last_ts = entries[kept - 1][1] if kept else float("-inf")
+            extra = []
+            position = valid_end
+            while position + RECORD_HEADER.size <= seg_size:
+                seg.seek(position)
+                (length,) = RECORD_HEADER.unpack(seg.read(RECORD_HEADER.size))
+                if position + RECORD_HEADER.size + length > seg_size:
+                    break
+                try:
+                    message = decode_record(seg.read(length))
+                except ValueError:
+                    break
+                default = last_ts if last_ts != float("-inf") else time.time()
+                last_ts = max(last_ts, message_timestamp(message, default))
+                extra.append(INDEX_ENTRY.pack(position, last_ts))
+                position += RECORD_HEADER.size + length
+
+        # 寫入新文件後替換，不在原地截斷可能被讀取方映射的文件
+        if position < seg_size:
+            with open(self.segment_path, "rb") as seg:
+                _replace_file(self.segment_path, _read_prefix(seg, position))
+        if kept < len(entries) or extra:
+            kept_entries = b""
+            if kept:
+                with open(self.index_path, "rb") as idx:
+                    kept_entries = idx.read(kept * INDEX_ENTRY.size)
+            _replace_file(self.index_path, [kept_entries, *extra])
+
+    def _read_index_entries(self) -> List[Tuple[int, float]]:
+        try:
+            raw = self.index_path.read_bytes()
+        except FileNotFoundError:
+            return []
+        usable = len(raw) - len(raw) % INDEX_ENTRY.size
+        return list(INDEX_ENTRY.iter_unpack(raw[:usable]))
+
+    # ---- 讀取 ----
+
+    def _open_maps(self) -> Optional[Tuple[mmap.mmap, mmap.mmap]]:
+        # 在鎖內打開兩個文件，保證映射的段文件和索引屬於同一代（壓縮會替換兩個文件）；
+        # 文件只會追加或被整體替換，已建立的映射在鎖外讀取是安全的
+        with self._lock:
+            self._recover()
+            try:
+                if os.path.getsize(self.segment_path) == 0 or os.path.getsize(self.index_path) < INDEX_ENTRY.size:
+                    return None
+                # 先映射索引：追加時段文件先於索引寫入，已映射的索引項一定指向已寫入的記錄
+                with open(self.index_path, "rb") as idx:
+                    index_map = mmap.mmap(idx.fileno(), 0, access=mmap.ACCESS_READ)
+                with open(self.segment_path, "rb") as seg:
+                    segment_map = mmap.mmap(seg.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                return None
+        return segment_map, index_map
+
+    @staticmethod
+    def _entry(index_map: mmap.mmap, position: int) -> Tuple[int, float]:
+        return INDEX_ENTRY.unpack_from(index_map, position * INDEX_ENTRY.size)
+
+    @staticmethod
+    def _decode_at(segment_map: mmap.mmap, offset: int) -> Dict[str, Any]:
+        (length,) = RECORD_HEADER.unpack_from(segment_map, offset)
+        start = offset + RECORD_HEADER.size
+        return decode_record(segment_map[start:start + length])
+
+    def count(self) -> int:
+        with self._lock:
+            self._recover()
+        try:
+            return os.path.getsize(self.index_path) // INDEX_ENTRY.size
+        except FileNotFoundError:
+            return 0
+
+    def read_slice(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """按位置讀取 [start, stop) 的消息"""
+        maps = self._open_maps()
+        if maps is None:
+            return []
+        segment_map, index_map = maps
+        try:
+            total = len(index_map) // INDEX_ENTRY.size
+            start, stop = max(0, start), min(stop, total)
+            return [self._decode_at(segment_map, self._entry(index_map, i)[0]) for i in range(start, stop)]
+        finally:
+            segment_map.close()
+            index_map.close()
+
+    def tail(self, limit: int) -> List[Dict[str, Any]]:
+        """最後limit條消息（按寫入順序）"""
+        total = self.count()
+        return self.read_slice(total - limit, total) if limit > 0 else []
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        return self.read_slice(0, self.count())
+
+    def time_range(self, start: Optional[Any] = None, end: Optional[Any] = None,
+                   limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        時間在 [start, end) 內的消息
+
+        Args:
+            start, end: datetime或epoch秒，None表示不限
+            limit: 最多返回多少條（取範圍內最新的）
+        """
+        maps = self._open_maps()
+        if maps is None:
+            return []
+        segment_map, index_map = maps
+        try:
+            total = len(index_map) // INDEX_ENTRY.size
+            low = 0 if start is None else self._bisect(index_map, total, _to_epoch(start))
+            high = total if end is None else self._bisect(index_map, total, _to_epoch(end))
+            if limit is not None:
+                low = max(low, high - limit)
+            return [self._decode_at(segment_map, self._entry(index_map, i)[0]) for i in range(low, high)]
+        finally:
+            segment_map.close()
+            index_map.close()
+
+    def _bisect(self, index_map: mmap.mmap, total: int, timestamp: float) -> int:
+        """第一個時間戳 >= timestamp 的位置"""
+        low, high = 0, total
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(index_map, middle)[1] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # ---- 壓縮 ----
+
+    def compact(self, retain_since: Optional[Any] = None, keep_last: Optional[int] = None) -> Dict[str, int]:
+        """
+        重寫日誌，只保留時間不早於retain_since的消息和/或最後keep_last條
+
+        新文件寫完後原子替換；替換兩個文件之間中斷時，下次打開會按段文件重建索引
+
+        Returns:
+            壓縮前後的消息數
+        """
+        with self._lock:
+            maps = self._open_maps()
+            if maps is None:
+                return {"before": 0, "after": 0}
+            segment_map, index_map = maps
+            try:
+                total = len(index_map) // INDEX_ENTRY.size
+                first = 0 if retain_since is None else self._bisect(index_map, total, _to_epoch(retain_since))
+                if keep_last is not None:
+                    first = max(first, total - keep_last)
+                if first == 0:
+                    return {"before": total, "after": total}
+
+                seg_tmp = self.segment_path.with_name(self.segment_path.name + ".compact")
+                idx_tmp = self.index_path.with_name(self.index_path.name + ".compact")
+                base = self._entry(index_map, first)[0] if first < total else len(segment_map)
+                with open(seg_tmp, "wb") as seg, open(idx_tmp, "wb") as idx:
+                    # 保留的記錄在段文件中是連續的，整塊複製，不逐條解析
+                    for chunk_start in range(base, len(segment_map), 1 << 24):
+                        seg.write(segment_map[chunk_start:min(chunk_start + (1 << 24), len(segment_map))])
+                    entries = bytearray()
+                    for i in range(first, total):
+                        offset, timestamp = self._entry(index_map, i)
+                        entries += INDEX_ENTRY.pack(offset - base, timestamp)
+                    idx.write(entries)
+                    for f in (seg, idx):
+                        f.flush()
+                        os.fsync(f.fileno())
+            finally:
+                segment_map.close()
+                index_map.close()
+
+            self._install(seg_tmp, idx_tmp)
+            return {"before": total, "after": total - first}
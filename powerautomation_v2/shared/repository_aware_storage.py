@@ -3,27 +3,88 @@
 """
 倉庫感知數據存儲系統 - PowerAutomation
 實現 倉庫/conversationid 的層級數據組織
+保存操作同步更新索引，統計和總覽查詢讀索引而不遍歷目錄；
+文件由後台寫入器成組原子寫盤；對話消息追加到段文件，可直接讀取最近的消息
 """
 
 import os
-import json
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 
+from message_segments import MessageSegmentLog
+from repository_storage_index import RepositoryStorageIndex
+from storage_writer import StorageWriter, atomic_write, compress_cold_files, encode_record, read_record
+
+INDEX_FILENAME = ".storage_index.db"
+# 消息段文件名（messages.seg / messages.idx）
+MESSAGES_BASENAME = "messages"
+# 保持打開的消息日誌對象數（每個對象帶自己的寫鎖）
+MESSAGE_LOG_CACHE_SIZE = 256
+
 class RepositoryAwareDataStorage:
     """倉庫感知的數據存儲系統"""
     
-    def __init__(self, base_data_dir: str = "/home/ec2-user/powerautomation/data"):
+    def __init__(self, base_data_dir: str = "/home/ec2-user/powerautomation/data",
+                 repository_cache_ttl: float = 60, write_behind: bool = True, compact: bool = True):
         self.base_data_dir = Path(base_data_dir)
         self.base_data_dir.mkdir(parents=True, exist_ok=True)
         
-        # 當前倉庫檢測緩存
+        # 當前倉庫檢測緩存（檢測需要調用trae/git子進程）
         self._current_repository_cache = None
         self._cache_timestamp = 0
-        self._cache_ttl = 300  # 5分鐘緩存
+        self._cache_ttl = repository_cache_ttl
+        
+        # 對話索引，首次使用時從現有目錄重建
+        self.index = RepositoryStorageIndex(str(self.base_data_dir / INDEX_FILENAME))
+        if not self.index.is_built():
+            self.index.rebuild(self.base_data_dir)
+        
+        # 後台寫入器；write_behind=False時在調用線程中同步原子寫入
+        self.compact = compact
+        self.writer = StorageWriter(compact=compact) if write_behind else None
+        
+        # 同一對話共用一個消息日誌對象，保證追加互斥
+        self._message_logs: 'OrderedDict[Path, MessageSegmentLog]' = OrderedDict()
+        self._message_logs_lock = threading.Lock()
+    
+    def _write_record(self, path: Path, data: Dict):
+        if self.writer is not None:
+            self.writer.submit(path, data)
+        else:
+            atomic_write(path, encode_record(data, self.compact))
+    
+    def _read_record(self, path: Path) -> Optional[Dict]:
+        if self.writer is not None:
+            return self.writer.read(path)
+        return read_record(path)
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待所有已保存的數據寫盤"""
+        return self.writer.flush(timeout) if self.writer is not None else True
+    
+    def close(self):
+        """寫完待寫數據並停止後台寫入器，關閉索引連接"""
+        if self.writer is not None:
+            self.writer.close()
+        self.index.close()
+    
+    def _message_log(self, repository: str, conversation_id: str) -> MessageSegmentLog:
+        base_path = self.get_conversation_data_dir(repository, conversation_id, create=False) / MESSAGES_BASENAME
+        with self._message_logs_lock:
+            log = self._message_logs.get(base_path)
+            if log is None:
+                log = MessageSegmentLog(base_path)
+                self._message_logs[base_path] = log
+                while len(self._message_logs) > MESSAGE_LOG_CACHE_SIZE:
+                    self._message_logs.popitem(last=False)
+            else:
+                self._message_logs.move_to_end(base_path)
+            return log
     
     def detect_current_repository(self) -> str:
         """
@@ -32,7 +93,7 @@ class RepositoryAwareDataStorage:
         Returns:
             當前倉庫名稱
         """
-        current_time = time.time()
+        current_time = time.monotonic()
         
         # 檢查緩存
         if (self._current_repository_cache and 
@@ -115,33 +176,37 @@ class RepositoryAwareDataStorage:
         
         return f"conv_{timestamp}_{unique_id}"
     
-    def get_repository_data_dir(self, repository: str) -> Path:
+    def get_repository_data_dir(self, repository: str, create: bool = True) -> Path:
         """
         獲取倉庫數據目錄
         
         Args:
             repository: 倉庫名稱
+            create: 目錄不存在時是否創建（只讀查詢傳False）
             
         Returns:
             倉庫數據目錄路徑
         """
         repo_dir = self.base_data_dir / repository
-        repo_dir.mkdir(parents=True, exist_ok=True)
+        if create:
+            repo_dir.mkdir(parents=True, exist_ok=True)
         return repo_dir
     
-    def get_conversation_data_dir(self, repository: str, conversation_id: str) -> Path:
+    def get_conversation_data_dir(self, repository: str, conversation_id: str, create: bool = True) -> Path:
         """
         獲取對話數據目錄
         
         Args:
             repository: 倉庫名稱
             conversation_id: 對話ID
+            create: 目錄不存在時是否創建（只讀查詢傳False）
             
         Returns:
             對話數據目錄路徑
         """
-        conv_dir = self.get_repository_data_dir(repository) / conversation_id
-        conv_dir.mkdir(parents=True, exist_ok=True)
+        conv_dir = self.get_repository_data_dir(repository, create) / conversation_id
+        if create:
+            conv_dir.mkdir(parents=True, exist_ok=True)
         return conv_dir
     
     def save_conversation_data(self, conversation_data: Dict, 
@@ -155,6 +220,8 @@ class RepositoryAwareDataStorage:
             repository: 倉庫名稱，如果為None則自動檢測
             conversation_id: 對話ID，如果為None則自動生成
             
+        conversation_data中的messages列表追加到消息段文件，conversation.json只保存message_count
+            
         Returns:
             對話ID
         """
@@ -164,8 +231,8 @@ class RepositoryAwareDataStorage:
         if conversation_id is None:
             conversation_id = self.generate_conversation_id(repository)
         
-        # 獲取對話數據目錄
-        conv_dir = self.get_conversation_data_dir(repository, conversation_id)
+        # 獲取對話數據目錄（後台寫入器寫盤時才創建目錄）
+        conv_dir = self.get_conversation_data_dir(repository, conversation_id, create=self.writer is None)
         
         # 添加元數據
         conversation_data.update({
@@ -175,10 +242,16 @@ class RepositoryAwareDataStorage:
             'storage_version': '2.0'
         })
         
+        record = conversation_data
+        messages = conversation_data.get('messages')
+        if isinstance(messages, list):
+            record = {key: value for key, value in conversation_data.items() if key != 'messages'}
+            # 保存是整體覆蓋：重新保存同一對話時替換其消息，不重複追加
+            record['message_count'] = self._message_log(repository, conversation_id).replace(messages)
+        
         # 保存主要對話數據
-        conversation_file = conv_dir / 'conversation.json'
-        with open(conversation_file, 'w', encoding='utf-8') as f:
-            json.dump(conversation_data, f, ensure_ascii=False, indent=2)
+        self._write_record(conv_dir / 'conversation.json', record)
+        self.index.record(repository, conversation_id, 'conversation')
         
         return conversation_id
     
@@ -193,7 +266,8 @@ class RepositoryAwareDataStorage:
             repository: 倉庫名稱
             conversation_id: 對話ID
         """
-        conv_dir = self.get_conversation_data_dir(repository, conversation_id)
+        # 後台寫入器寫盤時才創建目錄
+        conv_dir = self.get_conversation_data_dir(repository, conversation_id, create=self.writer is None)
         
         analysis_data.update({
             'repository': repository,
@@ -201,9 +275,8 @@ class RepositoryAwareDataStorage:
             'analysis_timestamp': datetime.now().isoformat()
         })
         
-        analysis_file = conv_dir / 'intervention_analysis.json'
-        with open(analysis_file, 'w', encoding='utf-8') as f:
-            json.dump(analysis_data, f, ensure_ascii=False, indent=2)
+        self._write_record(conv_dir / 'intervention_analysis.json', analysis_data)
+        self.index.record(repository, conversation_id, 'analysis')
     
     def save_intervention_result(self, result_data: Dict, 
                                repository: str, 
@@ -216,7 +289,8 @@ class RepositoryAwareDataStorage:
             repository: 倉庫名稱
             conversation_id: 對話ID
         """
-        conv_dir = self.get_conversation_data_dir(repository, conversation_id)
+        # 後台寫入器寫盤時才創建目錄
+        conv_dir = self.get_conversation_data_dir(repository, conversation_id, create=self.writer is None)
         
         result_data.update({
             'repository': repository,
@@ -224,29 +298,74 @@ class RepositoryAwareDataStorage:
             'result_timestamp': datetime.now().isoformat()
         })
         
-        result_file = conv_dir / 'intervention_result.json'
-        with open(result_file, 'w', encoding='utf-8') as f:
-            json.dump(result_data, f, ensure_ascii=False, indent=2)
+        self._write_record(conv_dir / 'intervention_result.json', result_data)
+        self.index.record(repository, conversation_id, 'result')
     
-    def load_conversation_data(self, repository: str, conversation_id: str) -> Optional[Dict]:
+    def load_conversation_data(self, repository: str, conversation_id: str,
+                               max_messages: Optional[int] = None) -> Optional[Dict]:
         """
         加載對話數據
         
         Args:
             repository: 倉庫名稱
             conversation_id: 對話ID
+            max_messages: 只附帶最後N條消息，None表示全部
             
         Returns:
             對話數據或None
         """
-        conv_dir = self.get_conversation_data_dir(repository, conversation_id)
-        conversation_file = conv_dir / 'conversation.json'
+        conv_dir = self.get_conversation_data_dir(repository, conversation_id, create=False)
+        data = self._read_record(conv_dir / 'conversation.json')
         
-        if conversation_file.exists():
-            with open(conversation_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        log = self._message_log(repository, conversation_id)
+        if data is not None and log.exists():
+            data['messages'] = log.read_all() if max_messages is None else log.tail(max_messages)
+        return data
+    
+    def append_messages(self, repository: str, conversation_id: str, messages: List[Dict]) -> int:
+        """
+        追加對話消息到段文件
         
-        return None
+        Returns:
+            追加後的消息總數
+        """
+        return self._message_log(repository, conversation_id).append(messages)
+    
+    def get_recent_messages(self, repository: str, conversation_id: str, limit: int = 20) -> List[Dict]:
+        """讀取最後limit條消息（只解碼這些消息）"""
+        return self._message_log(repository, conversation_id).tail(limit)
+    
+    def get_messages_between(self, repository: str, conversation_id: str,
+                             start: Optional[Any] = None, end: Optional[Any] = None,
+                             limit: Optional[int] = None) -> List[Dict]:
+        """
+        讀取時間在 [start, end) 內的消息
+        
+        Args:
+            start, end: datetime或epoch秒，None表示不限
+            limit: 最多返回範圍內最新的limit條
+        """
+        return self._message_log(repository, conversation_id).time_range(start, end, limit)
+    
+    def compact_message_logs(self, retain_days: Optional[float] = None,
+                             keep_last: Optional[int] = None) -> Dict[str, int]:
+        """
+        壓縮所有對話的消息段文件，丟棄早於retain_days天的消息和/或只保留最後keep_last條
+        
+        Returns:
+            處理的日誌數和丟棄的消息數
+        """
+        retain_since = time.time() - retain_days * 86400 if retain_days is not None else None
+        summary = {'logs': 0, 'dropped_messages': 0}
+        for repository in self.list_all_repositories():
+            for conversation_id in self.index.list_conversations(repository):
+                log = self._message_log(repository, conversation_id)
+                if not log.exists():
+                    continue
+                result = log.compact(retain_since=retain_since, keep_last=keep_last)
+                summary['logs'] += 1
+                summary['dropped_messages'] += result['before'] - result['after']
+        return summary
     
     def list_repository_conversations(self, repository: str) -> List[str]:
         """
@@ -258,14 +377,7 @@ class RepositoryAwareDataStorage:
         Returns:
             對話ID列表
         """
-        repo_dir = self.get_repository_data_dir(repository)
-        
-        conversations = []
-        for item in repo_dir.iterdir():
-            if item.is_dir() and item.name.startswith('conv_'):
-                conversations.append(item.name)
-        
-        return sorted(conversations, reverse=True)  # 最新的在前
+        return self.index.list_conversations(repository)  # 最新的在前
     
     def list_all_repositories(self) -> List[str]:
         """
@@ -274,12 +386,7 @@ class RepositoryAwareDataStorage:
         Returns:
             倉庫名稱列表
         """
-        repositories = []
-        for item in self.base_data_dir.iterdir():
-            if item.is_dir():
-                repositories.append(item.name)
-        
-        return sorted(repositories)
+        return self.index.list_repositories()
     
     def get_repository_statistics(self, repository: str) -> Dict:
         """
@@ -291,26 +398,36 @@ class RepositoryAwareDataStorage:
         Returns:
             統計信息
         """
-        conversations = self.list_repository_conversations(repository)
-        
-        stats = {
+        indexed = self.index.repository_statistics(repository).get(repository, {})
+        return self._build_statistics(repository, indexed)
+    
+    def _build_statistics(self, repository: str, indexed: Dict) -> Dict:
+        total = indexed.get('total_conversations', 0)
+        interventions = indexed.get('interventions', 0)
+        return {
             'repository': repository,
-            'total_conversations': len(conversations),
-            'latest_conversation': conversations[0] if conversations else None,
-            'data_directory': str(self.get_repository_data_dir(repository))
+            'total_conversations': total,
+            'latest_conversation': indexed.get('latest_conversation'),
+            'data_directory': str(self.get_repository_data_dir(repository, create=False)),
+            'interventions': interventions,
+            'intervention_rate': interventions / total if total else 0
         }
+    
+    def compress_cold_data(self, older_than_days: float = 7) -> int:
+        """
+        用zstd壓縮超過指定天數未修改的記錄文件（需要安裝zstandard）
         
-        # 計算介入統計
-        intervention_count = 0
-        for conv_id in conversations:
-            conv_dir = self.get_conversation_data_dir(repository, conv_id)
-            if (conv_dir / 'intervention_result.json').exists():
-                intervention_count += 1
-        
-        stats['interventions'] = intervention_count
-        stats['intervention_rate'] = intervention_count / len(conversations) if conversations else 0
+        壓縮後的文件仍可通過load_conversation_data讀取
         
-        return stats
+        Returns:
+            壓縮的文件數
+        """
+        self.flush()
+        return compress_cold_files(self.base_data_dir, older_than_days * 86400, writer=self.writer)
+    
+    def rebuild_index(self) -> int:
+        """從數據目錄重建索引（手動修改過數據目錄時使用）"""
+        return self.index.rebuild(self.base_data_dir)
     
     def get_system_overview(self) -> Dict:
         """
@@ -332,8 +449,9 @@ class RepositoryAwareDataStorage:
         total_conversations = 0
         total_interventions = 0
         
+        indexed = self.index.repository_statistics()
         for repo in repositories:
-            stats = self.get_repository_statistics(repo)
+            stats = self._build_statistics(repo, indexed.get(repo, {}))
             overview['repository_stats'][repo] = stats
             total_conversations += stats['total_conversations']
             total_interventions += stats['interventions']
@@ -382,4 +500,6 @@ if __name__ == "__main__":
     # 系統總覽
     overview = storage.get_system_overview()
     print(f"系統總覽: {overview}")
+    
+    storage.close()
 
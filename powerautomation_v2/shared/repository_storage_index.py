@@ -0,0 +1,173 @@
+"""
+倉庫存儲索引模組
+記錄每個 倉庫/conversationid 目錄中已保存的文件，
+統計和總覽查詢直接讀索引，不再遍歷數據目錄
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+from storage_writer import record_exists
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    repository TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    has_conversation INTEGER NOT NULL DEFAULT 0,
+    has_analysis INTEGER NOT NULL DEFAULT 0,
+    has_result INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (repository, conversation_id)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 記錄類型 -> (文件名, 索引列)
+RECORD_KINDS = {
+    "conversation": ("conversation.json", "has_conversation"),
+    "analysis": ("intervention_analysis.json", "has_analysis"),
+    "result": ("intervention_result.json", "has_result"),
+}
+
+# 與目錄遍歷的行為一致，只統計 conv_ 開頭的對話
+CONVERSATION_FILTER = "conversation_id LIKE 'conv\\_%' ESCAPE '\\'"
+
+class RepositoryStorageIndex:
+    """RepositoryAwareDataStorage的SQLite索引"""
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        每個線程復用一個連接（每次保存對話都會記錄索引）
+
+        連接的上下文管理器只界定事務，不關閉連接；用close()關閉當前線程的連接
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # 索引可以從數據目錄重建，不需要每次提交都fsync
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """關閉當前線程的連接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def is_built(self) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = 'built'").fetchone() is not None
+
+    def rebuild(self, base_data_dir: Path) -> int:
+        """
+        從數據目錄重建索引（首次啟用索引或索引丟失時使用）
+
+        Returns:
+            索引的對話數量
+        """
+        rows = []
+        now = datetime.now().isoformat()
+        for repo_dir in Path(base_data_dir).iterdir():
+            if not repo_dir.is_dir():
+                continue
+            for conv_dir in repo_dir.iterdir():
+                if not conv_dir.is_dir():
+                    continue
+                flags = [int(record_exists(conv_dir / filename)) for filename, _ in RECORD_KINDS.values()]
+                rows.append((repo_dir.name, conv_dir.name, *flags, now))
+
+        with self._connect() as conn:
+            conn.execute("DELETE FROM conversations")
+            conn.executemany(
+                "INSERT INTO conversations(repository, conversation_id, has_conversation, has_analysis, "
+                "has_result, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('built', ?)", (now,))
+        return len(rows)
+
+    def record(self, repository: str, conversation_id: str, kind: str):
+        """記錄一次保存"""
+        column = RECORD_KINDS[kind][1]
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO conversations(repository, conversation_id, {column}, updated_at) "
+                f"VALUES (?, ?, 1, ?) "
+                f"ON CONFLICT(repository, conversation_id) DO UPDATE SET "
+                f"{column} = 1, updated_at = excluded.updated_at",
+                (repository, conversation_id, datetime.now().isoformat())
+            )
+
+    def list_repositories(self) -> List[str]:
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT repository FROM conversations ORDER BY repository"
+            )]
+
+    def list_conversations(self, repository: str) -> List[str]:
+        """倉庫的對話ID（最新的在前）"""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                f"SELECT conversation_id FROM conversations WHERE repository = ? AND {CONVERSATION_FILTER} "
+                f"ORDER BY conversation_id DESC",
+                (repository,)
+            )]
+
+    def has_record(self, repository: str, conversation_id: str, kind: str) -> bool:
+        column = RECORD_KINDS[kind][1]
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {column} FROM conversations WHERE repository = ? AND conversation_id = ?",
+                (repository, conversation_id)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def repository_statistics(self, repository: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        按倉庫匯總對話數、介入數和最新對話
+
+        Args:
+            repository: 只統計指定倉庫，None表示所有倉庫
+        """
+        sql = (
+            f"SELECT repository, "
+            f"SUM(CASE WHEN {CONVERSATION_FILTER} THEN 1 ELSE 0 END) AS total, "
+            f"SUM(CASE WHEN {CONVERSATION_FILTER} THEN has_result ELSE 0 END) AS interventions, "
+            f"MAX(CASE WHEN {CONVERSATION_FILTER} THEN conversation_id END) AS latest "
+            f"FROM conversations"
+        )
+        params = []
+        if repository is not None:
+            sql += " WHERE repository = ?"
+            params.append(repository)
+        sql += " GROUP BY repository"
+
+        with self._connect() as conn:
+            return {
+                row["repository"]: {
+                    "total_conversations": row["total"] or 0,
+                    "interventions": row["interventions"] or 0,
+                    "latest_conversation": row["latest"]
+                }
+                for row in conn.execute(sql, params)
+            }
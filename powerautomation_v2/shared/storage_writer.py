@@ -0,0 +1,269 @@
+"""
+存儲寫入模組
+保存請求先進入內存隊列立即返回，後台線程成組寫盤；
+每個文件先寫臨時文件再原子替換，崩潰時不會留下截斷的JSON；
+尚未寫盤的記錄可以直接從隊列讀取
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 冷數據壓縮後的文件後綴
+COMPRESSED_SUFFIX = ".zst"
+
+def encode_record(data: Any, compact: bool = True) -> bytes:
+    """編碼為JSON（compact時優先使用orjson）"""
+    if compact and orjson is not None:
+        return orjson.dumps(data, default=str)
+    if compact:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+
+def decode_record(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def atomic_write(path: Path, raw: bytes, fsync: bool = True):
+    """寫臨時文件後原子替換目標文件"""
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(raw)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def fsync_directory(directory: Path):
+    """讓目錄中的重命名落盤（不支持目錄fsync的平台上忽略）"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def record_exists(path: Path) -> bool:
+    return path.exists() or path.with_name(path.name + COMPRESSED_SUFFIX).exists()
+
+def read_record(path: Path) -> Optional[Any]:
+    """讀取記錄文件，支持壓縮過的冷數據；不存在時返回None"""
+    if path.exists():
+        return decode_record(path.read_bytes())
+
+    compressed = path.with_name(path.name + COMPRESSED_SUFFIX)
+    if compressed.exists():
+        if zstandard is None:
+            raise RuntimeError(f"讀取 {compressed} 需要安裝zstandard")
+        return decode_record(zstandard.ZstdDecompressor().decompress(compressed.read_bytes()))
+
+    return None
+
+class StorageWriter:
+    """
+    後台批量寫入器
+
+    同一路徑在寫盤前被多次保存時只寫最後一次；
+    flush() 等待當前隊列全部寫盤，close() 寫完後停止後台線程
+    """
+
+    def __init__(self, compact: bool = True, fsync: bool = True,
+                 batch_delay: float = 0.05, max_batch: int = 256):
+        self.compact = compact
+        self.fsync = fsync
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+
+        # 路徑 -> (序號, 編碼後的數據)
+        self._pending: Dict[Path, Tuple[int, bytes]] = {}
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"submitted": 0, "written": 0, "superseded": 0, "batches": 0, "errors": 0}
+
+        atexit.register(self.close)
+
+    def submit(self, path: Path, data: Any):
+        """
+        加入寫入隊列並立即返回
+
+        數據在提交時編碼，之後調用方修改原對象不會影響寫入內容
+        """
+        raw = encode_record(data, self.compact)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("StorageWriter已關閉")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+                self._thread.start()
+            self._sequence += 1
+            if path in self._pending:
+                self.stats["superseded"] += 1
+            self._pending[path] = (self._sequence, raw)
+            self.stats["submitted"] += 1
+            self._condition.notify_all()
+
+    def read(self, path: Path) -> Optional[Any]:
+        """讀取記錄，優先返回尚未寫盤的數據"""
+        with self._condition:
+            pending = self._pending.get(path)
+        if pending is not None:
+            return decode_record(pending[1])
+        return read_record(path)
+
+    def has_pending(self, path: Path) -> bool:
+        with self._condition:
+            return path in self._pending
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+            # 留出短暫時間讓更多記錄加入同一批
+            if not self._closed:
+                time.sleep(self.batch_delay)
+            with self._condition:
+                batch = list(self._pending.items())[:self.max_batch]
+            if not self._write_batch(batch) and self._closed:
+                logger.error(f"StorageWriter關閉時仍有 {len(self._pending)} 條記錄無法寫入")
+                return
+
+    def _write_batch(self, batch: List[Tuple[Path, Tuple[int, bytes]]]) -> int:
+        written = []
+        directories = set()
+        for path, (sequence, raw) in batch:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write(path, raw, self.fsync)
+                # 新數據取代之前壓縮過的舊版本
+                stale = path.with_name(path.name + COMPRESSED_SUFFIX)
+                if stale.exists():
+                    stale.unlink()
+                directories.add(path.parent)
+                written.append((path, sequence))
+            except Exception as e:
+                # 寫入失敗的記錄留在隊列中，下一批重試
+                self.stats["errors"] += 1
+                logger.error(f"寫入 {path} 失敗: {e}")
+
+        if self.fsync:
+            for directory in directories:
+                fsync_directory(directory)
+
+        with self._condition:
+            for path, sequence in written:
+                # 寫盤期間又被重新提交的記錄保留在隊列中
+                if self._pending.get(path, (None,))[0] == sequence:
+                    del self._pending[path]
+            self.stats["written"] += len(written)
+            self.stats["batches"] += 1
+            self._condition.notify_all()
+
+        if not written and not self._closed:
+            time.sleep(min(1.0, self.batch_delay * 10))
+        return len(written)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的記錄全部寫盤"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                if self._thread is None or not self._thread.is_alive():
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return not self._pending
+
+    def close(self, timeout: Optional[float] = None):
+        """寫完隊列中的記錄並停止後台線程"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        atexit.unregister(self.close)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {**self.stats, "pending": len(self._pending), "compact": self.compact,
+                    "encoder": "orjson" if self.compact and orjson is not None else "json"}
+
+def compress_cold_files(root: Path, older_than: float, pattern: str = "*.json",
+                        writer: Optional[StorageWriter] = None) -> int:
+    """
+    用zstd壓縮超過 older_than 秒未修改的記錄文件（原子替換，壓縮後刪除原文件）
+
+    讀取和壓縮在鎖外進行；替換前在writer的鎖內確認文件不在寫入隊列中（包括正在寫盤的批次）
+    且修改時間沒有變化，否則跳過，避免刪掉剛寫入的新數據
+
+    Args:
+        writer: 寫入同一目錄的StorageWriter
+
+    Returns:
+        壓縮的文件數
+    """
+    if zstandard is None:
+        raise RuntimeError("壓縮冷數據需要安裝zstandard")
+
+    compressor = zstandard.ZstdCompressor(level=10)
+    cutoff = time.time() - older_than
+    lock = writer._condition if writer is not None else threading.Lock()
+    count = 0
+    for path in Path(root).rglob(pattern):
+        try:
+            stat = path.stat()
+            if not path.is_file() or stat.st_mtime >= cutoff or (writer is not None and writer.has_pending(path)):
+                continue
+            compressed = compressor.compress(path.read_bytes())
+        except FileNotFoundError:
+            continue
+        with lock:
+            if writer is not None and path in writer._pending:
+                continue
+            try:
+                current = path.stat()
+            except FileNotFoundError:
+                continue
+            if (current.st_mtime_ns, current.st_size, current.st_ino) != (stat.st_mtime_ns, stat.st_size, stat.st_ino):
+                continue
+            atomic_write(path.with_name(path.name + COMPRESSED_SUFFIX), compressed)
+            path.unlink()
+        count += 1
+    return count
@@ -1,24 +1,33 @@
 """
 TRAE數據庫操作模組
 通過SSH連接到Mac，直接訪問TRAE的SQLite數據庫
+數據庫文件經TraeDbMirror增量同步到本地鏡像，只傳輸變化的頁；
+對話歷史經TraeHistoryIndex解析到按倉庫和時間索引的側表
 """
 
-import sqlite3
+import asyncio
+import hashlib
 import json
 import subprocess
 import tempfile
 import os
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from dataclasses import dataclass
 import logging
 
+from trae_db_sync import TraeDbMirror, SSHTransport
+from trae_history_index import TraeHistoryIndex
+
+# 對話數據中標識倉庫的字段（按優先級）
+REPO_FIELDS = ("repo", "repository", "repo_name", "workspace", "workspaceFolder", "folder")
+
 @dataclass
 class TraeConversation:
     """TRAE對話數據結構"""
     id: str
     content: str
-    timestamp: datetime
+    timestamp: Optional[datetime]
     conversation_type: str
     metadata: Dict[str, Any] = None
 
@@ -40,8 +49,17 @@ class TraeDatabase:
         # TRAE數據庫路徑
         self.trae_db_path = "/Users/alexchuang/Library/Application Support/Trae/User/workspaceStorage/f002a9b85f221075092022809f5a075f/state.vscdb"
         
-        # 本地臨時文件
+        # 本地鏡像（跨connect()複用，只同步變化的頁）
+        mirror_dir = os.path.join(getattr(config, "data_dir", None) or tempfile.gettempdir(), "trae_mirror")
+        self.db_mirror = TraeDbMirror(
+            SSHTransport(self.ssh_config),
+            self.trae_db_path,
+            os.path.join(mirror_dir, "state.vscdb"),
+            logger=logger
+        )
+        self.history_index = TraeHistoryIndex(os.path.join(mirror_dir, "history_index.db"), logger=logger)
         self.temp_db_path = None
+        self.last_sync_result = None
     
     async def connect(self) -> bool:
         """連接到TRAE數據庫"""
@@ -61,48 +79,34 @@ class TraeDatabase:
             return False
     
     async def _copy_db_from_remote(self) -> bool:
-        """從遠程複製數據庫文件"""
+        """增量同步遠程數據庫到本地鏡像"""
         try:
-            # 創建臨時文件
-            temp_fd, self.temp_db_path = tempfile.mkstemp(suffix='.db')
-            os.close(temp_fd)
-            
-            # 構建scp命令
-            scp_cmd = [
-                "scp",
-                "-P", str(self.ssh_config["port"]),
-                "-o", "StrictHostKeyChecking=no",
-                f"{self.ssh_config['user']}@{self.ssh_config['host']}:{self.trae_db_path}",
-                self.temp_db_path
-            ]
-            
-            self.logger.debug(f"執行SCP命令: {' '.join(scp_cmd)}")
-            
-            # 執行scp命令
-            process = subprocess.Popen(
-                scp_cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            loop = asyncio.get_running_loop()
+            self.last_sync_result = await loop.run_in_executor(None, self.db_mirror.sync)
+            self.temp_db_path = self.db_mirror.mirror_path
             
-            # 發送密碼
-            stdout, stderr = process.communicate(input=f"{self.ssh_config['password']}\n")
-            
-            if process.returncode == 0:
-                self.logger.info("✅ 數據庫文件複製成功")
-                return True
+            db_result = self.last_sync_result["files"]["db"]
+            if db_result.get("skipped"):
+                self.logger.info("✅ 遠程數據庫未變化，沿用本地鏡像")
             else:
-                self.logger.error(f"SCP失敗: {stderr}")
-                return False
+                self.logger.info(
+                    f"✅ 數據庫鏡像已同步: {self.last_sync_result['pages_fetched']} 頁，"
+                    f"{self.last_sync_result['bytes_transferred']} 字節"
+                )
+            return True
                 
         except Exception as e:
-            self.logger.error(f"複製數據庫文件失敗: {e}")
+            self.logger.error(f"同步數據庫文件失敗: {e}")
             return False
     
-    async def get_conversation_history(self, repo_name: Optional[str] = None) -> List[TraeConversation]:
-        """獲取對話歷史"""
+    async def get_conversation_history(self, repo_name: Optional[str] = None, limit: int = 100,
+                                       offset: int = 0, since: Optional[datetime] = None) -> List[TraeConversation]:
+        """
+        獲取對話歷史（按時間倒序分頁）
+        
+        ItemTable中的blob只在內容變化時解析一次並寫入歷史索引，
+        查詢直接走索引的倉庫和時間列
+        """
         if not self.temp_db_path or not os.path.exists(self.temp_db_path):
             self.logger.error("數據庫文件不存在，請先連接")
             return []
@@ -112,46 +116,18 @@ class TraeDatabase:
         try:
             self.logger.info("📜 從TRAE數據庫提取對話歷史...")
             
-            with sqlite3.connect(self.temp_db_path) as conn:
-                cursor = conn.cursor()
-                
-                # 查詢對話歷史
-                if repo_name:
-                    query = """
-                    SELECT key, value FROM ItemTable
-                    WHERE key LIKE '%input-history%' OR key LIKE '%memento%'
-                    AND value LIKE ?
-                    ORDER BY key;
-                    """
-                    cursor.execute(query, (f"%{repo_name}%",))
-                else:
-                    query = """
-                    SELECT key, value FROM ItemTable
-                    WHERE key LIKE '%input-history%' OR key LIKE '%memento%'
-                    ORDER BY key;
-                    """
-                    cursor.execute(query)
-                
-                rows = cursor.fetchall()
-                
-                for key, value in rows:
-                    try:
-                        # 解析JSON數據
-                        if value:
-                            data = json.loads(value)
-                            conversation = self._parse_conversation_data(key, data)
-                            if conversation:
-                                conversations.append(conversation)
-                    except json.JSONDecodeError:
-                        # 如果不是JSON，直接作為文本處理
-                        conversation = TraeConversation(
-                            id=key,
-                            content=value,
-                            timestamp=datetime.now(),
-                            conversation_type="text",
-                            metadata={"raw_key": key}
-                        )
-                        conversations.append(conversation)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.history_index.refresh, self.temp_db_path, self._normalize_item)
+            rows = await loop.run_in_executor(None, self.history_index.query, repo_name, since, limit, offset)
+            
+            for row in rows:
+                conversations.append(TraeConversation(
+                    id=row["key"],
+                    content=row["content"],
+                    timestamp=datetime.fromisoformat(row["timestamp"]),
+                    conversation_type=row["conversation_type"],
+                    metadata=json.loads(row["metadata"]) if row["metadata"] else None
+                ))
             
             self.logger.info(f"✅ 成功提取 {len(conversations)} 條對話記錄")
             
@@ -160,8 +136,85 @@ class TraeDatabase:
         
         return conversations
     
+    def _normalize_item(self, key: str, value: Any) -> Union[Dict[str, Any], List[Dict[str, Any]], None]:
+        """
+        把ItemTable的一行解析為歷史索引的規範化字段
+        
+        列表blob（如輸入歷史）按條目拆分為多行，每個條目有自己的倉庫和時間；
+        條目key由內容哈希生成，列表增刪條目時其他條目的key不變
+        """
+        if not value:
+            return None
+        
+        try:
+            data = json.loads(value)
+        except json.JSONDecodeError:
+            # 如果不是JSON，直接作為文本處理
+            return self._normalize_conversation(TraeConversation(
+                id=key,
+                content=value.decode("utf-8", "replace") if isinstance(value, bytes) else value,
+                timestamp=None,
+                conversation_type="text",
+                metadata={"raw_key": key}
+            ))
+        
+        if not isinstance(data, list):
+            return self._normalize_conversation(self._parse_conversation_data(key, data))
+        
+        items = []
+        occurrences: Dict[str, int] = {}
+        for entry in data:
+            entry_digest = hashlib.blake2b(
+                json.dumps(entry, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"), digest_size=8
+            ).hexdigest()
+            occurrences[entry_digest] = occurrences.get(entry_digest, 0) + 1
+            entry_key = f"{key}#{entry_digest}"
+            if occurrences[entry_digest] > 1:
+                entry_key += f"-{occurrences[entry_digest]}"
+            item = self._normalize_conversation(self._parse_conversation_data(entry_key, entry))
+            if item is not None:
+                item["metadata"] = {**(item["metadata"] or {}), "source_key": key}
+                items.append(item)
+        return items
+    
+    def _normalize_conversation(self, conversation: Optional[TraeConversation]) -> Optional[Dict[str, Any]]:
+        """時間未知時timestamp為None，由歷史索引填入首次發現的時間"""
+        if conversation is None:
+            return None
+        return {
+            "key": conversation.id,
+            "repo": self._extract_repo(conversation.metadata),
+            "timestamp": conversation.timestamp.isoformat() if conversation.timestamp else None,
+            "conversation_type": conversation.conversation_type,
+            "content": conversation.content,
+            "metadata": conversation.metadata
+        }
+    
+    @staticmethod
+    def _extract_repo(data: Any, depth: int = 2) -> Optional[str]:
+        """從對話數據的倉庫/工作區字段中提取倉庫名（路徑或URI取最後一段）"""
+        if depth < 0:
+            return None
+        
+        if isinstance(data, dict):
+            for field in REPO_FIELDS:
+                value = data.get(field)
+                if isinstance(value, str) and value.strip():
+                    return value.rstrip("/").rsplit("/", 1)[-1]
+            children = list(data.values())
+        elif isinstance(data, list):
+            children = data
+        else:
+            return None
+        
+        for child in children:
+            repo = TraeDatabase._extract_repo(child, depth - 1)
+            if repo:
+                return repo
+        return None
+    
     def _parse_conversation_data(self, key: str, data: Any) -> Optional[TraeConversation]:
-        """解析對話數據"""
+        """解析對話數據（沒有可用時間字段時timestamp為None）"""
         try:
             if isinstance(data, dict):
                 # 處理結構化數據
@@ -172,9 +225,9 @@ class TraeDatabase:
                     try:
                         timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
                     except:
-                        timestamp = datetime.now()
+                        timestamp = None
                 else:
-                    timestamp = datetime.now()
+                    timestamp = None
                 
                 return TraeConversation(
                     id=key,
@@ -190,7 +243,7 @@ class TraeDatabase:
                 return TraeConversation(
                     id=key,
                     content=content,
-                    timestamp=datetime.now(),
+                    timestamp=None,
                     conversation_type="list",
                     metadata={"items": data}
                 )
@@ -200,7 +253,7 @@ class TraeDatabase:
                 return TraeConversation(
                     id=key,
                     content=str(data),
-                    timestamp=datetime.now(),
+                    timestamp=None,
                     conversation_type="simple",
                     metadata={"raw_data": data}
                 )
@@ -350,9 +403,9 @@ class TraeDatabase:
     async def cleanup(self):
         """清理資源"""
         try:
-            if self.temp_db_path and os.path.exists(self.temp_db_path):
-                os.unlink(self.temp_db_path)
-                self.logger.info("✅ 臨時數據庫文件已清理")
+            # 保留本地鏡像供下次增量同步，只關閉SSH主連接
+            self.db_mirror.close()
+            self.logger.info("✅ SSH連接已關閉")
         except Exception as e:
             self.logger.error(f"清理資源失敗: {e}")
     
@@ -362,6 +415,7 @@ class TraeDatabase:
             "connected": self.temp_db_path is not None,
             "db_path": self.trae_db_path,
             "temp_path": self.temp_db_path,
+            "mirror": self.db_mirror.get_stats(),
             "ssh_host": f"{self.ssh_config['user']}@{self.ssh_config['host']}:{self.ssh_config['port']}"
         }
 
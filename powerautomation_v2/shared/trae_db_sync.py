@@ -0,0 +1,302 @@
+"""
+TRAE數據庫增量同步模組
+在本地維護遠程state.vscdb的一份鏡像，按SQLite頁比較摘要，只傳輸變化的頁；
+遠程文件的mtime和大小未變時直接跳過傳輸
+"""
+
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Tuple, Any
+import logging
+
+# SQLite默認頁大小；比較粒度與數據庫頁對齊時，單行修改只影響少數頁
+DEFAULT_PAGE_SIZE = 4096
+
+# 與主數據庫一同鏡像的附屬文件（WAL中尚未檢查點的修改）
+SIDECAR_SUFFIXES = ("-wal",)
+
+def page_digest(data: bytes) -> str:
+    """計算單頁摘要"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def file_page_digests(path: str, page_size: int = DEFAULT_PAGE_SIZE) -> List[str]:
+    """計算文件每一頁的摘要，文件不存在時返回空列表"""
+    digests = []
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(page_size)
+                if not data:
+                    break
+                digests.append(page_digest(data))
+    except FileNotFoundError:
+        pass
+    return digests
+
+def _to_ranges(indexes: List[int]) -> List[Tuple[int, int]]:
+    """把有序頁號壓縮成閉區間列表"""
+    ranges = []
+    for index in indexes:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1] = (ranges[-1][0], index)
+        else:
+            ranges.append((index, index))
+    return ranges
+
+class LocalTransport:
+    """以本地目錄模擬遠程主機（用於測試和本機部署）"""
+
+    def __init__(self, root: str = "/"):
+        self.root = root
+
+    def _path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def stat(self, path: str) -> Optional[Tuple[int, float]]:
+        """返回 (大小, mtime)，文件不存在時返回None"""
+        try:
+            st = os.stat(self._path(path))
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime
+
+    def page_digests(self, path: str, page_size: int) -> List[str]:
+        return file_page_digests(self._path(path), page_size)
+
+    def read_pages(self, path: str, page_size: int, indexes: List[int]) -> Dict[int, bytes]:
+        pages = {}
+        with open(self._path(path), 'rb') as f:
+            for start, end in _to_ranges(indexes):
+                f.seek(start * page_size)
+                data = f.read((end - start + 1) * page_size)
+                for offset in range(end - start + 1):
+                    pages[start + offset] = data[offset * page_size:(offset + 1) * page_size]
+        return pages
+
+    def close(self):
+        pass
+
+# 在遠程主機上執行的輔助腳本：stat / digests / read 三個子命令
+_REMOTE_HELPER = r'''
+import hashlib, json, os, sys
+cmd, path, page_size = sys.argv[1], sys.argv[2], int(sys.argv[3])
+if cmd == "stat":
+    try:
+        st = os.stat(path)
+        print(json.dumps([st.st_size, st.st_mtime]))
+    except FileNotFoundError:
+        print("null")
+elif cmd == "digests":
+    out = []
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(page_size)
+            if not data:
+                break
+            out.append(hashlib.blake2b(data, digest_size=16).hexdigest())
+    print(json.dumps(out))
+elif cmd == "read":
+    with open(path, "rb") as f:
+        for item in sys.argv[4].split(","):
+            start, end = map(int, item.split("-"))
+            f.seek(start * page_size)
+            data = f.read((end - start + 1) * page_size).ljust((end - start + 1) * page_size, b"\0")
+            sys.stdout.buffer.write(data)
+'''
+
+class SSHTransport:
+    """
+    通過SSH訪問遠程文件
+
+    所有調用共用一個ControlMaster連接，只在首次調用時握手認證
+    """
+
+    def __init__(self, ssh_config: Dict[str, Any], control_dir: Optional[str] = None,
+                 control_persist: int = 600, timeout: int = 120, connect_timeout: int = 10):
+        self.ssh_config = ssh_config
+        self.control_dir = control_dir or tempfile.gettempdir()
+        self.control_persist = control_persist
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.control_path = os.path.join(
+            self.control_dir,
+            f"pa-ssh-{ssh_config['user']}@{ssh_config['host']}-{ssh_config['port']}"
+        )
+
+    def _ssh_command(self) -> List[str]:
+        """
+        ssh命令前綴
+
+        配置了密碼時經sshpass認證，只嘗試一次密碼；否則以BatchMode運行，
+        需要交互輸入時直接失敗而不是在沒有終端的子進程中等到超時
+        """
+        command = []
+        if self.ssh_config.get("password"):
+            command += ["sshpass", "-p", self.ssh_config["password"], "ssh", "-o", "NumberOfPasswordPrompts=1"]
+        else:
+            command += ["ssh", "-o", "BatchMode=yes"]
+        return command + [
+            "-p", str(self.ssh_config["port"]),
+            "-o", f"ConnectTimeout={self.connect_timeout}",
+            "-o", "StrictHostKeyChecking=no",
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={self.control_path}",
+            "-o", f"ControlPersist={self.control_persist}",
+            f"{self.ssh_config['user']}@{self.ssh_config['host']}"
+        ]
+
+    def _run_helper(self, *args: str) -> bytes:
+        remote_cmd = " ".join(shlex.quote(arg) for arg in ("python3", "-c", _REMOTE_HELPER) + args)
+        process = subprocess.run(
+            self._ssh_command() + [remote_cmd],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=self.timeout
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"遠程命令失敗: {process.stderr.decode('utf-8', 'replace').strip()}")
+        return process.stdout
+
+    def stat(self, path: str) -> Optional[Tuple[int, float]]:
+        result = json.loads(self._run_helper("stat", path, "0"))
+        return tuple(result) if result else None
+
+    def page_digests(self, path: str, page_size: int) -> List[str]:
+        return json.loads(self._run_helper("digests", path, str(page_size)))
+
+    def read_pages(self, path: str, page_size: int, indexes: List[int]) -> Dict[int, bytes]:
+        ranges = _to_ranges(indexes)
+        data = self._run_helper("read", path, str(page_size),
+                                ",".join(f"{start}-{end}" for start, end in ranges))
+        pages = {}
+        position = 0
+        for start, end in ranges:
+            for index in range(start, end + 1):
+                pages[index] = data[position:position + page_size]
+                position += page_size
+        return pages
+
+    def close(self):
+        """關閉ControlMaster連接"""
+        subprocess.run(
+            self._ssh_command()[:-1] + ["-O", "exit", self._ssh_command()[-1]],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+class TraeDbMirror:
+    """遠程SQLite數據庫的本地增量鏡像"""
+
+    def __init__(self, transport, remote_path: str, mirror_path: str,
+                 page_size: int = DEFAULT_PAGE_SIZE, logger: Optional[logging.Logger] = None):
+        self.transport = transport
+        self.remote_path = remote_path
+        self.mirror_path = mirror_path
+        self.page_size = page_size
+        self.logger = logger or logging.getLogger(__name__)
+        self.state_path = f"{mirror_path}.sync.json"
+        self.state = self._load_state()
+        self.stats = {
+            "syncs": 0,
+            "skipped": 0,
+            "pages_fetched": 0,
+            "bytes_transferred": 0
+        }
+
+        os.makedirs(os.path.dirname(mirror_path) or ".", exist_ok=True)
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def sync(self) -> Dict[str, Any]:
+        """
+        同步鏡像
+
+        Returns:
+            本次同步結果：每個文件是否跳過、傳輸的頁數和字節數
+        """
+        result = {"files": {}, "pages_fetched": 0, "bytes_transferred": 0}
+        for suffix in ("",) + SIDECAR_SUFFIXES:
+            file_result = self._sync_file(self.remote_path + suffix, self.mirror_path + suffix)
+            result["files"][suffix or "db"] = file_result
+            result["pages_fetched"] += file_result.get("pages_fetched", 0)
+            result["bytes_transferred"] += file_result.get("bytes_transferred", 0)
+
+        if any(not file_result.get("skipped") for file_result in result["files"].values()):
+            # WAL變化後舊的共享內存索引失效，由SQLite在下次打開時重建
+            shm_path = f"{self.mirror_path}-shm"
+            if os.path.exists(shm_path):
+                os.unlink(shm_path)
+
+        self._save_state()
+        self.stats["syncs"] += 1
+        self.stats["pages_fetched"] += result["pages_fetched"]
+        self.stats["bytes_transferred"] += result["bytes_transferred"]
+        return result
+
+    def _sync_file(self, remote_path: str, local_path: str) -> Dict[str, Any]:
+        remote_stat = self.transport.stat(remote_path)
+
+        if remote_stat is None:
+            # 遠程文件不存在（例如WAL已被檢查點清空），同步刪除本地副本
+            if os.path.exists(local_path):
+                os.unlink(local_path)
+            self.state.pop(remote_path, None)
+            return {"skipped": False, "missing": True}
+
+        size, mtime = remote_stat
+        if self.state.get(remote_path) == [size, mtime] and os.path.exists(local_path) \
+                and os.path.getsize(local_path) == size:
+            self.stats["skipped"] += 1
+            return {"skipped": True}
+
+        remote_digests = self.transport.page_digests(remote_path, self.page_size)
+        local_digests = file_page_digests(local_path, self.page_size)
+        changed = [index for index, digest in enumerate(remote_digests)
+                   if index >= len(local_digests) or local_digests[index] != digest]
+
+        pages = self.transport.read_pages(remote_path, self.page_size, changed) if changed else {}
+
+        mode = 'r+b' if os.path.exists(local_path) else 'w+b'
+        with open(local_path, mode) as f:
+            for index in changed:
+                f.seek(index * self.page_size)
+                f.write(pages[index])
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # 記錄傳輸前觀察到的stat；傳輸期間遠程若再被修改，下次同步會重新比較
+        self.state[remote_path] = [size, mtime]
+        transferred = sum(len(page) for page in pages.values())
+        self.logger.debug(f"鏡像 {remote_path}: {len(changed)}/{len(remote_digests)} 頁變化")
+        return {
+            "skipped": False,
+            "pages_total": len(remote_digests),
+            "pages_fetched": len(changed),
+            "bytes_transferred": transferred
+        }
+
+    def close(self):
+        self.transport.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "mirror_path": self.mirror_path,
+            "page_size": self.page_size
+        }
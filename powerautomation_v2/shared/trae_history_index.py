@@ -0,0 +1,201 @@
+"""
+TRAE對話歷史索引模組
+把state.vscdb中ItemTable的對話blob解析一次，寫入規範化的側表 (key, repo, timestamp, content)，
+按倉庫和時間建立索引；之後只重新解析內容變化的key。
+一個blob可以解析為多行（如輸入歷史列表的每個條目），行的source_key是blob的key；
+每個已解析blob的摘要單獨記錄在blobs表中，解析不出任何行的blob也不會被重複解析
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Union
+import logging
+
+# ItemTable中保存對話歷史的key
+HISTORY_KEY_FILTER = "key LIKE '%input-history%' OR key LIKE '%memento%'"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    key TEXT PRIMARY KEY,
+    source_key TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    repo TEXT,
+    timestamp TEXT NOT NULL,
+    conversation_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_history_repo_timestamp ON history(repo, timestamp);
+CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp);
+CREATE INDEX IF NOT EXISTS idx_history_source_key ON history(source_key);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    source_key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def _digest(value: Any) -> str:
+    if value is None:
+        data = b""
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+    else:
+        data = bytes(value)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _like_pattern(text: str) -> str:
+    """LIKE子串匹配模式（轉義通配符）"""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def _source_signature(db_path: str) -> str:
+    """數據庫及其WAL的 (大小, mtime)，未變化時跳過整個刷新"""
+    parts = []
+    for path in (db_path, f"{db_path}-wal"):
+        try:
+            st = os.stat(path)
+            parts.append([st.st_size, st.st_mtime])
+        except FileNotFoundError:
+            parts.append(None)
+    return json.dumps(parts)
+
+class TraeHistoryIndex:
+    """TRAE對話歷史的規範化側表"""
+
+    def __init__(self, index_path: str, logger: Optional[logging.Logger] = None):
+        self.index_path = index_path
+        self.logger = logger or logging.getLogger(__name__)
+
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            tables = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(history)")}
+            if columns and ("source_key" not in columns or "blobs" not in tables):
+                # 舊版本的索引沒有source_key或blobs表，側表可以從源數據庫重建
+                conn.executescript("DROP TABLE history; DROP TABLE IF EXISTS meta;")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """打開索引連接（調用方負責關閉，連接的上下文管理器只提交事務）"""
+        conn = sqlite3.connect(self.index_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def refresh(self, source_db_path: str,
+                normalize: Callable[[str, Any], Union[Dict[str, Any], List[Dict[str, Any]], None]]) -> Dict[str, Any]:
+        """
+        從源數據庫增量刷新索引
+
+        Args:
+            source_db_path: state.vscdb路徑（以只讀方式打開）
+            normalize: 把 (key, value) 解析為 repo/timestamp/conversation_type/content/metadata 字典的函數，
+                一個blob對應多行時返回字典列表，每個字典的key是該行的唯一key；返回None時不保留該blob的行。
+                timestamp為None時沿用該行之前的時間，新行使用首次發現的時間
+
+        Returns:
+            刷新統計：跳過、新增或更新、刪除、未變化的key數量
+        """
+        result = {"skipped": False, "parsed": 0, "deleted": 0, "unchanged": 0}
+        signature = _source_signature(source_db_path)
+
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'source_signature'").fetchone()
+            if row is not None and row["value"] == signature:
+                result["skipped"] = True
+                return result
+
+            known = {r["source_key"]: r["digest"] for r in conn.execute("SELECT source_key, digest FROM blobs")}
+            seen = set()
+            changed = []
+            rows = []
+            now = datetime.now().isoformat()
+
+            with closing(sqlite3.connect(f"file:{source_db_path}?mode=ro", uri=True)) as source:
+                for key, value in source.execute(f"SELECT key, value FROM ItemTable WHERE {HISTORY_KEY_FILTER}"):
+                    seen.add(key)
+                    digest = _digest(value)
+                    if known.get(key) == digest:
+                        result["unchanged"] += 1
+                        continue
+
+                    # 解析為空的blob同樣記錄摘要，內容不變時不再重新解析
+                    changed.append((key, digest))
+                    items = normalize(key, value)
+                    if not items:
+                        continue
+                    previous = {r["key"]: r["timestamp"] for r in conn.execute(
+                        "SELECT key, timestamp FROM history WHERE source_key = ?", (key,))}
+                    for item in items if isinstance(items, list) else [items]:
+                        row_key = item.get("key") or key
+                        rows.append((
+                            row_key, key, digest, item.get("repo"),
+                            item.get("timestamp") or previous.get(row_key) or now,
+                            item["conversation_type"], item["content"],
+                            json.dumps(item.get("metadata"), ensure_ascii=False, default=str)
+                        ))
+
+            # 變化的blob整體替換，解析失敗的blob不留下舊行
+            removed = [(key,) for key in known if key not in seen]
+            conn.executemany("DELETE FROM history WHERE source_key = ?", [(key,) for key, _ in changed] + removed)
+            conn.executemany("DELETE FROM blobs WHERE source_key = ?", removed)
+            conn.executemany("INSERT OR REPLACE INTO blobs(source_key, digest) VALUES (?, ?)", changed)
+            conn.executemany(
+                "INSERT OR REPLACE INTO history(key, source_key, digest, repo, timestamp, conversation_type, "
+                "content, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute(
+                "INSERT INTO meta(key, value) VALUES ('source_signature', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (signature,)
+            )
+
+        result["parsed"] = len(changed)
+        result["rows"] = len(rows)
+        result["deleted"] = len(removed)
+        self.logger.debug(f"歷史索引刷新: {result}")
+        return result
+
+    @staticmethod
+    def _repo_clause(repo: str):
+        """倉庫過濾條件：沒有倉庫字段的行按內容是否提到倉庫名匹配"""
+        return "(repo = ? OR (repo IS NULL AND content LIKE ? ESCAPE '\\'))", [repo, _like_pattern(repo)]
+
+    def query(self, repo: Optional[str] = None, since: Optional[datetime] = None,
+              limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """按倉庫和時間分頁查詢（按時間倒序）"""
+        clauses, params = [], []
+        if repo:
+            clause, clause_params = self._repo_clause(repo)
+            clauses.append(clause)
+            params += clause_params
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since.isoformat())
+
+        sql = "SELECT key, repo, timestamp, conversation_type, content, metadata FROM history"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC, key LIMIT ? OFFSET ?"
+        params += [limit, offset]
+
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def count(self, repo: Optional[str] = None) -> int:
+        with closing(self._connect()) as conn:
+            if repo:
+                clause, params = self._repo_clause(repo)
+                return conn.execute(f"SELECT COUNT(*) FROM history WHERE {clause}", params).fetchone()[0]
+            return conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
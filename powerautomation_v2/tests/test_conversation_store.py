@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EC2對話存儲測試
+驗證SQLite後端的增量統計計數、最新對話和介入查詢的排序、舊版JSON文件只導入一次、空庫判斷，
+按對話ID和內容哈希去重以及按冪等鍵重放同步批次
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ec2"))
+
+from conversation_store import SQLiteConversationStorage
+
+def conversation(conv_id, timestamp, needed=False, priority="low", confidence=0.0, **fields):
+    return {
+        "id": conv_id,
+        "user_message": f"消息 {conv_id}",
+        "timestamp": timestamp,
+        "intervention_analysis": {
+            "intervention_needed": needed, "priority": priority, "confidence_score": confidence
+        },
+        **fields
+    }
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteConversationStorage(str(tmp_path / "db" / "conversations.db"))
+    yield storage
+    storage.close()
+
+def test_statistics_are_maintained_incrementally(storage):
+    storage.save_conversations([
+        conversation(1, "2026-01-01T00:00:00", needed=True),
+        conversation(2, "2026-01-01T00:01:00")
+    ], {"source_system": "mac"})
+    storage.save_conversations([conversation(3, "2026-01-01T00:02:00", needed=True)], {})
+
+    stats = storage.get_statistics()
+
+    assert stats["total_files"] == 2
+    assert stats["total_conversations"] == 3
+    assert stats["intervention_needed_count"] == 2
+    assert stats["latest_sync_time"] is not None
+    assert [item["conversation_count"] for item in stats["file_list"]] == [1, 2]
+
+def test_latest_conversations_are_ordered_by_timestamp(storage):
+    storage.save_conversations([conversation(i, f"2026-01-01T00:{i:02d}:00") for i in (2, 0, 1)], {})
+
+    latest = storage.get_latest_conversations(limit=2)
+
+    assert [conv["id"] for conv in latest] == [2, 1]
+
+def test_interventions_are_ordered_by_priority_and_confidence(storage):
+    storage.save_conversations([
+        conversation("low", "2026-01-01T00:00:00", needed=True, priority="low", confidence=0.9),
+        conversation("high-a", "2026-01-01T00:01:00", needed=True, priority="high", confidence=0.5),
+        conversation("high-b", "2026-01-01T00:02:00", needed=True, priority="high", confidence=0.8),
+        conversation("none", "2026-01-01T00:03:00", priority="high", confidence=1.0)
+    ], {})
+
+    needed = storage.get_interventions_needed()
+
+    assert [conv["id"] for conv in needed] == ["high-b", "high-a", "low"]
+
+def test_json_files_are_imported_once(storage, tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for i in range(2):
+        (data_dir / f"conversations_2026010{i}.json").write_text(json.dumps({
+            "metadata": {"source_system": "mac"},
+            "conversations": [conversation(f"{i}-{j}", f"2026-01-0{i + 1}T00:0{j}:00") for j in range(3)],
+            "save_time": f"2026-01-0{i + 1}T12:00:00"
+        }), encoding="utf-8")
+    (data_dir / "intervention_analysis_20260101.json").write_text("{}", encoding="utf-8")
+
+    first = storage.import_json_files(str(data_dir))
+    second = storage.import_json_files(str(data_dir))
+
+    assert (first["imported_files"], first["imported_conversations"], first["errors"]) == (2, 6, [])
+    assert (second["imported_files"], second["skipped_files"]) == (0, 2)
+    stats = storage.get_statistics()
+    assert stats["total_conversations"] == 6
+    assert stats["latest_sync_time"] == "2026-01-02T12:00:00"
+    assert {item["filename"] for item in stats["file_list"]} == {
+        "conversations_20260100.json", "conversations_20260101.json"
+    }
+
+def test_store_is_empty_until_the_first_batch(storage, tmp_path):
+    assert storage.is_empty()
+    # 沒有可導入的文件時仍為空，服務下次啟動會再嘗試導入
+    storage.import_json_files(str(tmp_path / "missing"))
+    assert storage.is_empty()
+
+    storage.save_conversations([conversation(1, "2026-01-01T00:00:00")], {})
+
+    assert not storage.is_empty()
+
+def test_conversations_are_deduplicated_by_id_and_content_hash(storage):
+    batch = [
+        conversation(1, "2026-01-01T00:00:00", sync_time="t1"),
+        conversation(None, "2026-01-01T00:01:00", sync_time="t1")
+    ]
+    first = storage.save_conversations(batch, {})
+
+    # 只有同步時間變化的對話視為未變；內容變化的對話更新而不新增
+    resent = [dict(conv, sync_time="t2") for conv in batch]
+    resent[0]["intervention_analysis"] = {"intervention_needed": True, "priority": "high"}
+    second = storage.save_conversations(resent + [conversation(2, "2026-01-01T00:02:00")], {})
+
+    assert (first["inserted"], first["updated"], first["skipped"]) == (2, 0, 0)
+    assert (second["inserted"], second["updated"], second["skipped"]) == (1, 1, 1)
+    assert second["changed_ids"] == [1, 2]
+    assert second["changed_hashes"] == []
+    stats = storage.get_statistics()
+    assert (stats["total_conversations"], stats["intervention_needed_count"]) == (3, 1)
+
+def test_anonymous_conversations_are_reported_by_hash_not_id(storage):
+    result = storage.save_conversations([conversation(None, "2026-01-01T00:00:00"),
+                                         conversation(1, "2026-01-01T00:01:00")], {})
+
+    assert result["changed_ids"] == [1]
+    assert len(result["changed_hashes"]) == 1
+
+def test_idempotency_key_replays_the_first_result(storage):
+    batch = [conversation(1, "2026-01-01T00:00:00"), conversation(2, "2026-01-01T00:01:00")]
+    first = storage.save_conversations(batch, {}, idempotency_key="batch-1")
+    replay = storage.save_conversations(batch + [conversation(3, "2026-01-01T00:02:00")], {},
+                                        idempotency_key="batch-1")
+
+    assert first["replayed"] is False
+    assert replay["replayed"] is True
+    assert {key: replay[key] for key in ("batch", "inserted", "changed_ids")} == {
+        key: first[key] for key in ("batch", "inserted", "changed_ids")
+    }
+    stats = storage.get_statistics()
+    assert (stats["total_files"], stats["total_conversations"]) == (1, 2)
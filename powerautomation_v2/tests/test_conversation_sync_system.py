@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+對話同步系統測試
+以臨時TRAE數據庫和假的EC2同步代替網絡，驗證按 (timestamp, id) 水位線的鍵集分頁、
+同步失敗時水位線不推進，以及水位線跨實例持久化
+"""
+
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ec2"))
+
+from conversation_sync_system import ConversationSyncSystem
+
+# 時間戳相同的對話靠id區分先後，分頁邊界落在同一時間戳內
+ROWS = [
+    (1, "2026-01-01T00:00:00"),
+    (2, "2026-01-01T00:00:00"),
+    (3, "2026-01-01T00:00:00"),
+    (4, "2026-01-01T00:01:00"),
+    (5, "2026-01-01T00:02:00")
+]
+
+def _insert(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO conversations VALUES (?, ?, '', ?, 'done', 's1', ?)",
+        [(conv_id, f"消息 {conv_id}", timestamp, json.dumps({"n": conv_id})) for conv_id, timestamp in rows]
+    )
+    conn.commit()
+    conn.close()
+
+@pytest.fixture
+def make_system(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / "trae.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE conversations (id INTEGER, user_message TEXT, assistant_message TEXT, "
+                 "timestamp TEXT, status TEXT, session_id TEXT, metadata TEXT)")
+    conn.close()
+    _insert(db_path, ROWS)
+
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({
+        "trae_db_path": db_path,
+        "page_size": 2,
+        "max_pages_per_cycle": 20,
+        "watermark_path": str(tmp_path / "watermarks.json")
+    }), encoding="utf-8")
+
+    def make(sync_results=None):
+        system = ConversationSyncSystem(str(config_path))
+        system.batches = []
+        results = iter(sync_results or [])
+
+        def fake_sync(conversations):
+            system.batches.append([conv["id"] for conv in conversations])
+            return next(results, True)
+
+        system.sync_to_ec2 = fake_sync
+        return system
+
+    make.db_path = db_path
+    return make
+
+def test_pages_follow_the_watermark_across_equal_timestamps(make_system):
+    system = make_system()
+
+    result = system.run_sync_cycle(include_current=False)
+
+    assert result["success"]
+    assert system.batches == [[1, 2], [3, 4], [5]]
+    assert (result["pages_synced"], result["conversations_synced"]) == (3, 5)
+    assert system.watermarks["trae"]["timestamp"] == "2026-01-01T00:02:00"
+    assert system.watermarks["trae"]["id"] == 5
+
+def test_failed_sync_keeps_the_watermark(make_system):
+    system = make_system(sync_results=[True, False])
+
+    result = system.run_sync_cycle(include_current=False)
+
+    assert not result["success"]
+    assert system.batches == [[1, 2], [3, 4]]
+    assert system.watermarks["trae"]["id"] == 2
+
+    # 下一個週期從同一水位線重試失敗的頁
+    system.batches = []
+    assert system.run_sync_cycle(include_current=False)["success"]
+    assert system.batches == [[3, 4], [5]]
+
+def test_watermark_persists_and_only_new_rows_are_extracted(make_system):
+    make_system().run_sync_cycle(include_current=False)
+    _insert(make_system.db_path, [(6, "2026-01-01T00:02:00"), (7, "2026-01-01T00:03:00")])
+
+    system = make_system()
+    result = system.run_sync_cycle(include_current=False)
+
+    assert system.watermarks["trae"]["id"] == 7
+    assert system.batches == [[6, 7]]
+    assert result["conversations_synced"] == 2
+    assert system.run_sync_cycle(include_current=False)["conversations_synced"] == 0
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EC2按倉庫併發提取測試
+以本機worker代替SSH，驗證優先級排序、部分失敗和每個倉庫的耗時記錄
+"""
+
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ec2"))
+
+import powerautomation_ec2_system
+from powerautomation_ec2_system import PowerAutomationEC2
+from remote_agent import RemoteAgentChannel, local_worker_command
+
+EXTRACT_SCRIPT = """
+import json, sys, time
+repo = sys.argv[2]
+if repo == "subtitles":
+    time.sleep(10)
+if repo == "automation":
+    sys.exit(2)
+print(json.dumps([{"timestamp": "2026-01-01T00:00:%02d" % len(repo), "message": repo}]))
+"""
+
+@pytest.fixture
+def system(tmp_path):
+    scripts_dir = tmp_path / "scripts"
+    scripts_dir.mkdir()
+    (scripts_dir / "extract_history.py").write_text(EXTRACT_SCRIPT, encoding="utf-8")
+
+    # 跳過__init__，避免寫入/home/ec2-user
+    system = object.__new__(PowerAutomationEC2)
+    system.logger = logging.getLogger("test")
+    system.data_dir = Path(tmp_path)
+    system.repository_timings = {}
+    system.repository_selector = powerautomation_ec2_system.IntelligentRepositorySelector()
+    system.config = {
+        "trae_scripts_dir": str(scripts_dir),
+        "remote_agent": {"enabled": True},
+        "fanout": {"enabled": True, "max_concurrency": 6, "repo_timeout": 1}
+    }
+    system.remote_agent = RemoteAgentChannel(local_worker_command(max_workers=6), default_timeout=10)
+    yield system
+    system.remote_agent.close()
+
+def test_repositories_ordered_by_sync_strategy(system):
+    order = system.get_repository_order()
+
+    assert order[:2] == ["final_integration_fixed", "communitypowerauto"]
+    assert set(order) == set(system.repository_selector.repositories)
+
+def test_failed_and_slow_repositories_do_not_block_others(system):
+    result = system.extract_trae_history()
+
+    assert result["success"] and result["partial"]
+    assert not result["repositories"]["automation"]["success"]
+    assert not result["repositories"]["subtitles"]["success"]
+    assert {conv["message"] for conv in result["data"]} == {
+        "final_integration_fixed", "communitypowerauto", "powerauto.ai_0.53", "powerauto_v0.3"
+    }
+    assert result["data"] == sorted(result["data"], key=lambda conv: conv["timestamp"])
+    assert json.loads(Path(result["file"]).read_text(encoding="utf-8")) == result["data"]
+    assert set(system.repository_timings) == set(system.get_repository_order())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Manus API客戶端測試
+以假的遠程調用代替HTTP，驗證微批合併、結果分發、失敗項目的重試、
+結果緩存和相同請求的合併（同步與異步客戶端）
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+
+from manus_api_client import (
+    AnalysisCache, AnalysisRequest, AnalysisResponse, AsyncManusAPIClient, ManusAPIClient, ManusAPIConfig
+)
+
+def ok(content):
+    return AnalysisResponse(success=True, analysis_mode="smart", summary=content, ai_analysis={"echo": content})
+
+class FakeClient(ManusAPIClient):
+    """記錄每次遠程調用的內容，fail中的內容第一次返回失敗"""
+
+    def __init__(self, config, fail=(), delay=0.0):
+        super().__init__(config)
+        self.fail = set(fail)
+        self.delay = delay
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+    def _send_batch(self, requests):
+        time.sleep(self.delay)
+        responses = []
+        with self._calls_lock:
+            self.calls.append([request.content for request in requests])
+            for request in requests:
+                if request.content in self.fail:
+                    self.fail.discard(request.content)
+                    responses.append(AnalysisResponse(success=False, analysis_mode="smart", summary="",
+                                                      ai_analysis={}, error="boom"))
+                else:
+                    responses.append(ok(request.content))
+        return responses
+
+    def _analyze_remote(self, request):
+        return self._send_batch([request])[0]
+
+def batch_config(**overrides):
+    return ManusAPIConfig(**{"batch_max_items": 8, "batch_max_wait_ms": 50, "retry_delay": 0.05, **overrides})
+
+def test_concurrent_requests_share_one_batch_and_get_their_own_results():
+    client = FakeClient(batch_config())
+    contents = [f"請求{i}" for i in range(4)]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(lambda c: client.analyze(AnalysisRequest(content=c)), contents))
+
+    assert [response.summary for response in responses] == contents
+    assert len(client.calls) == 1 and sorted(client.calls[0]) == sorted(contents)
+    assert client.get_stats()["batching"]["max_batch_size"] == 4
+
+def test_failed_items_are_retried_without_delaying_successes():
+    client = FakeClient(batch_config(retry_delay=0.5), fail={"壞"})
+    batcher = client.batcher
+
+    start = time.monotonic()
+    good, bad = batcher.submit(AnalysisRequest(content="好")), batcher.submit(AnalysisRequest(content="壞"))
+
+    assert good.result(timeout=2).summary == "好"
+    assert time.monotonic() - start < 0.4
+    assert not bad.done()
+
+    assert bad.result(timeout=2).summary == "壞"
+    assert client.calls[-1] == ["壞"]
+    assert client.get_stats()["retried_items"] == 1
+
+def test_items_failing_every_attempt_return_the_error():
+    client = FakeClient(batch_config(batch_item_retries=1))
+    client.fail = {"壞"}
+    original = client._send_batch
+
+    def always_fail(requests):
+        client.fail.add("壞")
+        return original(requests)
+
+    client._send_batch = always_fail
+    response = client.batcher.submit(AnalysisRequest(content="壞")).result(timeout=2)
+
+    assert not response.success and response.error == "boom"
+    assert len(client.calls) == 2
+
+def test_cache_entries_expire_after_ttl():
+    cache = AnalysisCache(ttl=0.05)
+    cache.put("k", ok("內容"))
+
+    assert cache.get("k").summary == "內容"
+    time.sleep(0.06)
+    assert cache.get("k") is None
+    assert cache.get_stats()["size"] == 0
+
+def test_cache_evicts_least_recently_used_entry():
+    cache = AnalysisCache(max_entries=2)
+    cache.put("a", ok("a"))
+    cache.put("b", ok("b"))
+    cache.get("a")
+    cache.put("c", ok("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a").summary == "a" and cache.get("c").summary == "c"
+    assert cache.get_stats()["evictions"] == 1
+
+def test_cache_does_not_share_nested_data_with_callers():
+    cache = AnalysisCache()
+    response = ok("內容")
+    cache.put("k", response)
+    response.ai_analysis["echo"] = "存入後修改"
+    cache.get("k").ai_analysis["echo"] = "讀取後修改"
+
+    assert cache.get("k").ai_analysis == {"echo": "內容"}
+
+def test_failed_responses_are_not_cached():
+    cache = AnalysisCache()
+    cache.put("k", AnalysisResponse(success=False, analysis_mode="smart", summary="", ai_analysis={}))
+
+    assert cache.get("k") is None
+
+def test_concurrent_identical_requests_are_sent_once():
+    client = FakeClient(ManusAPIConfig(batch_max_items=1), delay=0.2)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(lambda _: client.analyze(AnalysisRequest(content="相同")), range(4)))
+
+    assert len(client.calls) == 1
+    assert client.get_stats()["coalesced_requests"] == 3
+    responses[0].ai_analysis["echo"] = "修改"
+    assert [response.ai_analysis["echo"] for response in responses[1:]] == ["相同"] * 3
+    # 之後的相同請求命中緩存
+    assert client.analyze(AnalysisRequest(content="相同")).summary == "相同"
+    assert len(client.calls) == 1
+
+class FakeAsyncClient(AsyncManusAPIClient):
+    def __init__(self, config=None, delay=0.05):
+        super().__init__(config)
+        self.delay = delay
+        self.calls = []
+
+    async def _analyze_remote(self, request):
+        self.calls.append(request.content)
+        await asyncio.sleep(self.delay)
+        return ok(request.content)
+
+def test_async_identical_requests_are_sent_once():
+    async def run():
+        client = FakeAsyncClient()
+        responses = await asyncio.gather(*[client.analyze(AnalysisRequest(content="相同")) for _ in range(3)])
+        cached = await client.analyze(AnalysisRequest(content="相同"))
+        return client, responses, cached
+
+    client, responses, cached = asyncio.run(run())
+
+    assert client.calls == ["相同"]
+    assert client.get_stats()["coalesced_requests"] == 2
+    assert [response.summary for response in responses] == ["相同"] * 3
+    assert cached.summary == "相同"
+
+def test_async_cancelled_request_fails_waiters_with_an_ordinary_error():
+    async def run():
+        client = FakeAsyncClient(delay=1)
+        owner = asyncio.ensure_future(client.analyze(AnalysisRequest(content="相同")))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(client.analyze(AnalysisRequest(content="相同")))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        results = await asyncio.gather(owner, waiter, return_exceptions=True)
+        return client, results
+
+    client, (owner_result, waiter_result) = asyncio.run(run())
+
+    assert isinstance(owner_result, asyncio.CancelledError)
+    assert isinstance(waiter_result, RuntimeError)
+    assert client.get_stats()["inflight"] == 0
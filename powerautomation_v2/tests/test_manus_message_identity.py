@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Manus消息標識與增量解析測試
+用靜態渲染的頁面快照模擬虛擬列表的滾動，驗證消息ID穩定、已見節點不重複解析
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+
+from manus_message_identity import IncrementalMessageParser, message_fingerprint, new_messages
+
+@dataclass
+class Message:
+    id: str
+    sender: str
+    content: str
+    metadata: dict
+
+def _html(sender, content):
+    return f'<div class="message {sender}"><span class="sender">{sender}</span><p>{content}</p></div>'
+
+# 虛擬列表的三次渲染（節點key, HTML）：窗口向下移動並重新創建節點、出現重複內容、最後一條流式輸出仍在變化
+RENDERS = [
+    [
+        ("p:1", _html("user", "部署失敗了")),
+        ("p:2", _html("assistant", "請貼一下錯誤日誌")),
+        ("p:3", _html("user", "好")),
+    ],
+    [
+        ("p:12", _html("assistant", "請貼一下錯誤日誌")),
+        ("p:13", _html("user", "好")),
+        ("p:14", _html("user", "好")),
+        ("p:15", _html("assistant", "正在分")),
+    ],
+    [
+        ("p:13", _html("user", "好")),
+        ("p:14", _html("user", "好")),
+        ("p:15", _html("assistant", "正在分析日誌")),
+    ],
+]
+
+def _snapshot(key, html):
+    """與頁面端快照腳本返回的字段一致"""
+    sender = html.split('<span class="sender">')[1].split("</span>")[0]
+    content = html.split("<p>")[1].split("</p>")[0]
+    return {"key": key, "hash": hashlib.md5(html.encode()).hexdigest(), "content": content,
+            "text": f"{sender}\n{content}", "sender": sender, "className": "message " + sender,
+            "timeAttr": None, "timeText": None, "attachments": [], "html": html}
+
+class FakePage:
+    """按快照腳本的約定，已緩存的節點只返回key和hash"""
+
+    def __init__(self, render):
+        self.render = render
+
+    async def eval_on_selector_all(self, selector, script, arg):
+        if selector != ".message":
+            return []
+        known = set(arg["known"])
+        snapshots = [_snapshot(key, html) for key, html in self.render]
+        return [{"key": s["key"], "hash": s["hash"]} if s["hash"] in known else s for s in snapshots]
+
+def _build(snapshot):
+    return Message(id=message_fingerprint(snapshot["sender"], snapshot["content"], snapshot["timeAttr"]),
+                   sender=snapshot["sender"], content=snapshot["content"], metadata={})
+
+def _collect(parser, render):
+    return asyncio.run(parser.collect(FakePage(render), [".chat-message", ".message"],
+                                      {"content": ["p"], "sender": [".sender"], "time": ["time"]}))
+
+def test_ids_are_stable_when_the_list_window_moves():
+    parser = IncrementalMessageParser(_build)
+    seen = set()
+
+    first = _collect(parser, RENDERS[0])
+    assert [m.content for m in new_messages(first, seen)] == ["部署失敗了", "請貼一下錯誤日誌", "好"]
+
+    second = _collect(parser, RENDERS[1])
+    assert second[0].id == first[1].id and second[1].id == first[2].id
+    # 內容相同的新消息加後綴
+    assert second[2].id == second[1].id + "-2"
+    assert [m.content for m in new_messages(second, seen)] == ["好", "正在分"]
+    # 只解析了新出現的節點，HTML相同的節點復用同一個解析結果
+    assert parser.get_stats() == {"parsed": 4, "reused": 3, "missing": 0, "cached_nodes": 4}
+
+def test_changed_nodes_are_reparsed_under_a_new_id():
+    parser = IncrementalMessageParser(_build)
+    seen = set()
+    for render in RENDERS[:2]:
+        new_messages(_collect(parser, render), seen)
+
+    third = _collect(parser, RENDERS[2])
+    assert [m.content for m in new_messages(third, seen)] == ["正在分析日誌"]
+    assert parser.stats["parsed"] == 5
+
+def test_cache_is_bounded():
+    parser = IncrementalMessageParser(_build, max_entries=2)
+    messages = _collect(parser, RENDERS[0])
+    assert len(messages) == 3
+    assert parser.get_stats()["cached_nodes"] == 2
+    # 被淘汰的節點下次快照會重新提取字段
+    assert [m.id for m in _collect(parser, RENDERS[0])] == [m.id for m in messages]
+
+def test_pushed_duplicates_get_distinct_ids_shared_with_resync():
+    parser = IncrementalMessageParser(_build)
+    seen = set()
+    new_messages(_collect(parser, RENDERS[0]), seen)
+
+    # 同一句話推送兩次（中間隔著助手回覆）
+    pushed = [
+        parser.parse_pushed({**_snapshot("p:4", _html("user", "继续")), "prevKey": "p:3"}),
+        parser.parse_pushed({**_snapshot("p:5", _html("assistant", "好的")), "prevKey": "p:4"}),
+        parser.parse_pushed({**_snapshot("p:6", _html("user", "继续")), "prevKey": "p:5"}),
+    ]
+    assert [m.content for m in new_messages(pushed, seen)] == ["继续", "好的", "继续"]
+    assert pushed[2].id == pushed[0].id + "-2"
+
+    # 之後的完整同步（虛擬列表重新創建了節點，窗口從第二條開始）得到相同的ID
+    render = [("p:30", _html("assistant", "請貼一下錯誤日誌")), ("p:31", _html("user", "好")),
+              ("p:32", _html("user", "继续")), ("p:33", _html("assistant", "好的")), ("p:34", _html("user", "继续"))]
+    resynced = _collect(parser, render)
+    assert [m.id for m in resynced[2:]] == [m.id for m in pushed]
+    assert new_messages(resynced, seen) == []
+    assert resynced[2].metadata["key"] == "p:32"
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Manus消息推送監聽測試
+用假頁面模擬頁面端推送的批次，驗證序號檢查和完整同步回退
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+
+from manus_message_watcher import BINDING_NAME, ManusMessageWatcher, merge_pushed_messages
+
+SELECTORS = {
+    "message_container": [".message"],
+    "message_content": [".content"],
+    "message_sender": [".sender"],
+    "message_time": ["time"],
+}
+
+class FakePage:
+    def __init__(self):
+        self.bindings = {}
+        self.scripts = []
+
+    async def expose_binding(self, name, callback):
+        # 與Playwright一致，同名binding只能註冊一次
+        if name in self.bindings:
+            raise RuntimeError(f"Function \"{name}\" has been already registered")
+        self.bindings[name] = callback
+
+    async def add_init_script(self, script):
+        self.scripts.append(script)
+
+    async def evaluate(self, script):
+        self.scripts.append(script)
+
+    def push(self, epoch, seq, added=(), updated=()):
+        self.bindings[BINDING_NAME](None, {"epoch": epoch, "seq": seq, "added": list(added), "updated": list(updated)})
+
+def _item(key, content):
+    return {"key": key, "content": content, "sender": None, "time": None, "className": "", "html": ""}
+
+def _watcher(page, history):
+    async def resync():
+        return list(history)
+    return ManusMessageWatcher(page, SELECTORS, to_message=lambda item: item["content"], resync=resync,
+                               resync_interval=3600)
+
+def test_batches_are_delivered_in_order():
+    async def scenario():
+        page = FakePage()
+        watcher = _watcher(page, ["a"])
+        await watcher.start()
+        assert '".message"' in page.scripts[0]
+
+        start = await watcher.next_event(timeout=0.1)
+        assert (start.kind, start.messages, start.reason) == ("resync", ["a"], "start")
+
+        page.push("e1", 1, added=[_item("e1:1", "b")])
+        page.push("e1", 2, added=[_item("e1:2", "c")], updated=[_item("e1:1", "b!")])
+        events = [await watcher.next_event(timeout=0.1) for _ in range(3)]
+        assert [(e.kind, e.messages) for e in events] == [
+            ("new_messages", ["b"]), ("new_messages", ["c"]), ("updated_messages", ["b!"])
+        ]
+        assert await watcher.next_event(timeout=0.01) is None
+        assert watcher.get_stats()["resyncs"] == 1
+
+    asyncio.run(scenario())
+
+def test_sequence_gap_and_reload_trigger_resync():
+    async def scenario():
+        page = FakePage()
+        history = ["a"]
+        watcher = _watcher(page, history)
+        await watcher.start()
+        await watcher.next_event(timeout=0.1)
+
+        page.push("e1", 1, added=[_item("e1:1", "b")])
+        history.extend(["b", "c", "d"])
+        # 批次2丟失
+        page.push("e1", 3, added=[_item("e1:3", "d")])
+        assert (await watcher.next_event(timeout=0.1)).messages == ["b"]
+        gap = await watcher.next_event(timeout=0.1)
+        assert (gap.kind, gap.reason, gap.messages) == ("resync", "sequence_gap", ["a", "b", "c", "d"])
+
+        page.push("e1", 4, added=[_item("e1:4", "e")])
+        assert (await watcher.next_event(timeout=0.1)).messages == ["e"]
+
+        # 頁面重載後序號從1重新開始
+        page.push("e2", 1, added=[_item("e2:1", "f")])
+        events = [await watcher.next_event(timeout=0.1) for _ in range(2)]
+        assert {(e.kind, e.reason) for e in events} == {("new_messages", None), ("resync", "reload")}
+
+        stats = watcher.get_stats()
+        assert (stats["sequence_gaps"], stats["reloads"], stats["epoch"], stats["last_seq"]) == (1, 1, "e2", 1)
+        await watcher.stop()
+
+    asyncio.run(scenario())
+
+def test_restarted_watcher_reuses_the_page_binding():
+    async def scenario():
+        page = FakePage()
+        old = _watcher(page, ["a"])
+        await old.start()
+        await old.next_event(timeout=0.1)
+        await old.stop()
+        assert "__powerautomationWatcher.stop()" in page.scripts[-1]
+
+        # 出錯後在同一頁面重新啟動：不重複註冊binding，推送交給新的監聽器
+        new = _watcher(page, ["a", "b"])
+        await new.start()
+        start = await new.next_event(timeout=0.1)
+        assert (start.kind, start.messages) == ("resync", ["a", "b"])
+
+        page.push("e2", 1, added=[_item("e2:1", "c")])
+        assert (await new.next_event(timeout=0.1)).messages == ["c"]
+        assert await old.next_event(timeout=0.01) is None
+        await new.stop()
+
+    asyncio.run(scenario())
+
+class Pushed:
+    def __init__(self, id, key, settled=True):
+        self.id, self.metadata = id, {"key": key, "settled": settled}
+
+def test_streaming_messages_are_reported_once_settled():
+    messages = [Pushed("a", "p:1")]
+    seen = {"a"}
+
+    # 強制推送的流式回覆：合併但不報告
+    assert merge_pushed_messages(messages, [Pushed("b-partial", "p:2", settled=False)], seen) == []
+    more = merge_pushed_messages(messages, [Pushed("b-longer", "p:2", settled=False)], seen)
+    assert more == [] and [m.id for m in messages] == ["a", "b-longer"]
+
+    final = merge_pushed_messages(messages, [Pushed("b", "p:2")], seen)
+    assert [m.id for m in final] == ["b"] and [m.id for m in messages] == ["a", "b"]
+    # 重新推送同一條已處理的消息不再報告
+    assert merge_pushed_messages(messages, [Pushed("b", "p:7")], seen) == []
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+對話消息段文件測試
+驗證尾部/時間範圍讀取、中斷寫入的恢復和壓縮
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+
+from message_segments import INDEX_ENTRY, MessageSegmentLog
+from repository_aware_storage import RepositoryAwareDataStorage
+
+def _messages(start, count):
+    return [{"role": "user", "content": f"m{i}", "timestamp": 1000.0 + i} for i in range(start, start + count)]
+
+def test_tail_and_time_range(tmp_path):
+    log = MessageSegmentLog(tmp_path / "messages")
+    log.append(_messages(0, 50))
+    assert log.append(_messages(50, 50)) == 100
+
+    assert [m["content"] for m in log.tail(3)] == ["m97", "m98", "m99"]
+    assert [m["content"] for m in log.time_range(1010, 1013)] == ["m10", "m11", "m12"]
+    assert [m["content"] for m in log.time_range(1000, 1050, limit=2)] == ["m48", "m49"]
+
+def test_torn_write_is_recovered(tmp_path):
+    log = MessageSegmentLog(tmp_path / "messages")
+    log.append(_messages(0, 3))
+    # 模擬段文件已寫入但索引未寫入的完整記錄，以及寫了一半的記錄
+    MessageSegmentLog(tmp_path / "other").append(_messages(3, 1))
+    with open(log.segment_path, "ab") as seg:
+        seg.write((tmp_path / "other.seg").read_bytes())
+        seg.write(b"\x40\x00\x00\x00{\"ro")
+
+    reopened = MessageSegmentLog(tmp_path / "messages")
+    assert [m["content"] for m in reopened.tail(10)] == ["m0", "m1", "m2", "m3"]
+    reopened.append(_messages(4, 1))
+    assert reopened.count() == 5
+
+def test_compaction_keeps_recent_messages(tmp_path):
+    log = MessageSegmentLog(tmp_path / "messages")
+    log.append(_messages(0, 100))
+
+    assert log.compact(retain_since=1090) == {"before": 100, "after": 10}
+    assert log.read_all() == _messages(90, 10)
+    log.append(_messages(100, 1))
+    assert log.tail(1) == _messages(100, 1)
+
+def test_storage_keeps_messages_out_of_conversation_json(tmp_path):
+    storage = RepositoryAwareDataStorage(str(tmp_path), write_behind=False)
+    conv_id = storage.save_conversation_data({"messages": _messages(0, 30)}, repository="alpha")
+
+    assert "messages" not in (tmp_path / "alpha" / conv_id / "conversation.json").read_text(encoding="utf-8")
+    data = storage.load_conversation_data("alpha", conv_id, max_messages=2)
+    assert data["message_count"] == 30
+    assert [m["content"] for m in data["messages"]] == ["m28", "m29"]
+    assert storage.compact_message_logs(keep_last=5) == {"logs": 1, "dropped_messages": 25}
+
+def test_compaction_does_not_shrink_mapped_files(tmp_path):
+    log = MessageSegmentLog(tmp_path / "messages")
+    log.append(_messages(0, 100))
+    segment_map, index_map = log._open_maps()
+    try:
+        log.compact(keep_last=10)
+        # 舊映射仍然指向完整的舊文件
+        assert len(index_map) // INDEX_ENTRY.size == 100
+        assert log._decode_at(segment_map, log._entry(index_map, 99)[0]) == _messages(99, 1)[0]
+    finally:
+        segment_map.close()
+        index_map.close()
+    assert log.read_all() == _messages(90, 10)
+
+def test_resaving_a_conversation_replaces_its_messages(tmp_path):
+    storage = RepositoryAwareDataStorage(str(tmp_path), write_behind=False)
+    conv_id = storage.save_conversation_data({"messages": _messages(0, 30)}, repository="alpha")
+    storage.save_conversation_data({"messages": _messages(0, 31)}, repository="alpha", conversation_id=conv_id)
+
+    data = storage.load_conversation_data("alpha", conv_id)
+    assert data["message_count"] == 31
+    assert data["messages"] == _messages(0, 31)
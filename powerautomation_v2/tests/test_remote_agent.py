@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+遠程代理通道測試
+以本機子進程代替SSH，驗證JSON Lines RPC的流水線併發、腳本在常駐解釋器中fork運行和斷線恢復
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "ec2"))
+
+from remote_agent import RemoteAgentChannel, RemoteAgentError, local_worker_command
+
+@pytest.fixture
+def channel():
+    channel = RemoteAgentChannel(local_worker_command(max_workers=4), default_timeout=10)
+    yield channel
+    channel.close()
+
+def test_ping(channel):
+    assert channel.call("ping")["pid"] == channel.process.pid
+
+def test_run_script_passes_args_and_exit_code(channel, tmp_path):
+    script = tmp_path / "echo_args.py"
+    script.write_text("import sys\nprint(' '.join(sys.argv[1:]))\nsys.exit(3)\n", encoding="utf-8")
+
+    result = channel.run_script(str(script), ["--message", "它's a 'quoted' msg"])
+
+    assert result["returncode"] == 3
+    assert result["stdout"].strip() == "--message 它's a 'quoted' msg"
+
+def test_scripts_run_in_the_resident_interpreter(channel, tmp_path):
+    script = tmp_path / "modules.py"
+    script.write_text("import sys\nprint('concurrent.futures' in sys.modules)\n", encoding="utf-8")
+
+    assert channel.run_script(str(script))["stdout"].strip() == "True"
+
+def test_script_exception_reports_traceback(channel, tmp_path):
+    script = tmp_path / "fail.py"
+    script.write_text("print('before')\nraise RuntimeError('壞了')\n", encoding="utf-8")
+
+    result = channel.run_script(str(script))
+
+    assert result["returncode"] == 1
+    assert result["stdout"] == "before\n"
+    assert "RuntimeError: 壞了" in result["stderr"]
+
+def test_pipelined_requests_run_concurrently(channel, tmp_path):
+    script = tmp_path / "slow.py"
+    script.write_text("import time\ntime.sleep(0.5)\nprint('done')\n", encoding="utf-8")
+    channel.call("ping")
+
+    start = time.monotonic()
+    futures = [channel.submit("run_script", {"path": str(script)}) for _ in range(4)]
+    results = [future.result(timeout=10) for future in futures]
+
+    assert all(result["stdout"].strip() == "done" for result in results)
+    assert time.monotonic() - start < 1.5
+
+def test_script_timeout_kills_child(channel, tmp_path):
+    script = tmp_path / "hang.py"
+    script.write_text("import time\ntime.sleep(30)\n", encoding="utf-8")
+
+    result = channel.run_script(str(script), timeout=0.5)
+
+    assert result["timed_out"]
+
+def test_call_timeout_drops_pending_request(channel, tmp_path):
+    script = tmp_path / "slow.py"
+    script.write_text("import time\ntime.sleep(2)\n", encoding="utf-8")
+
+    with pytest.raises(RemoteAgentError):
+        channel.call("run_script", {"path": str(script), "timeout": 5}, timeout=0.2)
+
+    assert channel.get_stats()["pending"] == 0
+
+def test_unknown_method_raises(channel):
+    with pytest.raises(RemoteAgentError):
+        channel.call("no_such_method")
+
+def test_worker_restarts_after_exit(channel):
+    first_pid = channel.call("ping")["pid"]
+    channel.process.kill()
+    channel.process.wait()
+
+    assert channel.call("ping")["pid"] != first_pid
+    assert channel.get_stats()["restarts"] == 1
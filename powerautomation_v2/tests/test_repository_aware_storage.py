@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+倉庫感知存儲索引測試
+驗證統計查詢走索引、舊數據目錄的重建、只讀查詢不創建目錄和索引連接按線程復用
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+
+from repository_aware_storage import RepositoryAwareDataStorage
+from repository_storage_index import RepositoryStorageIndex
+from storage_writer import StorageWriter, compress_cold_files, read_record
+
+def test_statistics_follow_saves(tmp_path):
+    storage = RepositoryAwareDataStorage(str(tmp_path))
+    first = storage.save_conversation_data({"user_message": "a"}, repository="alpha")
+    second = storage.save_conversation_data({"user_message": "b"}, repository="alpha")
+    storage.save_conversation_data({"user_message": "c"}, repository="beta")
+    storage.save_intervention_analysis({"needs_intervention": True}, "alpha", first)
+    storage.save_intervention_result({"sent": True}, "alpha", first)
+
+    stats = storage.get_repository_statistics("alpha")
+    assert stats["total_conversations"] == 2
+    assert stats["interventions"] == 1
+    assert stats["latest_conversation"] == max(first, second)
+
+    # 避免測試中調用trae/git檢測當前倉庫
+    storage._current_repository_cache = "alpha"
+    storage._cache_timestamp = time.monotonic()
+    overview = storage.get_system_overview()
+    assert overview["repositories"] == ["alpha", "beta"]
+    assert overview["total_conversations"] == 3
+    assert overview["total_interventions"] == 1
+
+def test_index_rebuilt_from_existing_directories(tmp_path):
+    conv_dir = tmp_path / "legacy" / "conv_20250101_000000_abcd1234"
+    conv_dir.mkdir(parents=True)
+    (conv_dir / "conversation.json").write_text(json.dumps({}), encoding="utf-8")
+    (conv_dir / "intervention_result.json").write_text(json.dumps({}), encoding="utf-8")
+
+    storage = RepositoryAwareDataStorage(str(tmp_path))
+
+    assert storage.list_repository_conversations("legacy") == [conv_dir.name]
+    assert storage.get_repository_statistics("legacy")["interventions"] == 1
+
+    assert storage.load_conversation_data("missing", "conv_x") is None
+    assert storage.get_repository_statistics("missing")["total_conversations"] == 0
+    assert not (tmp_path / "missing").exists()
+
+def test_index_reuses_one_connection_per_thread(tmp_path):
+    index = RepositoryStorageIndex(str(tmp_path / "index.db"))
+    index.record("alpha", "conv_1", "conversation")
+    conn = index._connect()
+
+    assert index.list_repositories() == ["alpha"]
+    assert index.has_record("alpha", "conv_1", "conversation")
+    assert index._connect() is conn
+
+    others = []
+    thread = threading.Thread(target=lambda: others.append((index._connect(), index.list_repositories())))
+    thread.start()
+    thread.join()
+    assert others[0][0] is not conn and others[0][1] == ["alpha"]
+
+    index.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    # 關閉後再次使用時重新打開
+    assert index.repository_statistics()["alpha"]["total_conversations"] == 1
+    index.close()
+
+def test_pending_writes_are_readable_and_flushed_atomically(tmp_path):
+    storage = RepositoryAwareDataStorage(str(tmp_path))
+    conversation = {"user_message": "寫入中"}
+    conv_id = storage.save_conversation_data(conversation, repository="alpha")
+    conversation["user_message"] = "提交後修改"
+
+    assert storage.load_conversation_data("alpha", conv_id)["user_message"] == "寫入中"
+
+    storage.close()
+    conv_dir = tmp_path / "alpha" / conv_id
+    assert json.loads((conv_dir / "conversation.json").read_text(encoding="utf-8"))["user_message"] == "寫入中"
+    assert not [p for p in conv_dir.iterdir() if p.name.endswith(".tmp")]
+
+def test_cold_compression_skips_records_queued_for_writing(tmp_path):
+    pytest.importorskip("zstandard")
+    queued, cold = tmp_path / "queued.json", tmp_path / "cold.json"
+    for path in (queued, cold):
+        path.write_text('{"v": "old"}', encoding="utf-8")
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+
+    writer = StorageWriter(fsync=False, batch_delay=0.2)
+    writer.submit(queued, {"v": "new"})
+    assert compress_cold_files(tmp_path, older_than=60, writer=writer) == 1
+    writer.close()
+
+    assert read_record(queued) == {"v": "new"}
+    assert not (tmp_path / "queued.json.zst").exists()
+    assert read_record(cold) == {"v": "old"} and not cold.exists()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TRAE數據庫增量同步測試
+以本地目錄模擬遠程Mac，驗證鏡像只傳輸變化的頁，以及SSH命令不依賴終端認證
+"""
+
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+
+from trae_db_sync import TraeDbMirror, LocalTransport, SSHTransport
+
+REMOTE_DB = "/trae/state.vscdb"
+
+def _make_remote(root, rows=2000):
+    os.makedirs(os.path.join(root, "trae"))
+    conn = sqlite3.connect(os.path.join(root, "trae", "state.vscdb"))
+    conn.execute("CREATE TABLE ItemTable (key TEXT UNIQUE ON CONFLICT REPLACE, value BLOB)")
+    conn.executemany("INSERT INTO ItemTable VALUES (?, ?)",
+                     [(f"key-{i}", f"value-{i}" * 10) for i in range(rows)])
+    conn.commit()
+    return conn
+
+def _read_mirror(path):
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        return dict(conn.execute("SELECT key, value FROM ItemTable"))
+
+def test_initial_sync_copies_everything(tmp_path):
+    _make_remote(str(tmp_path / "remote")).close()
+    mirror = TraeDbMirror(LocalTransport(str(tmp_path / "remote")), REMOTE_DB,
+                          str(tmp_path / "mirror" / "state.vscdb"))
+
+    result = mirror.sync()
+
+    assert result["files"]["db"]["pages_fetched"] == result["files"]["db"]["pages_total"]
+    assert len(_read_mirror(mirror.mirror_path)) == 2000
+
+def test_unchanged_remote_is_skipped(tmp_path):
+    _make_remote(str(tmp_path / "remote")).close()
+    mirror = TraeDbMirror(LocalTransport(str(tmp_path / "remote")), REMOTE_DB,
+                          str(tmp_path / "mirror" / "state.vscdb"))
+    mirror.sync()
+
+    # 新實例從持久化狀態恢復，遠程未變化時不讀取任何頁
+    mirror = TraeDbMirror(LocalTransport(str(tmp_path / "remote")), REMOTE_DB,
+                          str(tmp_path / "mirror" / "state.vscdb"))
+    result = mirror.sync()
+
+    assert result["files"]["db"]["skipped"]
+    assert result["bytes_transferred"] == 0
+
+def test_small_change_transfers_only_changed_pages(tmp_path):
+    conn = _make_remote(str(tmp_path / "remote"))
+    mirror = TraeDbMirror(LocalTransport(str(tmp_path / "remote")), REMOTE_DB,
+                          str(tmp_path / "mirror" / "state.vscdb"))
+    total = mirror.sync()["files"]["db"]["pages_total"]
+
+    conn.execute("UPDATE ItemTable SET value = 'changed' WHERE key = 'key-1500'")
+    conn.commit()
+    conn.close()
+    result = mirror.sync()
+
+    assert 0 < result["files"]["db"]["pages_fetched"] < total / 4
+    assert _read_mirror(mirror.mirror_path)["key-1500"] == "changed"
+
+def test_wal_sidecar_is_mirrored(tmp_path):
+    conn = _make_remote(str(tmp_path / "remote"))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA wal_autocheckpoint=0")
+    conn.execute("INSERT INTO ItemTable VALUES ('in-wal', 'pending')")
+    conn.commit()
+
+    mirror = TraeDbMirror(LocalTransport(str(tmp_path / "remote")), REMOTE_DB,
+                          str(tmp_path / "mirror" / "state.vscdb"))
+    mirror.sync()
+    assert _read_mirror(mirror.mirror_path)["in-wal"] == "pending"
+
+    # 檢查點後遠程WAL清空，本地WAL副本隨之刪除
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    mirror.sync()
+    assert not os.path.exists(mirror.mirror_path + "-wal")
+    assert _read_mirror(mirror.mirror_path)["in-wal"] == "pending"
+
+def test_ssh_command_authenticates_without_a_terminal():
+    config = {"host": "mac.local", "port": 22, "user": "alex"}
+
+    with_password = SSHTransport({**config, "password": "secret"})._ssh_command()
+    assert with_password[:4] == ["sshpass", "-p", "secret", "ssh"]
+    assert "BatchMode=yes" not in with_password
+
+    key_only = SSHTransport(config, connect_timeout=5)._ssh_command()
+    assert key_only[0] == "ssh"
+    assert "BatchMode=yes" in key_only and "ConnectTimeout=5" in key_only
+    assert key_only[-1] == "alex@mac.local"
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TRAE對話歷史索引測試
+驗證倉庫過濾、分頁、只重新解析變化的key（包括解析不出行的blob）、列表blob按條目拆分，
+以及索引連接用完即關閉
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "shared"))
+
+from trae_database import TraeDatabase
+from trae_db_sync import LocalTransport
+from trae_history_index import TraeHistoryIndex
+
+class _Config:
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+def _make_database(tmp_path):
+    remote_root = tmp_path / "remote"
+    db = TraeDatabase(_Config(str(tmp_path / "data")), logging.getLogger("test"))
+    os.makedirs(remote_root / os.path.dirname(db.trae_db_path).lstrip("/"))
+    db.db_mirror.transport = LocalTransport(str(remote_root))
+
+    conn = sqlite3.connect(str(remote_root / db.trae_db_path.lstrip("/")))
+    conn.execute("CREATE TABLE ItemTable (key TEXT UNIQUE ON CONFLICT REPLACE, value BLOB)")
+    rows = [
+        (f"memento/chat-{i}", json.dumps({
+            "content": f"message {i}",
+            "timestamp": f"2026-01-01T00:{i:02d}:00",
+            "repository": "/Users/alex/git/alpha" if i % 2 else "/Users/alex/git/beta"
+        }))
+        for i in range(10)
+    ]
+    # 只有 value 提到 alpha、key 不匹配歷史前綴的行不應被返回
+    rows.append(("settings/other", json.dumps({"repository": "alpha"})))
+    conn.executemany("INSERT INTO ItemTable VALUES (?, ?)", rows)
+    conn.commit()
+    return db, conn
+
+def test_repo_filter_and_pagination(tmp_path):
+    db, conn = _make_database(tmp_path)
+    conn.close()
+
+    async def run():
+        await db.connect()
+        first = await db.get_conversation_history("alpha", limit=3)
+        second = await db.get_conversation_history("alpha", limit=3, offset=3)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert [c.content for c in first] == ["message 9", "message 7", "message 5"]
+    assert [c.content for c in second] == ["message 3", "message 1"]
+
+def test_only_changed_keys_are_reparsed(tmp_path):
+    db, conn = _make_database(tmp_path)
+    parsed = []
+    normalize = db._normalize_item
+
+    def counting_normalize(key, value):
+        parsed.append(key)
+        return normalize(key, value)
+
+    db._normalize_item = counting_normalize
+
+    async def run():
+        await db.connect()
+        await db.get_conversation_history()
+        await db.get_conversation_history()
+        conn.execute("INSERT INTO ItemTable VALUES (?, ?)", ("memento/chat-3", json.dumps({
+            "content": "edited", "timestamp": "2026-01-01T01:00:00", "repository": "alpha"
+        })))
+        conn.commit()
+        await db.connect()
+        return await db.get_conversation_history("alpha", limit=1)
+
+    latest = asyncio.run(run())
+    conn.close()
+
+    assert parsed.count("memento/chat-0") == 1
+    assert parsed.count("memento/chat-3") == 2
+    assert latest[0].content == "edited"
+
+def test_list_blobs_are_split_into_entries_with_stable_timestamps(tmp_path):
+    db, conn = _make_database(tmp_path)
+    history = [
+        {"text": "整理 alpha 的測試", "timestamp": "2026-01-02T00:00:00", "repository": "/Users/alex/git/alpha"},
+        "在 alpha 裡重跑構建",
+        "無關的輸入"
+    ]
+    conn.execute("INSERT INTO ItemTable VALUES (?, ?)", ("chat.input-history", json.dumps(history)))
+    conn.commit()
+
+    async def run():
+        await db.connect()
+        first = await db.get_conversation_history("alpha", limit=20)
+        conn.execute("INSERT INTO ItemTable VALUES (?, ?)", ("chat.input-history", json.dumps(history + ["新輸入"])))
+        conn.commit()
+        await db.connect()
+        second = await db.get_conversation_history(limit=20)
+        return first, second
+
+    first, second = asyncio.run(run())
+    conn.close()
+
+    entries = {c.content: c for c in first if c.id.startswith("chat.input-history#")}
+    assert set(entries) == {"整理 alpha 的測試", "在 alpha 裡重跑構建"}
+    assert entries["整理 alpha 的測試"].timestamp.isoformat() == "2026-01-02T00:00:00"
+
+    # 列表增加條目後，沒有時間字段的舊條目保持首次發現的時間
+    after = {c.id: c.timestamp for c in second}
+    plain = next(c for c in first if c.content == "在 alpha 裡重跑構建")
+    assert after[plain.id] == plain.timestamp
+    assert sum(1 for key in after if key.startswith("chat.input-history#")) == 4
+
+def test_rows_of_unparseable_blobs_are_removed(tmp_path):
+    db, conn = _make_database(tmp_path)
+
+    async def run():
+        await db.connect()
+        await db.get_conversation_history()
+        conn.execute("INSERT INTO ItemTable VALUES (?, ?)", ("memento/chat-3", ""))
+        conn.commit()
+        await db.connect()
+        return await db.get_conversation_history(limit=20)
+
+    conversations = asyncio.run(run())
+    conn.close()
+
+    assert "memento/chat-3" not in {c.id for c in conversations}
+    assert len(conversations) == 9
+
+def _make_source(tmp_path, rows):
+    path = str(tmp_path / "state.vscdb")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE ItemTable (key TEXT UNIQUE ON CONFLICT REPLACE, value BLOB)")
+    conn.executemany("INSERT INTO ItemTable VALUES (?, ?)", rows)
+    conn.commit()
+    return path, conn
+
+def _normalize(key, value):
+    data = json.loads(value)
+    if not data:
+        return data
+    return {"timestamp": None, "conversation_type": "chat", "content": data["content"]}
+
+def test_blobs_without_rows_are_not_reparsed(tmp_path):
+    path, conn = _make_source(tmp_path, [
+        ("memento/chat-1", json.dumps({"content": "hello"})),
+        ("memento/empty-list", "[]"),
+        ("memento/null", "null")
+    ])
+    index = TraeHistoryIndex(str(tmp_path / "index" / "history.db"))
+    parsed = []
+
+    def counting_normalize(key, value):
+        parsed.append(key)
+        return _normalize(key, value)
+
+    index.refresh(path, counting_normalize)
+    # 改動無關的key使源數據庫簽名變化，強制第二次刷新逐個比較摘要
+    conn.execute("INSERT INTO ItemTable VALUES (?, ?)", ("settings/other", "{}"))
+    conn.commit()
+    result = index.refresh(path, counting_normalize)
+
+    assert sorted(parsed) == ["memento/chat-1", "memento/empty-list", "memento/null"]
+    assert (result["skipped"], result["parsed"], result["unchanged"]) == (False, 0, 3)
+    assert index.count() == 1
+    assert [row["content"] for row in index.query()] == ["hello"]
+
+    # 刪除的blob連同摘要一起移除
+    conn.execute("DELETE FROM ItemTable WHERE key = 'memento/empty-list'")
+    conn.commit()
+    conn.close()
+    assert index.refresh(path, counting_normalize)["deleted"] == 1
+    with sqlite3.connect(index.index_path) as check:
+        assert [row[0] for row in check.execute("SELECT source_key FROM blobs ORDER BY source_key")] == [
+            "memento/chat-1", "memento/null"
+        ]
+
+def test_index_connections_are_closed(tmp_path):
+    path, conn = _make_source(tmp_path, [("memento/chat-1", json.dumps({"content": "hello"}))])
+    conn.close()
+    index = TraeHistoryIndex(str(tmp_path / "history.db"))
+    opened = []
+    connect = index._connect
+
+    def tracking_connect():
+        opened.append(connect())
+        return opened[-1]
+
+    index._connect = tracking_connect
+
+    index.refresh(path, _normalize)
+    index.refresh(path, _normalize)
+    index.query()
+    index.count("alpha")
+
+    assert len(opened) == 4
+    for opened_conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            opened_conn.execute("SELECT 1")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TRAE異步任務測試
+以本機Python子進程代替trae命令，驗證任務執行、同鍵合併、隊列已滿拒絕和任務狀態/結果接口
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "powerautomation_server"))
+
+from src.integrations.trae_integration import TraeIntegration
+from src.integrations.trae_jobs import JobQueueFullError, TraeJob, TraeJobManager
+
+def python_job(code, **kwargs):
+    kwargs.setdefault("finalize", lambda job: {"success": job.status == TraeJob.SUCCEEDED, "stdout": job.stdout})
+    return TraeJob(kind="test", argv=[sys.executable, "-c", code], params={}, timeout=kwargs.pop("timeout", 5), **kwargs)
+
+def test_job_runs_and_finalizes_result():
+    manager = TraeJobManager(max_concurrency=2)
+    job = manager.submit(python_job("import sys; print(sys.stdin.read().strip())", stdin_data="你好\n"))
+
+    assert job.wait(5)
+    assert job.status == TraeJob.SUCCEEDED
+    assert job.result == {"success": True, "stdout": "你好\n"}
+    assert manager.get_stats()["succeeded"] == 1
+
+def test_jobs_with_the_same_key_run_once():
+    manager = TraeJobManager()
+    completed = []
+    first = manager.submit(python_job("import time; time.sleep(0.3)", coalesce_key="sync:*"), completed.append)
+    second = manager.submit(python_job("raise SystemExit(1)", coalesce_key="sync:*"), completed.append)
+
+    assert second is first
+    assert first.wait(5)
+    assert first.coalesced_requests == 1
+    assert completed == [first, first]
+    # 任務結束後同鍵的新任務重新執行
+    third = manager.submit(python_job("pass", coalesce_key="sync:*"))
+    assert third is not first and third.wait(5)
+
+def test_job_timeout_kills_the_process():
+    manager = TraeJobManager()
+    job = manager.submit(python_job("import time; time.sleep(30)", timeout=0.3))
+
+    assert job.wait(5)
+    assert job.status == TraeJob.TIMEOUT
+    assert "超時" in job.error
+
+def test_full_queue_rejects_new_jobs():
+    manager = TraeJobManager(max_queue_size=0)
+
+    with pytest.raises(JobQueueFullError):
+        manager.submit(python_job("pass"))
+    assert manager.get_stats()["rejected"] == 1
+
+def test_failed_finalize_returns_an_error_result():
+    integration = TraeIntegration(TraeJobManager())
+    integration._trae_available = True
+    integration._finalize_send = lambda job: 1 / 0
+
+    result = integration.send_message("消息")
+
+    assert result["success"] is False
+    assert result["message"] == "消息"
+    assert result["error"]
+
+@pytest.fixture
+def api(monkeypatch):
+    flask = pytest.importorskip("flask")
+    from src.routes import powerautomation as routes
+
+    integration = TraeIntegration(TraeJobManager(max_concurrency=1, max_queue_size=1))
+    integration._trae_available = True
+    monkeypatch.setattr(routes, "trae_integration", integration)
+
+    app = flask.Flask(__name__)
+    app.register_blueprint(routes.powerautomation_bp, url_prefix="/api/powerautomation")
+    return app.test_client(), integration
+
+def test_status_and_result_endpoints(api):
+    client, integration = api
+    job = integration.jobs.submit(python_job("print('done')"))
+
+    result = client.get(f"/api/powerautomation/trae/jobs/{job.id}/result?wait=5")
+    assert result.status_code == 200
+    assert result.get_json()["stdout"] == "done\n"
+
+    status = client.get(f"/api/powerautomation/trae/jobs/{job.id}")
+    assert status.status_code == 200
+    assert status.get_json()["job"]["status"] == TraeJob.SUCCEEDED
+
+    assert client.get("/api/powerautomation/trae/jobs/missing").status_code == 404
+
+def test_pending_result_returns_202_and_full_queue_returns_503(api):
+    client, integration = api
+    # 唯一的worker被佔用，隊列容量為1
+    running = integration.jobs.submit(python_job("import time; time.sleep(1)"))
+    deadline = time.monotonic() + 5
+    while running.status != TraeJob.RUNNING and time.monotonic() < deadline:
+        time.sleep(0.01)
+    queued = integration.jobs.submit(python_job("import time; time.sleep(1)"))
+
+    assert client.get(f"/api/powerautomation/trae/jobs/{running.id}/result").status_code == 202
+    response = client.post("/api/powerautomation/trae/sync", json={"repository": "alpha"})
+    assert response.status_code == 503
+    assert queued.wait(5)
@@ -8,19 +8,24 @@ Action Executor - Unified Execution Engine
 """
 
 import asyncio
-import json
 import logging
 import time
-import aiohttp
 import subprocess
-from typing import Dict, List, Any, Optional, Callable, Union
+from typing import Dict, List, Any, Optional, Callable
 from dataclasses import dataclass, asdict
 from enum import Enum
 from concurrent.futures import ThreadPoolExecutor
-import importlib
+from collections import deque
+
+from ..core.connection_manager import get_connection_manager
+from ..core.history import RingBuffer, LatencyHistogram
+from .resilience import RetryPolicy, CircuitBreaker, CircuitState
 
 logger = logging.getLogger(__name__)
 
+# 並行模式下，請求截止後再等待多久才強制取消仍未結束的任務(秒)
+DEADLINE_GRACE = 0.1
+
 class ExecutionStatus(Enum):
     """執行狀態枚舉"""
     PENDING = "pending"
@@ -29,12 +34,14 @@ class ExecutionStatus(Enum):
     FAILED = "failed"
     TIMEOUT = "timeout"
     CANCELLED = "cancelled"
+    SKIPPED = "skipped"        # 上游依賴失敗而未執行
 
 class ExecutionMode(Enum):
     """執行模式枚舉"""
     SEQUENTIAL = "sequential"  # 順序執行
     PARALLEL = "parallel"      # 並行執行
     PIPELINE = "pipeline"      # 管道執行
+    DAG = "dag"                # 依賴圖執行
 
 @dataclass
 class ExecutionTask:
@@ -43,10 +50,12 @@ class ExecutionTask:
     tool_id: str
     action: str
     parameters: Dict[str, Any]
-    timeout: int = 30
+    timeout: float = 30
     retry_count: int = 0
     max_retries: int = 2
     dependencies: List[str] = None
+    deadline: Optional[float] = None  # 請求截止時間(time.monotonic()時間軸)
+    result_listener: Optional[Callable[['ExecutionResult'], None]] = None  # 任務完成時的回調
     
     def __post_init__(self):
         if self.dependencies is None:
@@ -70,6 +79,29 @@ class ExecutionResult:
         if self.timestamp is None:
             self.timestamp = str(time.time())
 
+class ExecutionRecord:
+    """執行歷史記錄（緊湊表示，不保留工具輸出）"""
+    
+    __slots__ = ('task_id', 'tool_id', 'status', 'execution_time', 'error', 'timestamp')
+    
+    def __init__(self, result: ExecutionResult):
+        self.task_id = result.task_id
+        self.tool_id = result.tool_id
+        self.status = result.status
+        self.execution_time = result.execution_time
+        self.error = result.error
+        self.timestamp = float(result.timestamp)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'task_id': self.task_id,
+            'tool_id': self.tool_id,
+            'status': self.status.value,
+            'execution_time': self.execution_time,
+            'error': self.error,
+            'timestamp': self.timestamp
+        }
+
 class ActionExecutor:
     """
     統一執行引擎
@@ -78,25 +110,98 @@ class ActionExecutor:
     1. 並行執行多個工具
     2. 流程編排和依賴管理
     3. 結果聚合和處理
-    4. 錯誤處理和重試
+    4. 錯誤處理、重試和熔斷
     """
     
     def __init__(self, config: Dict[str, Any] = None):
         self.config = config or {}
         self.tool_registry = None  # 將在初始化時注入
         self.active_executions: Dict[str, ExecutionTask] = {}
-        self.execution_history: List[ExecutionResult] = []
         self.thread_pool = ThreadPoolExecutor(max_workers=self.config.get('max_workers', 10))
         self.max_concurrent_tasks = self.config.get('max_concurrent_tasks', 20)
+        self.connection_manager = get_connection_manager(self.config.get('connection_pool'))
+        self.connection_manager.acquire(self)
+        
+        # 重試策略（兼容retry_policy分段和扁平的retry_attempts配置）
+        retry_config = dict(self._setting('retry_policy', None) or {})
+        if 'max_retries' not in retry_config and 'retry_attempts' in self.config:
+            retry_config['max_retries'] = self.config['retry_attempts']
+        self.retry_policy = RetryPolicy.from_config(retry_config)
+        
+        # 按工具劃分的熔斷器
+        self.circuit_breaker_config = {
+            'enabled': True,
+            'failure_threshold': 5,
+            'recovery_timeout': 60,
+            'half_open_max_calls': 1,
+            **(self._setting('circuit_breaker', None) or {})
+        }
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self.resilience_stats = {
+            'retries': 0,
+            'circuit_rejections': 0
+        }
+        
+        # 有界執行歷史和累計統計
+        self.execution_history = RingBuffer(
+            self._setting('history_limit', 1000),
+            spill_path=self._setting('history_spill_path', None)
+        )
+        self.execution_stats = {
+            'total_executions': 0,
+            'successful_executions': 0,
+            'total_execution_time': 0.0
+        }
+        self.latency_histograms: Dict[str, LatencyHistogram] = {}
         
         logger.info("ActionExecutor initialized")
     
+    def _setting(self, key: str, default: Any) -> Any:
+        """讀取配置（兼容扁平配置和帶action_executor分段的配置）"""
+        if key in self.config:
+            return self.config[key]
+        return self.config.get('action_executor', {}).get(key, default)
+    
     def set_tool_registry(self, tool_registry):
         """設置工具註冊系統"""
         self.tool_registry = tool_registry
         logger.info("Tool registry injected into ActionExecutor")
     
-    async def execute(self, request, tools: List[str], mode: ExecutionMode = ExecutionMode.PARALLEL) -> Dict[str, Any]:
+    def _get_circuit_breaker(self, tool_id: str) -> Optional[CircuitBreaker]:
+        """獲取工具的熔斷器，未啟用時返回None"""
+        if not self.circuit_breaker_config['enabled']:
+            return None
+        
+        breaker = self.circuit_breakers.get(tool_id)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                tool_id,
+                failure_threshold=self.circuit_breaker_config['failure_threshold'],
+                recovery_timeout=self.circuit_breaker_config['recovery_timeout'],
+                half_open_max_calls=self.circuit_breaker_config['half_open_max_calls'],
+                on_state_change=self._on_circuit_state_change
+            )
+            self.circuit_breakers[tool_id] = breaker
+        return breaker
+    
+    def _on_circuit_state_change(self, tool_id: str, old_state: CircuitState, new_state: CircuitState):
+        """熔斷器狀態變化時同步到工具註冊系統，使路由避開熔斷中的工具"""
+        logger.warning(f"Circuit breaker for {tool_id}: {old_state.value} -> {new_state.value}")
+        
+        if self.tool_registry and hasattr(self.tool_registry, 'set_circuit_state'):
+            self.tool_registry.set_circuit_state(tool_id, new_state.value)
+        
+        if new_state == CircuitState.OPEN:
+            # 恢復窗口結束後主動轉入半開，讓工具重新參與路由以便探測
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            breaker = self.circuit_breakers[tool_id]
+            loop.call_later(breaker.recovery_timeout, breaker.check_recovery)
+    
+    async def execute(self, request, tools: List[str], mode: ExecutionMode = ExecutionMode.PARALLEL,
+                      result_listener: Optional[Callable[[ExecutionResult], None]] = None) -> Dict[str, Any]:
         """
         執行任務的主入口
         
@@ -104,6 +209,7 @@ class ActionExecutor:
             request: Agent請求對象
             tools: 要使用的工具列表
             mode: 執行模式
+            result_listener: 每個任務得到最終結果時調用（每個任務恰好一次，按完成順序）
         
         Returns:
             執行結果字典
@@ -112,10 +218,20 @@ class ActionExecutor:
         logger.info(f"Starting execution {execution_id} with tools: {tools}")
         
         start_time = time.time()
+        deadline = time.monotonic() + request.timeout
         
         try:
             # 創建執行任務
-            tasks = await self._create_execution_tasks(execution_id, request, tools)
+            tasks = await self._create_execution_tasks(execution_id, request, tools, deadline)
+            
+            delivered = set()
+            if result_listener:
+                def deliver(result: ExecutionResult):
+                    delivered.add(result.task_id)
+                    result_listener(result)
+                
+                for task in tasks:
+                    task.result_listener = deliver
             
             # 根據模式執行任務
             if mode == ExecutionMode.SEQUENTIAL:
@@ -124,9 +240,17 @@ class ActionExecutor:
                 results = await self._execute_parallel(tasks)
             elif mode == ExecutionMode.PIPELINE:
                 results = await self._execute_pipeline(tasks)
+            elif mode == ExecutionMode.DAG:
+                results = await self._execute_dag(tasks)
             else:
                 raise ValueError(f"Unsupported execution mode: {mode}")
             
+            # 補發未經過單任務執行路徑的結果（被取消或被跳過的任務）
+            if result_listener:
+                for result in results:
+                    if result.task_id not in delivered:
+                        result_listener(result)
+            
             # 聚合結果
             aggregated_result = await self._aggregate_results(request, results)
             
@@ -162,11 +286,25 @@ class ActionExecutor:
                 }
             }
     
-    async def _create_execution_tasks(self, execution_id: str, request, tools: List[str]) -> List[ExecutionTask]:
-        """創建執行任務"""
+    async def _create_execution_tasks(self, execution_id: str, request, tools: List[str],
+                                      deadline: Optional[float] = None) -> List[ExecutionTask]:
+        """
+        創建執行任務
+        
+        DAG模式下的依賴通過request.context['tool_dependencies']聲明，
+        格式為 {工具ID: [上游工具ID, ...]}
+        """
         tasks = []
+        task_ids = {tool_id: f"{execution_id}_task_{i}" for i, tool_id in enumerate(tools)}
+        tool_dependencies = (request.context or {}).get('tool_dependencies', {})
         
         for i, tool_id in enumerate(tools):
+            dependencies = []
+            for upstream in tool_dependencies.get(tool_id, []):
+                if upstream not in task_ids:
+                    raise ValueError(f"Tool {tool_id} depends on {upstream}, which is not part of this request")
+                dependencies.append(task_ids[upstream])
+            
             task = ExecutionTask(
                 id=f"{execution_id}_task_{i}",
                 tool_id=tool_id,
@@ -177,7 +315,10 @@ class ActionExecutor:
                     'context': request.context,
                     'metadata': request.metadata
                 },
-                timeout=request.timeout // len(tools) if len(tools) > 1 else request.timeout
+                timeout=request.timeout // len(tools) if len(tools) > 1 else request.timeout,
+                max_retries=self.retry_policy.max_retries,
+                dependencies=dependencies,
+                deadline=deadline
             )
             tasks.append(task)
         
@@ -188,7 +329,8 @@ class ActionExecutor:
         logger.info(f"Executing {len(tasks)} tasks sequentially")
         results = []
         
-        for task in tasks:
+        for i, task in enumerate(tasks):
+            self._allot_budget(task, len(tasks) - i)
             result = await self._execute_single_task(task)
             results.append(result)
             
@@ -209,25 +351,44 @@ class ActionExecutor:
             async with semaphore:
                 return await self._execute_single_task(task)
         
+        # 並行任務共享整個請求的剩餘時間
+        for task in tasks:
+            self._allot_budget(task, 1)
+        
         # 並行執行所有任務
-        results = await asyncio.gather(
-            *[execute_with_semaphore(task) for task in tasks],
-            return_exceptions=True
+        futures = [asyncio.ensure_future(execute_with_semaphore(task)) for task in tasks]
+        remaining = min((self._remaining(task) for task in tasks), default=float('inf'))
+        done, pending = await asyncio.wait(
+            futures,
+            timeout=None if remaining == float('inf') else remaining + DEADLINE_GRACE
         )
         
+        # 請求截止後取消仍未結束的任務
+        if pending:
+            logger.warning(f"Cancelling {len(pending)} straggler tasks at request deadline")
+            for future in pending:
+                future.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        
         # 處理異常結果
         processed_results = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                error_result = ExecutionResult(
-                    task_id=tasks[i].id,
-                    tool_id=tasks[i].tool_id,
+        for task, future in zip(tasks, futures):
+            if future.cancelled():
+                processed_results.append(ExecutionResult(
+                    task_id=task.id,
+                    tool_id=task.tool_id,
+                    status=ExecutionStatus.CANCELLED,
+                    error="Cancelled at request deadline"
+                ))
+            elif future.exception() is not None:
+                processed_results.append(ExecutionResult(
+                    task_id=task.id,
+                    tool_id=task.tool_id,
                     status=ExecutionStatus.FAILED,
-                    error=str(result)
-                )
-                processed_results.append(error_result)
+                    error=str(future.exception())
+                ))
             else:
-                processed_results.append(result)
+                processed_results.append(future.result())
         
         return processed_results
     
@@ -237,11 +398,14 @@ class ActionExecutor:
         results = []
         pipeline_data = None
         
-        for task in tasks:
+        for i, task in enumerate(tasks):
             # 將前一個任務的結果作為當前任務的輸入
             if pipeline_data is not None:
                 task.parameters['pipeline_input'] = pipeline_data
             
+            # 前面階段節省的時間順延給後續階段
+            self._allot_budget(task, len(tasks) - i)
+            
             result = await self._execute_single_task(task)
             results.append(result)
             
@@ -254,31 +418,243 @@ class ActionExecutor:
         
         return results
     
+    async def _execute_dag(self, tasks: List[ExecutionTask]) -> List[ExecutionResult]:
+        """
+        依賴圖執行
+        
+        所有依賴已完成的任務在max_concurrent_tasks限制內立即並發執行，
+        上游結果一完成就寫入下游任務的dependency_inputs；
+        任務失敗時只跳過依賴它的子圖，其他分支繼續執行
+        """
+        logger.info(f"Executing {len(tasks)} tasks as a dependency graph")
+        
+        by_id = {task.id: task for task in tasks}
+        dependents: Dict[str, List[str]] = {task.id: [] for task in tasks}
+        waiting: Dict[str, int] = {}
+        for task in tasks:
+            upstreams = set(task.dependencies)
+            for upstream in upstreams:
+                if upstream not in by_id:
+                    raise ValueError(f"Task {task.id} depends on unknown task {upstream}")
+                dependents[upstream].append(task.id)
+            waiting[task.id] = len(upstreams)
+        
+        self._check_acyclic(tasks, dependents, waiting)
+        
+        results: Dict[str, ExecutionResult] = {}
+        ready = deque(task.id for task in tasks if waiting[task.id] == 0)
+        running: Dict[asyncio.Future, str] = {}
+        remaining = min((self._remaining(task) for task in tasks), default=float('inf'))
+        hard_deadline = None if remaining == float('inf') else time.monotonic() + remaining + DEADLINE_GRACE
+        
+        while ready or running:
+            while ready and len(running) < self.max_concurrent_tasks:
+                task = by_id[ready.popleft()]
+                self._allot_budget(task, 1)
+                running[asyncio.ensure_future(self._execute_single_task(task))] = task.id
+            
+            done, _ = await asyncio.wait(
+                running,
+                timeout=None if hard_deadline is None else max(0.0, hard_deadline - time.monotonic()),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            
+            if not done:
+                # 請求截止後取消仍在運行的任務
+                logger.warning(f"Cancelling {len(running)} straggler tasks at request deadline")
+                for future, task_id in running.items():
+                    future.cancel()
+                    results[task_id] = ExecutionResult(
+                        task_id=task_id,
+                        tool_id=by_id[task_id].tool_id,
+                        status=ExecutionStatus.CANCELLED,
+                        error="Cancelled at request deadline"
+                    )
+                await asyncio.gather(*running, return_exceptions=True)
+                break
+            
+            for future in done:
+                task_id = running.pop(future)
+                task = by_id[task_id]
+                if future.exception() is not None:
+                    result = ExecutionResult(
+                        task_id=task_id,
+                        tool_id=task.tool_id,
+                        status=ExecutionStatus.FAILED,
+                        error=str(future.exception())
+                    )
+                else:
+                    result = future.result()
+                results[task_id] = result
+                
+                if result.status == ExecutionStatus.COMPLETED:
+                    for child_id in dependents[task_id]:
+                        child = by_id[child_id]
+                        child.parameters.setdefault('dependency_inputs', {})[task.tool_id] = result.result
+                        waiting[child_id] -= 1
+                        if waiting[child_id] == 0:
+                            ready.append(child_id)
+                else:
+                    self._skip_dependents(task, dependents, by_id, results)
+        
+        # 截止時間到達時尚未啟動的任務
+        for task in tasks:
+            if task.id not in results:
+                results[task.id] = ExecutionResult(
+                    task_id=task.id,
+                    tool_id=task.tool_id,
+                    status=ExecutionStatus.TIMEOUT,
+                    error="Request deadline exceeded",
+                    metadata={'deadline_exceeded': True}
+                )
+        
+        return [results[task.id] for task in tasks]
+    
+    def _check_acyclic(self, tasks: List[ExecutionTask], dependents: Dict[str, List[str]],
+                       waiting: Dict[str, int]):
+        """拓撲排序檢查依賴圖中是否有環"""
+        in_degree = dict(waiting)
+        queue = deque(task.id for task in tasks if in_degree[task.id] == 0)
+        visited = 0
+        while queue:
+            task_id = queue.popleft()
+            visited += 1
+            for child_id in dependents[task_id]:
+                in_degree[child_id] -= 1
+                if in_degree[child_id] == 0:
+                    queue.append(child_id)
+        
+        if visited != len(tasks):
+            cyclic = [task_id for task_id, degree in in_degree.items() if degree > 0]
+            raise ValueError(f"Dependency cycle detected among tasks: {cyclic}")
+    
+    def _skip_dependents(self, failed_task: ExecutionTask, dependents: Dict[str, List[str]],
+                         by_id: Dict[str, ExecutionTask], results: Dict[str, ExecutionResult]):
+        """將失敗任務的所有下游任務標記為跳過"""
+        queue = deque(dependents[failed_task.id])
+        while queue:
+            task_id = queue.popleft()
+            if task_id in results:
+                continue
+            results[task_id] = ExecutionResult(
+                task_id=task_id,
+                tool_id=by_id[task_id].tool_id,
+                status=ExecutionStatus.SKIPPED,
+                error=f"Skipped because upstream task {failed_task.id} ({failed_task.tool_id}) did not complete"
+            )
+            logger.warning(f"Task {task_id} skipped: upstream {failed_task.id} did not complete")
+            queue.extend(dependents[task_id])
+    
     async def _execute_single_task(self, task: ExecutionTask) -> ExecutionResult:
-        """執行單個任務"""
+        """執行單個任務（帶熔斷檢查和指數退避重試）"""
+        tool_info = await self.tool_registry.get_tool_info(task.tool_id) if self.tool_registry else None
+        
+        if not tool_info:
+            # 工具不存在屬於不可重試的錯誤，也不計入熔斷
+            execution_result = ExecutionResult(
+                task_id=task.id,
+                tool_id=task.tool_id,
+                status=ExecutionStatus.FAILED,
+                error=f"Tool {task.tool_id} not found in registry"
+            )
+            logger.error(f"Task {task.id} failed: {execution_result.error}")
+            self._record_execution(execution_result, task.result_listener)
+            return execution_result
+        
+        breaker = self._get_circuit_breaker(task.tool_id)
+        
+        while True:
+            if task.deadline is not None and self._remaining(task) <= 0:
+                # 截止時間已過，不再發起調用，也不計入熔斷
+                execution_result = ExecutionResult(
+                    task_id=task.id,
+                    tool_id=task.tool_id,
+                    status=ExecutionStatus.TIMEOUT,
+                    error="Request deadline exceeded",
+                    metadata={'deadline_exceeded': True}
+                )
+                logger.warning(f"Task {task.id} skipped: request deadline exceeded")
+                break
+            
+            if breaker and not breaker.allow_request():
+                self.resilience_stats['circuit_rejections'] += 1
+                execution_result = ExecutionResult(
+                    task_id=task.id,
+                    tool_id=task.tool_id,
+                    status=ExecutionStatus.FAILED,
+                    error=f"Circuit breaker open for tool {task.tool_id}, retry after {breaker.retry_after():.1f}s",
+                    metadata={'circuit_state': breaker.state.value}
+                )
+                logger.warning(f"Task {task.id} rejected: {execution_result.error}")
+                break
+            
+            try:
+                execution_result = await self._execute_attempt(task, tool_info)
+            except BaseException:
+                # 調用被取消（並行/DAG取消落後任務、流式請求關閉）時沒有結果，歸還探測名額
+                if breaker:
+                    breaker.release_probe()
+                raise
+            failed = execution_result.status in (ExecutionStatus.FAILED, ExecutionStatus.TIMEOUT)
+            
+            if breaker:
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            
+            if not failed or task.retry_count >= task.max_retries:
+                break
+            
+            delay = self.retry_policy.get_delay(task.retry_count + 1)
+            if delay >= self._remaining(task):
+                logger.info(f"Not retrying task {task.id}: request deadline too close")
+                break
+            
+            task.retry_count += 1
+            self.resilience_stats['retries'] += 1
+            logger.info(f"Retrying task {task.id} ({task.retry_count}/{task.max_retries}) in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        
+        execution_result.metadata['attempts'] = task.retry_count + 1
+        
+        # 記錄到歷史
+        self._record_execution(execution_result, task.result_listener)
+        
+        return execution_result
+    
+    def _record_execution(self, result: ExecutionResult,
+                          listener: Optional[Callable[[ExecutionResult], None]] = None):
+        """記錄執行結果到環形歷史並更新累計統計和工具延遲直方圖"""
+        self.execution_history.append(ExecutionRecord(result))
+        
+        self.execution_stats['total_execution_time'] += result.execution_time
+        self.execution_stats['total_executions'] += 1
+        if result.status == ExecutionStatus.COMPLETED:
+            self.execution_stats['successful_executions'] += 1
+        
+        if result.execution_time > 0:
+            histogram = self.latency_histograms.get(result.tool_id)
+            if histogram is None:
+                histogram = self.latency_histograms[result.tool_id] = LatencyHistogram()
+            histogram.observe(result.execution_time)
+        
+        if listener:
+            listener(result)
+    
+    async def _execute_attempt(self, task: ExecutionTask, tool_info) -> ExecutionResult:
+        """執行單次任務嘗試"""
         logger.info(f"Executing task {task.id} with tool {task.tool_id}")
         
         start_time = time.time()
         self.active_executions[task.id] = task
         
         try:
-            # 獲取工具信息
-            tool_info = await self.tool_registry.get_tool_info(task.tool_id) if self.tool_registry else None
-            
-            if not tool_info:
-                raise ValueError(f"Tool {task.tool_id} not found in registry")
-            
-            # 根據工具類型執行
-            if tool_info.type.value == "mcp_service":
-                result = await self._execute_mcp_tool(tool_info, task)
-            elif tool_info.type.value == "http_api":
-                result = await self._execute_http_tool(tool_info, task)
-            elif tool_info.type.value == "python_module":
-                result = await self._execute_python_tool(tool_info, task)
-            elif tool_info.type.value == "shell_command":
-                result = await self._execute_shell_tool(tool_info, task)
-            else:
-                result = await self._execute_default_tool(tool_info, task)
+            # 所有工具類型統一受時間預算約束
+            result = await asyncio.wait_for(
+                self._dispatch_tool(tool_info, task),
+                timeout=self._time_budget(task)
+            )
             
             execution_time = time.time() - start_time
             
@@ -319,12 +695,37 @@ class ActionExecutor:
             # 清理活動執行
             if task.id in self.active_executions:
                 del self.active_executions[task.id]
-            
-            # 記錄到歷史
-            self.execution_history.append(execution_result)
         
         return execution_result
     
+    def _remaining(self, task: ExecutionTask) -> float:
+        """距離請求截止還剩多少秒，無截止時間時為無窮大"""
+        if task.deadline is None:
+            return float('inf')
+        return task.deadline - time.monotonic()
+    
+    def _time_budget(self, task: ExecutionTask) -> float:
+        """單次嘗試的時間預算: 任務超時與請求剩餘時間中的較小者"""
+        return max(0.0, min(task.timeout, self._remaining(task)))
+    
+    def _allot_budget(self, task: ExecutionTask, stages_left: int):
+        """把請求剩餘時間平均分配給尚未執行的階段"""
+        if task.deadline is not None:
+            task.timeout = max(0.0, self._remaining(task) / stages_left)
+    
+    async def _dispatch_tool(self, tool_info, task: ExecutionTask) -> Any:
+        """根據工具類型執行"""
+        if tool_info.type.value == "mcp_service":
+            return await self._execute_mcp_tool(tool_info, task)
+        elif tool_info.type.value == "http_api":
+            return await self._execute_http_tool(tool_info, task)
+        elif tool_info.type.value == "python_module":
+            return await self._execute_python_tool(tool_info, task)
+        elif tool_info.type.value == "shell_command":
+            return await self._execute_shell_tool(tool_info, task)
+        else:
+            return await self._execute_default_tool(tool_info, task)
+    
     async def _execute_mcp_tool(self, tool_info, task: ExecutionTask) -> Any:
         """執行MCP工具"""
         logger.info(f"Executing MCP tool: {tool_info.name}")
@@ -335,15 +736,14 @@ class ActionExecutor:
             'parameters': task.parameters
         }
         
-        # 發送HTTP請求到MCP服務
-        async with aiohttp.ClientSession() as session:
-            url = f"{tool_info.endpoint}/process"
-            async with session.post(url, json=mcp_request, timeout=task.timeout) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result
-                else:
-                    raise Exception(f"MCP tool returned status {response.status}")
+        # 通過共享連接池發送HTTP請求到MCP服務
+        url = f"{tool_info.endpoint}/process"
+        async with self.connection_manager.post(url, json=mcp_request, timeout=self._time_budget(task)) as response:
+            if response.status == 200:
+                result = await response.json()
+                return result
+            else:
+                raise Exception(f"MCP tool returned status {response.status}")
     
     async def _execute_http_tool(self, tool_info, task: ExecutionTask) -> Any:
         """執行HTTP API工具"""
@@ -354,14 +754,13 @@ class ActionExecutor:
             'data': task.parameters
         }
         
-        async with aiohttp.ClientSession() as session:
-            url = f"{tool_info.endpoint}/api/process"
-            async with session.post(url, json=api_request, timeout=task.timeout) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result
-                else:
-                    raise Exception(f"HTTP API returned status {response.status}")
+        url = f"{tool_info.endpoint}/api/process"
+        async with self.connection_manager.post(url, json=api_request, timeout=self._time_budget(task)) as response:
+            if response.status == 200:
+                result = await response.json()
+                return result
+            else:
+                raise Exception(f"HTTP API returned status {response.status}")
     
     async def _execute_python_tool(self, tool_info, task: ExecutionTask) -> Any:
         """執行Python模塊工具"""
@@ -369,7 +768,8 @@ class ActionExecutor:
         
         # 模擬Python工具執行
         if tool_info.name == "system_monitor":
-            return await self._execute_system_monitor(task.parameters)
+            # CPU採樣時長不超過時間預算的一半
+            return await self._execute_system_monitor(task.parameters, min(1.0, self._time_budget(task) / 2))
         elif tool_info.name == "file_processor":
             return await self._execute_file_processor(task.parameters)
         else:
@@ -385,11 +785,12 @@ class ActionExecutor:
             self.thread_pool,
             self._run_shell_command,
             tool_info.command,
-            task.parameters
+            task.parameters,
+            self._time_budget(task)
         )
         return result
     
-    def _run_shell_command(self, command: str, parameters: Dict[str, Any]) -> str:
+    def _run_shell_command(self, command: str, parameters: Dict[str, Any], timeout: float = 30) -> str:
         """運行shell命令"""
         try:
             # 替換命令中的參數
@@ -399,7 +800,7 @@ class ActionExecutor:
                 shell=True,
                 capture_output=True,
                 text=True,
-                timeout=30
+                timeout=timeout
             )
             
             if result.returncode == 0:
@@ -425,17 +826,21 @@ class ActionExecutor:
             'processing_time': time.time()
         }
     
-    async def _execute_system_monitor(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """執行系統監控"""
+    async def _execute_system_monitor(self, parameters: Dict[str, Any], interval: float = 1.0) -> Dict[str, Any]:
+        """執行系統監控（阻塞的psutil採樣放到線程池中）"""
         try:
             import psutil
             
-            return {
-                'cpu_percent': psutil.cpu_percent(interval=1),
-                'memory_percent': psutil.virtual_memory().percent,
-                'disk_percent': psutil.disk_usage('/').percent,
-                'timestamp': time.time()
-            }
+            def collect():
+                return {
+                    'cpu_percent': psutil.cpu_percent(interval=interval),
+                    'memory_percent': psutil.virtual_memory().percent,
+                    'disk_percent': psutil.disk_usage('/').percent,
+                    'timestamp': time.time()
+                }
+            
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.thread_pool, collect)
         except ImportError:
             return {
                 'error': 'psutil not available',
@@ -567,18 +972,35 @@ class ActionExecutor:
         
         return max(0.0, min(1.0, base_confidence))
     
+    def get_execution_history(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """獲取最近的執行歷史"""
+        return [record.to_dict() for record in self.execution_history.latest(limit)]
+    
     def get_executor_stats(self) -> Dict[str, Any]:
         """獲取執行器統計信息"""
-        total_executions = len(self.execution_history)
-        successful_executions = len([r for r in self.execution_history if r.status == ExecutionStatus.COMPLETED])
+        total_executions = self.execution_stats['total_executions']
+        successful_executions = self.execution_stats['successful_executions']
         
         return {
             'active_tasks': len(self.active_executions),
             'total_executions': total_executions,
             'successful_executions': successful_executions,
             'success_rate': successful_executions / total_executions if total_executions > 0 else 0.0,
-            'average_execution_time': sum(r.execution_time for r in self.execution_history) / total_executions if total_executions > 0 else 0.0
+            'average_execution_time': self.execution_stats['total_execution_time'] / total_executions if total_executions > 0 else 0.0,
+            'history': self.execution_history.get_stats(),
+            'latency_histograms': {tool_id: histogram.to_dict() for tool_id, histogram in self.latency_histograms.items()},
+            'retry_policy': asdict(self.retry_policy),
+            'resilience': dict(self.resilience_stats),
+            'circuit_breakers': {tool_id: breaker.get_stats() for tool_id, breaker in self.circuit_breakers.items()},
+            'connection_pool': self.connection_manager.get_metrics()
         }
+    
+    async def close(self):
+        """關閉執行器，釋放線程池和共享連接池"""
+        self.thread_pool.shutdown(wait=False)
+        self.execution_history.close()
+        await self.connection_manager.release(self)
+        logger.info("ActionExecutor closed")
 
 # 工廠函數
 def create_action_executor(config: Dict[str, Any] = None) -> ActionExecutor:
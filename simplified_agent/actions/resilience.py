@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Resilience - 重試策略與熔斷器
+Resilience - Retry Policy and Circuit Breaker
+
+為ActionExecutor提供帶抖動的指數退避重試，以及按工具劃分的熔斷器
+（連續失敗後打開，恢復窗口過後進入半開狀態放行探測請求）
+"""
+
+import random
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, Any, Optional, Callable
+
+class CircuitState(Enum):
+    """熔斷器狀態枚舉"""
+    CLOSED = "closed"        # 正常放行
+    OPEN = "open"            # 拒絕請求
+    HALF_OPEN = "half_open"  # 放行有限的探測請求
+
+@dataclass
+class RetryPolicy:
+    """重試策略"""
+    max_retries: int = 2
+    retry_delay: float = 1.0        # 首次重試前的基礎延遲(秒)
+    exponential_backoff: bool = True
+    max_delay: float = 30.0
+    jitter: bool = True
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'RetryPolicy':
+        """從配置字典創建，忽略未知字段"""
+        fields = {k: v for k, v in (config or {}).items() if k in cls.__dataclass_fields__}
+        return cls(**fields)
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        計算第attempt次重試前的等待時間(attempt從1開始)
+
+        指數退避時使用full jitter: 在[0, min(max_delay, retry_delay * 2^(attempt-1))]內均勻取值，
+        避免大量失敗請求同步重試
+        """
+        if self.exponential_backoff:
+            delay = min(self.max_delay, self.retry_delay * (2 ** (attempt - 1)))
+        else:
+            delay = min(self.max_delay, self.retry_delay)
+
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+class CircuitBreaker:
+    """
+    單個工具的熔斷器
+
+    CLOSED --連續失敗達到閾值--> OPEN --恢復超時--> HALF_OPEN
+    HALF_OPEN --探測成功--> CLOSED, HALF_OPEN --探測失敗--> OPEN
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 60,
+                 half_open_max_calls: int = 1,
+                 on_state_change: Optional[Callable[[str, CircuitState, CircuitState], None]] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.on_state_change = on_state_change
+
+        self._state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+
+        self.stats = {
+            'successes': 0,
+            'failures': 0,
+            'rejections': 0,
+            'times_opened': 0
+        }
+
+    @property
+    def state(self) -> CircuitState:
+        """當前狀態（恢復超時已過的OPEN狀態在讀取時轉為HALF_OPEN）"""
+        self.check_recovery()
+        return self._state
+
+    def check_recovery(self) -> bool:
+        """
+        恢復超時已過時把OPEN轉為HALF_OPEN
+
+        Returns:
+            是否發生了狀態轉換
+        """
+        if self._state == CircuitState.OPEN and self.retry_after() <= 0:
+            self._transition(CircuitState.HALF_OPEN)
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        """距離允許半開探測還有多少秒"""
+        if self._state != CircuitState.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow_request(self) -> bool:
+        """判斷是否放行請求；半開狀態下只放行有限的探測請求"""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+
+        if state == CircuitState.HALF_OPEN and self.half_open_calls < self.half_open_max_calls:
+            self.half_open_calls += 1
+            return True
+
+        self.stats['rejections'] += 1
+        return False
+
+    def release_probe(self):
+        """
+        探測請求沒有得到結果（例如被取消）時歸還半開狀態的探測名額
+
+        否則熔斷器會停在HALF_OPEN且探測名額已用完，之後的請求一直被拒絕
+        """
+        if self._state == CircuitState.HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def record_success(self):
+        """記錄成功調用"""
+        self.stats['successes'] += 1
+        self.consecutive_failures = 0
+        if self._state != CircuitState.CLOSED:
+            self._transition(CircuitState.CLOSED)
+
+    def record_failure(self):
+        """記錄失敗調用"""
+        self.stats['failures'] += 1
+        self.consecutive_failures += 1
+
+        if self._state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self._transition(CircuitState.OPEN)
+
+    def reset(self):
+        """手動重置為關閉狀態"""
+        self.consecutive_failures = 0
+        if self._state != CircuitState.CLOSED:
+            self._transition(CircuitState.CLOSED)
+
+    def _transition(self, new_state: CircuitState):
+        old_state = self._state
+        self._state = new_state
+        self.half_open_calls = 0
+
+        if new_state == CircuitState.OPEN:
+            self.opened_at = time.monotonic()
+            self.stats['times_opened'] += 1
+
+        if self.on_state_change:
+            self.on_state_change(self.name, old_state, new_state)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取熔斷器統計信息"""
+        return {
+            **self.stats,
+            'state': self.state.value,
+            'consecutive_failures': self.consecutive_failures,
+            'retry_after': self.retry_after()
+        }
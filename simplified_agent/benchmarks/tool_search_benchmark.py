@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+工具搜索基准测试
+对比原线性扫描与倒排索引在10k/100k工具规模下的查询延迟
+
+用法:
+    python simplified_agent/benchmarks/tool_search_benchmark.py [--sizes 10000 100000] [--queries 200]
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from simplified_agent.tools.tool_search_index import ToolSearchIndex
+
+PLATFORMS = ["aci.dev", "mcp.so", "zapier"]
+CATEGORIES = ["productivity", "data_analysis", "communication", "development", "marketing", "finance"]
+WORDS = [
+    "calendar", "slack", "github", "notion", "sheet", "email", "crm", "invoice", "report",
+    "chart", "translate", "search", "deploy", "monitor", "ticket", "payment", "weather",
+    "数据", "分析", "通知", "日程", "自动化", "同步", "可视化", "搜索"
+]
+CAPABILITIES = ["schedule", "remind", "sync", "share", "analyze", "visualize", "predict",
+                "export", "message", "channel", "mention", "format", "query", "notify"]
+
+QUERIES = ["calendar", "数据分析", "slack message", "analy", "invoice report", "sync", "deploy monitor"]
+
+
+def generate_tools(count: int, seed: int = 42) -> List[Dict]:
+    """生成与 UnifiedToolRegistry.register_tool 结构一致的合成工具"""
+    rng = random.Random(seed)
+    tools = []
+    for i in range(count):
+        words = rng.sample(WORDS, 3)
+        tools.append({
+            "id": f"{rng.choice(PLATFORMS)}:{words[0]}_{words[1]}_{i}",
+            "name": f"{words[0]}_{words[1]}_{i}",
+            "description": f"{' '.join(words)} integration tool #{i}",
+            "category": rng.choice(CATEGORIES),
+            "capabilities": rng.sample(CAPABILITIES, 4)
+        })
+    return tools
+
+
+def linear_search(tools_db: Dict[str, Dict], query: str) -> List[Dict]:
+    """原 UnifiedToolRegistry.search_tools 的线性扫描实现(作为基线)"""
+    matches = []
+    query_lower = query.lower()
+    for tool in tools_db.values():
+        score = 0.0
+        if query_lower in tool["name"].lower():
+            score += 0.4
+        if query_lower in tool["description"].lower():
+            score += 0.3
+        if query_lower in tool["category"].lower():
+            score += 0.2
+        for capability in tool["capabilities"]:
+            if query_lower in capability.lower():
+                score += 0.1
+                break
+        if score > 0:
+            tool_copy = tool.copy()
+            tool_copy["relevance_score"] = score
+            matches.append(tool_copy)
+    return sorted(matches, key=lambda x: x["relevance_score"], reverse=True)
+
+
+def measure(fn, queries: List[str], rounds: int) -> Dict[str, float]:
+    """测量查询延迟(毫秒)"""
+    latencies = []
+    for i in range(rounds):
+        query = queries[i % len(queries)]
+        start = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    }
+
+
+def run_benchmark(size: int, rounds: int):
+    tools = generate_tools(size)
+    tools_db = {tool["id"]: tool for tool in tools}
+
+    index = ToolSearchIndex()
+    start = time.perf_counter()
+    for tool in tools:
+        index.add(tool["id"], tool)
+    build_time = time.perf_counter() - start
+
+    linear = measure(lambda q: linear_search(tools_db, q), QUERIES, rounds)
+    indexed = measure(lambda q: index.search(q), QUERIES, rounds)
+    indexed_top10 = measure(lambda q: index.search(q, limit=10), QUERIES, rounds)
+
+    print(f"\n=== {size:,} tools (index build {build_time:.2f}s, "
+          f"{len(index.postings):,} terms, {len(index.gram_index):,} grams) ===")
+    print(f"{'mode':<18}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, result in (("linear scan", linear), ("index (all)", indexed), ("index (top 10)", indexed_top10)):
+        print(f"{name:<18}{result['mean_ms']:>10.3f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tool search benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200, help="每种模式执行的查询次数")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run_benchmark(size, args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ class SimplifiedAgentConfig:
         'max_concurrent_requests': 50,
         'request_timeout': 300,  # 秒
         'history_limit': 1000,
+        'history_spill_path': None,  # 溢出歷史的JSON Lines日誌路徑，None表示不落盤
         'performance_tracking': True,
         'ai_reasoning_enabled': True
     }
@@ -28,6 +29,12 @@ class SimplifiedAgentConfig:
         'auto_discovery': True,
         'discovery_interval': 300,  # 秒
         'health_check_interval': 60,  # 秒
+        'enable_background_refresh': False,  # 默認關閉，需要時顯式開啟
+        'probe_concurrency': 10,
+        'probe_timeout': 5,  # 秒
+        'discovery_deadline': 10,  # 秒，單輪發現/健康檢查的整體期限
+        'probe_backoff_base': 5,  # 秒，失敗端點的退避起點
+        'probe_backoff_max': 300,  # 秒
         'discovery_paths': [
             '/opt/aiengine/mcp',
             '/opt/aiengine/tools',
@@ -47,10 +54,39 @@ class SimplifiedAgentConfig:
         'max_concurrent_tasks': 20,
         'default_timeout': 30,  # 秒
         'retry_attempts': 2,
-        'execution_modes': ['sequential', 'parallel', 'pipeline'],
+        'history_limit': 1000,
+        'history_spill_path': None,
+        'retry_policy': {
+            'retry_delay': 1,  # 秒
+            'exponential_backoff': True,
+            'max_delay': 30,  # 秒
+            'jitter': True
+        },
+        'circuit_breaker': {
+            'enabled': True,
+            'failure_threshold': 5,
+            'recovery_timeout': 60,  # 秒
+            'half_open_max_calls': 1
+        },
+        'execution_modes': ['sequential', 'parallel', 'pipeline', 'dag'],
         'default_mode': 'parallel'
     }
     
+    # HTTP連接池配置
+    CONNECTION_POOL = {
+        'limit': 100,
+        'limit_per_host': 10,
+        'keepalive_timeout': 30,  # 秒
+        'dns_cache_ttl': 300,  # 秒
+        'default_timeout': 30,  # 秒
+        'connect_timeout': 5,  # 秒
+        'endpoint_timeouts': {
+            'http://localhost:8321': 45,
+            'http://localhost:8090': 60,
+            'http://localhost:8888': 45
+        }
+    }
+    
     # MCP服務配置
     MCP_SERVICES = [
         {
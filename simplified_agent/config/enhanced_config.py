@@ -25,13 +25,24 @@ class EnhancedAgentConfig:
         env_config = EnhancedAgentConfig._get_environment_config(environment)
         
         # 合併配置
-        config = {**base_config, **env_config}
+        config = EnhancedAgentConfig._merge_config(base_config, env_config)
         
         # 環境變量覆蓋
         config = EnhancedAgentConfig._apply_environment_overrides(config)
         
         return config
     
+    @staticmethod
+    def _merge_config(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+        """逐層合併配置，環境配置只覆蓋其聲明的鍵，其餘沿用基礎配置"""
+        merged = dict(base)
+        for key, value in override.items():
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = EnhancedAgentConfig._merge_config(merged[key], value)
+            else:
+                merged[key] = value
+        return merged
+    
     @staticmethod
     def _get_base_config() -> Dict[str, Any]:
         """基礎配置"""
@@ -44,7 +55,10 @@ class EnhancedAgentConfig:
                 'max_concurrent_requests': 10,
                 'default_timeout': 30,
                 'enable_caching': True,
-                'cache_ttl': 300
+                'cache_ttl': 300,
+                'cache_max_entries': 1024,
+                'history_limit': 1000,
+                'history_spill_path': None
             },
             
             # 增強功能配置
@@ -64,7 +78,13 @@ class EnhancedAgentConfig:
                 'discovery_interval': 60,
                 'health_check_interval': 30,
                 'max_tools': 100,
-                'enable_tool_caching': True
+                'enable_tool_caching': True,
+                'enable_background_refresh': False,  # 默認關閉，需要時顯式開啟
+                'probe_concurrency': 10,
+                'probe_timeout': 5,
+                'discovery_deadline': 10,
+                'probe_backoff_base': 5,
+                'probe_backoff_max': 300
             },
             
             # Smart Tool Engine配置
@@ -127,13 +147,34 @@ class EnhancedAgentConfig:
                 'max_parallel_tasks': 5,
                 'task_timeout': 60,
                 'enable_result_aggregation': True,
+                'history_limit': 1000,
+                'history_spill_path': None,
                 'retry_policy': {
                     'max_retries': 3,
                     'retry_delay': 1,
-                    'exponential_backoff': True
+                    'exponential_backoff': True,
+                    'max_delay': 30,
+                    'jitter': True
+                },
+                'circuit_breaker': {
+                    'enabled': True,
+                    'failure_threshold': 5,
+                    'recovery_timeout': 60,
+                    'half_open_max_calls': 1
                 }
             },
             
+            # HTTP連接池配置（ActionExecutor與ToolRegistry共享）
+            'connection_pool': {
+                'limit': 100,
+                'limit_per_host': 10,
+                'keepalive_timeout': 30,
+                'dns_cache_ttl': 300,
+                'default_timeout': 30,
+                'connect_timeout': 5,
+                'endpoint_timeouts': {}
+            },
+            
             # 日誌配置
             'logging': {
                 'level': 'INFO',
@@ -182,6 +223,19 @@ class EnhancedAgentConfig:
                     'enable_cloud_tools': False,
                     'enable_cost_optimization': False
                 },
+                'tool_registry': {
+                    'enable_auto_discovery': True,
+                    'discovery_interval': 60,
+                    'health_check_interval': 30,
+                    'max_tools': 100,
+                    'enable_tool_caching': True,
+                    'enable_background_refresh': False,  # 測試環境不啟動後台刷新
+                    'probe_concurrency': 10,
+                    'probe_timeout': 1,
+                    'discovery_deadline': 3,
+                    'probe_backoff_base': 5,
+                    'probe_backoff_max': 300
+                },
                 'adapter_mcp': {'enable_adapters': False},
                 'monitoring': {'enable_metrics': False}
             },
@@ -12,10 +12,12 @@ import json
 import logging
 import time
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Callable
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Any, Optional, Callable, AsyncIterator
+from dataclasses import dataclass, field, is_dataclass, asdict
 from enum import Enum
 
+from .history import RingBuffer, LatencyHistogram
+
 # 設置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -73,6 +75,72 @@ class AgentResponse:
         if self.timestamp is None:
             self.timestamp = datetime.now().isoformat()
 
+class AgentEventType(Enum):
+    """流式處理事件類型"""
+    ANALYSIS = "analysis"              # 需求分析完成
+    TOOL_SELECTION = "tool_selection"  # 工具選擇完成
+    TOOL_RESULT = "tool_result"        # 單個工具的執行結果(ExecutionResult)
+    COMPLETED = "completed"            # 最終響應(AgentResponse)
+    FAILED = "failed"                  # 處理失敗(AgentResponse)
+
+def _to_serializable(value: Any) -> Any:
+    """將數據類和枚舉轉換為可JSON序列化的結構"""
+    if is_dataclass(value) and not isinstance(value, type):
+        value = asdict(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {key: _to_serializable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_serializable(item) for item in value]
+    return value
+
+@dataclass
+class AgentEvent:
+    """流式處理事件"""
+    request_id: str
+    type: AgentEventType
+    data: Any = None
+    timestamp: float = field(default_factory=time.time)
+    
+    @property
+    def is_final(self) -> bool:
+        return self.type in (AgentEventType.COMPLETED, AgentEventType.FAILED)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為可JSON序列化的字典（供SSE/WebSocket前端使用）"""
+        return {
+            'request_id': self.request_id,
+            'type': self.type.value,
+            'data': _to_serializable(self.data),
+            'timestamp': self.timestamp
+        }
+
+class TaskRecord:
+    """任務歷史記錄（緊湊表示，不保留結果和元數據）"""
+    
+    __slots__ = ('request_id', 'status', 'error', 'execution_time', 'tools_used', 'confidence', 'timestamp')
+    
+    def __init__(self, response: AgentResponse):
+        self.request_id = response.request_id
+        self.status = response.status
+        self.error = response.error
+        self.execution_time = response.execution_time
+        self.tools_used = tuple(response.tools_used)
+        self.confidence = response.confidence
+        self.timestamp = response.timestamp
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'request_id': self.request_id,
+            'status': self.status.value,
+            'error': self.error,
+            'execution_time': self.execution_time,
+            'tools_used': list(self.tools_used),
+            'confidence': self.confidence,
+            'timestamp': self.timestamp
+        }
+
 class AgentCore:
     """
     統一Agent核心
@@ -89,7 +157,14 @@ class AgentCore:
         self.tool_registry = None  # 將在初始化時注入
         self.action_executor = None  # 將在初始化時注入
         self.active_tasks: Dict[str, AgentRequest] = {}
-        self.task_history: List[AgentResponse] = []
+        
+        # 有界任務歷史（兼容扁平配置和帶agent_core分段的配置）
+        core_config = self.config.get('agent_core', self.config)
+        self.task_history = RingBuffer(
+            core_config.get('history_limit', 1000),
+            spill_path=core_config.get('history_spill_path')
+        )
+        self.latency_histogram = LatencyHistogram()
         self.performance_metrics = {
             'total_requests': 0,
             'successful_requests': 0,
@@ -112,21 +187,46 @@ class AgentCore:
         
         這是簡化架構的核心方法，替代了原來的三層調用
         """
+        response = None
+        async for event in self.process_request_stream(request):
+            if event.is_final:
+                response = event.data
+        return response
+    
+    async def process_request_stream(self, request: AgentRequest) -> AsyncIterator[AgentEvent]:
+        """
+        流式處理用戶請求
+        
+        依次產出需求分析、工具選擇、每個工具完成時的執行結果，
+        最後產出COMPLETED或FAILED事件(data為AgentResponse)
+        """
         start_time = time.time()
         self.active_tasks[request.id] = request
         self.performance_metrics['total_requests'] += 1
+        response = None
         
         try:
             logger.info(f"Processing request {request.id}: {request.type}")
             
             # 1. AI驅動的需求分析 (替代Product Layer)
             analysis_result = await self._analyze_requirement(request)
+            yield AgentEvent(request.id, AgentEventType.ANALYSIS, analysis_result)
             
             # 2. 智能工具選擇 (替代Workflow Layer)
             selected_tools = await self._select_tools(request, analysis_result)
+            yield AgentEvent(request.id, AgentEventType.TOOL_SELECTION, {'selected_tools': selected_tools})
             
-            # 3. 執行和結果處理 (替代Adapter Layer)
-            execution_result = await self._execute_with_tools(request, selected_tools)
+            # 3. 執行和結果處理 (替代Adapter Layer)，工具結果完成一個推送一個
+            results = asyncio.Queue()
+            execution = asyncio.ensure_future(
+                self._execute_with_tools(request, selected_tools, result_listener=results.put_nowait)
+            )
+            try:
+                async for event in self._stream_tool_results(request, execution, results):
+                    yield event
+                execution_result = execution.result()
+            finally:
+                execution.cancel()
             
             # 4. 結果評估和質量控制
             final_result = await self._evaluate_result(request, execution_result)
@@ -170,14 +270,37 @@ class AgentCore:
             if request.id in self.active_tasks:
                 del self.active_tasks[request.id]
             
-            # 記錄到歷史
-            self.task_history.append(response)
+            if response is None:
+                # 調用方提前關閉了事件流
+                response = AgentResponse(
+                    request_id=request.id,
+                    status=TaskStatus.CANCELLED,
+                    error="Request stream closed before completion",
+                    execution_time=time.time() - start_time
+                )
             
-            # 保持歷史記錄在合理範圍內
-            if len(self.task_history) > 1000:
-                self.task_history = self.task_history[-500:]
+            # 記錄到歷史（環形緩衝區，容量滿時覆蓋最舊記錄）
+            self.task_history.append(TaskRecord(response))
+            self.latency_histogram.observe(response.execution_time)
         
-        return response
+        final_type = AgentEventType.COMPLETED if response.status == TaskStatus.COMPLETED else AgentEventType.FAILED
+        yield AgentEvent(request.id, final_type, response)
+    
+    async def _stream_tool_results(self, request: AgentRequest, execution: asyncio.Future,
+                                   results: asyncio.Queue) -> AsyncIterator[AgentEvent]:
+        """在執行完成前持續產出隊列中的工具結果"""
+        while not execution.done() or not results.empty():
+            if results.empty():
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait({getter, execution}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                result = getter.result()
+            else:
+                result = results.get_nowait()
+            
+            yield AgentEvent(request.id, AgentEventType.TOOL_RESULT, result)
     
     async def _analyze_requirement(self, request: AgentRequest) -> Dict[str, Any]:
         """
@@ -269,7 +392,8 @@ class AgentCore:
         logger.info(f"Selected tools for {request.id}: {validated_tools}")
         return validated_tools
     
-    async def _execute_with_tools(self, request: AgentRequest, tools: List[str]) -> Dict[str, Any]:
+    async def _execute_with_tools(self, request: AgentRequest, tools: List[str],
+                                  result_listener: Optional[Callable] = None) -> Dict[str, Any]:
         """
         使用選定工具執行任務
         
@@ -289,7 +413,8 @@ class AgentCore:
         # 使用Action Executor執行
         execution_result = await self.action_executor.execute(
             request=request,
-            tools=tools
+            tools=tools,
+            result_listener=result_listener
         )
         
         logger.info(f"Execution completed for {request.id}")
@@ -411,16 +536,17 @@ class AgentCore:
         """獲取Agent狀態"""
         return {
             'active_tasks': len(self.active_tasks),
-            'total_processed': len(self.task_history),
+            'total_processed': self.task_history.total_appended,
             'performance_metrics': self.performance_metrics,
+            'latency': self.latency_histogram.to_dict(),
+            'history': self.task_history.get_stats(),
             'uptime': time.time(),  # 可以改為實際運行時間
             'health': 'healthy' if len(self.active_tasks) < 10 else 'busy'
         }
     
     def get_task_history(self, limit: int = 50) -> List[Dict[str, Any]]:
         """獲取任務歷史"""
-        recent_history = self.task_history[-limit:] if limit else self.task_history
-        return [asdict(response) for response in recent_history]
+        return [record.to_dict() for record in self.task_history.latest(limit)]
 
 # 工廠函數
 def create_agent_core(config: Dict[str, Any] = None) -> AgentCore:
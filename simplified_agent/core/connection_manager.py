@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP連接管理器 - 進程級共享連接池
+HTTP Connection Manager - Process-wide Shared Connection Pool
+
+為ActionExecutor和ToolRegistry提供共享的aiohttp ClientSession，
+按主機保持keep-alive連接，支持連接數限制、端點級超時和連接復用統計
+"""
+
+import asyncio
+import atexit
+import logging
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_CONFIG = {
+    'limit': 100,                # 全局最大連接數
+    'limit_per_host': 10,        # 每個主機最大連接數
+    'keepalive_timeout': 30,     # keep-alive連接保持時間(秒)
+    'dns_cache_ttl': 300,        # DNS緩存時間(秒)
+    'default_timeout': 30,       # 默認請求超時(秒)
+    'connect_timeout': 5,        # 建立連接超時(秒)
+    'endpoint_timeouts': {}      # URL前綴 -> 超時(秒)
+}
+
+class ConnectionManager:
+    """
+    HTTP連接管理器
+
+    職責:
+    1. 維護共享的ClientSession和TCPConnector
+    2. 根據端點解析請求超時
+    3. 統計連接創建與復用
+    4. 提供關閉鉤子
+
+    使用共享Session的組件通過acquire/release登記，最後一個組件釋放時才關閉Session
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = {**DEFAULT_POOL_CONFIG, **(config or {})}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        # 正在使用共享Session的組件（弱引用，id在對象回收後可能被復用）
+        self._users = weakref.WeakSet()
+
+        self.metrics = {
+            'requests': 0,
+            'errors': 0,
+            'connections_created': 0,
+            'connections_reused': 0,
+            'dns_cache_hits': 0,
+            'dns_cache_misses': 0,
+            'sessions_created': 0,
+            'per_host': {}
+        }
+
+    def configure(self, config: Dict[str, Any]):
+        """更新連接池配置（對下一次創建的Session生效）"""
+        self.config.update(config or {})
+
+    def acquire(self, owner: Any):
+        """登記使用共享Session的組件（重複登記無影響）"""
+        self._users.add(owner)
+
+    async def release(self, owner: Any):
+        """組件不再使用共享Session，最後一個組件釋放時關閉Session"""
+        if owner not in self._users:
+            return
+        self._users.discard(owner)
+        if not self._users:
+            await self.close()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """獲取當前事件循環上的共享Session"""
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is loop:
+            return self._session
+
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._session is None or self._session.closed or self._loop is not loop:
+                # 其他事件循環上的舊Session不能在當前循環中使用，先釋放其連接器
+                if self._session is not None and not self._session.closed:
+                    self._discard(self._session, self._loop)
+                self._session = self._create_session()
+                self._loop = loop
+
+        return self._session
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        """創建帶連接池和追蹤鉤子的Session"""
+        connector = aiohttp.TCPConnector(
+            limit=self.config['limit'],
+            limit_per_host=self.config['limit_per_host'],
+            keepalive_timeout=self.config['keepalive_timeout'],
+            ttl_dns_cache=self.config['dns_cache_ttl']
+        )
+
+        self.metrics['sessions_created'] += 1
+        logger.info(
+            f"Created shared HTTP session (limit={self.config['limit']}, "
+            f"limit_per_host={self.config['limit_per_host']})"
+        )
+
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=self.config['default_timeout'],
+                connect=self.config['connect_timeout']
+            ),
+            trace_configs=[self._build_trace_config()]
+        )
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """構建連接追蹤配置，用於統計連接復用"""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.metrics['requests'] += 1
+            context.host = params.url.host
+            host_stats = self._host_stats(params.url.host)
+            host_stats['requests'] += 1
+
+        async def on_connection_create_end(session, context, params):
+            self.metrics['connections_created'] += 1
+            self._host_stats(getattr(context, 'host', None))['connections_created'] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.metrics['connections_reused'] += 1
+            self._host_stats(getattr(context, 'host', None))['connections_reused'] += 1
+
+        async def on_dns_cache_hit(session, context, params):
+            self.metrics['dns_cache_hits'] += 1
+
+        async def on_dns_cache_miss(session, context, params):
+            self.metrics['dns_cache_misses'] += 1
+
+        async def on_request_exception(session, context, params):
+            self.metrics['errors'] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        trace_config.on_request_exception.append(on_request_exception)
+
+        return trace_config
+
+    def _host_stats(self, host: Optional[str]) -> Dict[str, int]:
+        host = host or 'unknown'
+        if host not in self.metrics['per_host']:
+            self.metrics['per_host'][host] = {
+                'requests': 0,
+                'connections_created': 0,
+                'connections_reused': 0
+            }
+        return self.metrics['per_host'][host]
+
+    def resolve_timeout(self, url: str, timeout: float = None) -> aiohttp.ClientTimeout:
+        """
+        解析請求超時
+
+        優先順序: 調用方指定 > 端點配置(最長URL前綴匹配) > 主機配置 > 默認值
+        """
+        if timeout is None:
+            endpoint_timeouts = self.config.get('endpoint_timeouts', {})
+            matched_prefix = ''
+            for prefix, prefix_timeout in endpoint_timeouts.items():
+                if url.startswith(prefix) and len(prefix) > len(matched_prefix):
+                    matched_prefix = prefix
+                    timeout = prefix_timeout
+
+            if timeout is None:
+                host = urlsplit(url).netloc
+                timeout = endpoint_timeouts.get(host, self.config['default_timeout'])
+
+        return aiohttp.ClientTimeout(
+            total=timeout,
+            connect=min(timeout, self.config['connect_timeout'])
+        )
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, timeout: float = None, **kwargs):
+        """
+        使用共享連接池發送請求
+
+        Args:
+            method: HTTP方法
+            url: 請求URL
+            timeout: 總超時(秒)，None時按端點配置解析
+            **kwargs: 傳遞給aiohttp的其他參數
+        """
+        session = await self.get_session()
+        async with session.request(method, url, timeout=self.resolve_timeout(url, timeout), **kwargs) as response:
+            yield response
+
+    def get(self, url: str, timeout: float = None, **kwargs):
+        """發送GET請求"""
+        return self.request('GET', url, timeout=timeout, **kwargs)
+
+    def post(self, url: str, timeout: float = None, **kwargs):
+        """發送POST請求"""
+        return self.request('POST', url, timeout=timeout, **kwargs)
+
+    async def close(self):
+        """關閉共享Session和連接池"""
+        session, self._session = self._session, None
+        self._loop = None
+        if session is not None and not session.closed:
+            await session.close()
+            logger.info("Shared HTTP session closed")
+
+    def close_sync(self):
+        """同步關閉（用於進程退出鉤子）"""
+        session, loop = self._session, self._loop
+        if session is None or session.closed:
+            return
+
+        if loop is not None and not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(self.close())
+        else:
+            self._session = None
+            self._loop = None
+            self._discard(session, loop)
+
+    @staticmethod
+    def _discard(session: aiohttp.ClientSession, loop: Optional[asyncio.AbstractEventLoop]):
+        """在所屬事件循環之外關閉Session"""
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # 事件循環已關閉或不再運行，只能直接釋放連接器
+        if session.connector is not None:
+            session.connector._close()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """獲取連接池統計信息"""
+        connections = self.metrics['connections_created'] + self.metrics['connections_reused']
+        return {
+            **self.metrics,
+            'per_host': {host: dict(stats) for host, stats in self.metrics['per_host'].items()},
+            'reuse_rate': self.metrics['connections_reused'] / connections if connections else 0.0,
+            'session_open': self._session is not None and not self._session.closed,
+            'users': len(self._users),
+            'limits': {
+                'limit': self.config['limit'],
+                'limit_per_host': self.config['limit_per_host'],
+                'keepalive_timeout': self.config['keepalive_timeout']
+            }
+        }
+
+# 進程級單例
+_connection_manager: Optional[ConnectionManager] = None
+
+def get_connection_manager(config: Dict[str, Any] = None) -> ConnectionManager:
+    """
+    獲取進程級共享的連接管理器
+
+    Args:
+        config: 連接池配置，首次創建時使用，之後傳入會更新配置
+    """
+    global _connection_manager
+    if _connection_manager is None:
+        _connection_manager = ConnectionManager(config)
+        atexit.register(_connection_manager.close_sync)
+    elif config:
+        _connection_manager.configure(config)
+    return _connection_manager
+
+async def close_connection_manager():
+    """關閉進程級連接管理器（不論是否還有組件登記）"""
+    if _connection_manager is not None:
+        _connection_manager._users.clear()
+        await _connection_manager.close()
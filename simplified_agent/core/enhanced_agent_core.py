@@ -7,17 +7,20 @@ Enhanced Agent Core with Smart Tool Engine and Adapter MCP Integration
 import asyncio
 import logging
 import time
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, AsyncIterator, Set, TYPE_CHECKING
 from datetime import datetime
 
 # 導入原有的Agent Core
-from .agent_core import AgentCore, AgentRequest, AgentResponse, Priority, TaskStatus
-
-# 導入增強版Tool Registry
-from ..tools.enhanced_tool_registry import EnhancedToolRegistry
+from .agent_core import (
+    AgentCore, AgentRequest, AgentResponse, AgentEvent, AgentEventType, Priority, TaskStatus
+)
 
 # 導入Action Executor
-from ..actions.action_executor import ActionExecutor
+from ..actions.action_executor import ActionExecutor, ExecutionMode
+
+if TYPE_CHECKING:
+    # 增強版Tool Registry只用於類型標註，運行時不依賴其外部MCP包
+    from ..tools.enhanced_tool_registry import EnhancedToolRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -52,7 +55,7 @@ class EnhancedAgentCore(AgentCore):
         
         logger.info("Enhanced Agent Core initialized")
     
-    def set_enhanced_dependencies(self, tool_registry: EnhancedToolRegistry, action_executor: ActionExecutor):
+    def set_enhanced_dependencies(self, tool_registry: 'EnhancedToolRegistry', action_executor: ActionExecutor):
         """設置增強版依賴"""
         self.tool_registry = tool_registry
         self.action_executor = action_executor
@@ -67,17 +70,43 @@ class EnhancedAgentCore(AgentCore):
         增強版請求處理
         使用Smart Tool Engine進行智能決策
         """
+        response = None
+        async for event in self.process_request_stream(request):
+            if event.is_final:
+                response = event.data
+        return response
+    
+    async def process_request_stream(self, request: AgentRequest) -> AsyncIterator[AgentEvent]:
+        """
+        增強版流式請求處理
+        事件順序與AgentCore.process_request_stream一致；回退時已產出過的分析和工具選擇事件不再重複產出
+        """
         start_time = time.time()
+        # 已產出的分析和工具選擇事件類型，回退時據此去重
+        emitted: Set[AgentEventType] = set()
         
         try:
             # 階段1: 智能需求分析
             analysis_result = await self._enhanced_requirement_analysis(request)
+            emitted.add(AgentEventType.ANALYSIS)
+            yield AgentEvent(request.id, AgentEventType.ANALYSIS, analysis_result)
             
             # 階段2: 智能工具選擇
             tool_selection_result = await self._intelligent_tool_selection(request, analysis_result)
+            emitted.add(AgentEventType.TOOL_SELECTION)
+            yield AgentEvent(request.id, AgentEventType.TOOL_SELECTION, tool_selection_result)
             
-            # 階段3: 智能執行策略
-            execution_result = await self._intelligent_execution(request, tool_selection_result)
+            # 階段3: 智能執行策略，標準執行路徑下工具結果完成一個推送一個
+            results = asyncio.Queue()
+            execution = asyncio.ensure_future(
+                self._intelligent_execution(request, tool_selection_result, result_listener=results.put_nowait)
+            )
+            try:
+                async for event in self._stream_tool_results(request, execution, results):
+                    yield event
+                execution_result = execution.result()
+            finally:
+                execution.cancel()
             
             # 階段4: 結果評估和優化
             final_result = await self._evaluate_and_optimize_result(execution_result)
@@ -87,7 +116,7 @@ class EnhancedAgentCore(AgentCore):
             # 更新統計
             self.enhanced_stats['smart_decisions'] += 1
             
-            return AgentResponse(
+            response = AgentResponse(
                 request_id=request.id,
                 status=TaskStatus.COMPLETED,
                 result=final_result,
@@ -107,14 +136,19 @@ class EnhancedAgentCore(AgentCore):
             
             # 智能回退機制
             if self.enhanced_config['intelligent_fallback']:
-                return await self._intelligent_fallback(request, str(e))
-            else:
-                return AgentResponse(
-                    request_id=request.id,
-                    status=TaskStatus.FAILED,
-                    error=str(e),
-                    execution_time=time.time() - start_time
-                )
+                async for event in self._intelligent_fallback(request, str(e), emitted):
+                    yield event
+                return
+            
+            response = AgentResponse(
+                request_id=request.id,
+                status=TaskStatus.FAILED,
+                error=str(e),
+                execution_time=time.time() - start_time
+            )
+        
+        final_type = AgentEventType.COMPLETED if response.status == TaskStatus.COMPLETED else AgentEventType.FAILED
+        yield AgentEvent(request.id, final_type, response)
     
     async def _enhanced_requirement_analysis(self, request: AgentRequest) -> Dict[str, Any]:
         """
@@ -128,7 +162,7 @@ class EnhancedAgentCore(AgentCore):
             # 增強分析：使用Smart Tool Engine的智能能力
             enhanced_analysis = {
                 'requirement_type': self._classify_requirement_type(request.content),
-                'complexity_level': self._assess_complexity(request.content),
+                'complexity_level': self._assess_content_complexity(request.content),
                 'resource_requirements': self._estimate_resources(request.content),
                 'quality_expectations': self._determine_quality_expectations(request),
                 'cost_constraints': self._extract_cost_constraints(request),
@@ -164,8 +198,8 @@ class EnhancedAgentCore(AgentCore):
         else:
             return 'general'
     
-    def _assess_complexity(self, content: str) -> str:
-        """評估需求複雜度"""
+    def _assess_content_complexity(self, content: str) -> str:
+        """評估需求文本的複雜度（不覆蓋基礎分析使用的_assess_complexity(request)）"""
         # 基於內容長度和關鍵詞複雜度評估
         word_count = len(content.split())
         complex_keywords = ['整合', '架構', '系統', '複雜', '多步驟', '協調']
@@ -181,7 +215,7 @@ class EnhancedAgentCore(AgentCore):
     
     def _estimate_resources(self, content: str) -> Dict[str, Any]:
         """估算資源需求"""
-        complexity = self._assess_complexity(content)
+        complexity = self._assess_content_complexity(content)
         
         resource_map = {
             'low': {'cpu': 'low', 'memory': 'low', 'time': 'short', 'tools': 1},
@@ -198,7 +232,7 @@ class EnhancedAgentCore(AgentCore):
             Priority.LOW: 0.7,
             Priority.MEDIUM: 0.8,
             Priority.HIGH: 0.9,
-            Priority.URGENT: 0.95
+            Priority.CRITICAL: 0.95
         }
         
         base_quality = priority_quality_map.get(request.priority, 0.8)
@@ -308,7 +342,8 @@ class EnhancedAgentCore(AgentCore):
         requirement_type = analysis['enhanced_insights']['requirement_type']
         return await self.tool_registry.find_tools_by_capability(requirement_type)
     
-    async def _intelligent_execution(self, request: AgentRequest, tool_selection: Dict[str, Any]) -> Dict[str, Any]:
+    async def _intelligent_execution(self, request: AgentRequest, tool_selection: Dict[str, Any],
+                                     result_listener: Optional[Callable] = None) -> Dict[str, Any]:
         """
         智能執行
         根據工具特性選擇最佳執行策略
@@ -340,7 +375,8 @@ class EnhancedAgentCore(AgentCore):
             execution_result = await self.action_executor.execute(
                 request=request,
                 tools=selected_tools,
-                mode=self._determine_execution_mode(tool_selection)
+                mode=self._determine_execution_mode(tool_selection),
+                result_listener=result_listener
             )
             
             return {
@@ -359,16 +395,14 @@ class EnhancedAgentCore(AgentCore):
                 'execution_method': 'failed'
             }
     
-    def _determine_execution_mode(self, tool_selection: Dict[str, Any]) -> str:
+    def _determine_execution_mode(self, tool_selection: Dict[str, Any]) -> ExecutionMode:
         """確定執行模式"""
         tools_count = len(tool_selection['selected_tools'])
         
-        if tools_count == 1:
-            return 'single'
-        elif tools_count <= 3:
-            return 'parallel'
+        if 1 < tools_count <= 3:
+            return ExecutionMode.PARALLEL
         else:
-            return 'sequential'
+            return ExecutionMode.SEQUENTIAL
     
     async def _evaluate_and_optimize_result(self, execution_result: Dict[str, Any]) -> Dict[str, Any]:
         """評估和優化結果"""
@@ -439,20 +473,31 @@ class EnhancedAgentCore(AgentCore):
         
         return optimizations
     
-    async def _intelligent_fallback(self, request: AgentRequest, error: str) -> AgentResponse:
-        """智能回退機制"""
+    async def _intelligent_fallback(self, request: AgentRequest, error: str,
+                                    emitted: Optional[Set[AgentEventType]] = None) -> AsyncIterator[AgentEvent]:
+        """
+        智能回退機制（以基礎Agent Core的事件流繼續處理）
+        
+        Args:
+            emitted: 主流程已產出的分析和工具選擇事件類型，對應的回退事件不再產出；
+                回退重新執行的工具結果和最終事件總是產出，最終響應正是基於這些結果
+        """
         self.enhanced_stats['fallback_activations'] += 1
+        emitted = emitted if emitted is not None else set()
         
         try:
             # 使用基礎Agent Core處理
-            return await super().process_request(request)
+            async for event in super().process_request_stream(request):
+                if event.type in emitted:
+                    continue
+                yield event
         except Exception as fallback_error:
-            return AgentResponse(
+            yield AgentEvent(request.id, AgentEventType.FAILED, AgentResponse(
                 request_id=request.id,
                 status=TaskStatus.FAILED,
                 error=f"Primary error: {error}, Fallback error: {str(fallback_error)}",
                 execution_time=0.0
-            )
+            ))
     
     def get_enhanced_status(self) -> Dict[str, Any]:
         """獲取增強狀態"""
@@ -470,7 +515,7 @@ class EnhancedAgentCore(AgentCore):
         }
 
 # 工廠函數
-async def create_enhanced_agent_core(config: Dict[str, Any], tool_registry: EnhancedToolRegistry, action_executor: ActionExecutor) -> EnhancedAgentCore:
+async def create_enhanced_agent_core(config: Dict[str, Any], tool_registry: 'EnhancedToolRegistry', action_executor: ActionExecutor) -> EnhancedAgentCore:
     """
     創建增強版Agent Core實例
     
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+歷史記錄緩衝區 - 固定容量環形緩衝與延遲直方圖
+History Buffer - Fixed-capacity Ring Buffer and Latency Histogram
+
+為AgentCore和ActionExecutor提供有界的歷史記錄存儲，
+溢出的記錄可選地追加寫入磁盤日誌（JSON Lines）
+"""
+
+import bisect
+import json
+import logging
+from array import array
+from typing import Dict, List, Any, Optional, Iterator, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 延遲直方圖桶上界(秒)，最後一個桶收集所有更慢的樣本
+DEFAULT_LATENCY_BUCKETS = (
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+    1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+class RingBuffer:
+    """
+    固定容量環形緩衝區
+
+    寫入為O(1)且不會複製底層列表；容量滿時覆蓋最舊的記錄，
+    被覆蓋的記錄在配置了spill_path時追加寫入磁盤
+    """
+
+    def __init__(self, capacity: int = 1000, spill_path: Optional[str] = None):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._items: List[Any] = [None] * capacity
+        self._next = 0
+        self._size = 0
+        self.total_appended = 0
+        self.spilled = 0
+        self._spill_file = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Any]:
+        """從最舊到最新迭代"""
+        start = (self._next - self._size) % self.capacity
+        for offset in range(self._size):
+            yield self._items[(start + offset) % self.capacity]
+
+    def append(self, item: Any):
+        """追加記錄，容量滿時覆蓋最舊的記錄"""
+        if self._size == self.capacity:
+            self._spill(self._items[self._next])
+        else:
+            self._size += 1
+        self._items[self._next] = item
+        self._next = (self._next + 1) % self.capacity
+        self.total_appended += 1
+
+    def latest(self, limit: Optional[int] = None) -> List[Any]:
+        """返回最近的limit條記錄（從舊到新），耗時O(limit)"""
+        count = self._size if not limit else min(limit, self._size)
+        start = self._next - count
+        return [self._items[(start + offset) % self.capacity] for offset in range(count)]
+
+    def clear(self):
+        """清空緩衝區（不影響已溢出到磁盤的記錄）"""
+        self._items = [None] * self.capacity
+        self._next = 0
+        self._size = 0
+
+    def _spill(self, item: Any):
+        if not self.spill_path:
+            return
+        try:
+            if self._spill_file is None:
+                self._spill_file = open(self.spill_path, 'a', encoding='utf-8')
+            record = item.to_dict() if hasattr(item, 'to_dict') else item
+            self._spill_file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            self.spilled += 1
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to spill history record to {self.spill_path}: {e}")
+
+    def close(self):
+        """關閉溢出日誌文件"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """獲取緩衝區統計信息"""
+        return {
+            'size': self._size,
+            'capacity': self.capacity,
+            'total_appended': self.total_appended,
+            'spilled': self.spilled,
+            'spill_path': self.spill_path
+        }
+
+class LatencyHistogram:
+    """
+    固定桶延遲直方圖
+
+    內存佔用與樣本數無關，分位數按所在桶的上界近似
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = array('Q', [0] * (len(self.bounds) + 1))
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """記錄一個延遲樣本(秒)"""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        """近似分位數(p取0-100)"""
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * p / 100.0)))
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(upper, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """導出直方圖摘要"""
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': {
+                (f"le_{bound}" if index < len(self.bounds) else 'inf'): bucket_count
+                for index, (bound, bucket_count) in enumerate(
+                    zip(self.bounds + (float('inf'),), self.counts))
+                if bucket_count
+            }
+        }
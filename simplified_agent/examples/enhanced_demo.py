@@ -252,7 +252,7 @@ class EnhancedAgentDemo:
         # 測試超時請求
         timeout_request = AgentRequest(
             content="執行一個需要很長時間的複雜分析",
-            priority=Priority.URGENT,
+            priority=Priority.CRITICAL,
             timeout=1  # 1秒超時
         )
         
@@ -12,6 +12,7 @@ from typing import Dict, Any, Optional
 from core.agent_core import AgentCore, AgentRequest, AgentResponse, Priority
 from tools.tool_registry import ToolRegistry
 from actions.action_executor import ActionExecutor, ExecutionMode
+from core.connection_manager import get_connection_manager, close_connection_manager
 from config.config import get_config, apply_env_overrides, validate_config
 
 logger = logging.getLogger(__name__)
@@ -98,6 +99,12 @@ class SimplifiedAgent:
             'total_tools': status['tool_registry_stats']['total_tools'],
             'success_rate': status['executor_stats']['success_rate']
         }
+    
+    async def close(self):
+        """關閉組件和共享連接池"""
+        await self.tool_registry.close()
+        await self.action_executor.close()
+        await close_connection_manager()
 
 async def create_simplified_agent(env: str = 'development', config_overrides: Dict[str, Any] = None) -> SimplifiedAgent:
     """
@@ -132,6 +139,9 @@ async def create_simplified_agent(env: str = 'development', config_overrides: Di
         format=config.LOGGING['format']
     )
     
+    # 共享連接池在組件創建前配置
+    get_connection_manager(config.CONNECTION_POOL)
+    
     # 創建核心組件
     tool_registry = ToolRegistry(config.TOOL_REGISTRY)
     action_executor = ActionExecutor(config.ACTION_EXECUTOR)
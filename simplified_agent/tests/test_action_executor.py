@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+執行引擎測試
+以假的連接管理器和工具註冊系統代替真實工具，驗證請求截止時間對每種工具類型都生效，
+重試和後續階段只能使用請求剩餘的時間，以及依賴圖模式的執行順序、並發、失敗跳過和環檢測
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from simplified_agent.actions import action_executor
+from simplified_agent.actions.action_executor import ActionExecutor, ExecutionMode, ExecutionStatus
+from simplified_agent.core.agent_core import AgentRequest
+from simplified_agent.tools.tool_registry import ToolInfo, ToolType
+
+class FakeResponse:
+    def __init__(self, status, payload):
+        self.status = status
+        self.payload = payload
+
+    async def json(self):
+        return self.payload
+
+class FakeConnectionManager:
+    """按URL返回 (狀態碼或異常, 內容, 延遲)，記錄每次請求收到的超時、請求體和最大並發數"""
+
+    def __init__(self, routes=None, default=(200, {"ok": True}, 0)):
+        self.routes = routes or {}
+        self.default = default
+        self.requests = []
+        self.bodies = {}
+        self.active = 0
+        self.max_active = 0
+
+    def acquire(self, owner):
+        pass
+
+    async def release(self, owner):
+        pass
+
+    def get_metrics(self):
+        return {}
+
+    @contextlib.asynccontextmanager
+    async def post(self, url, json=None, timeout=None):
+        self.requests.append((url, timeout))
+        self.bodies[url] = json
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            status, payload, delay = self.routes.get(url, self.default)
+            await asyncio.sleep(delay)
+            if isinstance(status, Exception):
+                raise status
+            yield FakeResponse(status, payload)
+        finally:
+            self.active -= 1
+
+class FakeToolRegistry:
+    def __init__(self, tools):
+        self.tools = {tool.id: tool for tool in tools}
+
+    async def get_tool_info(self, tool_id):
+        return self.tools.get(tool_id)
+
+def tool(tool_id, tool_type, **fields):
+    return ToolInfo(id=tool_id, name=tool_id, type=tool_type, description="", version="1.0.0",
+                    capabilities=[], **fields)
+
+@pytest.fixture
+def make_executor(monkeypatch):
+    executors = []
+
+    def make(tools, connection_manager=None, **config):
+        manager = connection_manager or FakeConnectionManager()
+        monkeypatch.setattr(action_executor, "get_connection_manager", lambda pool_config=None: manager)
+        config.setdefault("retry_policy", {"max_retries": 0})
+        executor = ActionExecutor(config)
+        executor.set_tool_registry(FakeToolRegistry(tools))
+        executor.connection_manager = manager
+        executors.append(executor)
+        return executor
+
+    yield make
+    for executor in executors:
+        executor.thread_pool.shutdown(wait=False)
+
+def run(executor, tools, timeout, mode=ExecutionMode.SEQUENTIAL, context=None):
+    request = AgentRequest(id="req", type="general", content="內容", context=context, timeout=timeout)
+    start = time.monotonic()
+    result = asyncio.run(executor.execute(request, tools, mode))
+    return result, time.monotonic() - start
+
+@pytest.mark.parametrize("tool_type, path", [
+    (ToolType.MCP_SERVICE, "/process"),
+    (ToolType.HTTP_API, "/api/process")
+])
+def test_http_tools_stop_at_the_deadline(make_executor, tool_type, path):
+    manager = FakeConnectionManager(default=(200, {}, 30))
+    executor = make_executor([tool("remote", tool_type, endpoint="http://remote")], manager)
+
+    result, elapsed = run(executor, ["remote"], timeout=0.3)
+
+    assert elapsed < 2
+    assert result["task_results"][0].status == ExecutionStatus.TIMEOUT
+    # 請求本身也帶上剩餘時間，連接池不會按自己的默認超時等待
+    (url, timeout), = manager.requests
+    assert url == "http://remote" + path
+    assert 0 < timeout <= 0.3
+
+def test_python_tool_stops_at_the_deadline(make_executor, monkeypatch):
+    executor = make_executor([tool("python", ToolType.PYTHON_MODULE)])
+
+    async def hang(parameters):
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(executor, "_execute_default_python_tool", hang)
+
+    result, elapsed = run(executor, ["python"], timeout=0.3)
+
+    assert elapsed < 2
+    assert result["task_results"][0].status == ExecutionStatus.TIMEOUT
+
+def test_system_monitor_samples_within_the_budget(make_executor, monkeypatch):
+    executor = make_executor([tool("system_monitor", ToolType.PYTHON_MODULE)])
+    intervals = []
+
+    async def sample(parameters, interval=1.0):
+        intervals.append(interval)
+        return {"cpu_percent": 1.0}
+
+    monkeypatch.setattr(executor, "_execute_system_monitor", sample)
+
+    result, _ = run(executor, ["system_monitor"], timeout=0.4)
+
+    assert result["task_results"][0].status == ExecutionStatus.COMPLETED
+    assert 0 < intervals[0] <= 0.2
+
+def test_shell_command_is_killed_at_the_deadline(make_executor):
+    executor = make_executor([tool("shell", ToolType.SHELL_COMMAND, command="sleep 5")])
+
+    result, elapsed = run(executor, ["shell"], timeout=0.3)
+
+    assert elapsed < 2
+    assert result["task_results"][0].status in (ExecutionStatus.TIMEOUT, ExecutionStatus.FAILED)
+    # 子進程按同一預算被終止，線程池不會被佔用到命令結束
+    start = time.monotonic()
+    executor.thread_pool.shutdown(wait=True)
+    assert time.monotonic() - start < 2
+
+def test_expired_deadline_skips_the_call(make_executor):
+    manager = FakeConnectionManager()
+    executor = make_executor([tool("remote", ToolType.HTTP_API, endpoint="http://remote")], manager)
+
+    result, _ = run(executor, ["remote"], timeout=0)
+
+    task_result = result["task_results"][0]
+    assert task_result.status == ExecutionStatus.TIMEOUT
+    assert task_result.metadata["deadline_exceeded"] is True
+    assert manager.requests == []
+
+def test_retries_only_get_the_remaining_budget(make_executor):
+    manager = FakeConnectionManager(default=(ConnectionError("refused"), None, 0.05))
+    executor = make_executor(
+        [tool("remote", ToolType.HTTP_API, endpoint="http://remote")], manager,
+        retry_policy={"max_retries": 3, "retry_delay": 0.1, "exponential_backoff": False, "jitter": False}
+    )
+
+    result, _ = run(executor, ["remote"], timeout=2)
+
+    task_result = result["task_results"][0]
+    assert task_result.status == ExecutionStatus.FAILED
+    assert task_result.metadata["attempts"] == 4
+    assert executor.resilience_stats["retries"] == 3
+    timeouts = [timeout for _, timeout in manager.requests]
+    assert len(timeouts) == 4 and timeouts[0] <= 2
+    # 每次重試都扣除上一次嘗試和退避等待所用的時間
+    assert all(earlier - later >= 0.15 for earlier, later in zip(timeouts, timeouts[1:]))
+
+def test_no_retry_when_backoff_outlasts_the_deadline(make_executor):
+    manager = FakeConnectionManager(default=(ConnectionError("refused"), None, 0))
+    executor = make_executor(
+        [tool("remote", ToolType.HTTP_API, endpoint="http://remote")], manager,
+        retry_policy={"max_retries": 3, "retry_delay": 1.0, "jitter": False}
+    )
+
+    result, elapsed = run(executor, ["remote"], timeout=0.5)
+
+    assert elapsed < 0.5
+    assert result["task_results"][0].metadata["attempts"] == 1
+    assert len(manager.requests) == 1
+
+def test_pipeline_stages_inherit_unused_time(make_executor):
+    manager = FakeConnectionManager(routes={"http://first/api/process": (200, {"step": 1}, 0.3)})
+    executor = make_executor(
+        [tool("first", ToolType.HTTP_API, endpoint="http://first"),
+         tool("second", ToolType.HTTP_API, endpoint="http://second")],
+        manager
+    )
+
+    result, _ = run(executor, ["first", "second"], timeout=1.0, mode=ExecutionMode.PIPELINE)
+
+    assert [r.status for r in result["task_results"]] == [ExecutionStatus.COMPLETED] * 2
+    (_, first), (_, second) = manager.requests
+    # 第一階段分到一半，第二階段拿到全部剩餘時間
+    assert first == pytest.approx(0.5, abs=0.05)
+    assert second == pytest.approx(0.7, abs=0.05)
+
+def http_tools(*tool_ids):
+    return [tool(tool_id, ToolType.HTTP_API, endpoint=f"http://{tool_id}") for tool_id in tool_ids]
+
+def called(manager):
+    return [url.split("/")[2] for url, _ in manager.requests]
+
+def test_dag_runs_tasks_after_their_dependencies(make_executor):
+    manager = FakeConnectionManager(routes={
+        f"http://{tool_id}/api/process": (200, {"from": tool_id}, 0) for tool_id in "abc"
+    })
+    executor = make_executor(http_tools("a", "b", "c"), manager)
+
+    result, _ = run(executor, ["c", "b", "a"], timeout=5, mode=ExecutionMode.DAG,
+                    context={"tool_dependencies": {"c": ["b"], "b": ["a"]}})
+
+    assert called(manager) == ["a", "b", "c"]
+    # 結果按請求中的工具順序返回
+    assert [r.tool_id for r in result["task_results"]] == ["c", "b", "a"]
+    assert all(r.status == ExecutionStatus.COMPLETED for r in result["task_results"])
+    # 上游結果寫入下游任務的dependency_inputs
+    assert manager.bodies["http://b/api/process"]["data"]["dependency_inputs"] == {"a": {"from": "a"}}
+    assert manager.bodies["http://c/api/process"]["data"]["dependency_inputs"] == {"b": {"from": "b"}}
+
+def test_dag_runs_ready_tasks_in_parallel(make_executor):
+    manager = FakeConnectionManager(default=(200, {}, 0.2))
+    executor = make_executor(http_tools("a", "b", "c", "join"), manager)
+
+    result, elapsed = run(executor, ["a", "b", "c", "join"], timeout=5, mode=ExecutionMode.DAG,
+                          context={"tool_dependencies": {"join": ["a", "b", "c"]}})
+
+    assert manager.max_active == 3
+    assert elapsed < 0.6
+    assert called(manager)[-1] == "join"
+    assert set(manager.bodies["http://join/api/process"]["data"]["dependency_inputs"]) == {"a", "b", "c"}
+    assert all(r.status == ExecutionStatus.COMPLETED for r in result["task_results"])
+
+def test_dag_respects_the_concurrency_limit(make_executor):
+    manager = FakeConnectionManager(default=(200, {}, 0.05))
+    executor = make_executor(http_tools("a", "b", "c", "d", "e"), manager, max_concurrent_tasks=2)
+
+    result, _ = run(executor, ["a", "b", "c", "d", "e"], timeout=5, mode=ExecutionMode.DAG)
+
+    assert manager.max_active == 2
+    assert len(manager.requests) == 5
+
+def test_dag_skips_only_the_failed_subgraph(make_executor):
+    manager = FakeConnectionManager(routes={"http://a/api/process": (500, None, 0)})
+    executor = make_executor(http_tools("a", "b", "c", "d"), manager)
+
+    result, _ = run(executor, ["a", "b", "c", "d"], timeout=5, mode=ExecutionMode.DAG,
+                    context={"tool_dependencies": {"b": ["a"], "c": ["b"]}})
+
+    statuses = {r.tool_id: r.status for r in result["task_results"]}
+    assert statuses == {
+        "a": ExecutionStatus.FAILED, "b": ExecutionStatus.SKIPPED,
+        "c": ExecutionStatus.SKIPPED, "d": ExecutionStatus.COMPLETED
+    }
+    assert sorted(called(manager)) == ["a", "d"]
+    skipped = result["task_results"][2]
+    assert "upstream" in skipped.error and "(a)" in skipped.error
+
+def test_dag_rejects_dependency_cycles(make_executor):
+    manager = FakeConnectionManager()
+    executor = make_executor(http_tools("a", "b", "c"), manager)
+
+    result, _ = run(executor, ["a", "b", "c"], timeout=5, mode=ExecutionMode.DAG,
+                    context={"tool_dependencies": {"a": ["c"], "b": ["a"], "c": ["b"]}})
+
+    assert result["details"]["failed"] is True
+    assert "cycle" in result["error"]
+    assert manager.requests == []
+
+def test_dag_rejects_dependencies_outside_the_request(make_executor):
+    manager = FakeConnectionManager()
+    executor = make_executor(http_tools("a"), manager)
+
+    result, _ = run(executor, ["a"], timeout=5, mode=ExecutionMode.DAG,
+                    context={"tool_dependencies": {"a": ["missing"]}})
+
+    assert "not part of this request" in result["error"]
+    assert manager.requests == []
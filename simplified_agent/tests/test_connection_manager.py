@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+共享連接池測試
+驗證組件登記的引用計數（按對象弱引用而非id）、執行器和註冊系統共用同一Session、
+連接器和超時配置，以及同一主機的請求復用keep-alive連接
+"""
+
+import asyncio
+import gc
+import os
+import sys
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from simplified_agent.actions.action_executor import ActionExecutor
+from simplified_agent.core import connection_manager
+from simplified_agent.core.connection_manager import ConnectionManager
+from simplified_agent.tools.tool_registry import ToolRegistry
+
+class Owner:
+    pass
+
+@pytest.fixture
+def fresh_manager(monkeypatch):
+    """隔離進程級單例，避免測試之間共享連接池"""
+    monkeypatch.setattr(connection_manager, "_connection_manager", None)
+    monkeypatch.setattr(connection_manager.atexit, "register", lambda func: None)
+
+def test_session_closed_after_last_user_releases():
+    manager = ConnectionManager()
+    executor, registry = Owner(), Owner()
+
+    async def run():
+        manager.acquire(executor)
+        manager.acquire(registry)
+        session = await manager.get_session()
+
+        await manager.release(executor)
+        await manager.release(executor)
+        assert not session.closed
+        assert await manager.get_session() is session
+
+        await manager.release(registry)
+        return session
+
+    assert asyncio.run(run()).closed
+
+def test_unregistered_owner_cannot_release_another_registration():
+    manager = ConnectionManager()
+    owner = Owner()
+
+    async def run():
+        manager.acquire(owner)
+        session = await manager.get_session()
+        # 從未登記的對象不能釋放別人的登記
+        await manager.release(Owner())
+        still_open = not session.closed
+        await manager.release(owner)
+        return still_open, session.closed
+
+    assert asyncio.run(run()) == (True, True)
+
+def test_collected_owner_does_not_keep_the_session_open():
+    manager = ConnectionManager()
+    owner, other = Owner(), Owner()
+    manager.acquire(owner)
+    manager.acquire(other)
+
+    # 未釋放就被回收的組件不再計數，其id被新對象復用也不會誤判
+    del owner
+    gc.collect()
+    assert manager.get_metrics()["users"] == 1
+
+    async def run():
+        session = await manager.get_session()
+        await manager.release(other)
+        return session
+
+    assert asyncio.run(run()).closed
+
+def test_executor_and_registry_share_one_session(fresh_manager):
+    async def run():
+        executor = ActionExecutor({"connection_pool": {"limit_per_host": 3}})
+        registry = ToolRegistry({"connection_pool": {"default_timeout": 7}})
+        manager = executor.connection_manager
+        try:
+            assert registry.connection_manager is manager
+            assert manager.get_metrics()["users"] == 2
+            # 後創建的組件的連接池配置合併到共享管理器
+            assert (manager.config["limit_per_host"], manager.config["default_timeout"]) == (3, 7)
+
+            session = await manager.get_session()
+            assert await registry.connection_manager.get_session() is session
+
+            await executor.close()
+            assert not session.closed
+        finally:
+            await registry.close()
+        return manager, session
+
+    manager, session = asyncio.run(run())
+
+    assert session.closed
+    assert manager.get_metrics()["session_open"] is False
+
+def test_session_applies_connector_settings(monkeypatch):
+    created = []
+
+    class RecordingConnector(aiohttp.TCPConnector):
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+            super().__init__(**kwargs)
+
+    monkeypatch.setattr(connection_manager.aiohttp, "TCPConnector", RecordingConnector)
+    manager = ConnectionManager({"limit": 40, "limit_per_host": 4, "keepalive_timeout": 15,
+                                 "dns_cache_ttl": 120, "default_timeout": 20, "connect_timeout": 2})
+
+    async def run():
+        session = await manager.get_session()
+        try:
+            return session.connector, session.timeout
+        finally:
+            await manager.close()
+
+    connector, timeout = asyncio.run(run())
+
+    assert created == [{"limit": 40, "limit_per_host": 4, "keepalive_timeout": 15, "ttl_dns_cache": 120}]
+    assert (connector.limit, connector.limit_per_host) == (40, 4)
+    assert (timeout.total, timeout.connect) == (20, 2)
+    assert manager.metrics["sessions_created"] == 1
+
+def test_timeout_resolution_order():
+    manager = ConnectionManager({
+        "default_timeout": 30,
+        "connect_timeout": 5,
+        "endpoint_timeouts": {"http://api": 10, "http://api/slow": 60, "cache:6379": 2}
+    })
+
+    assert manager.resolve_timeout("http://api/slow/report").total == 60
+    assert manager.resolve_timeout("http://api/fast").total == 10
+    assert manager.resolve_timeout("http://cache:6379/get").total == 2
+    assert manager.resolve_timeout("http://other/x").total == 30
+    assert manager.resolve_timeout("http://api/slow", timeout=1.5).total == 1.5
+    # 建立連接的超時不超過總超時
+    assert manager.resolve_timeout("http://cache:6379/get").connect == 2
+    assert manager.resolve_timeout("http://other/x").connect == 5
+
+def test_requests_to_one_host_reuse_connections():
+    manager = ConnectionManager()
+
+    async def handle(request):
+        return web.json_response({"ok": True})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/health", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            for _ in range(3):
+                async with manager.get(f"http://127.0.0.1:{port}/health") as response:
+                    assert (await response.json()) == {"ok": True}
+        finally:
+            await manager.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+    metrics = manager.get_metrics()
+
+    assert metrics["requests"] == 3
+    assert (metrics["connections_created"], metrics["connections_reused"]) == (1, 2)
+    assert metrics["per_host"]["127.0.0.1"]["connections_reused"] == 2
+
+def test_session_from_previous_loop_is_released():
+    manager = ConnectionManager()
+    first = asyncio.new_event_loop()
+    second = asyncio.new_event_loop()
+    try:
+        old = first.run_until_complete(manager.get_session())
+        new = second.run_until_complete(manager.get_session())
+
+        assert new is not old
+        assert old.connector is None or old.connector.closed
+        second.run_until_complete(manager.close())
+    finally:
+        first.close()
+        second.close()
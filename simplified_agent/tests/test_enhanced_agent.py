@@ -16,6 +16,9 @@ from ..tools.enhanced_tool_registry import EnhancedToolRegistry
 from ..actions.action_executor import ActionExecutor
 from ..config.enhanced_config import create_enhanced_config
 from ..core.agent_core import AgentRequest, Priority, TaskStatus
+from ..tools.tool_search_index import ToolSearchIndex
+from ..actions.resilience import RetryPolicy, CircuitBreaker, CircuitState
+from ..core.history import RingBuffer, LatencyHistogram
 
 class TestEnhancedAgentCore:
     """增強版Agent Core測試"""
@@ -367,6 +370,123 @@ class TestPerformance:
             # 記憶體增長應該在合理範圍內（小於100MB）
             assert memory_increase < 100 * 1024 * 1024
 
+class TestToolSearchIndex:
+    """工具搜索索引測試"""
+    
+    @pytest.fixture
+    def search_index(self):
+        index = ToolSearchIndex()
+        index.add('aci.dev:google_calendar_integration', {
+            'name': 'google_calendar_integration',
+            'description': 'Google Calendar API集成工具',
+            'category': 'productivity',
+            'capabilities': ['schedule', 'remind', 'sync']
+        })
+        index.add('mcp.so:advanced_data_analyzer', {
+            'name': 'advanced_data_analyzer',
+            'description': '高级数据分析MCP工具',
+            'category': 'data_analysis',
+            'capabilities': ['analyze', 'visualize']
+        })
+        return index
+    
+    def test_exact_and_substring_match(self, search_index):
+        """測試詞項與子串匹配"""
+        assert search_index.search('calendar')[0][0] == 'aci.dev:google_calendar_integration'
+        assert search_index.search('analy')[0][0] == 'mcp.so:advanced_data_analyzer'
+        assert search_index.search('不存在的工具') == []
+    
+    def test_empty_query_returns_all(self, search_index):
+        """測試空查詢返回全部工具"""
+        assert len(search_index.search('')) == 2
+        assert len(search_index.search('', limit=1)) == 1
+    
+    def test_reregister_replaces_terms(self, search_index):
+        """測試重複註冊時更新索引"""
+        search_index.add('aci.dev:google_calendar_integration', {
+            'name': 'google_calendar_integration',
+            'description': 'Renamed tool',
+            'category': 'productivity',
+            'capabilities': []
+        })
+        
+        assert search_index.search('schedule') == []
+        assert len(search_index) == 2
+        
+        search_index.remove('mcp.so:advanced_data_analyzer')
+        assert search_index.search('analyzer') == []
+        assert 'analyzer' not in search_index.postings
+
+class TestResilience:
+    """重試策略與熔斷器測試"""
+    
+    def test_retry_delay_bounds(self):
+        """測試指數退避延遲上限與抖動範圍"""
+        policy = RetryPolicy(retry_delay=1, max_delay=5, jitter=False)
+        assert [policy.get_delay(n) for n in range(1, 5)] == [1, 2, 4, 5]
+        
+        jittered = RetryPolicy(retry_delay=1, max_delay=5)
+        assert all(0 <= jittered.get_delay(3) <= 4 for _ in range(20))
+    
+    def test_circuit_breaker_transitions(self):
+        """測試熔斷器打開、半開探測和恢復"""
+        transitions = []
+        breaker = CircuitBreaker('tool', failure_threshold=2, recovery_timeout=0.05,
+                                 on_state_change=lambda name, old, new: transitions.append(new))
+        
+        breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow_request()
+        
+        time.sleep(0.06)
+        assert breaker.allow_request()
+        assert not breaker.allow_request()  # 半開狀態只放行一個探測
+        breaker.record_success()
+        
+        assert transitions == [CircuitState.OPEN, CircuitState.HALF_OPEN, CircuitState.CLOSED]
+    
+    def test_cancelled_probe_releases_half_open_slot(self):
+        """測試被取消的探測請求歸還半開名額"""
+        breaker = CircuitBreaker('tool', failure_threshold=1, recovery_timeout=0.05)
+        breaker.record_failure()
+        assert not breaker.check_recovery()
+        
+        time.sleep(0.06)
+        assert breaker.check_recovery()
+        assert breaker.allow_request()
+        breaker.release_probe()
+        assert breaker.allow_request()
+        assert breaker.state == CircuitState.HALF_OPEN
+
+class TestHistory:
+    """有界歷史記錄測試"""
+    
+    def test_ring_buffer_overwrites_oldest(self, tmp_path):
+        """測試環形緩衝區覆蓋最舊記錄並溢出到磁盤"""
+        spill_path = tmp_path / 'history.jsonl'
+        buffer = RingBuffer(3, spill_path=str(spill_path))
+        for i in range(5):
+            buffer.append({'i': i})
+        buffer.close()
+        
+        assert list(buffer) == [{'i': 2}, {'i': 3}, {'i': 4}]
+        assert buffer.latest(2) == [{'i': 3}, {'i': 4}]
+        assert buffer.total_appended == 5
+        assert spill_path.read_text().splitlines() == ['{"i": 0}', '{"i": 1}']
+    
+    def test_latency_histogram_percentiles(self):
+        """測試延遲直方圖分位數"""
+        histogram = LatencyHistogram()
+        for value in [0.001] * 90 + [0.5] * 9 + [3.0]:
+            histogram.observe(value)
+        
+        assert histogram.count == 100
+        assert histogram.percentile(50) == 0.001
+        assert histogram.percentile(99) == 0.5
+        assert histogram.percentile(100) == 3.0
+
 # 測試配置
 pytest_plugins = ['pytest_asyncio']
 
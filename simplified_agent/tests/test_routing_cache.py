@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+路由決策緩存測試
+驗證TTL過期、LRU淘汰、註冊表版本變化時失效，以及規範化的需求文本作為緩存鍵
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from simplified_agent.tools import routing_cache
+from simplified_agent.tools.routing_cache import RoutingDecisionCache, make_routing_key, normalize_requirement
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(routing_cache.time, "monotonic", clock)
+    return clock
+
+def test_entries_expire_after_ttl(clock):
+    cache = RoutingDecisionCache(ttl=10)
+    cache.put("k", 1, "決策")
+
+    clock.now += 9.9
+    assert cache.get("k", 1) == "決策"
+    clock.now += 0.1
+    assert cache.get("k", 1) is None
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["size"]) == (1, 1, 1, 0)
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = RoutingDecisionCache(max_entries=2)
+    cache.put("a", 1, "A")
+    cache.put("b", 1, "B")
+    cache.get("a", 1)
+    cache.put("c", 1, "C")
+
+    assert cache.get("b", 1) is None
+    assert (cache.get("a", 1), cache.get("c", 1)) == ("A", "C")
+    assert cache.get_stats()["evictions"] == 1
+
+def test_registry_version_change_invalidates_all_entries(clock):
+    cache = RoutingDecisionCache()
+    cache.put("a", 1, "A")
+    cache.put("b", 1, "B")
+
+    assert cache.get("a", 2) is None
+    assert len(cache) == 0
+    assert cache.get_stats()["invalidations"] == 1
+    cache.put("a", 2, "A2")
+    assert cache.get("a", 2) == "A2"
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = RoutingDecisionCache(enabled=False)
+    cache.put("k", 1, "決策")
+
+    assert cache.get("k", 1) is None
+    assert len(cache) == 0
+
+def test_routing_key_normalizes_requirement_and_orders_context():
+    key = make_routing_key("  Format   Python\tcode ", {"filters": {"b": 1, "a": 2}, "budget": {"max_cost_per_call": 0.01}})
+
+    assert normalize_requirement("  Format   Python\tcode ") == "format python code"
+    assert key == make_routing_key("format python code", {"budget": {"max_cost_per_call": 0.01}, "filters": {"a": 2, "b": 1}})
+    assert key != make_routing_key("format python code", {"filters": {"a": 2, "b": 1}})
+
+def test_routing_key_includes_weights():
+    context = {"decision_weights": {"cost": 0.5}}
+
+    assert make_routing_key("x", context) == make_routing_key("x", {}, {"cost": 0.5})
+    assert make_routing_key("x", {}, (0.1, 0.2, 0.3, 0.4)) == make_routing_key("x", {}, [0.1, 0.2, 0.3, 0.4])
+    assert make_routing_key("x", context) != make_routing_key("x", {})
+
+def test_requests_sharing_a_key_are_scored_identically():
+    pytest.importorskip("mcptool")
+    from simplified_agent.tools.smart_tool_engine_mcp import IntelligentRoutingEngine, UnifiedToolRegistry
+
+    registry = UnifiedToolRegistry()
+    for name in ("code formatter", "code linter"):
+        registry.register_tool({
+            "name": name, "description": f"{name} for python", "category": "dev", "platform": "local",
+            "platform_tool_id": name, "mcp_endpoint": "", "capabilities": [], "input_schema": {}, "output_schema": {}
+        })
+
+    def route(request):
+        result = IntelligentRoutingEngine(registry, {"enabled": False}).select_optimal_tool(request)
+        return [(tool["id"], tool["comprehensive_score"]) for tool in [result["selected_tool"]] + result["alternatives"]]
+
+    assert route("Code  Formatter") == route("code formatter")
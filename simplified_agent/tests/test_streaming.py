@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+流式請求處理測試
+以真實的ActionExecutor配合假的連接管理器和工具註冊系統，驗證工具結果按完成順序在最終事件前推送、
+提前關閉事件流時取消執行，以及增強版Agent Core回退時的事件去重和最終響應
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from simplified_agent.actions import action_executor
+from simplified_agent.actions.action_executor import ActionExecutor
+from simplified_agent.config.enhanced_config import create_enhanced_config
+from simplified_agent.core.agent_core import AgentCore, AgentEventType, AgentRequest, Priority, TaskStatus
+from simplified_agent.core.enhanced_agent_core import EnhancedAgentCore
+from simplified_agent.tools.tool_registry import ToolInfo, ToolType
+
+TOOL_DELAYS = {"fast": 0.05, "slow": 0.3}
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.status = 200
+        self.payload = payload
+
+    async def json(self):
+        return self.payload
+
+class FakeConnectionManager:
+    """每個工具按TOOL_DELAYS延遲後返回帶調用序號的結果"""
+
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+
+    def acquire(self, owner):
+        pass
+
+    async def release(self, owner):
+        pass
+
+    def get_metrics(self):
+        return {}
+
+    @contextlib.asynccontextmanager
+    async def post(self, url, json=None, timeout=None):
+        tool_id = url.split("/")[2]
+        self.calls += 1
+        call = self.calls
+        self.active += 1
+        try:
+            await asyncio.sleep(TOOL_DELAYS[tool_id])
+            yield FakeResponse({"tool": tool_id, "call": call})
+        finally:
+            self.active -= 1
+
+class FakeToolRegistry:
+    """同時提供基礎和增強版Agent Core用到的註冊系統接口"""
+
+    def __init__(self, optimal_result=None):
+        self.tools = {tool_id: ToolInfo(id=tool_id, name=tool_id, type=ToolType.HTTP_API, description="",
+                                        version="1.0.0", capabilities=[], endpoint=f"http://{tool_id}")
+                      for tool_id in TOOL_DELAYS}
+        self.optimal_result = optimal_result or {"success": False}
+
+    async def get_tool_info(self, tool_id):
+        return self.tools.get(tool_id)
+
+    async def get_available_tools(self):
+        return list(self.tools.values())
+
+    async def find_optimal_tools(self, requirement, context):
+        return self.optimal_result
+
+    async def find_tools_by_capability(self, capability):
+        return list(TOOL_DELAYS)
+
+    async def execute_with_smart_tool(self, tool_id, content, context):
+        return {"success": True, "result": {"analysis": "智能引擎結果"}}
+
+@pytest.fixture
+def make_agent(monkeypatch):
+    executors = []
+
+    def make(agent_class=AgentCore, registry=None):
+        manager = FakeConnectionManager()
+        monkeypatch.setattr(action_executor, "get_connection_manager", lambda pool_config=None: manager)
+        executor = ActionExecutor({"retry_policy": {"max_retries": 0}})
+        executors.append(executor)
+        registry = registry or FakeToolRegistry()
+
+        if agent_class is AgentCore:
+            agent = AgentCore({})
+            agent.set_dependencies(registry, executor)
+            executor.set_tool_registry(registry)
+        else:
+            agent = EnhancedAgentCore(create_enhanced_config("testing"))
+            agent.set_enhanced_dependencies(registry, executor)
+
+        async def select_tools(request, analysis):
+            return list(TOOL_DELAYS)
+
+        agent._select_tools = select_tools
+        agent.connection_manager = manager
+        return agent
+
+    yield make
+    for executor in executors:
+        executor.thread_pool.shutdown(wait=False)
+
+def request(request_id="req"):
+    return AgentRequest(id=request_id, type="analysis", content="分析服務狀態", priority=Priority.MEDIUM, timeout=5)
+
+def collect(agent, agent_request):
+    async def run():
+        start = time.monotonic()
+        return [(event, time.monotonic() - start) async for event in agent.process_request_stream(agent_request)]
+    return asyncio.run(run())
+
+def test_tool_results_stream_in_completion_order(make_agent):
+    agent = make_agent()
+
+    received = collect(agent, request())
+    events = [event for event, _ in received]
+
+    assert [event.type for event in events] == [
+        AgentEventType.ANALYSIS, AgentEventType.TOOL_SELECTION,
+        AgentEventType.TOOL_RESULT, AgentEventType.TOOL_RESULT, AgentEventType.COMPLETED
+    ]
+    assert [event.data.tool_id for event in events[2:4]] == ["fast", "slow"]
+    # 快工具的結果不等慢工具完成就已推送
+    assert received[2][1] < TOOL_DELAYS["slow"] - 0.1
+    response = events[-1].data
+    assert response.status == TaskStatus.COMPLETED
+    assert events[-1].to_dict()["data"]["status"] == "completed"
+    assert events[2].to_dict()["data"]["status"] == "completed"
+
+def test_closing_the_stream_cancels_execution(make_agent):
+    agent = make_agent()
+
+    async def run():
+        stream = agent.process_request_stream(request())
+        async for event in stream:
+            if event.type == AgentEventType.TOOL_RESULT:
+                break
+        await stream.aclose()
+
+    asyncio.run(run())
+
+    assert agent.connection_manager.active == 0
+    assert agent.connection_manager.calls == 2
+    record, = agent.task_history.latest(1)
+    assert record.status == TaskStatus.CANCELLED
+    assert agent.active_tasks == {}
+
+def test_enhanced_smart_engine_path_streams_phases(make_agent):
+    registry = FakeToolRegistry(optimal_result={
+        "success": True,
+        "selected_tool": {
+            "id": "smart_tool", "platform": "local",
+            "cost_model": {"type": "free", "cost_per_call": 0.0},
+            "performance_metrics": {"success_rate": 0.99}
+        },
+        "alternatives": []
+    })
+    agent = make_agent(EnhancedAgentCore, registry)
+
+    events = [event for event, _ in collect(agent, request())]
+
+    assert [event.type for event in events] == [
+        AgentEventType.ANALYSIS, AgentEventType.TOOL_SELECTION, AgentEventType.COMPLETED
+    ]
+    assert events[-1].data.status == TaskStatus.COMPLETED
+    assert events[-1].data.tools_used == ["smart_tool"]
+    assert agent.get_enhanced_status()["enhanced_stats"]["smart_decisions"] == 1
+
+def test_enhanced_standard_path_streams_tool_results(make_agent):
+    agent = make_agent(EnhancedAgentCore)
+
+    events = [event for event, _ in collect(agent, request())]
+
+    assert [event.type for event in events] == [
+        AgentEventType.ANALYSIS, AgentEventType.TOOL_SELECTION,
+        AgentEventType.TOOL_RESULT, AgentEventType.TOOL_RESULT, AgentEventType.COMPLETED
+    ]
+    assert [event.data.tool_id for event in events[2:4]] == ["fast", "slow"]
+    assert events[1].data["selected_tools"] == list(TOOL_DELAYS)
+    assert events[-1].data.status == TaskStatus.COMPLETED
+
+def test_fallback_emits_the_results_the_response_is_built_from(make_agent):
+    agent = make_agent(EnhancedAgentCore)
+
+    async def fail_evaluation(execution_result):
+        raise RuntimeError("評估失敗")
+
+    agent._evaluate_and_optimize_result = fail_evaluation
+
+    events = [event for event, _ in collect(agent, request())]
+    types = [event.type for event in events]
+
+    # 已產出的分析和工具選擇不重複，重新執行的工具結果照常產出
+    assert types == [
+        AgentEventType.ANALYSIS, AgentEventType.TOOL_SELECTION,
+        AgentEventType.TOOL_RESULT, AgentEventType.TOOL_RESULT,
+        AgentEventType.TOOL_RESULT, AgentEventType.TOOL_RESULT,
+        AgentEventType.COMPLETED
+    ]
+    first_run = {event.data.tool_id: event.data.result for event in events[2:4]}
+    rerun = {event.data.tool_id: event.data.result for event in events[4:6]}
+    assert first_run != rerun
+
+    response = events[-1].data
+    assert response.status == TaskStatus.COMPLETED
+    assert response.result["content"]["tool_results"] == rerun
+    # 工具選擇回退和事件流回退各計一次
+    assert agent.get_enhanced_status()["enhanced_stats"]["fallback_activations"] == 2
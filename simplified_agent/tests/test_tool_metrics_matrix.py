@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+工具指標矩陣測試
+以逐個工具計算的標量評分為基準，驗證批量子評分、綜合評分和前k個工具的排序
+"""
+
+import heapq
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from simplified_agent.tools.tool_metrics_matrix import (
+    SCORE_DIMENSIONS, ToolMetricsMatrix, top_k_indices, weight_vector
+)
+
+DECISION_WEIGHTS = {"performance": 0.3, "cost": 0.25, "quality": 0.25, "availability": 0.2}
+
+def make_tool(response_time, success_rate, throughput, reliability, cost_type, cost_per_call,
+              rating, docs, community, updates):
+    return {
+        "performance_metrics": {
+            "avg_response_time": response_time, "success_rate": success_rate,
+            "throughput": throughput, "reliability_score": reliability
+        },
+        "cost_model": {"type": cost_type, "cost_per_call": cost_per_call},
+        "quality_scores": {
+            "user_rating": rating, "documentation_quality": docs,
+            "community_support": community, "update_frequency": updates
+        }
+    }
+
+TOOLS = {
+    "fast-free": make_tool(200, 0.99, 800, 0.95, "free", 0.0, 4.8, 0.9, 0.8, 0.9),
+    "slow-free": make_tool(6000, 0.80, 50, 0.70, "free", 0.0, 3.0, 0.5, 0.4, 0.3),
+    "cheap-paid": make_tool(800, 0.95, 2000, 0.90, "per_call", 0.002, 4.2, 0.8, 0.7, 0.8),
+    "pricey-paid": make_tool(500, 0.97, 500, 0.92, "per_call", 0.02, 4.5, 0.9, 0.9, 0.9),
+    "subscription": make_tool(1500, 0.90, 300, 0.85, "subscription", 10.0, 4.0, 0.7, 0.6, 0.7),
+    "unrated": make_tool(3000, 0.85, 100, 0.80, "free", 0.0, 1.0, 0.2, 0.1, 0.1)
+}
+
+# 向量化之前逐個工具計算的評分
+def scalar_scores(tool, max_cost):
+    metrics = tool["performance_metrics"]
+    performance = (max(0, 1 - metrics["avg_response_time"] / 5000) * 0.3 + metrics["success_rate"] * 0.3 +
+                   min(metrics["throughput"] / 1000, 1.0) * 0.2 + metrics["reliability_score"] * 0.2)
+
+    cost_model = tool["cost_model"]
+    if cost_model["type"] == "free":
+        cost = 1.0
+    elif cost_model["type"] == "per_call":
+        cost = max(0, 1 - cost_model["cost_per_call"] / max_cost)
+    else:
+        cost = 0.8
+
+    quality = tool["quality_scores"]
+    quality_score = ((quality["user_rating"] - 1) / 4 * 0.4 + quality["documentation_quality"] * 0.2 +
+                     quality["community_support"] * 0.2 + quality["update_frequency"] * 0.2)
+    return [performance, cost, quality_score, 0.9]
+
+def scalar_comprehensive(tool, max_cost, relevance):
+    scores = dict(zip(SCORE_DIMENSIONS, scalar_scores(tool, max_cost)))
+    total = sum(scores[dimension] * DECISION_WEIGHTS[dimension] for dimension in SCORE_DIMENSIONS)
+    return min(total + relevance * 0.1, 1.0)
+
+@pytest.fixture
+def matrix():
+    # 初始容量小於工具數，同時覆蓋擴容
+    matrix = ToolMetricsMatrix(initial_capacity=2)
+    for tool_id, tool in TOOLS.items():
+        matrix.upsert(tool_id, tool)
+    return matrix
+
+@pytest.mark.parametrize("max_cost", [0.01, 0.05])
+def test_sub_scores_match_scalar_scoring(matrix, max_cost):
+    tool_ids = list(TOOLS)
+
+    vectorized = matrix.sub_scores(matrix.rows_for(tool_ids), max_cost)
+
+    expected = np.array([scalar_scores(TOOLS[tool_id], max_cost) for tool_id in tool_ids])
+    np.testing.assert_allclose(vectorized, expected)
+
+def test_comprehensive_ranking_matches_scalar_scoring(matrix):
+    tool_ids = list(TOOLS)
+    relevance = np.linspace(1.0, 0.5, len(tool_ids))
+
+    comprehensive = np.minimum(
+        matrix.sub_scores(matrix.rows_for(tool_ids)) @ weight_vector(None, DECISION_WEIGHTS) + relevance * 0.1, 1.0
+    )
+    top = [tool_ids[index] for index in top_k_indices(comprehensive, 4)]
+
+    expected = {tool_id: scalar_comprehensive(TOOLS[tool_id], 0.01, r) for tool_id, r in zip(tool_ids, relevance)}
+    np.testing.assert_allclose(comprehensive, [expected[tool_id] for tool_id in tool_ids])
+    assert top == heapq.nlargest(4, tool_ids, key=expected.get)
+
+def test_updates_are_written_in_place(matrix):
+    tool = TOOLS["cheap-paid"]
+    updated = {**tool, "cost_model": {"type": "per_call", "cost_per_call": 0.008}}
+    matrix.upsert("cheap-paid", updated)
+    matrix.set_availability("cheap-paid", 0.0)
+
+    scores = matrix.sub_scores(matrix.rows_for(["cheap-paid"]))[0]
+
+    assert len(matrix) == len(TOOLS)
+    assert scores[1] == pytest.approx(0.2)
+    assert scores[3] == 0.0
+
+def test_zero_budget_is_rejected_only_when_a_paid_tool_is_scored(matrix):
+    free_rows = matrix.rows_for(["fast-free", "subscription"])
+    np.testing.assert_allclose(matrix.sub_scores(free_rows, 0)[:, 1], [1.0, 0.8])
+
+    with pytest.raises(ValueError):
+        matrix.sub_scores(matrix.rows_for(["fast-free", "cheap-paid"]), 0)
+
+def test_top_k_indices_orders_descending():
+    scores = np.array([0.2, 0.9, 0.5, 0.9, 0.1, 0.7])
+
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 5]
+    assert top_k_indices(scores[:2], 4).tolist() == [1, 0]
+
+def test_weight_vector_accepts_partial_dicts_and_vectors():
+    np.testing.assert_allclose(weight_vector({"cost": 0.5}, DECISION_WEIGHTS), [0.3, 0.5, 0.25, 0.2])
+    np.testing.assert_allclose(weight_vector([0.1, 0.2, 0.3, 0.4], DECISION_WEIGHTS), [0.1, 0.2, 0.3, 0.4])
+    with pytest.raises(ValueError):
+        weight_vector([1.0, 2.0], DECISION_WEIGHTS)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+工具註冊系統測試
+以假的連接管理器代替HTTP，驗證並發探測的信號量上限、單次探測超時和整體期限、
+失敗端點的指數退避、同一URL共用的探測結果，以及後台刷新默認關閉
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from simplified_agent.config.config import get_config
+from simplified_agent.config.enhanced_config import EnhancedAgentConfig
+from simplified_agent.tools import tool_registry
+from simplified_agent.tools.tool_registry import ToolInfo, ToolRegistry, ToolStatus, ToolType
+
+class FakeResponse:
+    def __init__(self, status, payload):
+        self.status = status
+        self.payload = payload
+
+    async def json(self):
+        return self.payload
+
+class FakeConnectionManager:
+    """按URL返回 (狀態碼, 內容, 延遲)，記錄請求和最大並發數"""
+
+    def __init__(self, routes=None, default=(200, {}, 0)):
+        self.routes = routes or {}
+        self.default = default
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    def acquire(self, owner):
+        pass
+
+    async def release(self, owner):
+        pass
+
+    def get_metrics(self):
+        return {}
+
+    @contextlib.asynccontextmanager
+    async def get(self, url, timeout=None):
+        self.requests.append((url, timeout))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            status, payload, delay = self.routes.get(url, self.default)
+            await asyncio.sleep(delay)
+            if isinstance(status, Exception):
+                raise status
+            yield FakeResponse(status, payload)
+        finally:
+            self.active -= 1
+
+@pytest.fixture
+def make_registry(monkeypatch):
+    def make(connection_manager, **config):
+        monkeypatch.setattr(tool_registry, "get_connection_manager", lambda pool_config=None: connection_manager)
+        return ToolRegistry(config)
+    return make
+
+def http_tool(tool_id, url):
+    return ToolInfo(id=tool_id, name=tool_id, type=ToolType.HTTP_API, description="", version="1.0.0",
+                    capabilities=[], health_check_url=url)
+
+def register(registry, tools):
+    for tool in tools:
+        asyncio.run(registry.register_tool(tool))
+
+def test_background_refresh_is_off_by_default(make_registry):
+    assert make_registry(FakeConnectionManager()).background_refresh is False
+    assert get_config("development").TOOL_REGISTRY["enable_background_refresh"] is False
+    assert EnhancedAgentConfig.get_config("production")["tool_registry"]["enable_background_refresh"] is False
+
+def test_health_checks_run_concurrently_under_the_semaphore(make_registry):
+    manager = FakeConnectionManager(default=(200, {}, 0.05))
+    registry = make_registry(manager, probe_concurrency=2, probe_timeout=3)
+    register(registry, [http_tool(f"tool_{i}", f"http://host/{i}/health") for i in range(6)])
+
+    results = asyncio.run(registry.health_check_all())
+
+    assert all(results.values()) and len(results) == 6
+    assert manager.max_active == 2
+    # 每次探測都帶上單次超時
+    assert {timeout for _, timeout in manager.requests} == {3}
+
+def test_overall_deadline_cancels_hanging_checks(make_registry):
+    manager = FakeConnectionManager(routes={"http://slow/health": (200, {}, 30)})
+    registry = make_registry(manager, discovery_deadline=0.2)
+    register(registry, [http_tool("fast", "http://fast/health"), http_tool("slow", "http://slow/health")])
+
+    start = time.monotonic()
+    results = asyncio.run(registry.health_check_all())
+
+    assert time.monotonic() - start < 2
+    assert results == {"fast": True, "slow": False}
+
+def test_discovery_deadline_bounds_startup(make_registry):
+    manager = FakeConnectionManager(default=(200, {}, 30))
+    registry = make_registry(manager, discovery_deadline=0.2)
+
+    start = time.monotonic()
+    asyncio.run(registry.discover_tools())
+
+    assert time.monotonic() - start < 2
+    # 各來源並發探測，慢端點沒有被逐個等待
+    assert len(manager.requests) == 5
+    assert [tool_id for tool_id in registry.tools if tool_id.startswith(("mcp_", "api_"))] == []
+
+def test_failed_endpoint_backs_off_exponentially(make_registry, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(tool_registry.time, "monotonic", lambda: now[0])
+    manager = FakeConnectionManager(routes={"http://down/health": (ConnectionError("refused"), None, 0)})
+    registry = make_registry(manager, probe_backoff_base=5, probe_backoff_max=12)
+    url = "http://down/health"
+
+    async def probe_at(moment):
+        now[0] = moment
+        return await registry.probe_endpoint(url)
+
+    state = asyncio.run(probe_at(100))
+    assert (state.ok, state.error, state.next_probe_at) == (False, "refused", 105)
+
+    # 退避期內直接返回上次結果
+    asyncio.run(probe_at(104))
+    assert len(manager.requests) == 1
+
+    assert asyncio.run(probe_at(105)).next_probe_at == 115
+    assert asyncio.run(probe_at(115)).next_probe_at == 127  # 上限12秒
+    assert len(manager.requests) == 3
+
+    # 恢復後清零失敗計數
+    manager.routes[url] = (200, {"status": "ok"}, 0)
+    state = asyncio.run(registry.probe_endpoint(url, force=True))
+    assert (state.ok, state.consecutive_failures, state.payload) == (True, 0, {"status": "ok"})
+
+def test_tools_with_the_same_url_share_one_probe(make_registry):
+    manager = FakeConnectionManager(routes={"http://shared/health": (503, None, 0)})
+    registry = make_registry(manager)
+    register(registry, [http_tool("a", "http://shared/health"), http_tool("b", "http://shared/health")])
+
+    async def run():
+        return await registry.health_check_tool("a"), await registry.health_check_tool("b")
+
+    assert asyncio.run(run()) == (False, False)
+    assert len(manager.requests) == 1
+    assert list(registry.probe_cache) == ["http://shared/health"]
+    assert registry.tools["a"].status == registry.tools["b"].status == ToolStatus.UNAVAILABLE
+
+def test_successful_probe_is_reused_until_max_age(make_registry):
+    manager = FakeConnectionManager()
+    registry = make_registry(manager, health_check_interval=60)
+
+    async def run():
+        await registry.probe_endpoint("http://up/health")
+        await registry.probe_endpoint("http://up/health")
+        await registry.probe_endpoint("http://up/health", max_age=0)
+
+    asyncio.run(run())
+
+    assert len(manager.requests) == 2
+
+def test_background_refresh_runs_and_stops(make_registry):
+    manager = FakeConnectionManager()
+    registry = make_registry(manager, discovery_interval=0.05, health_check_interval=0.05)
+    register(registry, [http_tool("a", "http://up/health")])
+
+    async def run():
+        registry.start_background_refresh()
+        await asyncio.sleep(0.18)
+        running = registry.get_registry_stats()["background_refresh"]
+        await registry.stop_background_refresh()
+        return running
+
+    assert asyncio.run(run()) is True
+    assert registry.get_registry_stats()["background_refresh"] is False
+    assert len([url for url, _ in manager.requests if url == "http://up/health"]) >= 2
@@ -21,6 +21,7 @@ from .smart_tool_engine_mcp import (
     MCPUnifiedExecutionEngine,
     SmartToolEngineMCP
 )
+from .tool_metrics_matrix import DEFAULT_AVAILABILITY
 
 logger = logging.getLogger(__name__)
 
@@ -81,6 +82,15 @@ class EnhancedToolRegistry(ToolRegistry):
         self.smart_engine = SmartToolEngineMCP()
         self.unified_registry = self.smart_engine.registry
         self.routing_engine = self.smart_engine.execution_engine.routing_engine
+        self.unified_tool_ids: Dict[str, str] = {}  # 本地工具ID -> 統一註冊表ID
+        
+        # 路由決策緩存配置
+        agent_config = config.get('agent_core', {})
+        self.routing_engine.configure_cache(
+            enabled=agent_config.get('enable_caching', True),
+            ttl=agent_config.get('cache_ttl', 300),
+            max_entries=agent_config.get('cache_max_entries', 1024)
+        )
         
         # 增強配置
         self.smart_config = config.get('smart_engine', {
@@ -144,6 +154,7 @@ class EnhancedToolRegistry(ToolRegistry):
                 
                 # 註冊到統一註冊表
                 unified_tool_id = self.unified_registry.register_tool(smart_tool_info)
+                self.unified_tool_ids[tool_id] = unified_tool_id
                 
                 logger.debug(f"Synced tool {tool_id} to unified registry as {unified_tool_id}")
                 
@@ -351,6 +362,22 @@ class EnhancedToolRegistry(ToolRegistry):
                 'error': str(e)
             }
     
+    def set_circuit_state(self, tool_id: str, state: str):
+        """同步熔斷器狀態，並調整統一註冊表中的可用性使智能路由避開熔斷中的工具"""
+        super().set_circuit_state(tool_id, state)
+        
+        unified_tool_id = self.unified_tool_ids.get(tool_id, tool_id)
+        if unified_tool_id not in self.unified_registry.tools_db:
+            return
+        
+        if state == 'open':
+            availability = 0.0
+        elif state == 'half_open':
+            availability = DEFAULT_AVAILABILITY / 2
+        else:
+            availability = DEFAULT_AVAILABILITY
+        self.unified_registry.set_tool_availability(unified_tool_id, availability)
+    
     def get_enhanced_stats(self) -> Dict[str, Any]:
         """獲取增強統計信息"""
         base_stats = super().get_registry_stats()
@@ -364,6 +391,7 @@ class EnhancedToolRegistry(ToolRegistry):
             **base_stats,
             'enhanced_features': self.enhanced_stats,
             'smart_engine_stats': smart_stats.get('statistics', {}),
+            'routing_cache': self.routing_engine.get_cache_stats(),
             'cloud_tools_enabled': self.smart_config['enable_cloud_tools'],
             'intelligent_routing_enabled': self.smart_config['enable_intelligent_routing']
         }
@@ -381,7 +409,7 @@ class EnhancedToolRegistry(ToolRegistry):
         return {
             'base_registry': base_health,
             'smart_engine': smart_health,
-            'overall_health': base_health and smart_health.get('success', False),
+            'overall_health': all(base_health.values()) and smart_health.get('success', False),
             'timestamp': time.time()
         }
     
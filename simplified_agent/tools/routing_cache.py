@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+路由决策缓存
+LRU + TTL 缓存，键为规范化的需求文本、过滤条件、预算和权重，
+注册表版本变化时整体失效
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def normalize_requirement(requirement: str) -> str:
+    """规范化需求文本: 去除首尾空白、合并连续空白并小写化"""
+    return " ".join(requirement.split()).lower()
+
+
+def _stable_repr(value: Any) -> str:
+    if not value:
+        return ""
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def make_routing_key(requirement: str, context: Dict = None, weights: Any = None) -> Tuple[str, str, str, str]:
+    """生成路由缓存键(只包含会影响路由结果的上下文字段)"""
+    context = context or {}
+    if weights is None:
+        weights = context.get("decision_weights")
+    if weights is not None and not isinstance(weights, dict):
+        weights = list(weights)
+
+    return (
+        normalize_requirement(requirement),
+        _stable_repr(context.get("filters")),
+        _stable_repr(context.get("budget")),
+        _stable_repr(weights)
+    )
+
+
+class RoutingDecisionCache:
+    """路由决策缓存"""
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1024, enabled: bool = True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._version: Optional[int] = None
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """读取缓存，未命中、过期或注册表版本变化时返回None"""
+        if not self.enabled:
+            return None
+
+        self._check_version(version)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    def put(self, key: Hashable, version: int, value: Any):
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        if not self.enabled:
+            return
+
+        self._check_version(version)
+
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0
+        }
+
+    def _check_version(self, version: int):
+        if version != self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+                self._entries.clear()
+            self._version = version
@@ -11,7 +11,8 @@ import asyncio
 import time
 import os
 import requests
-from typing import Dict, List, Any, Optional, Union
+import numpy as np
+from typing import Dict, List, Any, Optional, Union, Tuple
 from pathlib import Path
 import sys
 from datetime import datetime
@@ -21,6 +22,10 @@ sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from mcptool.core.base_mcp import BaseMCP
 
+from .tool_search_index import ToolSearchIndex
+from .tool_metrics_matrix import ToolMetricsMatrix, SCORE_DIMENSIONS, top_k_indices, weight_vector
+from .routing_cache import RoutingDecisionCache, make_routing_key, normalize_requirement
+
 logger = logging.getLogger(__name__)
 
 class UnifiedToolRegistry:
@@ -30,6 +35,9 @@ class UnifiedToolRegistry:
         self.tools_db = {}
         self.platform_clients = {}
         self.last_sync_time = None
+        self.version = 0  # 每次注册或指标变化时递增，用于路由缓存失效
+        self.search_index = ToolSearchIndex()
+        self.metrics_matrix = ToolMetricsMatrix()
         
     def register_tool(self, tool_info: Dict) -> str:
         """注册工具到统一注册表"""
@@ -79,42 +87,63 @@ class UnifiedToolRegistry:
         }
         
         self.tools_db[tool_id] = unified_tool
+        self.search_index.add(tool_id, unified_tool)
+        self.metrics_matrix.upsert(tool_id, unified_tool)
+        self.version += 1
         return tool_id
     
-    def search_tools(self, query: str, filters: Dict = None) -> List[Dict]:
-        """搜索工具"""
-        filters = filters or {}
-        matches = []
-        query_lower = query.lower()
+    def update_tool_metrics(self, tool_id: str, performance_metrics: Dict = None,
+                            cost_model: Dict = None, quality_scores: Dict = None) -> bool:
+        """更新工具指标，同步写入指标矩阵"""
+        tool = self.tools_db.get(tool_id)
+        if tool is None:
+            return False
         
-        for tool_id, tool in self.tools_db.items():
-            score = 0.0
-            
-            # 名称匹配
-            if query_lower in tool["name"].lower():
-                score += 0.4
-            
-            # 描述匹配
-            if query_lower in tool["description"].lower():
-                score += 0.3
-            
-            # 类别匹配
-            if query_lower in tool["category"].lower():
-                score += 0.2
-            
-            # 能力匹配
-            for capability in tool["capabilities"]:
-                if query_lower in capability.lower():
-                    score += 0.1
+        if performance_metrics:
+            tool["performance_metrics"].update(performance_metrics)
+        if cost_model:
+            tool["cost_model"].update(cost_model)
+        if quality_scores:
+            tool["quality_scores"].update(quality_scores)
+        
+        self.metrics_matrix.upsert(tool_id, tool)
+        self.version += 1
+        return True
+    
+    def set_tool_availability(self, tool_id: str, availability: float):
+        """更新工具可用性评分"""
+        self.metrics_matrix.set_availability(tool_id, availability)
+        self.version += 1
+    
+    def search_tool_ids(self, query: str, filters: Dict = None,
+                        limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """搜索工具，返回轻量的 (tool_id, relevance_score) 列表"""
+        if not filters:
+            return self.search_index.search(query, limit)
+        
+        matches = []
+        for tool_id, score in self.search_index.search(query):
+            if self._apply_filters(self.tools_db[tool_id], filters):
+                matches.append((tool_id, score))
+                if limit is not None and len(matches) >= limit:
                     break
-            
-            # 应用过滤器
-            if self._apply_filters(tool, filters) and score > 0:
-                tool_copy = tool.copy()
-                tool_copy["relevance_score"] = score
-                matches.append(tool_copy)
         
-        return sorted(matches, key=lambda x: x["relevance_score"], reverse=True)
+        return matches
+    
+    def search_tools(self, query: str, filters: Dict = None,
+                     limit: Optional[int] = None) -> List[Dict]:
+        """搜索工具，返回带 relevance_score 的工具字典副本"""
+        return self.tools_for_matches(self.search_tool_ids(query, filters, limit))
+    
+    def tools_for_matches(self, matches: List[Tuple[str, float]]) -> List[Dict]:
+        """把 search_tool_ids 的结果转为带 relevance_score 的工具字典副本"""
+        tools = []
+        for tool_id, score in matches:
+            tool_copy = self.tools_db[tool_id].copy()
+            tool_copy["relevance_score"] = score
+            tools.append(tool_copy)
+        
+        return tools
     
     def _apply_filters(self, tool: Dict, filters: Dict) -> bool:
         """应用过滤器"""
@@ -137,7 +166,7 @@ class UnifiedToolRegistry:
 class IntelligentRoutingEngine:
     """智能路由决策引擎"""
     
-    def __init__(self, registry: UnifiedToolRegistry):
+    def __init__(self, registry: UnifiedToolRegistry, cache_config: Dict = None):
         self.registry = registry
         self.decision_weights = {
             "performance": 0.3,
@@ -145,100 +174,121 @@ class IntelligentRoutingEngine:
             "quality": 0.25,
             "availability": 0.2
         }
-    
-    def select_optimal_tool(self, user_request: str, context: Dict = None) -> Dict:
-        """选择最优工具"""
-        context = context or {}
         
-        # 工具发现
-        candidate_tools = self.registry.search_tools(
-            user_request, 
-            filters=context.get("filters", {})
+        cache_config = cache_config or {}
+        self.decision_cache = RoutingDecisionCache(
+            ttl=cache_config.get("ttl", 300),
+            max_entries=cache_config.get("max_entries", 1024),
+            enabled=cache_config.get("enabled", True)
         )
+    
+    def configure_cache(self, enabled: bool = None, ttl: float = None, max_entries: int = None):
+        """调整路由缓存配置"""
+        if enabled is not None:
+            self.decision_cache.enabled = enabled
+            if not enabled:
+                self.decision_cache.clear()
+        if ttl is not None:
+            self.decision_cache.ttl = ttl
+        if max_entries is not None:
+            self.decision_cache.max_entries = max_entries
+    
+    def get_cache_stats(self) -> Dict:
+        """获取路由缓存统计"""
+        return self.decision_cache.get_stats()
+    
+    def select_optimal_tool(self, user_request: str, context: Dict = None,
+                            weights: Union[Dict[str, float], List[float]] = None) -> Dict:
+        """选择最优工具
         
-        if not candidate_tools:
-            return {"success": False, "error": "未找到匹配的工具"}
+        Args:
+            user_request: 用户请求
+            context: 上下文(filters、budget、decision_weights)
+            weights: 本次请求的决策权重，字典或按 performance/cost/quality/availability 排列的向量
+        """
+        context = context or {}
+        # 缓存键和搜索使用同一个规范化文本，同键的请求评分一致
+        user_request = normalize_requirement(user_request)
         
-        # 多维度评分
-        scored_tools = []
-        for tool in candidate_tools:
-            score = self._calculate_comprehensive_score(tool, context)
-            tool["comprehensive_score"] = score
-            scored_tools.append(tool)
+        # 路由缓存: 注册表版本变化时整体失效
+        cache_key = make_routing_key(user_request, context, weights)
+        cached = self.decision_cache.get(cache_key, self.registry.version)
+        if cached is not None:
+            return self._copy_routing_result(cached)
         
-        # 选择最优工具
-        best_tool = max(scored_tools, key=lambda x: x["comprehensive_score"])
+        result = self._route(user_request, context, weights)
+        if result["success"]:
+            self.decision_cache.put(cache_key, self.registry.version, result)
+            return self._copy_routing_result(result)
         
+        return result
+    
+    @staticmethod
+    def _copy_routing_result(result: Dict) -> Dict:
+        """复制路由结果顶层结构，避免调用方修改缓存内容"""
         return {
-            "success": True,
-            "selected_tool": best_tool,
-            "alternatives": scored_tools[1:4],
-            "decision_explanation": self._generate_decision_explanation(best_tool, context)
+            **result,
+            "selected_tool": result["selected_tool"].copy(),
+            "alternatives": [tool.copy() for tool in result["alternatives"]]
         }
     
-    def _calculate_comprehensive_score(self, tool: Dict, context: Dict) -> float:
-        """计算综合评分"""
-        performance_score = self._calculate_performance_score(tool)
-        cost_score = self._calculate_cost_score(tool, context)
-        quality_score = self._calculate_quality_score(tool)
-        availability_score = self._calculate_availability_score(tool, context)
-        
-        comprehensive_score = (
-            performance_score * self.decision_weights["performance"] +
-            cost_score * self.decision_weights["cost"] +
-            quality_score * self.decision_weights["quality"] +
-            availability_score * self.decision_weights["availability"]
+    def _route(self, user_request: str, context: Dict,
+               weights: Union[Dict[str, float], List[float]] = None) -> Dict:
+        """执行路由决策(不经过缓存)"""
+        # 工具发现(只取ID和相关性，避免复制全部候选)
+        candidates = self.registry.search_tool_ids(
+            user_request,
+            filters=context.get("filters", {})
         )
         
-        # 相关性加成
-        relevance_bonus = tool.get("relevance_score", 0) * 0.1
+        if not candidates:
+            return {"success": False, "error": "未找到匹配的工具"}
         
-        return min(comprehensive_score + relevance_bonus, 1.0)
-    
-    def _calculate_performance_score(self, tool: Dict) -> float:
-        """计算性能评分"""
-        metrics = tool["performance_metrics"]
+        # 多维度批量评分
+        tool_ids = [tool_id for tool_id, _ in candidates]
+        relevance = np.fromiter((score for _, score in candidates), dtype=np.float64, count=len(candidates))
+        matrix = self.registry.metrics_matrix
+        sub_scores = matrix.sub_scores(
+            matrix.rows_for(tool_ids),
+            context.get("budget", {}).get("max_cost_per_call", 0.01)
+        )
         
-        response_time_score = max(0, 1 - (metrics["avg_response_time"] / 5000))
-        success_rate_score = metrics["success_rate"]
-        throughput_score = min(metrics["throughput"] / 1000, 1.0)
-        reliability_score = metrics["reliability_score"]
+        # 排除可用性为0的工具(如执行器熔断中的工具)
+        available = sub_scores[:, SCORE_DIMENSIONS.index("availability")] > 0
+        if not available.all():
+            if not available.any():
+                return {"success": False, "error": "匹配的工具当前均不可用"}
+            tool_ids = [tool_id for tool_id, keep in zip(tool_ids, available) if keep]
+            relevance = relevance[available]
+            sub_scores = sub_scores[available]
         
-        return (response_time_score * 0.3 + success_rate_score * 0.3 + 
-                throughput_score * 0.2 + reliability_score * 0.2)
-    
-    def _calculate_cost_score(self, tool: Dict, context: Dict) -> float:
-        """计算成本评分"""
-        cost_model = tool["cost_model"]
+        weight = weight_vector(weights if weights is not None else context.get("decision_weights"),
+                               self.decision_weights)
+        comprehensive = np.minimum(sub_scores @ weight + relevance * 0.1, 1.0)
         
-        if cost_model["type"] == "free":
-            return 1.0
-        elif cost_model["type"] == "per_call":
-            max_cost = context.get("budget", {}).get("max_cost_per_call", 0.01)
-            cost_ratio = cost_model["cost_per_call"] / max_cost
-            return max(0, 1 - cost_ratio)
-        else:
-            return 0.8
-    
-    def _calculate_quality_score(self, tool: Dict) -> float:
-        """计算质量评分"""
-        quality = tool["quality_scores"]
+        # 选择最优工具及前3个备选，仅对这些结果构建字典
+        top = top_k_indices(comprehensive, 4)
+        tools_db = self.registry.tools_db
+        top_tools = []
+        for index in top:
+            tool = tools_db[tool_ids[index]].copy()
+            tool["relevance_score"] = float(relevance[index])
+            tool["comprehensive_score"] = float(comprehensive[index])
+            top_tools.append(tool)
         
-        user_rating_score = (quality["user_rating"] - 1) / 4
-        doc_quality_score = quality["documentation_quality"]
-        community_score = quality["community_support"]
-        update_score = quality["update_frequency"]
+        best_tool = top_tools[0]
+        key_factors = dict(zip(SCORE_DIMENSIONS, sub_scores[top[0]].tolist()))
         
-        return (user_rating_score * 0.4 + doc_quality_score * 0.2 + 
-                community_score * 0.2 + update_score * 0.2)
-    
-    def _calculate_availability_score(self, tool: Dict, context: Dict) -> float:
-        """计算可用性评分"""
-        # 简化的可用性评分
-        return 0.9
+        return {
+            "success": True,
+            "selected_tool": best_tool,
+            "alternatives": top_tools[1:],
+            "decision_explanation": self._generate_decision_explanation(best_tool, context, key_factors)
+        }
     
-    def _generate_decision_explanation(self, tool: Dict, context: Dict) -> Dict:
-        """生成决策解释"""
+    def _generate_decision_explanation(self, tool: Dict, context: Dict,
+                                       key_factors: Dict[str, float]) -> Dict:
+        """生成决策解释(复用批量评分得到的子评分)"""
         return {
             "selected_tool": {
                 "name": tool["name"],
@@ -246,18 +296,18 @@ class IntelligentRoutingEngine:
                 "score": tool["comprehensive_score"]
             },
             "key_factors": {
-                "performance": self._calculate_performance_score(tool),
-                "cost": self._calculate_cost_score(tool, context),
-                "quality": self._calculate_quality_score(tool)
+                "performance": key_factors["performance"],
+                "cost": key_factors["cost"],
+                "quality": key_factors["quality"]
             }
         }
 
 class MCPUnifiedExecutionEngine:
     """MCP统一执行引擎"""
     
-    def __init__(self, registry: UnifiedToolRegistry):
+    def __init__(self, registry: UnifiedToolRegistry, cache_config: Dict = None):
         self.registry = registry
-        self.routing_engine = IntelligentRoutingEngine(registry)
+        self.routing_engine = IntelligentRoutingEngine(registry, cache_config)
         
         # 执行统计
         self.execution_stats = {
@@ -378,8 +428,10 @@ class MCPUnifiedExecutionEngine:
                 for platform, count in self.execution_stats["platform_usage"].items()
             },
             "registry_info": {
-                "total_tools": len(self.registry.tools_db)
-            }
+                "total_tools": len(self.registry.tools_db),
+                "version": self.registry.version
+            },
+            "routing_cache": self.routing_engine.get_cache_stats()
         }
 
 class UnifiedSmartToolEngineMCP(BaseMCP):
@@ -391,7 +443,9 @@ class UnifiedSmartToolEngineMCP(BaseMCP):
         
         # 初始化核心组件
         self.registry = UnifiedToolRegistry()
-        self.execution_engine = MCPUnifiedExecutionEngine(self.registry)
+        self.execution_engine = MCPUnifiedExecutionEngine(
+            self.registry, self.config.get("routing_cache")
+        )
         
         # 初始化示例工具
         self._initialize_sample_tools()
@@ -535,12 +589,17 @@ class UnifiedSmartToolEngineMCP(BaseMCP):
             filters = parameters.get("filters", {})
             limit = parameters.get("limit", 10)
             
-            tools = self.registry.search_tools(query, filters)
+            matches = self.registry.search_tool_ids(query, filters)
+            tools = []
+            for tool_id, score in matches[:limit]:
+                tool = self.registry.tools_db[tool_id].copy()
+                tool["relevance_score"] = score
+                tools.append(tool)
             
             return {
                 "success": True,
-                "tools": tools[:limit],
-                "total_count": len(tools),
+                "tools": tools,
+                "total_count": len(matches),
                 "search_query": query,
                 "filters_applied": filters
             }
@@ -784,12 +843,14 @@ class ReleaseDiscoveryEngine:
         search_query = " ".join(requirements) if requirements else context_result.get("key_concepts", ["general"])[0]
         
         # 使用統一工具註冊表搜索
-        discovered_tools = self.registry.search_tools(search_query)
+        # 只搜索一次，總數取全部結果，返回前10個工具
+        discovered_ids = self.registry.search_tool_ids(search_query)
+        discovered_tools = self.registry.tools_for_matches(discovered_ids[:10])
         
         return {
-            "tools": discovered_tools[:10],  # 限制返回前10個工具
+            "tools": discovered_tools,
             "search_query": search_query,
-            "total_found": len(discovered_tools),
+            "total_found": len(discovered_ids),
             "discovery_method": "registry_search"
         }
     
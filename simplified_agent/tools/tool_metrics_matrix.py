@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+工具指标列式矩阵
+将注册表中每个工具的性能、成本、质量指标保存为NumPy列式矩阵，
+供智能路由引擎对全部候选工具进行批量评分
+"""
+
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+# 矩阵列定义
+COLUMNS = (
+    "avg_response_time",
+    "success_rate",
+    "throughput",
+    "reliability_score",
+    "cost_type",
+    "cost_per_call",
+    "user_rating",
+    "documentation_quality",
+    "community_support",
+    "update_frequency",
+    "availability"
+)
+COL = {name: index for index, name in enumerate(COLUMNS)}
+
+# 成本类型编码
+COST_TYPE_CODES = {"free": 0.0, "per_call": 1.0}
+OTHER_COST_TYPE = 2.0
+
+# 评分维度顺序，与 IntelligentRoutingEngine.decision_weights 的键对应
+SCORE_DIMENSIONS = ("performance", "cost", "quality", "availability")
+
+DEFAULT_AVAILABILITY = 0.9
+
+
+class ToolMetricsMatrix:
+    """工具指标矩阵
+
+    每个工具占一行，行号通过 row_index 映射；容量按倍数扩展，
+    注册和指标更新时原地写入对应行，保持与 tools_db 同步
+    """
+
+    def __init__(self, initial_capacity: int = 64):
+        self.values = np.zeros((initial_capacity, len(COLUMNS)), dtype=np.float64)
+        self.row_index: Dict[str, int] = {}
+        self.tool_ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.tool_ids)
+
+    def upsert(self, tool_id: str, tool: Dict):
+        """写入或更新工具所在行"""
+        row = self.row_index.get(tool_id)
+        if row is None:
+            row = len(self.tool_ids)
+            if row >= self.values.shape[0]:
+                self._grow()
+            self.row_index[tool_id] = row
+            self.tool_ids.append(tool_id)
+            self.values[row, COL["availability"]] = DEFAULT_AVAILABILITY
+
+        self.values[row] = self._encode(tool, self.values[row, COL["availability"]])
+
+    def set_availability(self, tool_id: str, availability: float):
+        """更新工具可用性评分"""
+        row = self.row_index.get(tool_id)
+        if row is not None:
+            self.values[row, COL["availability"]] = availability
+
+    def rows_for(self, tool_ids: Sequence[str]) -> np.ndarray:
+        """将工具ID转换为行号数组"""
+        row_index = self.row_index
+        return np.fromiter((row_index[tool_id] for tool_id in tool_ids), dtype=np.intp, count=len(tool_ids))
+
+    def sub_scores(self, rows: np.ndarray, max_cost_per_call: float = 0.01) -> np.ndarray:
+        """批量计算子评分
+
+        Args:
+            rows: 工具行号数组
+            max_cost_per_call: 单次调用成本上限，只用于按次计费的工具
+
+        Returns:
+            形状为 (len(rows), 4) 的矩阵，列依次为 performance/cost/quality/availability
+
+        Raises:
+            ValueError: 候选中有按次计费的工具而 max_cost_per_call 不大于0
+        """
+        m = self.values[rows]
+
+        performance = (
+            np.maximum(0.0, 1.0 - m[:, COL["avg_response_time"]] / 5000) * 0.3 +
+            m[:, COL["success_rate"]] * 0.3 +
+            np.minimum(m[:, COL["throughput"]] / 1000, 1.0) * 0.2 +
+            m[:, COL["reliability_score"]] * 0.2
+        )
+
+        cost_type = m[:, COL["cost_type"]]
+        is_per_call = cost_type == COST_TYPE_CODES["per_call"]
+        per_call = np.zeros(len(m))
+        if is_per_call.any():
+            if not max_cost_per_call > 0:
+                raise ValueError(f"max_cost_per_call 必须大于0: {max_cost_per_call}")
+            per_call = np.maximum(0.0, 1.0 - m[:, COL["cost_per_call"]] / max_cost_per_call)
+        cost = np.where(cost_type == COST_TYPE_CODES["free"], 1.0, np.where(is_per_call, per_call, 0.8))
+
+        quality = (
+            (m[:, COL["user_rating"]] - 1) / 4 * 0.4 +
+            m[:, COL["documentation_quality"]] * 0.2 +
+            m[:, COL["community_support"]] * 0.2 +
+            m[:, COL["update_frequency"]] * 0.2
+        )
+
+        return np.column_stack((performance, cost, quality, m[:, COL["availability"]]))
+
+    def _encode(self, tool: Dict, availability: float) -> np.ndarray:
+        metrics = tool["performance_metrics"]
+        cost_model = tool["cost_model"]
+        quality = tool["quality_scores"]
+
+        return np.array([
+            metrics["avg_response_time"],
+            metrics["success_rate"],
+            metrics["throughput"],
+            metrics["reliability_score"],
+            COST_TYPE_CODES.get(cost_model["type"], OTHER_COST_TYPE),
+            cost_model["cost_per_call"],
+            quality["user_rating"],
+            quality["documentation_quality"],
+            quality["community_support"],
+            quality["update_frequency"],
+            availability
+        ], dtype=np.float64)
+
+    def _grow(self):
+        grown = np.zeros((self.values.shape[0] * 2, len(COLUMNS)), dtype=np.float64)
+        grown[:self.values.shape[0]] = self.values
+        self.values = grown
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """取得分最高的k个下标(降序，同分时保持原顺序)"""
+    if len(scores) > k:
+        partition = np.sort(np.argpartition(-scores, k - 1)[:k])
+    else:
+        partition = np.arange(len(scores))
+    return partition[np.argsort(-scores[partition], kind="stable")]
+
+
+def weight_vector(weights: Optional[Union[Dict[str, float], Sequence[float]]],
+                  defaults: Dict[str, float]) -> np.ndarray:
+    """将权重转换为按 SCORE_DIMENSIONS 排列的向量
+
+    weights 可以是只覆盖部分维度的字典，也可以是长度为4的序列
+    """
+    if weights is not None and not isinstance(weights, dict):
+        vector = np.asarray(weights, dtype=np.float64)
+        if vector.shape != (len(SCORE_DIMENSIONS),):
+            raise ValueError(f"权重向量长度必须为 {len(SCORE_DIMENSIONS)}")
+        return vector
+
+    merged = dict(defaults)
+    if weights:
+        merged.update(weights)
+    return np.array([merged[dimension] for dimension in SCORE_DIMENSIONS], dtype=np.float64)
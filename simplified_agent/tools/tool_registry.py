@@ -8,15 +8,13 @@ Tool Registry System - Tool Discovery and Management
 """
 
 import asyncio
-import json
 import logging
-import importlib
-import inspect
-from typing import Dict, List, Any, Optional, Callable, Type
+import time
+from typing import Dict, List, Any, Optional, Callable, Set
 from dataclasses import dataclass, asdict
 from enum import Enum
-from pathlib import Path
-import aiohttp
+
+from ..core.connection_manager import get_connection_manager
 
 logger = logging.getLogger(__name__)
 
@@ -75,6 +73,18 @@ class ToolInfo:
         if self.tags is None:
             self.tags = []
 
+@dataclass
+class ProbeState:
+    """端點探測結果緩存"""
+    url: str
+    ok: bool = False
+    status_code: int = None
+    payload: Any = None
+    error: str = None
+    checked_at: float = 0.0
+    consecutive_failures: int = 0
+    next_probe_at: float = 0.0
+
 class ToolRegistry:
     """
     工具註冊系統
@@ -93,9 +103,32 @@ class ToolRegistry:
         self.tag_index: Dict[str, List[str]] = {}  # 標籤 -> 工具ID列表
         self.discovery_paths = self.config.get('discovery_paths', [])
         self.auto_discovery = self.config.get('auto_discovery', True)
+        self.connection_manager = get_connection_manager(self.config.get('connection_pool'))
+        self.connection_manager.acquire(self)
+        
+        # 並發探測與後台刷新配置
+        self.discovery_interval = self._setting('discovery_interval', 300)
+        self.health_check_interval = self._setting('health_check_interval', 60)
+        self.probe_concurrency = self._setting('probe_concurrency', 10)
+        self.probe_timeout = self._setting('probe_timeout', 5)
+        self.discovery_deadline = self._setting('discovery_deadline', 10)
+        self.probe_backoff_base = self._setting('probe_backoff_base', 5)
+        self.probe_backoff_max = self._setting('probe_backoff_max', 300)
+        self.background_refresh = self._setting('enable_background_refresh', False)
+        
+        self.probe_cache: Dict[str, ProbeState] = {}  # URL -> 探測結果
+        self._probe_semaphore: Optional[asyncio.Semaphore] = None
+        self._refresh_tasks: List[asyncio.Task] = []
+        self.tripped_tools: Set[str] = set()  # 熔斷器打開中的工具
         
         logger.info("ToolRegistry initialized")
     
+    def _setting(self, key: str, default: Any) -> Any:
+        """讀取配置（兼容扁平配置和帶tool_registry分段的配置）"""
+        if key in self.config:
+            return self.config[key]
+        return self.config.get('tool_registry', {}).get(key, default)
+    
     async def initialize(self):
         """初始化工具註冊系統"""
         logger.info("Initializing ToolRegistry...")
@@ -109,23 +142,124 @@ class ToolRegistry:
         # 執行初始健康檢查
         await self.health_check_all()
         
+        if self.background_refresh:
+            self.start_background_refresh()
+        
         logger.info(f"ToolRegistry initialized with {len(self.tools)} tools")
     
     async def discover_tools(self):
-        """自動發現工具"""
+        """自動發現工具（各類來源並發探測，受整體期限約束）"""
         logger.info("Starting tool discovery...")
         
-        # 發現MCP服務
-        await self._discover_mcp_services()
+        # 並發發現MCP服務、HTTP API和Python模塊
+        discovery_tasks = [
+            asyncio.ensure_future(self._discover_mcp_services()),
+            asyncio.ensure_future(self._discover_http_apis()),
+            asyncio.ensure_future(self._discover_python_modules())
+        ]
         
-        # 發現HTTP API
-        await self._discover_http_apis()
+        done, pending = await asyncio.wait(discovery_tasks, timeout=self.discovery_deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"Tool discovery deadline ({self.discovery_deadline}s) exceeded, "
+                           f"{len(pending)} discovery source(s) cancelled")
         
-        # 發現Python模塊
-        await self._discover_python_modules()
+        for task in done:
+            if not task.cancelled() and task.exception():
+                logger.warning(f"Tool discovery source failed: {task.exception()}")
         
         logger.info(f"Tool discovery completed, found {len(self.tools)} tools")
     
+    async def probe_endpoint(self, url: str, max_age: float = None, force: bool = False) -> ProbeState:
+        """
+        探測端點（帶結果緩存和失敗退避）
+        
+        Args:
+            url: 探測URL
+            max_age: 成功結果的最大復用時間，默認health_check_interval
+            force: 忽略緩存和退避，立即探測
+        
+        失敗的端點按指數退避延後重試，退避期內直接返回上次結果
+        """
+        now = time.monotonic()
+        max_age = self.health_check_interval if max_age is None else max_age
+        state = self.probe_cache.get(url)
+        if state is None:
+            state = self.probe_cache[url] = ProbeState(url=url)
+        elif not force and state.checked_at:
+            if state.ok and now - state.checked_at < max_age:
+                return state
+            if not state.ok and now < state.next_probe_at:
+                return state
+        
+        if self._probe_semaphore is None:
+            self._probe_semaphore = asyncio.Semaphore(self.probe_concurrency)
+        
+        async with self._probe_semaphore:
+            try:
+                async with self.connection_manager.get(url, timeout=self.probe_timeout) as response:
+                    state.status_code = response.status
+                    state.ok = response.status == 200
+                    state.payload = await response.json() if state.ok else None
+                    state.error = None if state.ok else f"HTTP {response.status}"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                state.ok = False
+                state.status_code = None
+                state.payload = None
+                state.error = str(e) or type(e).__name__
+        
+        state.checked_at = time.monotonic()
+        if state.ok:
+            state.consecutive_failures = 0
+            state.next_probe_at = state.checked_at
+        else:
+            state.consecutive_failures += 1
+            backoff = min(
+                self.probe_backoff_base * (2 ** (state.consecutive_failures - 1)),
+                self.probe_backoff_max
+            )
+            state.next_probe_at = state.checked_at + backoff
+        
+        return state
+    
+    def start_background_refresh(self):
+        """啟動後台刷新（按discovery_interval重新發現，按health_check_interval健康檢查）"""
+        if self._refresh_tasks:
+            return
+        
+        self._refresh_tasks = [
+            asyncio.ensure_future(self._refresh_loop(self.discovery_interval, self.discover_tools, 'discovery')),
+            asyncio.ensure_future(self._refresh_loop(
+                self.health_check_interval, lambda: self.health_check_all(max_age=0), 'health_check'
+            ))
+        ]
+        logger.info(f"Background refresh started (discovery every {self.discovery_interval}s, "
+                    f"health check every {self.health_check_interval}s)")
+    
+    async def stop_background_refresh(self):
+        """停止後台刷新"""
+        tasks, self._refresh_tasks = self._refresh_tasks, []
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info("Background refresh stopped")
+    
+    async def _refresh_loop(self, interval: float, refresh: Callable, name: str):
+        """後台刷新循環"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Background {name} refresh failed: {e}")
+    
     async def _discover_mcp_services(self):
         """發現MCP服務"""
         logger.info("Discovering MCP services...")
@@ -137,17 +271,15 @@ class ToolRegistry:
             {"name": "requirements_analysis_mcp", "url": "http://localhost:8090", "port": 8090},
         ]
         
-        for endpoint in mcp_endpoints:
-            try:
-                # 嘗試連接MCP服務
-                health_url = f"{endpoint['url']}/health"
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(health_url, timeout=5) as response:
-                        if response.status == 200:
-                            service_info = await response.json()
-                            await self._register_mcp_service(endpoint, service_info)
-            except Exception as e:
-                logger.warning(f"Failed to discover MCP service {endpoint['name']}: {e}")
+        async def discover(endpoint):
+            # 嘗試連接MCP服務
+            state = await self.probe_endpoint(f"{endpoint['url']}/health")
+            if state.ok:
+                await self._register_mcp_service(endpoint, state.payload)
+            else:
+                logger.warning(f"Failed to discover MCP service {endpoint['name']}: {state.error}")
+        
+        await asyncio.gather(*[discover(endpoint) for endpoint in mcp_endpoints])
     
     async def _register_mcp_service(self, endpoint: Dict, service_info: Dict):
         """註冊MCP服務"""
@@ -192,16 +324,14 @@ class ToolRegistry:
             {"name": "operations_analysis_engine", "url": "http://localhost:8100", "type": "analysis"},
         ]
         
-        for endpoint in api_endpoints:
-            try:
-                health_url = f"{endpoint['url']}/health"
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(health_url, timeout=5) as response:
-                        if response.status == 200:
-                            api_info = await response.json()
-                            await self._register_http_api(endpoint, api_info)
-            except Exception as e:
-                logger.warning(f"Failed to discover HTTP API {endpoint['name']}: {e}")
+        async def discover(endpoint):
+            state = await self.probe_endpoint(f"{endpoint['url']}/health")
+            if state.ok:
+                await self._register_http_api(endpoint, state.payload)
+            else:
+                logger.warning(f"Failed to discover HTTP API {endpoint['name']}: {state.error}")
+        
+        await asyncio.gather(*[discover(endpoint) for endpoint in api_endpoints])
     
     async def _register_http_api(self, endpoint: Dict, api_info: Dict):
         """註冊HTTP API"""
@@ -351,17 +481,19 @@ class ToolRegistry:
         """註冊工具"""
         self.tools[tool_info.id] = tool_info
         
-        # 更新能力索引
+        # 更新能力索引（後台重新發現時避免重複）
         for capability in tool_info.capabilities:
             if capability.name not in self.capability_index:
                 self.capability_index[capability.name] = []
-            self.capability_index[capability.name].append(tool_info.id)
+            if tool_info.id not in self.capability_index[capability.name]:
+                self.capability_index[capability.name].append(tool_info.id)
         
         # 更新標籤索引
         for tag in tool_info.tags:
             if tag not in self.tag_index:
                 self.tag_index[tag] = []
-            self.tag_index[tag].append(tool_info.id)
+            if tool_info.id not in self.tag_index[tag]:
+                self.tag_index[tag].append(tool_info.id)
         
         logger.info(f"Tool registered: {tool_info.id}")
     
@@ -393,42 +525,82 @@ class ToolRegistry:
                 matching_tools.append(tool_id)
         return matching_tools
     
-    async def health_check_all(self):
-        """檢查所有工具健康狀態"""
+    async def health_check_all(self, max_age: float = None, force: bool = False) -> Dict[str, bool]:
+        """並發檢查所有工具健康狀態（受整體期限約束）"""
         logger.info("Performing health check on all tools...")
         
-        for tool_id, tool_info in self.tools.items():
-            try:
-                await self.health_check_tool(tool_id)
-            except Exception as e:
-                logger.warning(f"Health check failed for tool {tool_id}: {e}")
+        tool_ids = list(self.tools.keys())
+        checks = {
+            tool_id: asyncio.ensure_future(self.health_check_tool(tool_id, max_age=max_age, force=force))
+            for tool_id in tool_ids
+        }
+        if not checks:
+            return {}
+        
+        done, pending = await asyncio.wait(checks.values(), timeout=self.discovery_deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"Health check deadline ({self.discovery_deadline}s) exceeded, "
+                           f"{len(pending)} check(s) cancelled")
+        
+        results = {}
+        for tool_id, task in checks.items():
+            if task.cancelled():
+                results[tool_id] = False
+            elif task.exception():
+                logger.warning(f"Health check failed for tool {tool_id}: {task.exception()}")
+                results[tool_id] = False
+            else:
+                results[tool_id] = task.result()
+        
+        return results
     
-    async def health_check_tool(self, tool_id: str) -> bool:
-        """檢查單個工具健康狀態"""
+    async def health_check_tool(self, tool_id: str, max_age: float = None, force: bool = False) -> bool:
+        """檢查單個工具健康狀態（探測結果帶緩存，參數含義同probe_endpoint）"""
         tool_info = self.tools.get(tool_id)
         if not tool_info:
             return False
         
-        try:
-            if tool_info.health_check_url:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(tool_info.health_check_url, timeout=5) as response:
-                        if response.status == 200:
-                            tool_info.status = ToolStatus.AVAILABLE
-                            tool_info.last_health_check = str(asyncio.get_event_loop().time())
-                            return True
-                        else:
-                            tool_info.status = ToolStatus.UNAVAILABLE
-                            return False
-            else:
-                # 對於沒有健康檢查URL的工具，假設可用
+        if not tool_info.health_check_url:
+            # 對於沒有健康檢查URL的工具，假設可用
+            tool_info.status = ToolStatus.AVAILABLE
+            return True
+        
+        state = await self.probe_endpoint(tool_info.health_check_url, max_age=max_age, force=force)
+        if state.ok:
+            # 熔斷中的工具由執行器的半開探測決定何時恢復
+            if tool_id not in self.tripped_tools:
                 tool_info.status = ToolStatus.AVAILABLE
-                return True
-                
-        except Exception as e:
+            tool_info.last_health_check = str(state.checked_at)
+            return True
+        elif state.status_code is not None:
+            tool_info.status = ToolStatus.UNAVAILABLE
+        else:
             tool_info.status = ToolStatus.ERROR
-            logger.warning(f"Health check failed for {tool_id}: {e}")
-            return False
+            logger.warning(f"Health check failed for {tool_id}: {state.error}")
+        return False
+    
+    def set_circuit_state(self, tool_id: str, state: str):
+        """
+        同步執行器熔斷器狀態
+        
+        open時將工具標記為不可用，half_open/closed時恢復為可用，
+        使半開狀態下的工具可以重新被選中以完成探測
+        """
+        tool_info = self.tools.get(tool_id)
+        if not tool_info:
+            return
+        
+        if state == 'open':
+            self.tripped_tools.add(tool_id)
+            tool_info.status = ToolStatus.UNAVAILABLE
+        else:
+            self.tripped_tools.discard(tool_id)
+            tool_info.status = ToolStatus.AVAILABLE
+        
+        logger.info(f"Tool {tool_id} circuit state: {state}, status: {tool_info.status.value}")
     
     def get_registry_stats(self) -> Dict[str, Any]:
         """獲取註冊系統統計信息"""
@@ -446,9 +618,24 @@ class ToolRegistry:
             'unavailable_tools': total_tools - available_tools,
             'type_distribution': type_distribution,
             'total_capabilities': len(self.capability_index),
-            'total_tags': len(self.tag_index)
+            'total_tags': len(self.tag_index),
+            'probe_cache': {
+                'endpoints': len(self.probe_cache),
+                'healthy': len([p for p in self.probe_cache.values() if p.ok]),
+                'backing_off': len([p for p in self.probe_cache.values()
+                                    if not p.ok and p.next_probe_at > time.monotonic()])
+            },
+            'background_refresh': bool(self._refresh_tasks),
+            'tripped_tools': sorted(self.tripped_tools),
+            'connection_pool': self.connection_manager.get_metrics()
         }
     
+    async def close(self):
+        """關閉註冊系統，停止後台刷新並釋放共享連接池"""
+        await self.stop_background_refresh()
+        await self.connection_manager.release(self)
+        logger.info("ToolRegistry closed")
+    
     def export_registry(self) -> Dict[str, Any]:
         """導出註冊信息"""
         return {
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+工具搜索倒排索引
+为统一工具注册表提供增量维护的词项倒排索引、n-gram子串索引和BM25评分
+"""
+
+import heapq
+import math
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# 分词: 按非字母数字切分(下划线同样视为分隔符)，保留中文连续片段
+_TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+# 字段权重，与原线性扫描中 名称/描述/类别/能力 的加分比例一致
+FIELD_WEIGHTS = {
+    "name": 4.0,
+    "description": 3.0,
+    "category": 2.0,
+    "capabilities": 1.0
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """将文本切分为小写词项"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class ToolSearchIndex:
+    """工具搜索索引
+
+    - postings: 词项 -> {tool_id: 加权词频}
+    - gram_index: n-gram -> 包含该片段的词项集合(词表级，用于子串/前缀匹配)
+    - fields: tool_id -> 预先小写化的字段文本(用于整句短语加分)
+    - impacts: 词项 -> {tool_id: BM25得分} 的查询期缓存，索引变更时整体失效
+    """
+
+    def __init__(self, ngram_size: int = 3, k1: float = 1.2, b: float = 0.75):
+        self.ngram_size = ngram_size
+        self.k1 = k1
+        self.b = b
+
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.gram_index: Dict[str, Set[str]] = {}
+        self.fields: Dict[str, Dict[str, str]] = {}
+        self.doc_terms: Dict[str, Dict[str, float]] = {}
+        self.doc_lengths: Dict[str, float] = {}
+        self.impacts: Dict[str, Dict[str, float]] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, tool_id: str) -> bool:
+        return tool_id in self.doc_lengths
+
+    @property
+    def avg_doc_length(self) -> float:
+        """平均文档长度"""
+        return self._total_length / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def add(self, tool_id: str, tool: Dict):
+        """添加或更新工具索引(同ID重复注册时先移除旧词项)"""
+        if tool_id in self.doc_lengths:
+            self.remove(tool_id)
+        self.impacts.clear()
+
+        fields = {
+            "name": tool.get("name", "").lower(),
+            "description": tool.get("description", "").lower(),
+            "category": tool.get("category", "").lower(),
+            "capabilities": " ".join(tool.get("capabilities", [])).lower()
+        }
+
+        term_freqs: Dict[str, float] = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for token in _TOKEN_PATTERN.findall(text):
+                term_freqs[token] = term_freqs.get(token, 0.0) + weight
+
+        for token, freq in term_freqs.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                self._index_grams(token)
+            posting[tool_id] = freq
+
+        doc_length = sum(term_freqs.values())
+        self.fields[tool_id] = fields
+        self.doc_terms[tool_id] = term_freqs
+        self.doc_lengths[tool_id] = doc_length
+        self._total_length += doc_length
+
+    def remove(self, tool_id: str):
+        """移除工具索引"""
+        term_freqs = self.doc_terms.pop(tool_id, None)
+        if term_freqs is None:
+            return
+        self.impacts.clear()
+
+        for token in term_freqs:
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(tool_id, None)
+            if not posting:
+                del self.postings[token]
+                self._unindex_grams(token)
+
+        self._total_length -= self.doc_lengths.pop(tool_id)
+        self.fields.pop(tool_id, None)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """搜索工具
+
+        Args:
+            query: 查询文本，空查询返回全部工具
+            limit: 返回数量上限，None表示全部
+
+        Returns:
+            按相关性降序排列的 (tool_id, score) 列表，score归一化到 (0, 1]
+        """
+        query_lower = query.lower().strip()
+        if not query_lower:
+            tool_ids = list(self.doc_lengths)
+            if limit is not None:
+                tool_ids = tool_ids[:limit]
+            return [(tool_id, 1.0) for tool_id in tool_ids]
+
+        query_tokens = set(tokenize(query_lower))
+        weighted_impacts = [
+            (self._term_impacts(token), token_weight)
+            for query_token in query_tokens
+            for token, token_weight in self._expand_token(query_token)
+        ]
+        if not weighted_impacts:
+            return []
+
+        # 从最大的倒排表开始合并，单词项精确查询可直接复用缓存(只读)
+        weighted_impacts.sort(key=lambda item: len(item[0]), reverse=True)
+        base, base_weight = weighted_impacts[0]
+        if base_weight == 1.0 and len(weighted_impacts) == 1 and len(query_tokens) == 1:
+            scores = base
+        else:
+            scores = {tool_id: score * base_weight for tool_id, score in base.items()}
+            for impacts, token_weight in weighted_impacts[1:]:
+                for tool_id, score in impacts.items():
+                    scores[tool_id] = scores.get(tool_id, 0.0) + score * token_weight
+
+        # 多词查询整句出现在名称中时给予短语加分，保持原有整串匹配的排序倾向
+        if len(query_tokens) > 1:
+            fields = self.fields
+            for tool_id in scores:
+                if query_lower in fields[tool_id]["name"]:
+                    scores[tool_id] *= 1.5
+
+        if limit is not None:
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        else:
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+        top_score = ranked[0][1]
+        return [(tool_id, score / top_score) for tool_id, score in ranked]
+
+    def _expand_token(self, query_token: str) -> List[Tuple[str, float]]:
+        """将查询词展开为词表中的匹配词项(精确匹配权重1.0，子串匹配按长度比例折减)"""
+        matches = []
+        if query_token in self.postings:
+            matches.append((query_token, 1.0))
+
+        for token in self._substring_candidates(query_token):
+            if token != query_token:
+                matches.append((token, 0.5 * len(query_token) / len(token)))
+
+        return matches
+
+    def _substring_candidates(self, query_token: str) -> Set[str]:
+        """通过n-gram索引查找包含查询片段的词项"""
+        if len(query_token) < self.ngram_size:
+            # 短查询无法构成完整n-gram，退回到词表扫描
+            return {token for token in self.postings if query_token in token}
+
+        grams = self._grams(query_token)
+        candidate_sets = sorted(
+            (self.gram_index.get(gram, set()) for gram in grams),
+            key=len
+        )
+        if not candidate_sets or not candidate_sets[0]:
+            return set()
+
+        candidates = set(candidate_sets[0])
+        for gram_set in candidate_sets[1:]:
+            candidates &= gram_set
+            if not candidates:
+                return candidates
+
+        return {token for token in candidates if query_token in token}
+
+    def _term_impacts(self, token: str) -> Dict[str, float]:
+        """获取单个词项在各工具上的BM25得分(带缓存)"""
+        impacts = self.impacts.get(token)
+        if impacts is not None:
+            return impacts
+
+        posting = self.postings[token]
+        doc_count = len(self.doc_lengths)
+        idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+        avg_length = self.avg_doc_length or 1.0
+        k1, b = self.k1, self.b
+        doc_lengths = self.doc_lengths
+
+        impacts = {
+            tool_id: idf * freq * (k1 + 1) / (freq + k1 * (1 - b + b * doc_lengths[tool_id] / avg_length))
+            for tool_id, freq in posting.items()
+        }
+        self.impacts[token] = impacts
+        return impacts
+
+    def _grams(self, token: str) -> Set[str]:
+        n = self.ngram_size
+        return {token[i:i + n] for i in range(len(token) - n + 1)}
+
+    def _index_grams(self, token: str):
+        for gram in self._grams(token):
+            self.gram_index.setdefault(gram, set()).add(token)
+
+    def _unindex_grams(self, token: str):
+        for gram in self._grams(token):
+            tokens = self.gram_index.get(gram)
+            if tokens is None:
+                continue
+            tokens.discard(token)
+            if not tokens:
+                del self.gram_index[gram]